@@ -2,9 +2,13 @@ import network
 import time
 import json
 import random
-from umqtt.simple import MQTTClient
+from umqtt.simple import MQTTClient, MQTTException
 import machine
 from machine import Pin, PWM
+from edge_rules import EdgeRuleEngine
+from local_link import LocalSubscriber
+from wled import build_groups
+from supervisor import Supervisor
 
 # Configure your WiFi credentials
 WIFI_SSID = "T"
@@ -13,7 +17,10 @@ Fan = Pin(15, Pin.OUT)
 # MQTT Configuration
 MQTT_BROKER = "broker.emqx.io"
 MQTT_PORT = 1883
+# Drawn once per boot; reconnects keep it so the broker sees the same client
 MQTT_CLIENT_ID = f"pico_w_{random.randint(0, 1000000)}"
+MQTT_CONNECT_TIMEOUT_S = 5  # Below the watchdog timeout
+MQTT_PING_MS = 15000  # How often a quiet connection is checked
 DEVICE_ID = "pico_water_pump"  # A unique ID for your device
 MQTT_TOPIC_PREFIX = "ycstation/devices/"  # Same as in your server
 
@@ -25,6 +32,17 @@ BROADCAST_TOPIC = f"{MQTT_TOPIC_PREFIX}all/commands"
 STATUS_TOPIC = f"{MQTT_TOPIC_PREFIX}{DEVICE_ID}/status"
 # Acknowledgment topic (to confirm commands)
 ACK_TOPIC = f"{MQTT_TOPIC_PREFIX}{DEVICE_ID}/ack"
+# Edge rules topic (retained rules pushed by ruleService)
+RULES_TOPIC = f"{MQTT_TOPIC_PREFIX}{DEVICE_ID}/rules"
+# Telemetry from every device (readings the edge rules are evaluated against)
+TELEMETRY_TOPIC = f"{MQTT_TOPIC_PREFIX}+/telemetry"
+
+# Failures restart Wi-Fi, the MQTT socket or the LAN listener in place; the
+# watchdog resets the Pico if the loop hangs (None while developing at the
+# REPL: once started, the RP2040's watchdog can't be stopped)
+WATCHDOG_MS = 8000
+ESCALATE_MS = 30 * 60 * 1000  # Reset anyway if a subsystem stays down this long
+STATUS_INTERVAL_MS = 30000
 
 # Initialize pump control pins
 in1 = Pin(3, Pin.OUT)   # Control Pin 1
@@ -32,33 +50,59 @@ in2 = Pin(4, Pin.OUT)   # Control Pin 2
 pwm = PWM(Pin(2))       # PWM Pin (ENA)
 pwm.freq(1000)          # Set frequency
 
-# WLED Topics
-WLED_TOPIC_ON = "wled/508610"
-WLED_TOPIC_COLOR = "wled/508610/col"
-WLED_TOPIC_EFFECT = "wled/508610/api"
-WLED_TOPIC_BRIGHTNESS = "wled/508610/g"
+# WLED strips by group name. "led" commands go to the "all" group, and
+# "led:<group>" (e.g. "led:bench1") to a named one. group_topic is the group
+# topic set on those strips in WLED's MQTT settings; with it a command is a
+# single publish, without it (None) each strip gets its own publish. Don't use
+# WLED's default "wled/all" on a public broker, other people's strips listen there.
+WLED_GROUPS = {
+    "all": {"group_topic": None, "targets": ["wled/508610"]},
+    # "bench1": {"group_topic": "ycstation/wled/bench1", "targets": ["wled/bench1a", "wled/bench1b"]},
+}
+
+# ticks_ms() at which a timed pump run ends; None when none is running
+pump_stop_at = None
 
 # Pump control functions
 def pump_on(speed=65535):  # Default to full power
+    global pump_stop_at
+    pump_stop_at = None
     in1.value(1)
     in2.value(0)
     pwm.duty_u16(speed)
     print(f"Pump turned ON at speed {speed}")
 
 def pump_off():
+    global pump_stop_at
+    pump_stop_at = None
     in1.value(0)
     in2.value(0)
     pwm.duty_u16(0)
     print("Pump turned OFF")
 
-def run_duration(time_ms):
+def run_duration(seconds):
+    # The main loop stops the pump (check_pump), so the run carries on
+    # through reconnects instead of blocking the loop for its duration
+    global pump_stop_at
     pump_on()
-    time.sleep(time_ms)
-    pump_off()
+    pump_stop_at = time.ticks_add(time.ticks_ms(), seconds * 1000)
+
+def check_pump():
+    if pump_stop_at is not None and time.ticks_diff(time.ticks_ms(), pump_stop_at) >= 0:
+        pump_off()
+
+def pump_seconds_left():
+    if pump_stop_at is None:
+        return 0
+    return max(0, time.ticks_diff(pump_stop_at, time.ticks_ms())) // 1000
+
+# Restarts failed subsystems in place; the pump timer keeps running while it waits
+supervisor = Supervisor(WATCHDOG_MS, ESCALATE_MS, (OSError, MQTTException), check_pump)
+
+wlan = network.WLAN(network.STA_IF)
 
 # Initialize WiFi
 def connect_wifi():
-    wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
     
     print(f"Connecting to WiFi: {WIFI_SSID}")
@@ -71,7 +115,7 @@ def connect_wifi():
                 break
             max_wait -= 1
             print("Waiting for connection...")
-            time.sleep(1)
+            supervisor.wait(1000)
     
     if wlan.isconnected():
         print("WiFi connected!")
@@ -83,6 +127,8 @@ def connect_wifi():
 
 # MQTT callback function for incoming messages
 def mqtt_callback(topic, msg):
+    # Stamp arrival before anything else so the trace includes our own parsing
+    received_us = time.ticks_us()
     print(f"Received message on {topic}: {msg}")
     
     try:
@@ -93,12 +139,39 @@ def mqtt_callback(topic, msg):
         # Process commands from either direct or broadcast topics
         if topic_str == COMMANDS_TOPIC or topic_str == BROADCAST_TOPIC:
             command = json.loads(msg_str)
-            process_command(command)
+            process_command(command, received_us)
+        elif topic_str == RULES_TOPIC:
+            rules = json.loads(msg_str).get('rules', [])
+            edge_rules.load(rules)
+            edge_rules.save()
+        elif topic_str in wled_state_topics:
+            for group in wled_groups.values():
+                group.observe(topic_str, msg_str)
+        elif topic_str.endswith("/telemetry"):
+            reading = json.loads(msg_str)
+            device_id = reading.get('device_id') or topic_str.split('/')[-2]
+            edge_rules.update(device_id, reading.get('sensors', reading))
     except Exception as e:
         print(f"Error processing message: {e}")
 
+# Run an edge rule action through the normal command path
+def edge_actuate(component, action, value, rule_id):
+    process_command({
+        'id': f"edge_{rule_id}",
+        'component': component,
+        'action': action,
+        'value': value
+    })
+
+# Edge rule engine (evaluates ruleService rules locally)
+edge_rules = EdgeRuleEngine(edge_actuate)
+
 # Process command messages
-def process_command(command):
+def process_command(command, received_us=None):
+    exec_start_us = time.ticks_us()
+    if received_us is None:
+        received_us = exec_start_us
+
     command_id = command.get('id', 'unknown')
     component = command.get('component', '')
     action = command.get('action', '')
@@ -130,8 +203,9 @@ def process_command(command):
                     message = "Invalid speed value (must be 0-65535)"
             except ValueError:
                 message = "Invalid speed format"
-    elif component == "led":
-        success, message = process_wled_command(action, value)
+    elif component == "led" or component.startswith("led:"):
+        group_name = component[4:] or "all"
+        success, message = process_wled_command(group_name, action, value)
 
     elif component == 'fan':
         if action == 'power':
@@ -144,18 +218,27 @@ def process_command(command):
                 success = True
                 message = "Fan turned off"
 
+    exec_end_us = time.ticks_us()
 
     # Send acknowledgment
-    send_ack(command_id, success, message)
+    send_ack(command_id, success, message, (received_us, exec_start_us, exec_end_us))
 
 # Send command acknowledgment
-def send_ack(command_id, success, message):
+def send_ack(command_id, success, message, stamps=None):
     ack = {
         'command_id': command_id,
         'success': success,
         'message': message,
         'timestamp': time.time()
     }
+    if stamps:
+        # Relative timings only: the Pico's clock isn't synced with the server
+        received_us, exec_start_us, exec_end_us = stamps
+        ack['trace'] = {
+            'queue_us': time.ticks_diff(exec_start_us, received_us),
+            'exec_us': time.ticks_diff(exec_end_us, exec_start_us),
+            'device_us': time.ticks_diff(time.ticks_us(), received_us)
+        }
     try:
         client.publish(ACK_TOPIC, json.dumps(ack))
         print(f"Acknowledgment sent: {success}, {message}")
@@ -170,9 +253,12 @@ def send_status():
         'capabilities': ['pump'],
         'components': {
             'pump': {
-                'power': 'on' if in1.value() else 'off'
+                'power': 'on' if in1.value() else 'off',
+                'run_s_left': pump_seconds_left()
             }
         },
+        'edge_rules': edge_rules.status(),
+        'supervisor': supervisor.stats(),
         'timestamp': time.time()
     }
     try:
@@ -181,84 +267,131 @@ def send_status():
     except Exception as e:
         print(f"Error sending status: {e}")
 # 🎨 Process WLED Commands (Power, Color, Brightness, Effects)
-def process_wled_command(action, value):
-    global client  # Ensure MQTT client is accessible
+def process_wled_command(group_name, action, value):
+    group = wled_groups.get(group_name)
+    if group is None:
+        return False, f"Unknown WLED group: {group_name}"
+
+    # Changes are merged and sent as one JSON API publish from the main loop
+    success, message = group.apply(action, value)
+    if success:
+        print(f"🎨 Queued WLED {group_name} {action}: {value}")
+    return success, message
 
+# Connect (or reconnect) to the broker and subscribe. The client object,
+# its id and the WLED groups built on it are kept across reconnects.
+def connect_mqtt():
     try:
-        if action == "power":
-            payload = "ON" if value == "on" else "OFF"
-            print(f"🟢 Sending WLED Power: {payload} → {WLED_TOPIC_ON}")
-            client.publish(WLED_TOPIC_ON, payload)
-            return True, f"WLED Turned {value.upper()}"
-
-        elif action == "color":
-            if isinstance(value, str) and value.startswith("#"):
-                print(f"🎨 Sending WLED Color: {value} → {WLED_TOPIC_COLOR}")
-                client.publish(WLED_TOPIC_COLOR, value)
-                return True, f"WLED Color Set: {value}"
-            return False, "Invalid color format. Use HEX like #FF0000."
-
-        elif action == "brightness":
-            brightness = int(value)
-            if 0 <= brightness <= 255:
-                payload = json.dumps({"bri": brightness})  # JSON format required!
-                print(f"💡 Sending WLED Brightness: {payload} → {WLED_TOPIC_EFFECT}")
-                client.publish(WLED_TOPIC_EFFECT, payload)  # Use `wled/508610/api`
-                return True, f"WLED Brightness Set: {brightness}"
-            return False, "Brightness must be between 0-255."
+        client.connect(timeout=MQTT_CONNECT_TIMEOUT_S)
+    except TypeError:
+        client.connect()  # umqtt.simple without timeout=
+    print(f"Connected to MQTT broker: {MQTT_BROKER}")
+    
+    # Subscribe to device-specific commands topic
+    client.subscribe(COMMANDS_TOPIC)
+    print(f"Subscribed to device commands: {COMMANDS_TOPIC}")
+    
+    # Subscribe to broadcast commands topic
+    client.subscribe(BROADCAST_TOPIC)
+    print(f"Subscribed to broadcast commands: {BROADCAST_TOPIC}")
+    
+    # Subscribe to edge rules and the readings they depend on
+    client.subscribe(RULES_TOPIC)
+    client.subscribe(TELEMETRY_TOPIC)
+    print(f"Subscribed to edge rules: {RULES_TOPIC}")
+    
+    # Track WLED's own state so redundant changes are never published
+    for topic in wled_state_topics:
+        client.subscribe(topic)
+    
+    # Report the state the actuators kept through the reconnect
+    send_status()
+    return True
 
+def close_mqtt():
+    if client.sock:
+        client.sock.close()
 
-    except Exception as e:
-        print(f"⚠️ WLED Command Error: {e}")
-        return False, "Error processing WLED command"
+def mqtt_alive():
+    client.ping()  # Raises once the socket is gone
+    return True
 
-    return False, "Invalid WLED command"
+# Readings multicast by sensor Picos on the LAN (works without the broker);
+# rejoined after Wi-Fi comes back
+local_readings = None
+
+def open_local():
+    global local_readings
+    local_readings = LocalSubscriber()
+    return True
+
+def close_local():
+    if local_readings is not None:
+        local_readings.close()
+
+def poll_local():
+    local_readings.poll(edge_rules.update)
+
+def flush_wled():
+    for group in wled_groups.values():
+        group.flush()
 
 # Main function
 def main():
-    global client
+    global client, wled_groups, wled_state_topics
     
-    # Connect to WiFi
-    if not connect_wifi():
-        return
+    # Restore the last pushed edge rules so control works before the broker answers
+    edge_rules.restore()
+    
+    # Changes queued while the broker is unreachable are sent after the reconnect
+    client = MQTTClient(MQTT_CLIENT_ID, MQTT_BROKER, MQTT_PORT)
+    client.set_callback(mqtt_callback)
+    wled_groups = build_groups(client, WLED_GROUPS)
+    wled_state_topics = set()
+    for group in wled_groups.values():
+        wled_state_topics.update(group.state_topics())
+    
+    supervisor.add("wifi", connect_wifi, stop=wlan.disconnect, check=wlan.isconnected)
+    supervisor.add("mqtt", connect_mqtt, stop=close_mqtt, check=mqtt_alive, needs="wifi",
+                   check_ms=MQTT_PING_MS)
+    supervisor.add("lan", open_local, stop=close_local, needs="wifi")
+    supervisor.start()
     
-    # Set up MQTT client
     try:
-        client = MQTTClient(MQTT_CLIENT_ID, MQTT_BROKER, MQTT_PORT)
-        client.set_callback(mqtt_callback)
-        client.connect()
-        print(f"Connected to MQTT broker: {MQTT_BROKER}")
-        
-        # Subscribe to device-specific commands topic
-        client.subscribe(COMMANDS_TOPIC)
-        print(f"Subscribed to device commands: {COMMANDS_TOPIC}")
-        
-        # Subscribe to broadcast commands topic
-        client.subscribe(BROADCAST_TOPIC)
-        print(f"Subscribed to broadcast commands: {BROADCAST_TOPIC}")
-        
-        # Send initial status
-        send_status()
-        
-        # Main loop
-        last_status_time = time.time()
+        # Main loop: a step whose subsystem is down is skipped until it's back
+        last_status = time.ticks_ms()
         
         while True:
             # Check for new messages
-            client.check_msg()
+            supervisor.run("mqtt", client.check_msg)
+            
+            # Feed LAN-local readings straight into the edge rules
+            supervisor.run("lan", poll_local)
+            
+            # Apply edge rule transitions held back by min-on/min-off
+            supervisor.run(None, edge_rules.tick)
+            
+            # End a timed pump run
+            check_pump()
+            
+            # Send merged WLED changes (one publish per group or strip)
+            supervisor.run("mqtt", flush_wled)
             
             # Send status update every 30 seconds
-            current_time = time.time()
-            if current_time - last_status_time > 30:
-                send_status()
-                last_status_time = current_time
+            if time.ticks_diff(time.ticks_ms(), last_status) > STATUS_INTERVAL_MS:
+                supervisor.run("mqtt", send_status)
+                last_status = time.ticks_ms()
+            
+            # Feed the watchdog, run health checks and due restarts
+            supervisor.poll()
             
             # Small delay to prevent CPU overload
             time.sleep(0.1)
             
     except Exception as e:
-        print(f"MQTT error: {e}")
-        machine.reset()  # Reset the Pico W on error
+        # Only a bug in the loop itself gets here; every step is supervised
+        print(f"Main loop error: {e}, supervisor: {supervisor.stats()}")
+        machine.reset()
 
 # Run the main function
 if __name__ == "__main__":
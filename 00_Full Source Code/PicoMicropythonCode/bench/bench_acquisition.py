@@ -0,0 +1,241 @@
+# bench_acquisition.py
+# Host-side comparison of sensorPico1's sampling under network load, before
+# and after moving it to the RP2040's second core, on a virtual clock:
+#
+#   core 0:  machine.Timer soft callbacks (moisture every 10 ms, FS3000 every
+#            20 ms) share core 0 with the uploads. A callback only runs
+#            between bytecodes or while a socket waits, so TLS handshakes,
+#            JSON encoding and garbage collections hold it back; callbacks
+#            queue in the 8-deep scheduler and run late in a burst, or are
+#            lost when it's full.
+#   core 1:  the real lib/acquisition.py loop. Reads wait only for the
+#            sensor itself and for core 0 holding a lock: the buffer lock
+#            while it drains (every 200 ms) and the bus lock around
+#            I2CBus.check_frames() (every second).
+#
+# Core 0 runs the same load in both: a moisture and an air velocity HTTPS
+# POST each second (a new TLS handshake each), MQTT checks and periodic
+# garbage collections. The bench reports per channel how late samples were
+# taken (p50/p99/max), the spread of the intervals between them, and lost
+# samples. A last check runs the acquisition loop on a real thread with a
+# real clock and confirms no sample is lost or duplicated across the lock.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_acquisition.py [seconds]
+
+import random
+import sys
+import time
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+import acquisition  # noqa: E402
+import compat  # noqa: E402
+from acquisition import Acquisition  # noqa: E402
+
+SECONDS = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+CHANNELS = (("moisture", 10, 0.06), ("air", 20, 0.45))  # name, period ms, read ms
+SCHED_DEPTH = 8
+UPLOAD_MS = 1000
+DRAIN_MS = 200
+CHECK_FRAMES_MS = 1000
+GC_EVERY_MS = (800, 2500)
+GC_MS = (6, 14)
+
+
+def core0_load(rng, end_ms):
+    """Intervals (start, end) during which core 0 can't run a soft callback"""
+    blocked = []
+    t = 0.0
+    # Two uploads per second, half a period apart
+    while t < end_ms:
+        for offset in (0, UPLOAD_MS / 2):
+            start = t + offset
+            blocked.append((start, start + rng.uniform(4, 12)))  # json.dumps, print
+            start += rng.uniform(20, 80)  # DNS/connect: a socket wait, callbacks run
+            handshake = rng.uniform(120, 300)  # mbedtls key exchange, all in C
+            blocked.append((start, start + handshake))
+            start += handshake + rng.uniform(60, 200)  # Request and response waits
+            blocked.append((start, start + rng.uniform(2, 6)))  # Close, print the status
+        t += UPLOAD_MS
+    t = rng.uniform(*GC_EVERY_MS)
+    while t < end_ms:
+        blocked.append((t, t + rng.uniform(*GC_MS)))
+        t += rng.uniform(*GC_EVERY_MS)
+    blocked.sort()
+    # Merge overlaps
+    merged = []
+    for start, end in blocked:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_at(blocked, t, i):
+    """First time >= t outside the blocked intervals, scanning from index i"""
+    while i < len(blocked) and blocked[i][1] <= t:
+        i += 1
+    if i < len(blocked) and blocked[i][0] <= t:
+        t = blocked[i][1]
+    return t, i
+
+
+def run_core0(blocked, end_ms):
+    """Soft timer callbacks, run whenever core 0 is between bytecodes"""
+    fires = []
+    for index, (name, period, read_ms) in enumerate(CHANNELS):
+        t = 0.0
+        while t < end_ms:
+            fires.append((t, index))
+            t += period
+    fires.sort()
+    taken = {name: [] for name, _, _ in CHANNELS}
+    queue = []  # (nominal, channel) callbacks waiting for core 0
+    now = 0.0
+    i = 0
+    block_i = 0
+    while i < len(fires) or queue:
+        if not queue:
+            now = max(now, fires[i][0])
+        # Everything that fired by now joins the queue, or is dropped when it's full
+        while i < len(fires) and fires[i][0] <= now:
+            if len(queue) < SCHED_DEPTH:
+                queue.append(fires[i])
+            i += 1
+        now, block_i = free_at(blocked, now, block_i)
+        # Firing stops while core 0 is blocked, but callbacks keep queueing
+        while i < len(fires) and fires[i][0] <= now:
+            if len(queue) < SCHED_DEPTH:
+                queue.append(fires[i])
+            i += 1
+        nominal, index = queue.pop(0)
+        name, period, read_ms = CHANNELS[index]
+        taken[name].append((nominal, now))
+        now += read_ms
+    return taken
+
+
+def run_core1(blocked_locks, end_ms):
+    """The real Acquisition loop on a virtual clock"""
+    clock = [0.0]
+    acquisition.ticks_ms = lambda: int(clock[0])
+
+    def sleep(ms):
+        clock[0] += ms
+
+    acquisition.sleep_ms = sleep
+    tasks = Acquisition()
+    taken = {}
+    lock_i = [0]
+
+    def reader(name, read_ms):
+        record = taken.setdefault(name, [])
+
+        def read_into(values):
+            # Waits for core 0 if it holds a lock, then reads the sensor
+            t, lock_i[0] = free_at(blocked_locks, clock[0], lock_i[0])
+            clock[0] = t
+            record.append(clock[0])
+            clock[0] += read_ms
+            values[0] = 1
+            return True
+        return read_into
+
+    for name, period, read_ms in CHANNELS:
+        tasks.add(name, reader(name, read_ms), period, width=1)
+    # No thread here: step() is driven on the virtual clock, all channels due at 0
+    while clock[0] < end_ms:
+        wait = tasks.step()
+        clock[0] += 0.02  # Loop overhead
+        if wait > 0:
+            # sleep_ms(wait) from a clock that had ms fractions: wake on the tick
+            clock[0] = int(clock[0]) + wait
+    result = {}
+    for name, period, _ in CHANNELS:
+        times = taken[name]
+        start = times[0]
+        result[name] = [(start + round((t - start) / period) * period, t) for t in times]
+    return result
+
+
+def core0_locks(rng, end_ms):
+    """When core 0 holds the buffer lock (drains) or the bus lock (check_frames)"""
+    held = []
+    t = DRAIN_MS
+    while t < end_ms:
+        # Copying 20 moisture and 10 air samples out of the rings
+        held.append((t, t + 30 * 0.012))
+        t += DRAIN_MS
+    t = CHECK_FRAMES_MS + 3
+    while t < end_ms:
+        held.append((t, t + rng.uniform(0.05, 0.3)))
+        t += CHECK_FRAMES_MS
+    held.sort()
+    return held
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def report(label, taken, end_ms):
+    print(f"{label}:")
+    print(f"  {'channel':<9} {'samples':>8} {'lost':>6} {'late p50':>9} {'late p99':>9} {'late max':>9} "
+          f"{'interval min..max':>18}")
+    for name, period, _ in CHANNELS:
+        pairs = taken[name]
+        late = sorted(actual - nominal for nominal, actual in pairs)
+        actual = [a for _, a in pairs]
+        gaps = [b - a for a, b in zip(actual, actual[1:])]
+        expected = int(end_ms // period)
+        print(f"  {name:<9} {len(pairs):>8} {expected - len(pairs):>6} "
+              f"{percentile(late, 0.5):>7.2f}ms {percentile(late, 0.99):>7.2f}ms {late[-1]:>7.2f}ms "
+              f"{min(gaps):>7.2f}..{max(gaps):>7.2f}ms")
+    print()
+
+
+def threaded_check():
+    """The loop on a real thread: every sample arrives once, in order"""
+    acquisition.ticks_ms = compat.ticks_ms
+    acquisition.sleep_ms = compat.sleep_ms
+    counter = [0]
+
+    def read_into(values):
+        counter[0] += 1
+        values[0] = counter[0] & 0xFFFF
+        return True
+
+    tasks = Acquisition()
+    buffer = tasks.add("counter", read_into, 2, capacity=32)
+    tasks.start()
+    received = []
+    deadline = time.monotonic() + 1.0
+    while time.monotonic() < deadline:
+        time.sleep(0.02)
+        n = buffer.drain()
+        received.extend(buffer.out[i] for i in range(n))
+    stopped = tasks.stop()
+    n = buffer.drain()
+    received.extend(buffer.out[i] for i in range(n))
+    gaps = sum(1 for a, b in zip(received, received[1:]) if b != a + 1)
+    ok = stopped and gaps == buffer.overflows == 0 and len(received) == counter[0]
+    print(f"Threaded loop: {counter[0]} reads, {len(received)} drained, {gaps} gaps, "
+          f"{buffer.overflows} overflows, stopped {stopped}: {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    end_ms = SECONDS * 1000
+    rng = random.Random(5)
+    blocked = core0_load(rng, end_ms)
+    busy = sum(end - start for start, end in blocked) / end_ms
+    print(f"{SECONDS} s, core 0 blocked {100 * busy:.0f}% of the time by uploads and GC\n")
+    report("core 0 (machine.Timer soft callbacks)", run_core0(blocked, end_ms), end_ms)
+    report("core 1 (acquisition loop)", run_core1(core0_locks(rng, end_ms), end_ms), end_ms)
+    if not threaded_check():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# bench_as7341.py
+# Host-side comparison of AS7341 spectral reads on a virtual clock:
+#
+#   old:    per-channel access (register write + 2-byte read for each of 12
+#           channels) with the fixed SMUX/integration sleeps and 10 ms
+#           status polling, all blocking the CPU
+#   driver: one 12-byte burst per bank, SMUXEN completion instead of sleeps,
+#           and start()/poll() so the CPU is free while the sensor integrates
+#
+# A fake AS7341 models integration time and wire time at the bus clock, and
+# counts transactions. Reports bus work per reading, the sample rate each
+# approach can sustain, and how much of the CPU is left idle. A last run
+# drives FifoCapture (autonomous cycling into the on-chip FIFO) to show the
+# high-rate capture path.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_as7341.py [bus_hz]
+
+import sys
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+import as7341  # noqa: E402
+from as7341 import AS7341, FifoCapture  # noqa: E402
+from compat import ticks_us, ticks_diff  # noqa: E402
+
+READINGS = 50
+REPORT_INTERVAL_MS = 5000
+CAPTURE_SECONDS = 60
+CAPTURE_SAMPLE_MS = 10
+
+
+class FakeAS7341Bus:
+    """Register-file stand-in for an AS7341 on a virtual millisecond clock"""
+
+    def __init__(self, freq=100000):
+        self.bit_ms = 1000 / freq
+        self.now = 0.0
+        self.integration_ms = as7341.integration_ms()
+        self.sp_started_at = None
+        self.regs = bytearray(256)
+        self.regs[as7341.REG_ID] = 0x09
+        for ch in range(6):
+            value = 1000 * (ch + 1) + 7
+            self.regs[as7341.REG_CH0_DATA_L + 2 * ch] = value & 0xFF
+            self.regs[as7341.REG_CH0_DATA_L + 2 * ch + 1] = value >> 8
+        self.pointer = 0
+        self.fifo = []
+        self.cycles_done = 0
+        self.fifo_dropped = 0
+        self.transactions = 0
+        self.wire_ms = 0.0
+
+    def _cycle_ms(self):
+        atime = self.regs[as7341.REG_ATIME]
+        astep = self.regs[as7341.REG_ASTEP_L] | (self.regs[as7341.REG_ASTEP_H] << 8)
+        cycle = (atime + 1) * (astep + 1) * 0.00278
+        if self.regs[as7341.REG_ENABLE] & as7341.ENABLE_WEN:
+            cycle += (self.regs[as7341.REG_WTIME] + 1) * 2.78
+        return cycle
+
+    def _fill_fifo(self):
+        """Push one FIFO entry set per completed cycle while autonomous cycling runs"""
+        if self.sp_started_at is None or not self.regs[as7341.REG_FIFO_MAP]:
+            return
+        cycles = int((self.now - self.sp_started_at) / self._cycle_ms())
+        while self.cycles_done < cycles:
+            self.cycles_done += 1
+            if len(self.fifo) + 6 > as7341.FIFO_WORDS:
+                self.fifo_dropped += 1
+                continue
+            for ch in range(6):
+                # A little flicker so min/max differ from the mean
+                self.fifo.append(1000 * (ch + 1) + (self.cycles_done * 7) % 50)
+
+    def _wire(self, nbytes, restarts=0):
+        # Each byte is 8 bits + ACK; START/STOP (and repeated STARTs) add a bit each
+        ms = (9 * nbytes + 2 + restarts) * self.bit_ms
+        self.transactions += 1
+        self.wire_ms += ms
+        self.now += ms
+
+    def _write(self, reg, value):
+        if reg == as7341.REG_ENABLE:
+            # SMUXEN completes immediately; setting SP_EN starts integrating
+            if value & as7341.ENABLE_SP_EN:
+                self.sp_started_at = self.now
+                self.cycles_done = 0
+            else:
+                self.sp_started_at = None
+            value &= ~as7341.ENABLE_SMUXEN
+        elif reg == as7341.REG_FIFO_CONTROL and value & as7341.FIFO_CLR:
+            self.fifo = []
+            return
+        self.regs[reg] = value
+
+    def _read(self, reg, n):
+        self._fill_fifo()
+        if reg == as7341.REG_FIFO_LVL:
+            return bytes([len(self.fifo)])
+        if reg == as7341.REG_FDATA_L:
+            words, self.fifo = self.fifo[:n // 2], self.fifo[n // 2:]
+            return b"".join(bytes([w & 0xFF, w >> 8]) for w in words)
+        if reg == as7341.REG_STATUS:
+            done = self.sp_started_at is not None and self.now >= self.sp_started_at + self.integration_ms
+            self.regs[reg] = as7341.STATUS_AVALID if done else 0
+        return bytes(self.regs[reg:reg + n])
+
+    def writeto(self, addr, buf):
+        self._wire(1 + len(buf))
+        self.pointer = buf[0]
+        if len(buf) > 1:
+            self._write(buf[0], buf[1])
+
+    def readfrom(self, addr, n):
+        self._wire(1 + n)
+        return self._read(self.pointer, n)
+
+    def writeto_mem(self, addr, reg, buf):
+        self._wire(2 + len(buf))
+        self._write(reg, buf[0])
+
+    def readfrom_mem_into(self, addr, reg, buf):
+        self._wire(3 + len(buf), restarts=1)
+        buf[:] = self._read(reg, len(buf))
+
+
+def legacy_read(bus):
+    """The old read_spectral_data, sleeps included; returns CPU-blocked ms"""
+    start = bus.now
+
+    def sleep(ms):
+        bus.now += ms
+
+    def write_reg(reg, value):
+        bus.writeto(as7341.AS7341_ADDR, bytes([reg, value]))
+
+    def read_reg(reg):
+        bus.writeto(as7341.AS7341_ADDR, bytes([reg]))
+        return bus.readfrom(as7341.AS7341_ADDR, 1)[0]
+
+    def read_word(reg):
+        bus.writeto(as7341.AS7341_ADDR, bytes([reg]))
+        data = bus.readfrom(as7341.AS7341_ADDR, 2)
+        return data[0] | (data[1] << 8)
+
+    for bank in (0, 1):
+        write_reg(as7341.REG_CONFIG, 0x01)
+        sleep(10)
+        write_reg(as7341.REG_SMUX_CMD, 0x10 if bank == 0 else 0x20)
+        write_reg(as7341.REG_SMUX_CMD, 0x11 if bank == 0 else 0x21)
+        sleep(50)
+        write_reg(as7341.REG_CONFIG, 0x00)
+        sleep(50)
+        write_reg(as7341.REG_ENABLE, read_reg(as7341.REG_ENABLE) | 0x03)
+        sleep(100)
+        while (read_reg(as7341.REG_STATUS) & 0x08) == 0:
+            sleep(10)
+        for ch in range(6):
+            read_word(as7341.REG_CH0_DATA_L + 2 * ch)
+    # Every millisecond of it blocked the main loop
+    return bus.now - start
+
+
+def make_driver_read(bus):
+    sensor = AS7341(bus)
+
+    def read():
+        """One reading through start()/poll(); returns CPU-blocked ms (bus work only)"""
+        wire_before = bus.wire_ms
+        sensor.start(int(bus.now))
+        while sensor.poll(int(bus.now)) is None:
+            # The main loop sleeps (or does other work) until the sensor needs it
+            bus.now += sensor.ms_until_ready(int(bus.now)) or 1
+        return bus.wire_ms - wire_before
+
+    return read
+
+
+def run(name, bus, read):
+    blocked = 0.0
+    start = bus.now
+    for _ in range(READINGS):
+        blocked += read()
+    elapsed = (bus.now - start) / READINGS
+    blocked /= READINGS
+    print(f"{name}:")
+    print(f"  {bus.transactions / READINGS:5.1f} transactions, {bus.wire_ms / READINGS:5.2f} ms bus time per reading")
+    print(f"  {elapsed:.1f} ms per reading -> max {1000 / elapsed:4.2f} readings/s")
+    print(f"  CPU blocked {blocked:.1f} ms per reading: idle {100 * (1 - blocked / elapsed):5.1f}% "
+          f"when sampling flat out, {100 * (1 - blocked / REPORT_INTERVAL_MS):5.1f}% at one reading per "
+          f"{REPORT_INTERVAL_MS // 1000} s")
+
+
+def run_capture(freq):
+    """FifoCapture for CAPTURE_SECONDS, drained as late as it safely can be"""
+    bus = FakeAS7341Bus(freq)
+    bus.regs[as7341.REG_ASTEP_L] = as7341.ASTEP & 0xFF
+    bus.regs[as7341.REG_ASTEP_H] = as7341.ASTEP >> 8
+    capture = FifoCapture(AS7341(bus), bank=0)
+    capture.start(CAPTURE_SAMPLE_MS)
+
+    drains, drain_us, windows = 0, 0, 0
+    next_report = REPORT_INTERVAL_MS
+    wire_start = bus.wire_ms
+    next_drain = 0
+    while bus.now < CAPTURE_SECONDS * 1000:
+        # Drains are scheduled on a fixed cadence, like the main loop does
+        next_drain += capture.drain_interval_ms()
+        bus.now = max(bus.now, next_drain)
+        start = ticks_us()
+        capture.drain()
+        drain_us += ticks_diff(ticks_us(), start)
+        drains += 1
+        if bus.now >= next_report:
+            stats = capture.window_stats()
+            windows += 1
+            next_report += REPORT_INTERVAL_MS
+    wire_ms = bus.wire_ms - wire_start
+    name, (mean, low, high) = next(iter(stats.items()))
+
+    print(f"\nFIFO capture, bank 0 every {capture.cycle_ms} ms for {CAPTURE_SECONDS} s:")
+    print(f"  {capture.samples / CAPTURE_SECONDS:.1f} samples/s, {capture.overflows} full-FIFO drains, "
+          f"{bus.fifo_dropped} cycles dropped")
+    print(f"  {drains} drains every {capture.drain_interval_ms()} ms, {wire_ms / CAPTURE_SECONDS:.1f} ms bus time/s "
+          f"(CPU idle {100 * (1 - wire_ms / (CAPTURE_SECONDS * 1000)):.1f}%)")
+    print(f"  host decode {drain_us / max(1, capture.samples):.1f} us/sample; "
+          f"{windows} uploads of mean/min/max, e.g. {name}: {mean:.1f} [{low}..{high}]")
+
+
+def main():
+    freq = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"{READINGS} spectral readings (both banks) at {freq // 1000} kHz, "
+          f"{as7341.integration_ms()} ms integration per bank\n")
+
+    bus = FakeAS7341Bus(freq)
+    run("Per-channel reads, fixed sleeps", bus, lambda: legacy_read(bus))
+    bus = FakeAS7341Bus(freq)
+    run("Burst reads, start()/poll()", bus, make_driver_read(bus))
+    run_capture(freq)
+
+
+if __name__ == "__main__":
+    main()
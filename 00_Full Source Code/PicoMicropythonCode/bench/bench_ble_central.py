@@ -0,0 +1,333 @@
+# bench_ble_central.py
+# Host-side model of GATT connections to LYWSD03MMC thermometers:
+#
+#   old:      the previous XiaoMiTemp connect mode: one device; after a drop,
+#             scan until it advertises, connect (waiting for another
+#             advertisement), discover every characteristic, write the CCCD
+#   central:  BLECentral: direct gap_connect() to the known MAC, cached
+#             handles so a reconnect is one CCCD write, and round-robin
+#             turns when there are more thermometers than connection slots
+#
+# A fake BLE stack on a virtual clock schedules the IRQ events a Pico W
+# would see. Thermometers advertise every ADV_INTERVAL_MS and notify every
+# NOTIFY_INTERVAL_MS once subscribed. Each ATT request/response takes two
+# connection intervals. Discovery walks the LYWSD03MMC's characteristics,
+# which need about 20 round trips. Links drop at random. The advertising
+# interval and GATT table size are assumptions, so the absolute times are
+# approximate, but both approaches pay the same costs.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_ble_central.py [thermometers]
+
+import heapq
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+import ble_central  # noqa: E402
+from ble_central import BLECentral, UUID, UUID_TEMP_HUMIDITY, UUID_CCCD  # noqa: E402
+
+SECONDS = 3600
+ADV_INTERVAL_MS = 1600  # Assumed stock advertising interval
+CONN_INTERVAL_MS = 30
+ATT_ROUND_TRIP_MS = 2 * CONN_INTERVAL_MS
+NOTIFY_INTERVAL_MS = 6000
+DROP_MEAN_S = 300  # Mean time between link drops on a busy 2.4 GHz band
+LOOP_MS = 1000  # Main-loop pass: poll() and queue draining
+DISCOVERY_ROUND_TRIPS = 20  # 16-bit UUIDs pack 3 per response, 128-bit ones 1
+OLD_CCCD = 0x0038  # Hard-coded in the old connect mode
+OUT_OF_RANGE = (1200000, 2400000)  # Last thermometer unreachable for 20 min
+
+_IRQ_SCAN_RESULT = 5
+
+
+class FakeThermometer:
+    def __init__(self, mac, rng):
+        self.mac = mac
+        self.addr = bytes.fromhex(mac)
+        self.phase = rng.uniform(0, ADV_INTERVAL_MS)
+        self.conn_handle = None
+        self.subscribed = False
+        self.out_of_range = None
+        self.drops = []  # Times the link dropped
+        self.restored = []  # Times notifications were (re)enabled
+        self.notified = []  # Times a notification was delivered
+
+    def in_range(self, now):
+        return self.out_of_range is None or not self.out_of_range[0] <= now < self.out_of_range[1]
+
+    def next_adv(self, now):
+        """First advertisement at or after now"""
+        k = max(0, int((now - self.phase) // ADV_INTERVAL_MS) + 1)
+        return self.phase + k * ADV_INTERVAL_MS
+
+
+class FakeBLE:
+    """Event-scheduling stand-in for the Pico W's bluetooth.BLE"""
+
+    def __init__(self, thermometers, rng, max_connections):
+        self.devices = {t.addr: t for t in thermometers}
+        self.rng = rng
+        self.max_connections = max_connections
+        self.now = 0.0
+        self.events = []
+        self.seq = 0
+        self.handler = None
+        self.next_handle = 64
+        self.links = {}  # conn_handle -> thermometer
+        self.pending_connect = None  # Generation of the outstanding gap_connect()
+        self.scanning = False
+        self.gattc_ops = 0
+
+    def at(self, when, fn, *args):
+        self.seq += 1
+        heapq.heappush(self.events, (when, self.seq, fn, args))
+
+    def irq(self, event, data):
+        self.handler(event, data)
+
+    def run_until(self, end):
+        while self.events and self.events[0][0] <= end:
+            when, _, fn, args = heapq.heappop(self.events)
+            self.now = when
+            fn(*args)
+        self.now = end
+
+    # Central-side API used by BLECentral and the old handler
+
+    def gap_scan(self, duration_ms, interval_us=1280000, window_us=11250, active=False):
+        self.scanning = duration_ms is not None
+        if self.scanning:
+            for t in self.devices.values():
+                if t.conn_handle is None and t.in_range(self.now):
+                    self.at(t.next_adv(self.now), self._advertise, t)
+
+    def _advertise(self, t):
+        if self.scanning and t.conn_handle is None and t.in_range(self.now):
+            self.irq(_IRQ_SCAN_RESULT, (0, memoryview(t.addr), 0, -70, memoryview(b"\x02\x01\x06")))
+            self.at(t.next_adv(self.now + 1), self._advertise, t)
+
+    def gap_connect(self, addr_type, addr=None, scan_duration_ms=2000):
+        if addr_type is None:
+            self.pending_connect = None
+            return
+        if self.pending_connect is not None or len(self.links) >= self.max_connections:
+            raise OSError(16)  # EBUSY, as the stack reports it
+        t = self.devices[bytes(addr)]
+        self.seq += 1
+        generation = self.pending_connect = self.seq
+        # The controller waits for the device's next connectable advertisement
+        when = t.next_adv(self.now) + 2 * CONN_INTERVAL_MS
+        if t.in_range(when) and when - self.now <= scan_duration_ms:
+            self.at(when, self._connected, t, generation)
+        else:
+            self.at(self.now + scan_duration_ms, self._connect_timeout, t, generation)
+
+    def _connected(self, t, generation):
+        if self.pending_connect != generation:
+            return
+        self.pending_connect = None
+        handle = self.next_handle
+        self.next_handle += 1
+        t.conn_handle = handle
+        self.links[handle] = t
+        self.at(self.now + self.rng.expovariate(1 / (DROP_MEAN_S * 1000)), self._drop, t, handle)
+        self.irq(7, (handle, 0, memoryview(t.addr)))
+
+    def _connect_timeout(self, t, generation):
+        if self.pending_connect != generation:
+            return
+        self.pending_connect = None
+        self.irq(8, (0xFFFF, 0, memoryview(t.addr)))
+
+    def _drop(self, t, handle):
+        if t.conn_handle != handle:
+            return
+        t.drops.append(self.now)
+        self._close(t, handle)
+
+    def _close(self, t, handle):
+        t.conn_handle = None
+        t.subscribed = False
+        del self.links[handle]
+        self.irq(8, (handle, 0, memoryview(t.addr)))
+
+    def gap_disconnect(self, conn_handle):
+        t = self.links.get(conn_handle)
+        if t is None:
+            return False
+        self.at(self.now + CONN_INTERVAL_MS, self._disconnected, t, conn_handle)
+        return True
+
+    def _disconnected(self, t, handle):
+        if t.conn_handle == handle:
+            self._close(t, handle)
+
+    def _gatt(self, conn_handle, round_trips, fn, *args):
+        self.gattc_ops += 1
+        self.at(self.now + round_trips * ATT_ROUND_TRIP_MS, self._gatt_done, conn_handle, fn, args)
+
+    def _gatt_done(self, conn_handle, fn, args):
+        if conn_handle in self.links:
+            fn(*args)
+
+    def gattc_discover_characteristics(self, conn_handle, start, end):
+        def done():
+            self.irq(11, (conn_handle, 0x0038, 0x0036, 0x12, UUID_TEMP_HUMIDITY))
+            self.irq(12, (conn_handle, 0))
+        self._gatt(conn_handle, DISCOVERY_ROUND_TRIPS, done)
+
+    def gattc_discover_descriptors(self, conn_handle, start, end):
+        def done():
+            self.irq(13, (conn_handle, 0x0037, UUID(0x2901)))
+            self.irq(13, (conn_handle, 0x0038, UUID_CCCD))
+            self.irq(14, (conn_handle, 0))
+        self._gatt(conn_handle, 1, done)
+
+    def gattc_write(self, conn_handle, value_handle, data, mode=0):
+        t = self.links[conn_handle]
+
+        def done():
+            ok = value_handle == 0x0038
+            if ok:
+                t.subscribed = True
+                t.restored.append(self.now)
+                # The first notification follows within one measurement interval
+                self.at(self.now + self.rng.uniform(200, NOTIFY_INTERVAL_MS), self._notify, t, conn_handle)
+            if mode == 1:
+                self.irq(17, (conn_handle, value_handle, 0 if ok else 0x01))
+        self._gatt(conn_handle, 1 if mode == 1 else 0.5, done)
+
+    def _notify(self, t, handle):
+        if t.conn_handle != handle or not t.subscribed:
+            return
+        t.notified.append(self.now)
+        self.irq(18, (handle, 0x0036, memoryview(b"\x1c\x09\x30\x8e\x0b")))
+        self.at(self.now + NOTIFY_INTERVAL_MS, self._notify, t, handle)
+
+
+class OldHandler:
+    """The previous XiaoMiTemp connect-mode IRQ handler, for one device"""
+
+    def __init__(self, ble, mac):
+        self.ble = ble
+        self.mac = mac
+        self.conn_handle = None
+
+    def start_scan(self):
+        self.ble.gap_scan(0, 30000, 30000)
+
+    def irq(self, event, data):
+        if event == 5:
+            addr = bytes(data[1])
+            if addr.hex() == self.mac:
+                self.ble.gap_scan(None)
+                self.ble.gap_connect(0, addr)
+        elif event == 7:
+            self.conn_handle = data[0]
+            self.ble.gattc_discover_characteristics(self.conn_handle, 0x0001, 0xFFFF)
+        elif event == 8:
+            self.start_scan()
+        elif event == 12:
+            self.ble.gattc_write(self.conn_handle, OLD_CCCD, b"\x01\x00")
+
+
+def outages(t):
+    """Drop -> notifications enabled again, in ms, for each drop"""
+    result = []
+    for drop in t.drops:
+        later = [r for r in t.restored if r > drop]
+        if later:
+            result.append(later[0] - drop)
+    return result
+
+
+def gaps(t, end):
+    """Longest stretch without a notification, in s"""
+    times = [0.0] + t.notified + [end]
+    return max(b - a for a, b in zip(times, times[1:])) / 1000
+
+
+def thermometers(count, rng):
+    return [FakeThermometer("a4c138%06x" % (0x100000 + n * 0x1111), rng) for n in range(count)]
+
+
+def run_old():
+    rng = random.Random(1)
+    devices = thermometers(1, rng)
+    ble = FakeBLE(devices, rng, 1)
+    handler = OldHandler(ble, devices[0].mac)
+    ble.handler = handler.irq
+    handler.start_scan()
+    ble.run_until(SECONDS * 1000)
+    return devices, ble
+
+
+def run_central(count, max_connections, handles_file, out_of_range=False):
+    rng = random.Random(1)
+    devices = thermometers(count, rng)
+    if out_of_range:
+        devices[-1].out_of_range = OUT_OF_RANGE
+    ble = FakeBLE(devices, rng, max_connections)
+    central = BLECentral(ble, [t.mac for t in devices], max_connections, handles_file=handles_file)
+    central.restore()
+    ble.handler = lambda event, data: central.irq(event, data, int(ble.now))
+    central.start(0)
+
+    def loop():
+        central.poll(int(ble.now))
+        while central.queue.get() is not None:
+            pass
+        ble.at(ble.now + LOOP_MS, loop)
+
+    ble.at(LOOP_MS, loop)
+    ble.run_until(SECONDS * 1000)
+    return devices, ble, central
+
+
+def describe(values):
+    if not values:
+        return "   -"
+    return f"avg {sum(values) / len(values):6.0f} ms, max {max(values):6.0f} ms"
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    handles_file = os.path.join(tempfile.mkdtemp(), "ble_handles.json")
+    print(f"{SECONDS // 60} min, advertising every {ADV_INTERVAL_MS} ms, {CONN_INTERVAL_MS} ms connection "
+          f"interval, links drop every {DROP_MEAN_S} s on average\n")
+
+    print("One thermometer, link drop -> notifications enabled again:")
+    devices, ble = run_old()
+    out = outages(devices[0])
+    print(f"  old (rescan + rediscover): {len(out):3} drops, {describe(out)}, "
+          f"longest without a reading {gaps(devices[0], SECONDS * 1000):5.1f} s")
+    devices, ble, central = run_central(1, 1, handles_file)
+    out = outages(devices[0])
+    stats = central.stats()[devices[0].mac]
+    print(f"  central (direct, cached):  {len(out):3} drops, {describe(out)}, "
+          f"longest without a reading {gaps(devices[0], SECONDS * 1000):5.1f} s")
+    print(f"  central stats: {stats['connects']} connects, {stats['discoveries']} discovery, "
+          f"gap_connect -> subscribed avg {stats['latency_ms_avg']} ms "
+          f"(cached {stats['latency_ms_cached_avg']} ms), max {stats['latency_ms_max']} ms")
+    print(f"  handles cached in flash: {open(handles_file).read()}")
+
+    for slots in (1, 2):
+        print(f"\n{count} thermometers, {slots} connection slot(s), last one out of range "
+              f"{OUT_OF_RANGE[0] // 60000}-{OUT_OF_RANGE[1] // 60000} min:")
+        os.remove(handles_file)
+        devices, ble, central = run_central(count, slots, handles_file, out_of_range=True)
+        stats = central.stats()
+        for t in devices:
+            s = stats[t.mac]
+            print(f"  {t.mac}: {len(t.notified):4} readings, longest gap {gaps(t, SECONDS * 1000):6.1f} s, "
+                  f"{s['connects']:4} connects ({s['discoveries']} discovery, {s['failures']} failed), "
+                  f"latency avg {s['latency_ms_cached_avg']} ms")
+        print(f"  GATT requests: {ble.gattc_ops}, turn: {ble_central.READINGS_PER_TURN} reading or "
+              f"{ble_central.DWELL_MS // 1000} s")
+
+
+if __name__ == "__main__":
+    main()
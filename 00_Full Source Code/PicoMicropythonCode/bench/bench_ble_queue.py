@@ -0,0 +1,120 @@
+# bench_ble_queue.py
+# Host-side model of BLE notification handling on the sensor Pico:
+#
+#   old:    the IRQ handler decodes, prints and does the HTTPS upload itself,
+#           so the BLE stack is stuck for the whole post; events arriving
+#           meanwhile wait in the stack's small event buffer or are lost
+#   queue:  the IRQ handler copies the payload into NotificationQueue and
+#           returns; the main loop uploads between its other work
+#
+# Notifications arrive at a fixed interval on a virtual clock, uploads take
+# POST_MS_MIN..POST_MS_MAX (an HTTPS post from the Pico W), and the main
+# loop also uploads moisture and air velocity every pass. The bench reports
+# notifications lost, how long the BLE stack is blocked per event, and the
+# delay from notification to upload. The queue's own IRQ cost is timed for
+# real on this host.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_ble_queue.py [stack_events]
+
+import random
+import sys
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+from compat import ticks_us  # noqa: E402
+from ble_queue import NotificationQueue  # noqa: E402
+
+SECONDS = 600
+INTERVALS_MS = [500, 1000, 2000, 6000]  # LYWSD03MMC notifies about every 6 s
+POST_MS_MIN = 400
+POST_MS_MAX = 1500
+LOOP_SLEEP_MS = 1000
+OTHER_POSTS = 2  # Moisture and air velocity uploads per main-loop pass
+PAYLOAD = bytes([0x1C, 0x09, 0x30, 0x8E, 0x0B])  # 23.32 C, 48%, 2.958 V
+
+
+def old_handler(interval, stack_events, rng):
+    """Upload inside the IRQ; returns (lost, total, max blocked ms, mean delay ms)"""
+    busy_until = 0
+    waiting = []
+    delays = []
+    lost = 0
+    blocked = 0
+    arrivals = range(0, SECONDS * 1000, interval)
+    for arrival in arrivals:
+        # Let the handler work through what was waiting before this arrival
+        while waiting and busy_until <= arrival:
+            first = waiting.pop(0)
+            start = max(busy_until, first)
+            post = rng.uniform(POST_MS_MIN, POST_MS_MAX)
+            busy_until = start + post
+            blocked = max(blocked, post)
+            delays.append(start - first)
+        if busy_until > arrival and len(waiting) >= stack_events:
+            lost += 1
+        else:
+            waiting.append(arrival)
+    return lost, len(arrivals), blocked, sum(delays) / max(1, len(delays))
+
+
+def queued_handler(interval, rng):
+    """Queue in the IRQ, upload in the main loop; returns (lost, total, mean delay ms, queue)"""
+    queue = NotificationQueue()
+    arrivals = list(range(0, SECONDS * 1000, interval))
+    arrived_at = []
+    delays = []
+    nxt = 0
+    t = 0.0
+
+    def deliver(now):
+        nonlocal nxt
+        while nxt < len(arrivals) and arrivals[nxt] <= now:
+            if queue.put(0x36, PAYLOAD):
+                arrived_at.append(arrivals[nxt])
+            nxt += 1
+
+    while t < SECONDS * 1000:
+        deliver(t)
+        while queue.get() is not None:
+            delays.append(t - arrived_at.pop(0))
+            t += rng.uniform(POST_MS_MIN, POST_MS_MAX)
+            deliver(t)
+        for _ in range(OTHER_POSTS):
+            t += rng.uniform(POST_MS_MIN, POST_MS_MAX)
+            deliver(t)
+        t += LOOP_SLEEP_MS
+    return queue.dropped, len(arrivals), sum(delays) / max(1, len(delays)), queue
+
+
+def irq_cost():
+    """Real host time of the new IRQ path: put() plus irq_done()"""
+    queue = NotificationQueue()
+    data = memoryview(bytearray(PAYLOAD))
+    for _ in range(20000):
+        start = ticks_us()
+        queue.put(0x36, data)
+        queue.irq_done(start)
+        queue.get()
+    return queue
+
+
+def main():
+    stack_events = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    print(f"{SECONDS} s per run, uploads {POST_MS_MIN}-{POST_MS_MAX} ms, stack buffers "
+          f"{stack_events} event(s) while the IRQ handler is busy\n")
+    print(f"{'interval':>9} | {'upload in IRQ: lost':>20} {'blocked':>9} {'delay':>8} |"
+          f" {'queued: lost':>13} {'blocked':>9} {'delay':>8}")
+    queue = irq_cost()
+    stats = queue.stats()
+    for interval in INTERVALS_MS:
+        lost, total, blocked, delay = old_handler(interval, stack_events, random.Random(1))
+        q_lost, q_total, q_delay, _ = queued_handler(interval, random.Random(1))
+        print(f"{interval:>7}ms | {lost:>5}/{total:<5} {100 * lost / total:5.1f}%  {blocked:6.0f} ms {delay:6.0f}ms |"
+              f" {q_lost:>4}/{q_total:<5} {100 * q_lost / q_total:3.0f}% {stats['irq_us_max'] / 1000:6.3f} ms"
+              f" {q_delay:6.0f}ms")
+    print(f"\nQueued IRQ path on this host: {queue.irq_us_total / queue.irq_count:.2f} us average, "
+          f"{stats['irq_us_max']} us worst over {stats['irq_count']} calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# bench_boot.py
+# Host-side model of the time from power-on to the first reading, before and
+# after precompiling the firmware (tools/build_mpy.py), lazy imports and
+# overlapping the sensors' warm-up with Wi-Fi association:
+#
+#   before:  every .py is compiled on the Pico at each boot, sensorPico1
+#            imports all its BLE, core 1 and duty-cycle modules whatever
+#            the configuration, the intro blinks take 1.2 s, Wi-Fi is
+#            polled once a second, and the sensors (the SCD41 with its 5 s
+#            to a first sample) are only started once it's connected.
+#   .mpy:    the modules are loaded as bytecode, configurations import only
+#            what they use, the LED just stays on during setup, Wi-Fi
+#            associates while the sensors start and is polled every 100 ms.
+#   frozen:  the same with the modules frozen into the firmware image.
+#
+# Source sizes and import graphs are the real ones (lib modules imported at
+# module level count, plus the lazy ones the default configuration loads).
+# The per-KB costs and Wi-Fi and upload times are rough RP2040 figures, so
+# compare rows rather than trusting the absolute numbers; on a Pico, build
+# with --timeline to get the real table from lib/boot_timeline.py. The
+# sensorPico2 timelines below are that same class, on a virtual clock.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_boot.py
+
+import os
+import sys
+import tempfile
+
+ROOT = __file__.rsplit("/", 2)[0]
+sys.path.insert(0, ROOT + "/lib")
+sys.path.insert(0, ROOT + "/tools")
+
+from as7341 import integration_ms  # noqa: E402
+from boot_timeline import BootTimeline  # noqa: E402
+from build_mpy import LIB, lib_imports  # noqa: E402
+
+INTERPRETER_MS = 300  # Reset to main.py: clocks, flash filesystem mount
+MS_PER_KB = {"source": 25.0, ".mpy": 3.0, "frozen": 0.5}  # Compile, or load, per KB of source
+SETUP_MS = 40  # Module-level driver objects
+BLINK_MS = 1200  # The old 3 intro blinks
+WIFI_ASSOCIATE_MS = 2450  # Association, WPA2 handshake and DHCP
+WIFI_POLL_MS = {"before": 1000, "after": 100}
+CO2_INIT_MS = 120  # SCD41 presence check, bus negotiation, start command
+SPECTRO_INIT_MS = 90
+SCD41_FIRST_SAMPLE_MS = 5000
+UPLOAD_MS = 900  # DNS, TLS handshake and the POST
+
+SCRIPTS = ("sensorPico1_temp+soil+air.py", "sensorPico2_co2+light.py", "actuatorPico.py")
+# Imported at module level before this change
+FORMERLY_EAGER = {"sensorPico1_temp+soil+air.py": ("xiaomi_adv", "ble_central", "acquisition", "duty_cycle")}
+# Imported lazily by the default configuration (BLE_MODE "scan", CORE1_SAMPLING)
+DEFAULT_LAZY = {"sensorPico1_temp+soil+air.py": ("xiaomi_adv", "acquisition")}
+
+
+def closure(names):
+    """names and the lib modules they import at module level"""
+    found = list(names)
+    for name in names:
+        for other in lib_imports(os.path.join(LIB, name + ".py"), top_level_only=True):
+            if other not in found:
+                found.append(other)
+    return found
+
+
+def kb(path):
+    return os.path.getsize(path) / 1024
+
+
+def lib_kb(modules):
+    return sum(kb(os.path.join(LIB, module + ".py")) for module in modules)
+
+
+def module_kb(script):
+    """KB of source loaded at boot: (main script, lib modules before, lib modules after)"""
+    now = lib_imports(os.path.join(ROOT, script), top_level_only=True)
+    before = closure([m for m in now if m != "boot_timeline"] + list(FORMERLY_EAGER.get(script, ())))
+    after = closure(now + list(DEFAULT_LAZY.get(script, ())))
+    return kb(os.path.join(ROOT, script)), lib_kb(before), lib_kb(after)
+
+
+def import_table():
+    print("Compiling or loading the firmware at boot:")
+    print(f"  {'script':<30} {'main KB':>8} {'lib KB':>14} {'before':>8} {'.mpy':>8} {'frozen':>8}")
+    for script in SCRIPTS:
+        main_kb, before_kb, after_kb = module_kb(script)
+        before = (main_kb + before_kb) * MS_PER_KB["source"]
+        mpy = (main_kb + after_kb) * MS_PER_KB[".mpy"]
+        frozen = (main_kb + after_kb) * MS_PER_KB["frozen"]
+        print(f"  {script:<30} {main_kb:>8.1f} {before_kb:>6.1f} -> {after_kb:>4.1f} "
+              f"{before:>6.0f}ms {mpy:>6.0f}ms {frozen:>6.0f}ms")
+    print()
+
+
+def wifi_ready(started, now, poll_ms):
+    """When a Wi-Fi wait that began at now notices the association that began at started"""
+    done = started + WIFI_ASSOCIATE_MS
+    if done <= now:
+        return now
+    return now + -(-(done - now) // poll_ms) * poll_ms
+
+
+def boot_sensorpico2(variant, path):
+    """sensorPico2's boot; returns (timeline, first reading ms, first CO2 reading ms)"""
+    main_kb, before_kb, after_kb = module_kb("sensorPico2_co2+light.py")
+    cost = MS_PER_KB["source" if variant == "before" else variant]
+    t = INTERPRETER_MS + main_kb * cost
+    boot = BootTimeline(True, path, now=round(t))
+    t += (before_kb if variant == "before" else after_kb) * cost
+    boot.mark("imports", round(t))
+    t += SETUP_MS
+    boot.mark("setup", round(t))
+    if variant == "before":
+        t += BLINK_MS
+        boot.mark("intro blinks", round(t))
+        t = wifi_ready(t, t, WIFI_POLL_MS["before"])
+        boot.mark("wifi wait", round(t))
+    else:
+        wifi_started = t
+        boot.begin("wifi", round(t))
+    t += CO2_INIT_MS
+    co2_started = t
+    boot.begin("co2 first sample", round(t))
+    boot.mark("co2 sensor", round(t))
+    t += SPECTRO_INIT_MS
+    boot.mark("spectrometer", round(t))
+    if variant != "before":
+        t = wifi_ready(wifi_started, t, WIFI_POLL_MS["after"])
+        boot.end("wifi", round(t))
+        boot.mark("wifi wait", round(t))
+    # The spectrometer task runs first: two banks integrate, then the upload
+    t += 2 * integration_ms() + UPLOAD_MS
+    first = t
+    # The CO2 task waits for the sensor's first sample, or for that upload
+    co2_ready = co2_started + SCD41_FIRST_SAMPLE_MS
+    boot.end("co2 first sample", round(co2_ready))
+    first_co2 = max(t, co2_ready) + UPLOAD_MS
+    boot.finish("first reading", round(first))
+    return boot, first, first_co2
+
+
+def main():
+    import_table()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for variant in ("before", ".mpy", "frozen"):
+            print(f"sensorPico2, {variant}:")
+            boot, first, first_co2 = boot_sensorpico2(variant, os.path.join(tmp, "boot_timeline.json"))
+            results[variant] = (first, first_co2)
+            print()
+    print("sensorPico2, time from power-on:")
+    print(f"  {'':<8} {'first reading':>14} {'first CO2':>10}")
+    for variant, (first, first_co2) in results.items():
+        print(f"  {variant:<8} {first / 1000:>13.1f}s {first_co2 / 1000:>9.1f}s")
+    before = results["before"]
+    if not all(first < before[0] and first_co2 < before[1] for first, first_co2 in list(results.values())[1:]):
+        print("FAIL: the new boot isn't faster")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
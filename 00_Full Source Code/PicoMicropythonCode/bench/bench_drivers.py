@@ -0,0 +1,238 @@
+# bench_drivers.py
+# Host-side check of the lib/ sensor drivers on the scriptable fake bus
+# (bench/fake_i2c.py), one per i2c_device kind: SCD41 (CommandDevice),
+# AS7341 (RegisterDevice) and FS3000 (FrameDevice).
+#
+# Correctness: each driver decodes known values, recovers from a corrupt
+# frame by re-reading, drops a frame that stays corrupt, survives a NACK and
+# encodes command arguments with valid CRCs. Every check prints ok/FAIL.
+#
+# Throughput: host time per driver call (fake bus included, so compare the
+# rows rather than read them as Pico timings; the inline row shows what the
+# table lookups and CRC checks add), and wire time per reading at 100 and
+# 400 kHz. A last run reads the SCD41 with 5% of frames corrupted, through the
+# driver and through the inline read the cj/ scripts used to copy (no CRC
+# check), and counts the garbage each would have published.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_drivers.py [reads]
+
+import sys
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+sys.path.insert(0, __file__.rsplit("/", 1)[0])
+
+import as7341  # noqa: E402
+import i2c_device  # noqa: E402
+import scd41  # noqa: E402
+from as7341 import AS7341  # noqa: E402
+from compat import ticks_us, ticks_diff  # noqa: E402
+from fake_i2c import (FakeI2C, FakeCommandDevice, FakeRegisterDevice, FakeFrameDevice,  # noqa: E402
+                      CORRUPT, NACK, patch_clock)
+from fs3000 import FS3000, FS3000_ADDR  # noqa: E402
+from scd41 import SCD41, SCD41_ADDR  # noqa: E402
+
+READS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+CORRUPT_RATE = 0.05
+
+CO2_PPM = 612
+TEMP_WORD = 26000  # 24.4 C
+RH_WORD = 30000  # 45.8 %
+SERIAL = (0x1234, 0x5678, 0x9ABC)
+SPECTRUM = (1007, 2007, 3007, 4007, 5007, 6007)
+RAW_VELOCITY = 2300
+
+
+class SCD41Model:
+    """State behind a FakeCommandDevice answering the SCD41 command set"""
+
+    def __init__(self):
+        self.reference_ppm = CO2_PPM
+        self.asc = None
+        self.altitude = None
+
+    def handlers(self):
+        return {
+            scd41.CMD_START_PERIODIC_MEASUREMENT: (0, lambda args: None),
+            scd41.CMD_STOP_PERIODIC_MEASUREMENT: (scd41.STOP_DELAY_MS, lambda args: None),
+            scd41.CMD_GET_DATA_READY: (1, lambda args: [0x8006]),
+            scd41.CMD_READ_MEASUREMENT: (1, lambda args: [CO2_PPM, TEMP_WORD, RH_WORD]),
+            scd41.CMD_PERFORM_FORCED_RECALIBRATION: (400, self.frc),
+            scd41.CMD_SET_AUTOMATIC_SELF_CALIBRATION: (1, self.set_asc),
+            scd41.CMD_SET_SENSOR_ALTITUDE: (1, self.set_altitude),
+            scd41.CMD_GET_SERIAL_NUMBER: (1, lambda args: list(SERIAL))
+        }
+
+    def frc(self, args):
+        correction = args[0] - self.reference_ppm
+        self.reference_ppm = args[0]
+        return [correction + 0x8000]
+
+    def set_asc(self, args):
+        self.asc = args[0]
+
+    def set_altitude(self, args):
+        self.altitude = args[0]
+
+
+def as7341_device():
+    device = FakeRegisterDevice({as7341.REG_ID: 0x09, as7341.REG_STATUS: as7341.STATUS_AVALID})
+    for ch, value in enumerate(SPECTRUM):
+        device.set_word(as7341.REG_CH0_DATA_L + 2 * ch, value)
+
+    def on_write(reg, value):
+        if reg == as7341.REG_ENABLE:
+            # The SMUX is set at once, so SMUXEN reads back cleared
+            device.regs[reg] = value & ~as7341.ENABLE_SMUXEN
+        elif reg == as7341.REG_STATUS:
+            device.regs[reg] = as7341.STATUS_AVALID
+
+    device.on_write = on_write
+    return device
+
+
+def fs3000_frame(nbytes):
+    frame = bytearray([0, RAW_VELOCITY >> 8, RAW_VELOCITY & 0xFF, 0, 0])
+    frame[0] = -sum(frame[1:]) & 0xFF
+    return bytes(frame[:nbytes])
+
+
+def make_bus(freq=100000, seed=1):
+    bus = FakeI2C(freq, seed)
+    model = SCD41Model()
+    bus.attach(SCD41_ADDR, FakeCommandDevice(model.handlers()))
+    bus.attach(as7341.AS7341_ADDR, as7341_device())
+    bus.attach(FS3000_ADDR, FakeFrameDevice(fs3000_frame))
+    patch_clock(bus, i2c_device, as7341, scd41)
+    return bus, model
+
+
+def legacy_scd41_read(bus):
+    """The inline read the cj/ scripts carried: no CRC check, fixed 100 ms sleep"""
+    bus.writeto(SCD41_ADDR, scd41.CMD_READ_MEASUREMENT)
+    bus.sleep(100)
+    data = bus.readfrom(SCD41_ADDR, 9)
+    co2 = data[0] << 8 | data[1]
+    temp = -45 + 175 * ((data[3] << 8 | data[4]) / 65535.0)
+    humidity = 100 * ((data[6] << 8 | data[7]) / 65535.0)
+    return co2, temp, humidity
+
+
+def correctness():
+    checks = []
+    bus, model = make_bus()
+    co2 = SCD41(bus)
+    spectro = AS7341(bus)
+    air = FS3000(bus)
+
+    reading = co2.read_measurement()
+    checks.append(("SCD41 decodes co2/temp/RH", reading is not None and reading[0] == CO2_PPM
+                   and abs(reading[1] - (-45 + 175 * TEMP_WORD / 65535)) < 1e-9))
+    checks.append(("SCD41 data ready", co2.data_ready()))
+    bus.fail(SCD41_ADDR, CORRUPT)
+    checks.append(("SCD41 re-reads a corrupt frame", co2.read_measurement() is not None and co2.crc_errors == 1))
+    bus.fail(SCD41_ADDR, CORRUPT, 1 + scd41.SCD41.FRAME_REREADS)
+    dropped = co2.dropped
+    checks.append(("SCD41 drops a frame that stays corrupt", co2.read_measurement() is None
+                   and co2.dropped == dropped + 1))
+    bus.fail(SCD41_ADDR, NACK)
+    checks.append(("SCD41 survives a NACK", co2.read_measurement() is None and co2.bus_errors == 1))
+    checks.append(("SCD41 verify", co2.verify()))
+    checks.append(("SCD41 serial number", co2.serial_number() == (SERIAL[0] << 32) | (SERIAL[1] << 16) | SERIAL[2]))
+    checks.append(("SCD41 forced recalibration (argument CRC)", co2.forced_recalibration(650) == 650 - CO2_PPM))
+    co2.set_automatic_self_calibration(False)
+    co2.set_altitude(120)
+    checks.append(("SCD41 ASC and altitude arguments", model.asc == 0 and model.altitude == 120))
+
+    checks.append(("AS7341 verify (ID 0x09)", spectro.verify()))
+    bus.devices[as7341.AS7341_ADDR].regs[as7341.REG_ID] = 0x24
+    checks.append(("AS7341 verify (ID 0x24)", spectro.verify()))
+    checks.append(("AS7341 setup", spectro.setup()))
+    data = spectro.read_spectral_data()
+    checks.append(("AS7341 spectral data", data["F1 (415nm/Violet)"] == SPECTRUM[0]
+                   and data["F5 (555nm/Green)"] == SPECTRUM[0] and data["NIR"] == SPECTRUM[5]))
+    checks.append(("AS7341 per-reading bus counts", spectro.last_transactions > 0 and spectro.last_i2c_us >= 0))
+    checks.append(("AS7341 register dump", spectro.dump()["ATIME"] == as7341.ATIME))
+
+    checks.append(("FS3000 count", air.read_raw() == RAW_VELOCITY))
+    bus.fail(FS3000_ADDR, CORRUPT)
+    checks.append(("FS3000 drops a bad checksum", air.read_raw() is None and air.bad_frames == 1))
+    bus.devices[FS3000_ADDR].frame_fn = lambda nbytes: bytes(nbytes)
+    checks.append(("FS3000 drops an all-zero frame", air.read_raw() is None and air.bad_frames == 2))
+    checks.append(("FS3000 verify rejects it", not air.verify()))
+
+    bus.at(bus.now + 10, lambda b: b.detach(FS3000_ADDR))
+    bus.sleep(20)
+    checks.append(("scripted unplug: FS3000 missing from scan", not air.is_present()))
+
+    failed = 0
+    print("Correctness:")
+    for name, ok in checks:
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+        failed += not ok
+    return failed
+
+
+def host_us(fn, reads):
+    start = ticks_us()
+    for _ in range(reads):
+        fn()
+    return ticks_diff(ticks_us(), start) / reads
+
+
+def throughput(reads):
+    print(f"\nThroughput, {reads} reads each:")
+    print(f"  {'operation':<32} {'host us':>8} {'wire ms @100k':>14} {'wire ms @400k':>14}")
+    operations = (
+        ("SCD41 read_measurement", lambda bus: SCD41(bus).read_measurement),
+        ("SCD41 data_ready", lambda bus: SCD41(bus).data_ready),
+        ("AS7341 read_spectral_data", lambda bus: AS7341(bus).read_spectral_data),
+        ("AS7341 read_reg", lambda bus: (lambda s: lambda: s.read_reg(as7341.REG_STATUS))(AS7341(bus))),
+        ("FS3000 read_raw", lambda bus: FS3000(bus).read_raw),
+        ("inline SCD41 read (cj/, no CRC)", lambda bus: lambda: legacy_scd41_read(bus)),
+    )
+    for name, make in operations:
+        wire = []
+        for freq in (100000, 400000):
+            bus, model = make_bus(freq)
+            fn = make(bus)
+            cost = host_us(fn, reads)
+            wire.append(bus.wire_ms / reads)
+        print(f"  {name:<32} {cost:8.1f} {wire[0]:14.2f} {wire[1]:14.2f}")
+
+
+def noisy_bus(reads):
+    bus, model = make_bus(seed=7)
+    bus.error_rate(corrupt=CORRUPT_RATE)
+    co2 = SCD41(bus)
+    good = 0
+    for _ in range(reads):
+        if co2.read_measurement() is not None:
+            good += 1
+    driver_garbage = 0  # Every frame that reached the caller passed its CRCs
+
+    bus, model = make_bus(seed=7)
+    bus.error_rate(corrupt=CORRUPT_RATE)
+    legacy_garbage = 0
+    for _ in range(reads):
+        co2_ppm, temp, humidity = legacy_scd41_read(bus)
+        if co2_ppm != CO2_PPM or abs(humidity - 100 * RH_WORD / 65535) > 1e-9 \
+                or abs(temp - (-45 + 175 * TEMP_WORD / 65535)) > 1e-9:
+            legacy_garbage += 1
+
+    print(f"\nSCD41 with {CORRUPT_RATE:.0%} of transactions corrupted, {reads} reads:")
+    print(f"  driver: {good} good, {co2.crc_errors} CRC errors re-read, {co2.dropped} dropped, "
+          f"{driver_garbage} wrong values published")
+    print(f"  inline: {legacy_garbage} wrong values published")
+
+
+def main():
+    failed = correctness()
+    throughput(READS)
+    noisy_bus(READS)
+    if failed:
+        print(f"\n{failed} check(s) FAILED")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# bench_duty_cycle.py
+# Host-side energy model of a sensor node (like sensorPico1's moisture and
+# air velocity uploads, two readings per cycle) per reporting interval:
+#
+#   always-on     today's firmware: Wi-Fi stays connected, the CPU idles
+#                 between readings and each reading is POSTed at once
+#   light         machine.lightsleep between readings; the old connect_wifi
+#                 (full DHCP connect, status checked once a second) on every wake
+#   deep          machine.deepsleep, state in flash, fast_connect on every wake
+#   deep batch N  as deep, but the radio only comes up once N readings queue
+#                 or the oldest has waited 30 min
+#   deep deadband as deep batch 6, with readings only queued when they moved
+#                 past their deadband (or as a 12-wake heartbeat)
+#
+# The duty-cycled modes run the real lib/duty_cycle.py (WakeState in a temp
+# file, fast_connect against a fake WLAN) on a virtual clock that charges
+# each phase at its current draw. The currents and phase times are rough
+# published Pico W figures at 3.3 V; compare the rows rather than trust
+# the absolute mJ. Moisture drifts slowly and air velocity is noisy around
+# a steady mean, so the deadband keeps some readings and drops others.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_duty_cycle.py [hours]
+
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+import duty_cycle  # noqa: E402
+from duty_cycle import WakeState, fast_connect  # noqa: E402
+
+HOURS = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+INTERVALS_S = (10, 60, 300, 900)
+VOLTS = 3.3
+BATTERY_MAH = 2000  # e.g. 2x AA through a buck-boost
+
+# Current draw (mA)
+DEEP_SLEEP_MA = 1.0
+LIGHT_SLEEP_MA = 1.6
+CPU_MA = 22  # Awake, radio off
+WIFI_IDLE_MA = 40  # Connected, power saving on, CPU idling
+WIFI_CONNECT_MA = 60  # Scan, association, DHCP
+WIFI_TX_MA = 75  # TLS handshake and POST
+
+# Phase times (ms)
+BOOT_MS = 650  # Reset to main.py after a deep sleep, imports included
+SAMPLE_MS = 120  # Moisture window and an air velocity burst
+SCAN_MS = 900  # Finding the access point on every channel
+ASSOC_MS = 450
+DHCP_MS = 1100
+POST_MS = 700  # urequests opens a new TLS connection per POST
+
+READINGS_PER_WAKE = 2
+MOISTURE_BAND = 1.0  # %
+AIR_BAND = 0.1  # m/s
+BATCH = 6
+MAX_WAIT_S = 1800  # Longest a queued reading waits for its batch
+
+
+class Meter:
+    """Virtual clock that integrates charge"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.charge = 0.0  # mA*ms
+        self.current = CPU_MA
+
+    def spend(self, ms, ma):
+        self.now += ms
+        self.charge += ms * ma
+
+    def sleep(self, ms):
+        # duty_cycle's sleep_ms: waiting on the radio while it connects
+        self.spend(ms, self.current)
+
+
+class FakeWLAN:
+    """network.WLAN whose connect time depends on what the caller skipped"""
+
+    def __init__(self, meter):
+        self.meter = meter
+        self.static = None
+        self.ready_at = None
+        self.connects = 0
+
+    def active(self, on=None):
+        if on is False:
+            self.ready_at = None
+
+    def ifconfig(self, config=None):
+        if config is None:
+            return self.static or ("192.168.1.57", "255.255.255.0", "192.168.1.1", "192.168.1.1")
+        self.static = None if config == "dhcp" else tuple(config)
+
+    def config(self, name):
+        return 6
+
+    def connect(self, ssid, password, channel=None):
+        self.connects += 1
+        ms = ASSOC_MS
+        if not channel:
+            ms += SCAN_MS
+        if self.static is None:
+            ms += DHCP_MS
+        self.ready_at = self.meter.now + ms
+
+    def status(self):
+        if self.ready_at is None:
+            return 0
+        return duty_cycle.STAT_GOT_IP if self.meter.now >= self.ready_at else 1
+
+
+class Signals:
+    """Moisture drifting by a random walk, air velocity noisy around 0.4 m/s"""
+
+    def __init__(self, interval_s, seed=3):
+        self.rng = random.Random(seed)
+        self.interval_s = interval_s
+        self.moisture = 45.0
+
+    def read(self):
+        self.moisture += self.rng.gauss(0, 0.05 * (self.interval_s / 60) ** 0.5)
+        air = max(0.0, self.rng.gauss(0.4, 0.06))
+        return round(self.moisture, 1), round(air, 2)
+
+
+def old_connect(meter):
+    """connect_wifi() as in the firmware: full connect, status checked each second"""
+    connect_ms = SCAN_MS + ASSOC_MS + DHCP_MS
+    waited = -(-connect_ms // 1000) * 1000
+    meter.spend(waited, WIFI_CONNECT_MA)
+
+
+def always_on(interval_s, wakes):
+    meter = Meter()
+    old_connect(meter)
+    for _ in range(wakes):
+        meter.spend(SAMPLE_MS, CPU_MA)
+        for _ in range(READINGS_PER_WAKE):
+            meter.spend(POST_MS, WIFI_TX_MA)
+        idle = interval_s * 1000 - SAMPLE_MS - READINGS_PER_WAKE * POST_MS
+        meter.spend(idle, WIFI_IDLE_MA)
+    return meter, wakes * READINGS_PER_WAKE, 0
+
+
+def light_sleep(interval_s, wakes):
+    meter = Meter()
+    for _ in range(wakes):
+        start = meter.now
+        meter.spend(SAMPLE_MS, CPU_MA)
+        old_connect(meter)
+        for _ in range(READINGS_PER_WAKE):
+            meter.spend(POST_MS, WIFI_TX_MA)
+        meter.spend(interval_s * 1000 - (meter.now - start), LIGHT_SLEEP_MA)
+    return meter, wakes * READINGS_PER_WAKE, 0
+
+
+def deep_sleep(interval_s, wakes, batch=1, deadband=False):
+    meter = Meter()
+    wlan = FakeWLAN(meter)
+    duty_cycle.ticks_ms = lambda: int(meter.now)
+    duty_cycle.sleep_ms = meter.sleep
+    signals = Signals(interval_s)
+    sent = []
+    writes = 0
+    fd, path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    os.remove(path)
+    try:
+        for _ in range(wakes):
+            start = meter.now
+            meter.spend(BOOT_MS, CPU_MA)
+            # A new WakeState each wake, as after a reset: everything comes from flash
+            state = WakeState(path)
+            state.restore()
+            state.wake()
+            meter.spend(SAMPLE_MS, CPU_MA)
+            moisture, air = signals.read()
+            if not deadband or state.changed("moisture", moisture, MOISTURE_BAND):
+                state.queue("Soil Moisture Sensor", {"moisture": {"value": moisture, "unit": "%"}})
+            if not deadband or state.changed("air", air, AIR_BAND):
+                state.queue("FS3000 Air Velocity Sensor", {"air_velocity": {"value": air, "unit": "mps"}})
+
+            if state.batch_due(batch, -(-MAX_WAIT_S // interval_s)):
+                meter.current = WIFI_CONNECT_MA
+                if fast_connect(wlan, "ssid", "password", state) is not None:
+                    def send(payload):
+                        meter.spend(POST_MS, WIFI_TX_MA)
+                        sent.append(payload)
+                        return True
+                    state.send_pending(send, interval_s * 1000)
+                wlan.active(False)
+                meter.current = CPU_MA
+            state.save()
+            writes += state.writes
+            meter.spend(interval_s * 1000 - (meter.now - start), DEEP_SLEEP_MA)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    ages = [payload["age_ms"] for payload in sent]
+    return meter, len(sent), max(ages) if ages else 0, writes, wlan
+
+
+def report(label, interval_s, meter, readings, sent, extra=""):
+    mj = meter.charge * VOLTS / 1000  # mA*ms*V = uJ
+    avg_ma = meter.charge / meter.now
+    days = BATTERY_MAH / avg_ma / 24
+    print(f"  {label:<16} {interval_s:>6}s {mj / readings:>10.1f} {avg_ma:>8.2f} {days:>8.1f} {sent:>6} {extra}")
+
+
+def main():
+    print(f"{HOURS:g} h per row, {READINGS_PER_WAKE} readings per wake; energy per reading taken, "
+          f"battery life on {BATTERY_MAH} mAh\n")
+    print(f"  {'mode':<16} {'interval':>7} {'mJ/reading':>10} {'avg mA':>8} {'days':>8} {'sent':>6}")
+    for interval_s in INTERVALS_S:
+        wakes = int(HOURS * 3600 // interval_s)
+        readings = wakes * READINGS_PER_WAKE
+        meter, sent, _ = always_on(interval_s, wakes)
+        report("always-on", interval_s, meter, readings, sent or readings)
+        meter, sent, _ = light_sleep(interval_s, wakes)
+        report("light", interval_s, meter, readings, sent or readings)
+        for label, batch, deadband in (("deep", 1, False), (f"deep batch {BATCH}", BATCH, False),
+                                       ("deep deadband", BATCH, True)):
+            meter, sent, oldest, writes, wlan = deep_sleep(interval_s, wakes, batch, deadband)
+            report(label, interval_s, meter, readings, sent,
+                   f"connects {wlan.connects}, oldest sent {oldest / 1000:.0f} s, flash writes {writes}")
+        print()
+
+    # Reconnect time on its own
+    meter = Meter()
+    old_connect(meter)
+    old_ms = meter.now
+    meter = Meter()
+    wlan = FakeWLAN(meter)
+    duty_cycle.ticks_ms = lambda: int(meter.now)
+    duty_cycle.sleep_ms = meter.sleep
+    state = WakeState("unused")
+    first = fast_connect(wlan, "ssid", "password", state)
+    wlan.active(False)
+    cached = fast_connect(wlan, "ssid", "password", state)
+    print(f"Wi-Fi connect: old connect_wifi {old_ms:.0f} ms, fast_connect cold {first} ms, "
+          f"with cached channel and lease {cached} ms")
+
+
+if __name__ == "__main__":
+    main()
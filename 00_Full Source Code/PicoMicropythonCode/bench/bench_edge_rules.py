@@ -0,0 +1,83 @@
+# bench_edge_rules.py
+# Host-side check of lib/edge_rules.py when a sensor dies, on a virtual clock.
+#
+# The soil sensor reports every 5 s and the "Dry soil" rule turns the pump
+# on below 30 %. At 60 s the sensor dies with the soil still reading dry
+# (a crashed Pico, a lost Wi-Fi link) and comes back at 30 min. Without a
+# max age, the engine keeps acting on the last reading and the pump runs
+# until the sensor returns; with the default one, the rule is released once
+# the reading is MAX_AGE_S old and stays idle until a fresh reading. The
+# bench reports pump-on time while the sensor was dead, and checks the rule
+# is released on time and picks up again when readings resume.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_edge_rules.py
+
+import sys
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+import edge_rules  # noqa: E402
+from edge_rules import EdgeRuleEngine, MAX_AGE_S  # noqa: E402
+
+REPORT_MS = 5000
+TICK_MS = 1000
+DIES_MS = 60000
+RETURNS_MS = 1800000
+END_MS = 1900000
+DRY = 20.0  # %, below the threshold throughout
+
+RULE = {
+    "id": "rule_dry", "name": "Dry soil", "deviceId": "Soil Moisture Sensor",
+    "type": "condition", "enabled": True,
+    "condition": {"sensor": "moisture", "operator": "<", "value": 30, "hysteresis": 5},
+    "action": {"component": "pump", "command": "power", "value": "on"},
+    "releaseAction": {"component": "pump", "command": "power", "value": "off"},
+    "minOnSeconds": 600, "minOffSeconds": 60
+}
+
+
+def run(max_age_s):
+    """Pump-on ms while the sensor was dead, when the rule released, and whether it re-triggered"""
+    pump = {"on": False}
+    released_at = None
+    retriggered = False
+
+    def actuate(component, action, value, rule_id):
+        pump["on"] = value == "on"
+
+    rule = dict(RULE, maxAgeSeconds=max_age_s) if max_age_s is not None else dict(RULE)
+    engine = EdgeRuleEngine(actuate, rules_file="/dev/null")
+    engine.load([rule])
+    on_while_dead = 0
+    for now in range(0, END_MS, TICK_MS):
+        alive = now < DIES_MS or now >= RETURNS_MS
+        if alive and now % REPORT_MS == 0:
+            engine.update("Soil Moisture Sensor", {"moisture": {"value": DRY, "unit": "%"}}, now)
+        was_on = pump["on"]
+        engine.tick(now)
+        if was_on and not pump["on"] and released_at is None:
+            released_at = now
+        if now >= RETURNS_MS and pump["on"]:
+            retriggered = True
+        if not alive and pump["on"]:
+            on_while_dead += TICK_MS
+    return on_while_dead, released_at, retriggered
+
+
+def main():
+    edge_rules.print = lambda *args: None
+    print(f"Sensor dead from {DIES_MS // 1000} s to {RETURNS_MS // 1000} s, last reading {DRY} % (dry):")
+    stuck, _, _ = run(1e9)
+    on, released_at, retriggered = run(None)
+    print(f"  no max age:         pump on {stuck // 1000} s while the sensor was dead")
+    print(f"  max age {MAX_AGE_S} s:      pump on {on // 1000} s, released at {released_at // 1000} s, "
+          f"re-triggered on fresh readings: {retriggered}")
+    last_reading = DIES_MS - REPORT_MS
+    ok = released_at is not None and released_at <= last_reading + MAX_AGE_S * 1000 + TICK_MS and retriggered
+    print("ok" if ok else "FAIL")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
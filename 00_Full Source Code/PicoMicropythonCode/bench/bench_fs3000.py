@@ -0,0 +1,201 @@
+# bench_fs3000.py
+# Host-side comparison of FS3000 air velocity reporting:
+#
+#   old:    one instantaneous reading per 1 s upload, no frame checksum
+#   driver: timer sampling every SAMPLE_MS into the raw-count ring, frames
+#           checked and bad ones dropped, mean/peak/stddev per upload
+#
+# A fake FS3000 produces a turbulent airflow (steady mean plus gusts and
+# noise) and corrupts or NACKs a fraction of frames. For each approach the
+# bench reports how far each upload is from the true window mean, how many
+# corrupt frames got converted into readings, the bus time the sampling
+# costs at the sensor node's 10 kHz bus clock, and the host cost per sample.
+#
+# A second part checks the integer velocity tables of both parts against the
+# datasheet calibration points and a float reference interpolation, and
+# compares conversions per second with the old three-segment float formula.
+#
+# Uses only compat ticks so it runs on CPython and the MicroPython unix port.
+# Run from PicoMicropythonCode/:  python3 bench/bench_fs3000.py [sample_ms] [bad_percent]
+
+import random
+import sys
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+import fs3000  # noqa: E402
+from compat import ticks_us, ticks_diff  # noqa: E402
+from fs3000 import FS3000, raw_to_velocity, CALIBRATION, TABLES  # noqa: E402
+
+WINDOWS = 120
+CONVERSIONS = 40960  # Every 12-bit count ten times
+WINDOW_MS = 1000
+BUS_HZ = 10000
+MEAN_RAW = 2300  # About 3.6 m/s on the FS3000-1005
+
+
+class FakeFS3000Bus:
+    """FS3000 stand-in: turbulent raw counts, some corrupt or NACKed frames"""
+
+    def __init__(self, bad_fraction, seed=1):
+        self.rng = random.Random(seed)
+        self.bad_fraction = bad_fraction
+        self.gust = 0.0
+        self.raw = MEAN_RAW
+        self.corrupted = 0
+        self.transactions = 0
+        self.wire_ms = 0.0
+
+    def step(self):
+        """Advance the airflow by one sample period and return the true count"""
+        rng = self.rng
+        # Slow gusts (random walk pulled back to the mean) plus fast turbulence
+        self.gust = 0.95 * self.gust + rng.gauss(0, 40)
+        self.raw = max(409, min(3686, int(MEAN_RAW + self.gust + rng.gauss(0, 120))))
+        return self.raw
+
+    def _frame(self):
+        raw = self.raw
+        frame = bytearray([0, raw >> 8, raw & 0xFF, 0x00, 0x00])
+        frame[0] = -sum(frame[1:]) & 0xFF
+        roll = self.rng.random()
+        if roll < self.bad_fraction / 2:
+            self.corrupted += 1
+            frame[1] ^= 0x04  # A flipped bit in the count: a 1024-count jump
+        elif roll < self.bad_fraction:
+            raise OSError(5)
+        return frame
+
+    def readfrom_into(self, addr, buf):
+        # Address byte + 5 data bytes, 9 bits each, plus START/STOP
+        self.wire_ms += (9 * (1 + len(buf)) + 2) * 1000 / BUS_HZ
+        self.transactions += 1
+        buf[:] = self._frame()
+
+    def readfrom(self, addr, n):
+        buf = bytearray(n)
+        self.readfrom_into(addr, buf)
+        return buf
+
+
+def legacy_read(bus):
+    """One instant per upload, checksum ignored"""
+    buf = bus.readfrom(fs3000.FS3000_ADDR, 5)
+    return raw_to_velocity(((buf[1] & 0x0F) << 8) | buf[2])
+
+
+def legacy_convert(raw_value):
+    """The three-segment float formula the sensor scripts used before"""
+    MAX_VELOCITY = 7.5
+    if raw_value == 0 or raw_value == 65535:
+        return 0
+    if raw_value < 1024:
+        velocity = raw_value / 1024 * 1.25
+    elif raw_value < 8192:
+        velocity = (raw_value - 1024) / 7168 * 3.75 + 1.25
+    else:
+        velocity = (raw_value - 8192) / 57343 * 2.5 + 5.0
+    return min(velocity, MAX_VELOCITY)
+
+
+def float_reference(raw, raw_points, mm_points):
+    """Straight float interpolation between calibration points, in mm/s"""
+    if raw <= raw_points[0]:
+        return 0.0
+    if raw >= raw_points[-1]:
+        return float(mm_points[-1])
+    i = 1
+    while raw > raw_points[i]:
+        i += 1
+    return mm_points[i - 1] + (mm_points[i] - mm_points[i - 1]) * (raw - raw_points[i - 1]) / (
+        raw_points[i] - raw_points[i - 1])
+
+
+def bench_conversion():
+    print("\nVelocity conversion (all 4096 counts):")
+    for part, (raw_points, mm_points) in CALIBRATION.items():
+        table = TABLES[part]
+        at_points = max(abs(table.mm_per_s(r) - m) for r, m in zip(raw_points, mm_points))
+        worst = max(abs(table.mm_per_s(r) - float_reference(r, raw_points, mm_points)) for r in range(4096))
+        print(f"  FS3000-{part}: {at_points} mm/s off at the {len(raw_points)} datasheet points, "
+              f"worst {worst:.2f} mm/s from float interpolation")
+    raw_points, mm_points = CALIBRATION["1005"]
+    old = max(abs(legacy_convert(r) * 1000 - m) for r, m in zip(raw_points, mm_points))
+    print(f"  old formula: up to {old:.0f} mm/s off at the FS3000-1005 datasheet points")
+
+    convert = TABLES["1005"].mm_per_s
+    for name, fn in (("old float formula", legacy_convert),
+                     ("float interpolation", lambda r: float_reference(r, raw_points, mm_points)),
+                     ("integer table (mm/s)", convert)):
+        start = ticks_us()
+        for i in range(CONVERSIONS):
+            fn(i & 0xFFF)
+        elapsed = ticks_diff(ticks_us(), start)
+        print(f"  {name:<22}{CONVERSIONS * 1000000 // max(1, elapsed):>9} conversions/s")
+
+
+def run(sample_ms, bad_fraction):
+    per_window = WINDOW_MS // sample_ms
+
+    bus = FakeFS3000Bus(bad_fraction)
+    old_errors = []
+    old_bad = 0
+    for _ in range(WINDOWS):
+        truth = [raw_to_velocity(bus.step()) for _ in range(per_window)]
+        corrupted = bus.corrupted
+        try:
+            value = legacy_read(bus)
+        except OSError:
+            continue
+        old_bad += bus.corrupted - corrupted
+        old_errors.append(value - sum(truth) / len(truth))
+    old_wire = bus.wire_ms
+
+    bus = FakeFS3000Bus(bad_fraction)
+    sensor = FS3000(bus)
+    new_errors = []
+    sample_us = 0
+    stats_us = 0
+    peaks = 0.0
+    for _ in range(WINDOWS):
+        truth = []
+        for _ in range(per_window):
+            truth.append(raw_to_velocity(bus.step()))
+            start = ticks_us()
+            sensor.sample()
+            sample_us += ticks_diff(ticks_us(), start)
+        start = ticks_us()
+        window = sensor.window_stats()
+        stats_us += ticks_diff(ticks_us(), start)
+        new_errors.append(window["mean"] - sum(truth) / len(truth))
+        peaks += window["peak"] - window["mean"]
+
+    def rms(errors):
+        return (sum(e * e for e in errors) / len(errors)) ** 0.5
+
+    seconds = WINDOWS * WINDOW_MS / 1000
+    print(f"{WINDOWS} uploads, 1 per {WINDOW_MS} ms, {bad_fraction * 100:.0f}% bad frames, "
+          f"{BUS_HZ // 1000} kHz bus\n")
+    print("One read per upload, no checksum:")
+    print(f"  error vs true window mean: {rms(old_errors):.3f} m/s RMS, worst {max(map(abs, old_errors)):.2f} m/s")
+    print(f"  {len(old_errors)} uploads, {old_bad} from corrupt frames, {WINDOWS - len(old_errors)} lost to NACKs")
+    print(f"  bus time {old_wire / seconds:.1f} ms/s")
+    print(f"Timer sampling every {sample_ms} ms, windowed:")
+    print(f"  error vs true window mean: {rms(new_errors):.3f} m/s RMS, worst {max(map(abs, new_errors)):.2f} m/s")
+    print(f"  {sensor.samples} samples kept, {sensor.bad_frames} corrupt frames dropped, "
+          f"{sensor.bus_errors} NACKs, {sensor.overruns} ring overruns")
+    print(f"  peak {peaks / WINDOWS:.2f} m/s above the mean on average; stddev reported per upload")
+    print(f"  bus time {bus.wire_ms / seconds:.1f} ms/s ({bus.wire_ms / seconds / 10:.1f}% of the bus)")
+    print(f"  host cost {sample_us / sensor.samples:.1f} us/sample, "
+          f"{stats_us / WINDOWS:.0f} us per window_stats()")
+
+
+def main():
+    sample_ms = int(sys.argv[1]) if len(sys.argv) > 1 else fs3000.SAMPLE_MS
+    bad_percent = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+    run(sample_ms, bad_percent / 100)
+    bench_conversion()
+
+
+if __name__ == "__main__":
+    main()
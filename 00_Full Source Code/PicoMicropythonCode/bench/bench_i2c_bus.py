@@ -0,0 +1,229 @@
+# bench_i2c_bus.py
+# Host-side check of I2C clock negotiation on the sensor node's shared bus
+# (FS3000 sampled every 20 ms, SCD41 polled every 5 s).
+#
+# A fake bus models the wiring as an RC rise time (pull-up resistance times
+# bus capacitance). Once the rise time eats into the clock's high time, bytes
+# start coming back NACKed or with flipped bits. For a short breadboard bus
+# and two lengths of cable the bench runs negotiate() and reports the rate
+# chosen. It then runs 10 minutes of sensor traffic at the old fixed 10 kHz,
+# at the negotiated rate, and starting at 400 kHz with only the runtime
+# fallback. For each it reports the final clock, corrupt frames dropped by
+# the drivers and wire time, estimated from the bytes clocked (negotiation's
+# own probe reads included). A last run adds capacitance to a bus mid-way to show the runtime
+# fallback, and again with the FS3000 read through read_into() on a deferred
+# bus, as sensorPico1's core 1 does: the bus must only be rebuilt inside
+# check_frames(), where core 0 holds the bus lock.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_i2c_bus.py
+
+import random
+import sys
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+from fs3000 import FS3000, FS3000_ADDR  # noqa: E402
+from i2c_bus import I2CBus  # noqa: E402
+from scd41 import SCD41, SCD41_ADDR, CMD_GET_DATA_READY  # noqa: E402
+from sensirion import encode_words  # noqa: E402
+import i2c_device  # noqa: E402
+
+SECONDS = 600
+FS3000_SAMPLE_MS = 20
+SCD41_INTERVAL_MS = 5000
+BASELINE_HZ = 10000
+
+# (name, pull-up ohms, bus capacitance pF)
+WIRING = [
+    ("breadboard, 4.7k, 50 pF", 4700, 50),
+    ("1 m cable, 10k, 150 pF", 10000, 150),
+    ("2 m cable, 10k, 300 pF", 10000, 300),
+]
+
+i2c_device.sleep_ms = lambda ms: None  # No real waiting on the host
+
+
+def rise_ns(ohms, pf):
+    """10-90% rise time of an RC-loaded open-drain line"""
+    return 0.8473 * ohms * pf / 1000
+
+
+def byte_error_rate(freq, rise):
+    """Chance a byte is corrupted when the clock's high time is short of the rise time"""
+    margin = 500000000 / freq / rise
+    if margin >= 3:
+        return 0.0
+    if margin <= 1:
+        return 1.0
+    return 0.5 * ((3 - margin) / 2) ** 3
+
+
+class Wiring:
+    def __init__(self, ohms, pf, seed=1):
+        self.rng = random.Random(seed)
+        self.ohms = ohms
+        self.pf = pf
+        self.command = None
+        self.raw = 1800
+
+    def make(self, freq):
+        return FakeI2C(self, freq)
+
+
+class FakeI2C:
+    """machine.I2C stand-in with an FS3000 and an SCD41 on wiring of a given rise time"""
+
+    def __init__(self, wiring, freq):
+        self.wiring = wiring
+        self.freq = freq
+
+    def _transfer(self, nbytes):
+        """Raise for a NACK; return a byte index to corrupt, or None"""
+        w = self.wiring
+        p = byte_error_rate(self.freq, rise_ns(w.ohms, w.pf))
+        if p and w.rng.random() < 1 - (1 - p) ** (nbytes + 1):
+            if w.rng.random() < 0.5:
+                raise OSError(5)  # EIO: NACKed
+            return w.rng.randrange(nbytes) if nbytes else None
+        return None
+
+    def _corrupt(self, data, index):
+        if index is not None:
+            data[index] ^= 1 << self.wiring.rng.randrange(8)
+        return data
+
+    def scan(self):
+        return [FS3000_ADDR, SCD41_ADDR]
+
+    def writeto(self, addr, buf, stop=True):
+        self._transfer(len(buf))
+        self.wiring.command = bytes(buf)
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        index = self._transfer(nbytes)
+        if self.wiring.command == CMD_GET_DATA_READY:
+            data = encode_words([0x8006])
+        else:
+            data = encode_words([612, 26000, 30000])
+        return bytes(self._corrupt(bytearray(data[:nbytes]), index))
+
+    def readfrom_into(self, addr, buf, stop=True):
+        index = self._transfer(len(buf))
+        w = self.wiring
+        w.raw = max(409, min(3686, w.raw + w.rng.randint(-20, 20)))
+        frame = bytearray([0, w.raw >> 8, w.raw & 0xFF, w.raw >> 8, w.raw & 0xFF])
+        frame[0] = -sum(frame[1:]) & 0xFF
+        buf[:] = self._corrupt(frame, index)
+
+
+def traffic(bus, air, co2, seconds, on_second=None, read_air=None):
+    """Sensor node bus traffic: FS3000 frames every 20 ms, SCD41 data-ready + read every 5 s"""
+    for ms in range(0, seconds * 1000, FS3000_SAMPLE_MS):
+        if read_air is None:
+            air.read_raw()
+        else:
+            read_air()
+        if ms % SCD41_INTERVAL_MS == 0:
+            co2.data_ready()
+            co2.read_measurement()
+        if ms % 1000 == 0:
+            bus.check_frames(air.bad_frames + co2.crc_errors)
+            if on_second is not None:
+                on_second(ms // 1000)
+
+
+def run(ohms, pf, negotiate=False, freq=BASELINE_HZ, on_second=None):
+    wiring = Wiring(ohms, pf)
+    bus = I2CBus(wiring.make, freq, baseline=BASELINE_HZ)
+    air = FS3000(bus)
+    co2 = SCD41(bus)
+    if negotiate:
+        bus.negotiate([air.verify, co2.verify])
+    traffic(bus, air, co2, SECONDS, on_second and (lambda s: on_second(s, wiring, bus)))
+    return bus, air, co2
+
+
+def run_deferred(ohms, pf, on_second):
+    """run() with the FS3000 read as on core 1; returns it and the rebuilds outside check_frames()"""
+    wiring = Wiring(ohms, pf)
+    checking = [True]  # Construction and negotiation run on core 0 before sampling starts
+    stray = [0]
+
+    def make(freq):
+        if not checking[0]:
+            stray[0] += 1
+        return wiring.make(freq)
+
+    bus = I2CBus(make, BASELINE_HZ, baseline=BASELINE_HZ)
+    air = FS3000(bus)
+    co2 = SCD41(bus)
+    bus.negotiate([air.verify, co2.verify])
+    checking[0] = False
+    bus.deferred = True
+    check_frames = bus.check_frames
+
+    def locked_check(bad_frames):
+        checking[0] = True
+        check_frames(bad_frames)
+        checking[0] = False
+
+    bus.check_frames = locked_check
+    values = [0]
+    traffic(bus, air, co2, SECONDS, lambda s: on_second(s, wiring, bus), lambda: air.read_into(values))
+    return bus, air, co2, stray[0]
+
+
+def main():
+    print(f"{SECONDS // 60} min of traffic: FS3000 every {FS3000_SAMPLE_MS} ms, SCD41 every "
+          f"{SCD41_INTERVAL_MS // 1000} s; wire time vs the old fixed {BASELINE_HZ // 1000} kHz\n")
+    print(f"{'wiring':<26} {'rise':>7} | {'final':>8} {'bad frames':>10} {'NACKs':>6} {'wire time':>10}"
+          f" {'bus busy':>8}")
+    for name, ohms, pf in WIRING:
+        rise = rise_ns(ohms, pf)
+        for label, kwargs in (("fixed 10 kHz", {"freq": BASELINE_HZ}), ("negotiated", {"negotiate": True}),
+                              ("400 kHz, fallback only", {"freq": 400000})):
+            bus, air, co2 = run(ohms, pf, **kwargs)
+            stats = bus.stats()
+            bad = air.bad_frames + co2.crc_errors
+            busy = 100 * stats["wire_ms"] / (SECONDS * 1000)
+            print(f"{name:<26} {rise:5.0f}ns | {stats['freq'] // 1000:>4} kHz {bad:>10} {air.bus_errors:>6}"
+                  f" {stats['wire_ms'] / 1000:8.1f} s {busy:7.2f}%  {label}")
+            if label == "negotiated":
+                saved = stats["saved_ms"] / 1000
+                speedup = stats["baseline_wire_ms"] / stats["wire_ms"]
+            name = ""
+        print(f"{'':<36}negotiated: {saved:.1f} s of wire time saved, {speedup:.1f}x faster transactions\n")
+
+    events = []
+
+    def add_module(second, wiring, bus):
+        if second == SECONDS // 2:
+            wiring.pf += 200
+            events.append(f"t={second}s: +200 pF (module on a cable added), bus at {bus.freq // 1000} kHz")
+
+    bus, air, co2 = run(4700, 50, negotiate=True, on_second=add_module)
+    stats = bus.stats()
+    print("Runtime fallback, breadboard bus:")
+    for event in events:
+        print(f"  {event}")
+    print(f"  ended at {stats['freq'] // 1000} kHz after {stats['fallbacks']} fallback(s); "
+          f"{air.bad_frames + co2.crc_errors} bad frames, {stats['errors']} failed transactions in total")
+
+    events.clear()
+    bus, air, co2, stray = run_deferred(4700, 50, add_module)
+    stats = bus.stats()
+    print("Same, FS3000 read as on core 1 (deferred bus):")
+    for event in events:
+        print(f"  {event}")
+    print(f"  ended at {stats['freq'] // 1000} kHz after {stats['fallbacks']} fallback(s); "
+          f"{air.bad_frames + co2.crc_errors} bad frames, {stats['errors']} failed transactions in total; "
+          f"{stray} bus rebuilds outside check_frames()")
+    ok = stray == 0 and stats["fallbacks"] > 0 and stats["wire_ms"] > 0
+    print("ok" if ok else "FAIL")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# bench_local_link.py
+# Host-side stand-in for the farm LAN: a sensor publisher and an actuator
+# subscriber (with the edge rule engine attached) exchange readings over
+# UDP on this machine. Reports reading-to-actuation latency and the packet
+# rate the subscriber sustains, and checks that the largest readings the
+# sensors send (sensorPico2's spectral reading and capture stats) arrive
+# whole.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_local_link.py [--multicast]
+
+import sys
+import time
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+from edge_rules import EdgeRuleEngine  # noqa: E402
+from local_link import LocalPublisher, LocalSubscriber, LOCAL_GROUP  # noqa: E402
+
+PORT = 5921
+LATENCY_SAMPLES = 500
+BURST_SIZE = 5000
+
+RULE = {
+    "id": "bench_dry_soil",
+    "deviceId": "Soil Moisture Sensor",
+    "type": "condition",
+    "enabled": True,
+    "condition": {"sensor": "moisture", "operator": "<", "value": 30, "hysteresis": 5},
+    "action": {"component": "pump", "command": "power", "value": "on"},
+    "releaseAction": {"component": "pump", "command": "power", "value": "off"},
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_latency(publisher, subscriber):
+    """Time from publishing a reading to the edge rule firing its action"""
+    fired = []
+    engine = EdgeRuleEngine(lambda *args: fired.append(time.perf_counter()), rules_file="/dev/null")
+    engine.load([RULE])
+
+    latencies = []
+    for i in range(LATENCY_SAMPLES):
+        # Alternate dry/wet so every reading causes a transition
+        moisture = 20 if i % 2 == 0 else 40
+        fired.clear()
+        start = time.perf_counter()
+        publisher.publish("Soil Moisture Sensor", {"moisture": {"value": moisture, "unit": "%"}})
+        while not fired:
+            subscriber.poll(engine.update)
+        latencies.append((fired[0] - start) * 1e6)
+
+    print(f"Reading -> actuation latency over {LATENCY_SAMPLES} transitions:")
+    print(f"  p50 {percentile(latencies, 50):8.1f} us")
+    print(f"  p99 {percentile(latencies, 99):8.1f} us")
+    print(f"  max {max(latencies):8.1f} us")
+
+
+def bench_rate(publisher, subscriber):
+    """Burst readings and count how many the subscriber handles per second"""
+    received = [0]
+
+    def handler(device_id, sensors):
+        received[0] += 1
+
+    start = time.perf_counter()
+    for i in range(BURST_SIZE):
+        publisher.publish("Soil Moisture Sensor", {"moisture": {"value": i % 100, "unit": "%"}})
+        subscriber.poll(handler)
+    # Drain whatever is still in flight
+    idle_since = time.perf_counter()
+    while time.perf_counter() - idle_since < 0.2:
+        if subscriber.poll(handler):
+            idle_since = time.perf_counter()
+    elapsed = time.perf_counter() - start
+
+    print(f"Burst of {BURST_SIZE} readings:")
+    print(f"  delivered {received[0]} ({100 * received[0] / BURST_SIZE:.1f}%)")
+    print(f"  {received[0] / elapsed:,.0f} readings/s through publish + decode + dedupe")
+
+
+def spectral_sensors(suffixes):
+    """sensorPico2's spectral payload: every channel, for each suffix ("" or "_min"/"_max")"""
+    channels = ("violet", "indigo", "blue", "cyan", "green", "yellow", "orange", "red", "clear", "nir")
+    return {f"spectral_{channel}{suffix}": {"value": 65535.5, "unit": "counts"}
+            for suffix in suffixes for channel in channels}
+
+
+def check_large(publisher, subscriber):
+    """The largest payloads arrive whole; returns True if they all did"""
+    ok = True
+    for label, sensors in (("spectral reading", spectral_sensors([""])),
+                           ("capture stats", spectral_sensors(["", "_min", "_max"]))):
+        received = []
+        malformed = subscriber.malformed
+        sent = publisher.publish("spectrometerclick_sensor", sensors)
+        deadline = time.perf_counter() + 0.5
+        while not received and time.perf_counter() < deadline:
+            subscriber.poll(lambda device_id, values: received.append(values))
+        whole = sent and len(received) == 1 and len(received[0]) == len(sensors)
+        print(f"  {label} ({len(sensors)} values): received {len(received)}, "
+              f"malformed {subscriber.malformed - malformed}: {'ok' if whole else 'FAIL'}")
+        ok = ok and whole
+    return ok
+
+
+def main():
+    if "--multicast" in sys.argv:
+        group = LOCAL_GROUP
+    else:
+        # Loopback unicast works in containers without a multicast route
+        group = "127.0.0.1"
+
+    subscriber = LocalSubscriber(group=group, port=PORT)
+    publisher = LocalPublisher(group=group, port=PORT)
+    print(f"Stand-in network: {group}:{PORT}\n")
+
+    bench_latency(publisher, subscriber)
+    print()
+    bench_rate(publisher, subscriber)
+    print("\nLargest readings:")
+    ok = check_large(publisher, subscriber)
+    print(f"\nSubscriber stats: {subscriber.stats()}")
+
+    publisher.close()
+    subscriber.close()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
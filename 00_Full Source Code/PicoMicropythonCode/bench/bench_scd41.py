@@ -0,0 +1,180 @@
+# bench_scd41.py
+# Host-side comparison of the old SCD41 loop (send read_measurement, sleep
+# 100 ms, read 9 bytes on every pass) against the data-ready driven driver.
+# A fake SCD41 on a virtual clock produces one sample every 5 s; both loops
+# run for the same simulated time and the bus traffic, blocking sleeps and
+# uploads (fresh vs duplicate) are counted. A second table runs the mode
+# scheduler over a range of reporting intervals and estimates sensor current.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_scd41.py [loop_ms] [seconds]
+
+import sys
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+import scd41  # noqa: E402
+from scd41 import SCD41  # noqa: E402
+from sensirion import encode_words  # noqa: E402
+
+OLD_READ_SLEEP_MS = 100
+
+
+REPORT_INTERVALS_MS = [5000, 15000, 30000, 60000, 300000, 600000]
+
+
+class FakeSCD41Bus:
+    """I2C stand-in for an SCD41 (periodic or single-shot) on a virtual millisecond clock"""
+
+    def __init__(self):
+        self.now = 0
+        self.interval_ms = scd41.PERIODIC_INTERVAL_MS
+        self.started_at = None
+        self.last_read_sample = 0
+        self.shot_ready_at = None
+        self.shots = 0
+        self.last_cmd = None
+        self.transactions = 0
+        self.bytes = 0
+
+    def scan(self):
+        return [scd41.SCD41_ADDR]
+
+    def _sample_index(self):
+        if self.started_at is None:
+            return 0
+        return (self.now - self.started_at) // self.interval_ms
+
+    def writeto(self, addr, buf):
+        self.transactions += 1
+        self.bytes += len(buf)
+        self.last_cmd = bytes(buf)
+        if self.last_cmd == scd41.CMD_START_PERIODIC_MEASUREMENT:
+            self.started_at = self.now
+            self.interval_ms = scd41.PERIODIC_INTERVAL_MS
+        elif self.last_cmd == scd41.CMD_START_LOW_POWER_PERIODIC_MEASUREMENT:
+            self.started_at = self.now
+            self.interval_ms = scd41.LOW_POWER_INTERVAL_MS
+        elif self.last_cmd == scd41.CMD_MEASURE_SINGLE_SHOT:
+            self.shot_ready_at = self.now + scd41.SINGLE_SHOT_MS
+        elif self.last_cmd == scd41.CMD_MEASURE_SINGLE_SHOT_RHT_ONLY:
+            self.shot_ready_at = self.now + scd41.SINGLE_SHOT_RHT_ONLY_MS
+
+    def readfrom(self, addr, length):
+        self.transactions += 1
+        self.bytes += length
+        if self.shot_ready_at is not None:
+            shot_done = self.now >= self.shot_ready_at
+            if self.last_cmd == scd41.CMD_GET_DATA_READY:
+                return encode_words([0x8006 if shot_done else 0x8000])
+            self.shot_ready_at = None
+            self.shots += 1
+            sample = self.shots
+        else:
+            sample = self._sample_index()
+            if self.last_cmd == scd41.CMD_GET_DATA_READY:
+                return encode_words([0x8006 if sample > self.last_read_sample else 0x8000])
+        # read_measurement: the latest sample (stale if nothing new), clears data-ready
+        self.last_read_sample = sample
+        return encode_words([400 + sample, 0x6666, 0x8000])[:length]
+
+
+def run_old(loop_ms, seconds):
+    bus = FakeSCD41Bus()
+    bus.writeto(scd41.SCD41_ADDR, scd41.CMD_START_PERIODIC_MEASUREMENT)
+    uploads, duplicates, blocked_ms = 0, 0, 5000  # Old start blocked 5 s for the first sample
+    last_co2 = None
+    seen = set()
+    bus.now = 5000
+    while bus.now < seconds * 1000:
+        bus.writeto(scd41.SCD41_ADDR, scd41.CMD_READ_MEASUREMENT)
+        blocked_ms += OLD_READ_SLEEP_MS
+        data = bus.readfrom(scd41.SCD41_ADDR, 9)
+        co2 = data[0] << 8 | data[1]
+        uploads += 1
+        if co2 == last_co2:
+            duplicates += 1
+        seen.add(co2)
+        last_co2 = co2
+        bus.now += loop_ms + OLD_READ_SLEEP_MS
+    return bus, uploads, duplicates, blocked_ms, len(seen)
+
+
+def run_new(loop_ms, seconds):
+    bus = FakeSCD41Bus()
+    sensor = SCD41(bus)
+    sensor.start_periodic()
+    # start_periodic() scheduled against the real clock; rebase onto the virtual one
+    sensor.sample_due = sensor.next_check = sensor.interval_ms
+    uploads, duplicates = 0, 0
+    last_co2 = None
+    seen = set()
+    while bus.now < seconds * 1000:
+        reading = sensor.poll(bus.now)
+        if reading is not None:
+            uploads += 1
+            if reading[0] == last_co2:
+                duplicates += 1
+            seen.add(reading[0])
+            last_co2 = reading[0]
+        bus.now += loop_ms
+    blocked_ms = sensor.ready_checks * scd41.COMMAND_DELAY_MS + sensor.reads * scd41.COMMAND_DELAY_MS
+    return bus, uploads, duplicates, blocked_ms, len(seen)
+
+
+def run_scheduler(report_ms, seconds, co2_every):
+    """Readings and bus traffic when the driver picks its mode from report_ms"""
+    bus = FakeSCD41Bus()
+    sensor = SCD41(bus)
+    mode = sensor.start(report_ms, co2_every)
+    # Rebase the driver's real-clock schedule onto the virtual one
+    if mode == scd41.MODE_SINGLE_SHOT:
+        sensor.next_shot = sensor.next_check = 0
+    else:
+        sensor.sample_due = sensor.next_check = sensor.interval_ms
+
+    readings, co2_readings = 0, 0
+    while bus.now < seconds * 1000:
+        reading = sensor.poll(bus.now)
+        if reading is not None:
+            readings += 1
+            if reading[0] is not None:
+                co2_readings += 1
+        bus.now += 100
+    return mode, readings, co2_readings, bus.transactions
+
+
+def report_modes(seconds):
+    print(f"\nMode scheduler over {seconds} s (main loop every 100 ms):")
+    print(f"  {'report':<14}{'mode':<13}{'readings':>8}{'co2':>5}{'I2C ops':>9}   est. current")
+    for report_ms in REPORT_INTERVALS_MS:
+        for co2_every in (1, 4):
+            mode = scd41.select_mode(report_ms)
+            if co2_every > 1 and mode != scd41.MODE_SINGLE_SHOT:
+                continue
+            mode, readings, co2, ops = run_scheduler(report_ms, seconds, co2_every)
+            current = scd41.estimated_current_ma(mode, report_ms, co2_every)
+            label = f"{report_ms // 1000} s" + (f" co2 1/{co2_every}" if co2_every > 1 else "")
+            print(f"  {label:<14}{mode:<13}{readings:>8}{co2:>5}{ops:>9}   {current:6.2f} mA")
+    print(f"  (always-on periodic: {scd41.PERIODIC_CURRENT_MA:.2f} mA)")
+
+
+def report(name, result, seconds):
+    bus, uploads, duplicates, blocked_ms, distinct = result
+    print(f"{name}:")
+    print(f"  I2C transactions {bus.transactions:6d}  ({bus.bytes} bytes)")
+    print(f"  blocking sleeps  {blocked_ms:6d} ms ({100 * blocked_ms / (seconds * 1000):.1f}% of run)")
+    print(f"  uploads          {uploads:6d}  ({duplicates} duplicates, {distinct} distinct samples)")
+
+
+def main():
+    loop_ms = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    samples = seconds * 1000 // scd41.PERIODIC_INTERVAL_MS
+    print(f"{seconds} s simulated, main loop every {loop_ms} ms, sensor makes {samples} samples\n")
+    report("Fixed-sleep read every pass", run_old(loop_ms, seconds), seconds)
+    report("Data-ready driven", run_new(loop_ms, seconds), seconds)
+    report_modes(max(seconds, 3600))
+
+
+if __name__ == "__main__":
+    main()
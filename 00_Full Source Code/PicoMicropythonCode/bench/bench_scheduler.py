@@ -0,0 +1,229 @@
+# bench_scheduler.py
+# Host-side comparison of the fan + sensor node's main loop (as in
+# cj/combine_fan&sensor.py) before and after the multi-rate scheduler, on a
+# virtual clock:
+#
+#   old:        one loop pass per 100 ms sleep: MQTT check, status every 30
+#               s and the spectrometer every 5 s, both timed with whole-second
+#               time.time(), and a blocking two-bank spectral read
+#   scheduler:  tasks with their own periods in a min-heap; the CPU sleeps
+#               until the next due task, the spectral read is started and
+#               collected by the task returning how long until it's ready
+#
+# Uploads take 150-450 ms (HTTPS POST), fan commands arrive over MQTT at
+# random, and the SCD41 produces a sample every 5 s on its own clock. The
+# bench reports each periodic job's achieved period and interval jitter,
+# how stale CO2 samples are when read, fan command latency, wakeups and how
+# much of the time the CPU could sleep. The scheduler's own per-task stats
+# (lateness, overruns) follow.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_scheduler.py [seconds]
+
+import math
+import random
+import sys
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+import scheduler  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+
+SECONDS = int(sys.argv[1]) if len(sys.argv) > 1 else 3600
+SCD41_INTERVAL_MS = 5000
+SCD41_PHASE_MS = 1300  # Sensor's first sample after the loop starts
+SPECTRO_INTERVAL_MS = 5000
+STATUS_INTERVAL_MS = 30000
+MQTT_POLL_MS = 100
+INTEGRATION_MS = 170  # Per bank (ATIME 0x3C, ASTEP 999)
+SMUX_MS = 5
+COMMAND_MEAN_S = 20  # Mean time between fan commands
+CHECK_MSG_MS = 1
+
+
+class Clock:
+    """Virtual millisecond clock; awake time is everything not slept"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+        self.wakeups = 0
+
+    def advance(self, ms):
+        self.now += ms
+
+    def sleep(self, ms):
+        self.now += ms
+        self.slept += ms
+        self.wakeups += 1
+
+
+class Node:
+    """The jobs the loop runs, with their costs on the virtual clock"""
+
+    def __init__(self, clock, seed=1):
+        self.clock = clock
+        self.rng = random.Random(seed)
+        # Fan commands waiting on the broker, by arrival time
+        self.commands = []
+        t = 0.0
+        while t < SECONDS * 1000:
+            t += self.rng.expovariate(1 / (COMMAND_MEAN_S * 1000))
+            self.commands.append(t)
+        self.command_latency = []
+        self.co2_last_sample = None
+        self.co2_staleness = []
+        self.starts = {"status": [], "co2": [], "spectro": []}
+        self.spectro_bank = None
+
+    def upload(self):
+        self.clock.advance(self.rng.uniform(150, 450))
+
+    def check_msg(self):
+        self.clock.advance(CHECK_MSG_MS)
+        while self.commands and self.commands[0] <= self.clock.now:
+            self.command_latency.append(self.clock.now - self.commands.pop(0))
+            self.clock.advance(5)  # Switch the fan, publish the ack
+
+    def send_status(self):
+        self.starts["status"].append(self.clock.now)
+        self.upload()
+
+    def _latest_sample(self):
+        if self.clock.now < SCD41_PHASE_MS:
+            return None
+        return SCD41_PHASE_MS + (self.clock.now - SCD41_PHASE_MS) // SCD41_INTERVAL_MS * SCD41_INTERVAL_MS
+
+    def co2_ms_until_due(self):
+        """Whole ms until the next sample, as the driver's ticks_ms arithmetic gives"""
+        latest = self._latest_sample()
+        if latest is None:
+            return math.ceil(SCD41_PHASE_MS - self.clock.now)
+        return math.ceil(latest + SCD41_INTERVAL_MS - self.clock.now)
+
+    def co2_poll(self):
+        """Driver poll: data-ready check, then read and upload a fresh sample"""
+        latest = self._latest_sample()
+        if latest is None or latest == self.co2_last_sample:
+            return
+        self.clock.advance(2)  # Data-ready check + 9-byte read
+        self.starts["co2"].append(self.clock.now)
+        self.co2_staleness.append(self.clock.now - latest)
+        self.co2_last_sample = latest
+        self.upload()
+
+    def spectro_blocking(self):
+        self.starts["spectro"].append(self.clock.now)
+        for bank in range(2):
+            self.clock.advance(SMUX_MS + INTEGRATION_MS + 1)
+        self.upload()
+
+    def spectro_step(self):
+        """start()/poll() split: returns ms until the sensor needs the bus again"""
+        if self.spectro_bank is None:
+            self.starts["spectro"].append(self.clock.now)
+            self.clock.advance(SMUX_MS)
+            self.spectro_bank = 0
+            self.spectro_ready = self.clock.now + INTEGRATION_MS
+            return INTEGRATION_MS
+        if self.clock.now < self.spectro_ready:
+            return math.ceil(self.spectro_ready - self.clock.now)
+        self.clock.advance(1)
+        if self.spectro_bank == 0:
+            self.clock.advance(SMUX_MS)
+            self.spectro_bank = 1
+            self.spectro_ready = self.clock.now + INTEGRATION_MS
+            return INTEGRATION_MS
+        self.spectro_bank = None
+        self.upload()
+        return None
+
+
+def run_old(node, clock):
+    """The loop in cj/combine_fan&sensor.py"""
+    last_status_time = 0
+    last_sensor_time = 0
+    while clock.now < SECONDS * 1000:
+        current_time = int(clock.now // 1000)  # time.time() on the Pico: whole seconds
+        node.check_msg()
+        if current_time - last_status_time > 30:
+            node.send_status()
+            last_status_time = current_time
+        node.co2_poll()
+        if current_time - last_sensor_time > 5:
+            last_sensor_time = current_time
+            node.spectro_blocking()
+        clock.sleep(100)
+
+
+def run_scheduler(node, clock):
+    scheduler.ticks_ms = lambda: int(clock.now)
+    scheduler.ticks_us = lambda: int(clock.now * 1000)
+    tasks = Scheduler()
+
+    def sleep(ms):
+        clock.sleep(ms)
+        if clock.now >= SECONDS * 1000:
+            tasks.stop()
+
+    scheduler.sleep_ms = sleep
+    tasks.add("mqtt", node.check_msg, MQTT_POLL_MS)
+    tasks.add("status", node.send_status, STATUS_INTERVAL_MS, offset_ms=STATUS_INTERVAL_MS)
+
+    def co2():
+        node.co2_poll()
+        return node.co2_ms_until_due()
+
+    # First run when the sensor's first sample is due, so periods and samples line up
+    tasks.add("co2", co2, SCD41_INTERVAL_MS, offset_ms=node.co2_ms_until_due())
+    # Half a period out of phase with the SCD41 so the two uploads don't collide
+    tasks.add("spectro", node.spectro_step, SPECTRO_INTERVAL_MS, offset_ms=SPECTRO_INTERVAL_MS // 2)
+    tasks.run()
+    return tasks
+
+
+def intervals(starts):
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    if not gaps:
+        return 0, 0, 0
+    return sum(gaps) / len(gaps), min(gaps), max(gaps)
+
+
+def report(label, node, clock):
+    print(f"{label}:")
+    for job, nominal in (("co2", SCD41_INTERVAL_MS), ("spectro", SPECTRO_INTERVAL_MS),
+                         ("status", STATUS_INTERVAL_MS)):
+        mean, low, high = intervals(node.starts[job])
+        print(f"  {job:<8} {len(node.starts[job]):>5} runs, period {mean / 1000:6.2f} s "
+              f"(nominal {nominal // 1000} s), jitter {(high - low) / 1000:5.2f} s")
+    staleness = node.co2_staleness
+    latency = sorted(node.command_latency)
+    print(f"  CO2 sample age when read: avg {sum(staleness) / len(staleness):.0f} ms, max {max(staleness):.0f} ms")
+    print(f"  fan command latency: avg {sum(latency) / len(latency):.0f} ms, "
+          f"p95 {latency[int(0.95 * len(latency))]:.0f} ms, max {latency[-1]:.0f} ms ({len(latency)} commands)")
+    awake = 100 * (1 - clock.slept / clock.now)
+    print(f"  wakeups {clock.wakeups / (clock.now / 60000):.0f}/min, CPU awake {awake:.1f}%\n")
+
+
+def main():
+    print(f"{SECONDS // 60} min of the fan + sensor node: CO2 and spectrum every 5 s, status every 30 s,"
+          f" fan commands every ~{COMMAND_MEAN_S} s\n")
+    clock = Clock()
+    node = Node(clock)
+    run_old(node, clock)
+    report("old loop (100 ms sleep, whole-second timers, blocking spectral read)", node, clock)
+
+    clock = Clock()
+    node = Node(clock)
+    tasks = run_scheduler(node, clock)
+    report("scheduler", node, clock)
+
+    print("Scheduler task stats:")
+    print(f"  {'task':<8} {'period':>7} {'runs':>6} {'late avg':>9} {'late max':>9} {'run max':>8} "
+          f"{'overruns':>8} {'skipped':>7}")
+    for name, stats in tasks.stats()["tasks"].items():
+        print(f"  {name:<8} {stats['period_ms']:>5}ms {stats['runs']:>6} {stats['late_avg_ms']:>7}ms "
+              f"{stats['late_max_ms']:>7}ms {stats['run_max_ms']:>6}ms {stats['overruns']:>8} {stats['skipped']:>7}")
+
+
+if __name__ == "__main__":
+    main()
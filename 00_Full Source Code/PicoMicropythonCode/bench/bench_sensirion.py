@@ -0,0 +1,160 @@
+# bench_sensirion.py
+# Codec benchmark for the shared Sensirion word codec (lib/sensirion.py):
+# checks the table CRC against the bit-by-bit reference, compares 9-byte
+# SCD41 frame decoding against the old per-word calculate_crc approach,
+# and measures what a corrupt frame costs the SCD41 driver (re-reads, bus
+# transactions, time) versus a clean one.
+#
+# Uses only compat ticks so it runs on CPython and the MicroPython unix port.
+# Run from PicoMicropythonCode/:  python3 bench/bench_sensirion.py
+#                            or:  micropython bench/bench_sensirion.py
+
+import sys
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+import scd41  # noqa: E402
+from compat import ticks_us, ticks_diff  # noqa: E402
+from scd41 import SCD41  # noqa: E402
+from sensirion import crc8, decode_words, encode_words  # noqa: E402
+
+FRAMES = 20000
+READS = 200
+
+
+def calculate_crc(data):
+    """The bit-by-bit CRC the sensor scripts used before"""
+    crc = 0xFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 0x80:
+                crc = (crc << 1) ^ 0x31
+            else:
+                crc = crc << 1
+    return crc & 0xFF
+
+
+def legacy_decode(data):
+    """Old read_measurement parsing: three sliced CRCs, then the words"""
+    if calculate_crc(data[0:2]) != data[2]:
+        return None
+    if calculate_crc(data[3:5]) != data[5]:
+        return None
+    if calculate_crc(data[6:8]) != data[8]:
+        return None
+    return [(data[0] << 8) | data[1], (data[3] << 8) | data[4], (data[6] << 8) | data[7]]
+
+
+class FlakyBus:
+    """SCD41 stand-in whose next reads can be corrupted or NACKed"""
+
+    def __init__(self):
+        self.frame = encode_words([0x8006])
+        self.corrupt_next = 0
+        self.nack_after_corrupt = False
+        self.emptied = False
+        self.transactions = 0
+
+    def writeto(self, addr, buf):
+        self.transactions += 1
+        if buf == scd41.CMD_READ_MEASUREMENT:
+            self.frame = None if self.emptied else encode_words([612, 0x6666, 0x8000])
+
+    def readfrom(self, addr, length):
+        self.transactions += 1
+        if self.corrupt_next:
+            self.corrupt_next -= 1
+            frame = bytearray(self.frame)
+            frame[4] ^= 0x10  # Flip one bit in the temperature word
+            if self.nack_after_corrupt:
+                # Like the real buffer: emptied by the read, even a bad one
+                self.emptied = True
+            return frame
+        if self.frame is None:
+            raise OSError(5)  # EIO, as MicroPython reports a NACK
+        return self.frame
+
+
+def check_crc():
+    assert crc8(b"\xbe\xef") == 0x92, "datasheet example"
+    for a in range(256):
+        for b in range(0, 256, 7):
+            assert crc8(bytes([a, b])) == calculate_crc(bytes([a, b]))
+    print("CRC table matches bit-by-bit reference (datasheet 0xBEEF -> 0x92)")
+
+
+def bench_decode():
+    frame = encode_words([612, 0x6666, 0x8000])
+    out = [0, 0, 0]
+
+    start = ticks_us()
+    for _ in range(FRAMES):
+        legacy_decode(frame)
+    legacy_us = ticks_diff(ticks_us(), start)
+
+    start = ticks_us()
+    for _ in range(FRAMES):
+        decode_words(frame)
+    table_us = ticks_diff(ticks_us(), start)
+
+    start = ticks_us()
+    for _ in range(FRAMES):
+        decode_words(frame, out)
+    reuse_us = ticks_diff(ticks_us(), start)
+
+    print(f"\nDecoding {FRAMES} 9-byte frames:")
+    for name, elapsed in (("bit-by-bit CRC", legacy_us), ("table CRC", table_us),
+                          ("table CRC, reused list", reuse_us)):
+        print(f"  {name:<24}{FRAMES * 1000000 // max(1, elapsed):>9} frames/s"
+              f"  {elapsed / FRAMES:6.2f} us/frame")
+
+
+def time_reads(setup):
+    bus = FlakyBus()
+    sensor = SCD41(bus)
+    results = 0
+    elapsed = 0
+    for _ in range(READS):
+        bus.emptied = False
+        setup(bus)
+        start = ticks_us()
+        if sensor.read_measurement() is not None:
+            results += 1
+        elapsed += ticks_diff(ticks_us(), start)
+    return results, bus.transactions / READS, elapsed / READS, sensor
+
+
+def bench_corrupt():
+    def clean(bus):
+        bus.corrupt_next = 0
+        bus.nack_after_corrupt = False
+
+    def one_bad(bus):
+        bus.corrupt_next = 1
+        bus.nack_after_corrupt = False
+
+    def always_bad(bus):
+        bus.corrupt_next = 1 + SCD41.FRAME_REREADS
+        bus.nack_after_corrupt = False
+
+    def bad_then_nack(bus):
+        bus.corrupt_next = 1
+        bus.nack_after_corrupt = True
+
+    print(f"\nSCD41 read_measurement over {READS} reads (includes the 1 ms command delay):")
+    for name, setup in (("clean frame", clean), ("one corrupt, re-read ok", one_bad),
+                        ("corrupt every attempt", always_bad), ("corrupt, then NACK", bad_then_nack)):
+        good, ops, us, sensor = time_reads(setup)
+        print(f"  {name:<26}{good:>4} good  {ops:4.1f} bus ops  {us / 1000:5.2f} ms"
+              f"  crc_errors {sensor.crc_errors}, dropped {sensor.dropped}")
+
+
+def main():
+    check_crc()
+    bench_decode()
+    bench_corrupt()
+
+
+if __name__ == "__main__":
+    main()
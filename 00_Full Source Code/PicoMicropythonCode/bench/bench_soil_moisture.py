@@ -0,0 +1,107 @@
+# bench_soil_moisture.py
+# Host-side comparison of soil moisture readings:
+#
+#   old:    one ADC.read_u16() per upload, mapped with 0 / 65535 placeholders
+#   driver: timer oversampling into the array('H') ring, median, mean or
+#           trimmed-mean filter, and per-probe dry/wet calibration
+#
+# A fake capacitive probe reads 50000 counts dry and 22000 wet, with ADC
+# noise and occasional spikes (pump motor, Wi-Fi bursts). Soil is held at a
+# fixed true moisture; the bench reports the spread of uploaded values, how
+# far they are from the truth, and what each filter costs per reading.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_soil_moisture.py [true_percent]
+
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+from compat import ticks_us, ticks_diff  # noqa: E402
+from soil_moisture import (  # noqa: E402
+    MoistureCalibration, MoistureSampler, to_percent,
+    FILTER_MEDIAN, FILTER_MEAN, FILTER_TRIMMED, WINDOW
+)
+
+PROBE_DRY = 50000
+PROBE_WET = 22000
+NOISE = 600  # ADC noise, counts RMS
+SPIKE_CHANCE = 0.03
+UPLOADS = 200
+
+
+class FakeProbe:
+    """ADC stand-in for a capacitive probe in soil of a given moisture"""
+
+    def __init__(self, percent, seed=1):
+        self.rng = random.Random(seed)
+        self.level = PROBE_DRY - (PROBE_DRY - PROBE_WET) * percent / 100
+
+    def read_u16(self):
+        rng = self.rng
+        value = self.level + rng.gauss(0, NOISE)
+        if rng.random() < SPIKE_CHANCE:
+            value += rng.choice((-1, 1)) * rng.uniform(5000, 15000)
+        return max(0, min(65535, int(value)))
+
+
+def summarize(name, values, truth, us=None):
+    mean = sum(values) / len(values)
+    spread = (sum((v - mean) ** 2 for v in values) / len(values)) ** 0.5
+    worst = max(abs(v - truth) for v in values)
+    cost = f"  {us:6.0f} us/reading" if us is not None else ""
+    print(f"  {name:<26} mean {mean:5.1f}%  stddev {spread:5.2f}%  worst {worst:5.1f}% off{cost}")
+
+
+def main():
+    truth = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    print(f"Probe dry {PROBE_DRY}, wet {PROBE_WET}, true moisture {truth:.0f}%, "
+          f"{UPLOADS} uploads, {WINDOW}-sample window\n")
+
+    probe = FakeProbe(truth)
+    old = [max(0, min(100, 100 - probe.read_u16() / 65535 * 100)) for _ in range(UPLOADS)]
+    print("Single sample per upload:")
+    summarize("uncalibrated (0 / 65535)", old, truth)
+    probe = FakeProbe(truth)
+    single = [to_percent(probe.read_u16(), PROBE_DRY, PROBE_WET) for _ in range(UPLOADS)]
+    summarize("calibrated", single, truth)
+
+    print("Oversampled and calibrated:")
+    calibration = MoistureCalibration(os.path.join(tempfile.mkdtemp(), "moisture_cal.json"))
+    for mode in (FILTER_MEAN, FILTER_MEDIAN, FILTER_TRIMMED):
+        sampler = MoistureSampler({"soil": FakeProbe(truth)}, calibration)
+        # Calibrate the way a user would over MQTT: probe in dry air, then in water
+        sampler.adcs[0].level = PROBE_DRY
+        for _ in range(WINDOW):
+            sampler.sample()
+        sampler.handle_command("capture", {"probe": "soil", "point": "dry"})
+        sampler.adcs[0].level = PROBE_WET
+        for _ in range(WINDOW):
+            sampler.sample()
+        sampler.handle_command("capture", {"probe": "soil", "point": "wet"})
+        sampler.adcs[0].level = PROBE_DRY - (PROBE_DRY - PROBE_WET) * truth / 100
+
+        values = []
+        elapsed = 0
+        for _ in range(UPLOADS):
+            for _ in range(WINDOW):
+                sampler.sample()
+            start = ticks_us()
+            values.append(sampler.reading("soil", mode)[1])
+            elapsed += ticks_diff(ticks_us(), start)
+        summarize(f"{mode} filter", values, truth, elapsed / UPLOADS)
+
+    restored = MoistureCalibration(calibration.cal_file)
+    restored.restore()
+    print(f"\nCalibration in flash after capture: {restored.points}")
+    sampler = MoistureSampler({"soil": FakeProbe(truth)})
+    start = ticks_us()
+    for _ in range(1000):
+        sampler.sample()
+    print(f"Timer callback cost: {ticks_diff(ticks_us(), start) / 1000:.1f} us/sample (one probe)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# bench_supervisor.py
+# Host-side comparison of the actuator Pico's recovery from network faults,
+# before and after lib/supervisor.py, on a virtual clock:
+#
+#   reset:     the old `except Exception: machine.reset()`. Every fault
+#              costs a boot, a Wi-Fi connect (polled once a second), an
+#              MQTT connect and the five subscriptions. If the broker is
+#              still down the connect fails and the Pico resets again; if
+#              Wi-Fi is still down connect_wifi() gives up after 20 s and
+#              main() returns, leaving the Pico dead until power-cycled.
+#   in place:  actuatorPico's loop with the real Supervisor. A broker drop
+#              only reconnects the socket (same client object and id); a
+#              Wi-Fi drop is traced to the link by its check and retried
+#              with backoff; a broker restart retries the connect. The pump
+#              timer keeps running throughout.
+#
+# Faults over the run: broker connections dropped (RST, e.g. a broker
+# failover or a NAT timeout), broker restarts (connect refused for 10-60 s)
+# and Wi-Fi outages (AP reboot, 5-90 s). The bench reports the MTTR per
+# fault kind, total time without MQTT and Pico resets. A timed pump run is
+# requested every 30 min; the old run_duration() blocked the loop for the
+# whole run (no check_msg, and no 8 s watchdog possible), the new one is a
+# deadline checked each pass, so the bench also checks that every run
+# delivered its full time through the faults and reports the longest loop
+# stall. Faults during a blocking run were only noticed when it ended,
+# which the reset figures leave out, so they are a lower bound.
+#
+# Run from PicoMicropythonCode/:  python3 bench/bench_supervisor.py [hours]
+
+import bisect
+import random
+import sys
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/lib")
+
+import supervisor  # noqa: E402
+from supervisor import Supervisor  # noqa: E402
+
+HOURS = float(sys.argv[1]) if len(sys.argv) > 1 else 72
+LOOP_MS = 100  # time.sleep(0.1) per pass
+BOOT_MS = 650  # Reset to main.py, imports included
+WIFI_CONNECT_MS = 2450  # Scan, association and DHCP
+WIFI_POLLS = 20  # connect_wifi(): 20 checks a second apart
+MQTT_CONNECT_MS = 350  # DNS, TCP and CONNECT/CONNACK to a public broker
+REFUSED_MS = 60  # A connect refused while the broker restarts
+SUBSCRIPTIONS = 5  # Commands, broadcast, rules, telemetry, one WLED state topic
+SUBACK_MS = 90
+DROPS_PER_DAY = 12
+BROKER_RESTARTS_PER_DAY = 3
+BROKER_DOWN_S = (10, 60)
+WIFI_OUTAGES_PER_DAY = 4
+WIFI_DOWN_S = (5, 90)
+PUMP_EVERY_S = 1800
+PUMP_RUN_S = 120
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def sleep(self, ms):
+        self.now += ms
+
+
+class Faults:
+    """Fault timeline: when each happens, and what is down when"""
+
+    def __init__(self, rng, end_ms):
+        def times(per_day):
+            out = []
+            t = rng.expovariate(per_day / 86400000)
+            while t < end_ms:
+                out.append(int(t))
+                t += rng.expovariate(per_day / 86400000)
+            return out
+
+        self.drops = times(DROPS_PER_DAY)
+        self.broker = [(t, t + int(rng.uniform(*BROKER_DOWN_S) * 1000)) for t in times(BROKER_RESTARTS_PER_DAY)]
+        self.wifi = [(t, t + int(rng.uniform(*WIFI_DOWN_S) * 1000)) for t in times(WIFI_OUTAGES_PER_DAY)]
+        self.wifi_starts = [start for start, _ in self.wifi]
+        self.broker_starts = [start for start, _ in self.broker]
+
+    @staticmethod
+    def inside(outages, t):
+        return any(start <= t < end for start, end in outages)
+
+    @staticmethod
+    def any_between(starts, since, now):
+        """Whether one of starts falls in (since, now]"""
+        i = bisect.bisect_right(starts, since)
+        return i < len(starts) and starts[i] <= now
+
+    def kinds(self):
+        """(time, kind) of every fault, in order"""
+        events = [(t, "broker drop") for t in self.drops]
+        events += [(start, "broker restart") for start, _ in self.broker]
+        events += [(start, "Wi-Fi outage") for start, _ in self.wifi]
+        return sorted(events)
+
+
+class FakeWLAN:
+    def __init__(self, clock, faults):
+        self.clock = clock
+        self.faults = faults
+        self.joined_at = None
+
+    def active(self, on=None):
+        pass
+
+    def connect(self, ssid=None, password=None):
+        # A join tried while the AP is away fails; connect_wifi tries again
+        now = self.clock.now
+        self.joined_at = None if Faults.inside(self.faults.wifi, now) else now + WIFI_CONNECT_MS
+
+    def disconnect(self):
+        self.joined_at = None
+
+    def isconnected(self):
+        now = self.clock.now
+        if self.joined_at is None or now < self.joined_at:
+            return False
+        if Faults.any_between(self.faults.wifi_starts, self.joined_at, now):
+            self.joined_at = None  # The AP went away since
+            return False
+        return True
+
+
+class FakeMQTT:
+    """umqtt.simple's MQTTClient against the fault timeline"""
+
+    def __init__(self, clock, faults, wlan):
+        self.clock = clock
+        self.faults = faults
+        self.wlan = wlan
+        self.sock = None
+        self.since = None
+        self.connects = 0
+
+    def connect(self, timeout=None):
+        if not self.wlan.isconnected():
+            self.clock.sleep(REFUSED_MS)
+            raise OSError(113)  # EHOSTUNREACH
+        if Faults.inside(self.faults.broker, self.clock.now):
+            self.clock.sleep(REFUSED_MS)
+            raise OSError(111)  # ECONNREFUSED
+        self.clock.sleep(MQTT_CONNECT_MS)
+        self.sock = True
+        self.since = self.clock.now
+        self.connects += 1
+
+    def _check(self):
+        now = self.clock.now
+        if (self.sock is None or not self.wlan.isconnected() or
+                Faults.any_between(self.faults.drops, self.since, now) or
+                Faults.any_between(self.faults.broker_starts, self.since, now)):
+            self.sock = None
+            raise OSError(104)  # ECONNRESET
+
+    def subscribe(self, topic):
+        self._check()
+        self.clock.sleep(SUBACK_MS)
+
+    def check_msg(self):
+        self._check()
+
+    def ping(self):
+        self._check()
+
+
+def reset_recovery(faults, t):
+    """The old firmware from a fault at t: ms until MQTT is back, or None if it never is"""
+    start = t
+    while True:
+        t += BOOT_MS
+        # connect_wifi(): one join, status checked once a second for 20 s
+        if Faults.inside(faults.wifi, t):
+            return None  # Gave up; main() returned
+        t += -(-WIFI_CONNECT_MS // 1000) * 1000
+        if Faults.inside(faults.broker, t):
+            t += REFUSED_MS
+            continue  # MQTT error -> machine.reset()
+        t += MQTT_CONNECT_MS + SUBSCRIPTIONS * SUBACK_MS
+        return t - start
+
+
+def run_reset(faults):
+    """Each fault on its own, as if the Pico had been up until then"""
+    by_kind = {}
+    down = 0
+    for t, kind in faults.kinds():
+        took = reset_recovery(faults, t)
+        by_kind.setdefault(kind, []).append(took)
+        down += took or 0
+    return by_kind, down
+
+
+def run_in_place(faults, end_ms):
+    clock = Clock()
+    supervisor.ticks_ms = lambda: clock.now
+    supervisor.sleep_ms = clock.sleep
+    supervisor.print = lambda *args: None  # Quiet the per-failure messages
+    wlan = FakeWLAN(clock, faults)
+    client = FakeMQTT(clock, faults, wlan)
+    pump = {"stop_at": None, "on_at": None, "delivered": 0, "requested": 0}
+
+    def pump_on(seconds):
+        if pump["on_at"] is None:
+            pump["on_at"] = clock.now
+        pump["stop_at"] = clock.now + seconds * 1000
+        pump["requested"] += seconds * 1000
+
+    def check_pump():
+        if pump["stop_at"] is not None and clock.now >= pump["stop_at"]:
+            pump["delivered"] += clock.now - pump["on_at"]
+            pump["stop_at"] = pump["on_at"] = None
+
+    sup = Supervisor(None, idle=check_pump)
+
+    def connect_wifi():
+        # As in the firmware: one join, then checks a second apart
+        wlan.active(True)
+        if not wlan.isconnected():
+            wlan.connect()
+            for _ in range(WIFI_POLLS):
+                if wlan.isconnected():
+                    break
+                sup.wait(1000)
+        return wlan.isconnected()
+
+    def connect_mqtt():
+        client.connect()
+        for _ in range(SUBSCRIPTIONS):
+            client.subscribe("topic")
+        return True
+
+    def close_mqtt():
+        client.sock = None
+
+    def mqtt_alive():
+        client.ping()
+        return True
+
+    sup.add("wifi", connect_wifi, stop=wlan.disconnect, check=wlan.isconnected)
+    sup.add("mqtt", connect_mqtt, stop=close_mqtt, check=mqtt_alive, needs="wifi", check_ms=15000)
+    sup.start()
+
+    # Each MQTT recovery, as the supervisor timed it, goes to the fault before it
+    mqtt = sup.subsystems["mqtt"]
+    kinds = faults.kinds()
+    by_kind = {}
+    recoveries = mqtt.recoveries
+    mttr_total = mqtt.mttr_total
+    next_pump = PUMP_EVERY_S * 1000 // 2
+    stall = 0
+    while clock.now < end_ms:
+        before = clock.now
+        sup.run("mqtt", client.check_msg)
+        if clock.now >= next_pump:
+            # The command arrives over MQTT, or is retried by the server once it's back
+            if sup.up("mqtt"):
+                pump_on(PUMP_RUN_S)
+                next_pump += PUMP_EVERY_S * 1000
+        check_pump()
+        sup.poll()
+        if mqtt.recoveries != recoveries:
+            took = mqtt.mttr_total - mttr_total
+            i = bisect.bisect_right(kinds, (clock.now - took, "~")) - 1
+            by_kind.setdefault(kinds[i][1], []).append(took)
+            recoveries = mqtt.recoveries
+            mttr_total = mqtt.mttr_total
+        stall = max(stall, clock.now - before)
+        clock.sleep(LOOP_MS)
+    check_pump()
+    return by_kind, mqtt.mttr_total, sup, pump, stall, client.connects
+
+
+def mean(values):
+    return sum(values) / len(values) if values else 0
+
+
+def report_kinds(by_kind, kinds):
+    print(f"  {'fault':<15} {'count':>6} {'MTTR':>9} {'worst':>9} {'never back':>11}")
+    for kind in kinds:
+        times = by_kind.get(kind, [])
+        done = [t for t in times if t is not None]
+        worst = f"{max(done) / 1000:>8.1f}s" if done else f"{'-':>9}"
+        print(f"  {kind:<15} {len(times):>6} {mean(done) / 1000:>8.1f}s {worst} {len(times) - len(done):>11}")
+
+
+def main():
+    end_ms = int(HOURS * 3600000)
+    faults = Faults(random.Random(11), end_ms)
+    kinds = ("broker drop", "broker restart", "Wi-Fi outage")
+    print(f"{HOURS:g} h of the actuator Pico: {len(faults.drops)} broker drops, {len(faults.broker)} broker "
+          f"restarts, {len(faults.wifi)} Wi-Fi outages\n")
+
+    by_kind, down = run_reset(faults)
+    dead = sum(times.count(None) for times in by_kind.values())
+    print("reset (machine.reset() on any error), each fault on its own:")
+    report_kinds(by_kind, kinds)
+    print(f"  without MQTT {down / 1000:.0f} s, {len(faults.kinds())} resets, {dead} of which leave the Pico"
+          f" dead until power-cycled (not counted)")
+    print(f"  pump runs block the loop for {PUMP_RUN_S} s each\n")
+
+    by_kind, down, sup, pump, stall, connects = run_in_place(faults, end_ms)
+    print("in place (supervisor):")
+    report_kinds(by_kind, kinds)
+    print(f"  without MQTT {down / 1000:.0f} s, 0 resets, {connects} MQTT connects")
+    full = pump["delivered"] == pump["requested"]
+    print(f"  pump: {pump['requested'] // 1000} s requested, {pump['delivered'] // 1000} s delivered"
+          f" ({'ok' if full else 'FAIL'}), longest loop stall {stall / 1000:.1f} s\n")
+
+    print("Supervisor stats:")
+    print(f"  {'subsystem':<9} {'failures':>8} {'attempts':>8} {'recovered':>9} {'MTTR':>8} {'worst':>8}")
+    for name, stats in sup.stats(end_ms)["subsystems"].items():
+        print(f"  {name:<9} {stats['failures']:>8} {stats['attempts']:>8} {stats['recoveries']:>9} "
+              f"{stats['mttr_ms'] / 1000:>7.1f}s {stats['mttr_max_ms'] / 1000:>7.1f}s")
+    if not full:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# fake_i2c.py
+# Scriptable machine.I2C stand-in for the host benches.
+#
+# FakeI2C carries fake devices by address on a virtual millisecond clock.
+# Every transaction advances the clock by its wire time at the bus rate, and
+# patch_clock() makes the drivers' ticks_ms and sleep_ms follow it too, so a
+# bench sees the timing the Pico would without waiting for it. Scripted
+# actions run when the clock passes their time (at(ms, fn)), e.g. to change
+# a reading or unplug a device mid-run.
+#
+# Faults are injected per transaction: fail(addr, NACK) queues one for the
+# device's next transaction and fail(addr, CORRUPT) for its next read, and
+# error_rate(nack, corrupt) makes them random. A corrupt read flips one bit
+# of the data coming back, as noise on SDA would.
+#
+# The three device models match i2c_device's driver kinds:
+#   FakeRegisterDevice  byte registers behind an auto-incrementing pointer
+#   FakeCommandDevice   Sensirion-style 16-bit commands answered with
+#                       word+CRC frames; NACKs reads while a command executes
+#   FakeFrameDevice     a fixed-length frame produced on every read
+#
+# Not a bench itself: import it from one after the sys.path line, e.g.
+#   sys.path.insert(0, __file__.rsplit("/", 1)[0])
+
+import heapq
+import random
+
+from sensirion import encode_words
+
+NACK = "nack"
+CORRUPT = "corrupt"
+
+
+class FakeI2C:
+    def __init__(self, freq=100000, seed=1):
+        self.freq = freq
+        self.bit_ms = 1000 / freq
+        self.rng = random.Random(seed)
+        self.now = 0.0
+        self.devices = {}
+        self.script = []  # heap of (ms, order, fn)
+        self.faults = {}  # addr -> queued fault kinds
+        self.nack_rate = 0.0
+        self.corrupt_rate = 0.0
+        self.transactions = 0
+        self.nacks = 0
+        self.corrupted = 0
+        self.wire_ms = 0.0
+
+    def attach(self, addr, device):
+        device.bus = self
+        self.devices[addr] = device
+        return device
+
+    def detach(self, addr):
+        self.devices.pop(addr, None)
+
+    def at(self, ms, fn):
+        """Run fn(bus) once the virtual clock reaches ms"""
+        heapq.heappush(self.script, (ms, len(self.script), fn))
+
+    def fail(self, addr, kind=NACK, count=1):
+        """Queue count faults (NACK or CORRUPT) for addr's next transactions"""
+        self.faults.setdefault(addr, []).extend([kind] * count)
+
+    def error_rate(self, nack=0.0, corrupt=0.0):
+        self.nack_rate = nack
+        self.corrupt_rate = corrupt
+
+    def advance(self, ms):
+        self.now += ms
+        while self.script and self.script[0][0] <= self.now:
+            heapq.heappop(self.script)[2](self)
+
+    def sleep(self, ms):
+        self.advance(ms)
+
+    def _begin(self, addr, nbytes, restarts=0, reading=True):
+        """Clock one transaction; returns (device, fault) and raises for a NACK"""
+        # Address byte plus data, 9 clocks each, START/STOP and repeated STARTs
+        ms = (9 * (nbytes + 1 + restarts) + 2) * self.bit_ms
+        self.transactions += 1
+        self.wire_ms += ms
+        self.advance(ms)
+        device = self.devices.get(addr)
+        queued = self.faults.get(addr)
+        fault = None
+        # A queued corruption waits for a transaction that reads data back
+        if queued and (reading or queued[0] == NACK):
+            fault = queued.pop(0)
+        else:
+            r = self.rng.random()
+            if r < self.nack_rate:
+                fault = NACK
+            elif reading and r < self.nack_rate + self.corrupt_rate:
+                fault = CORRUPT
+        if device is None or fault == NACK or not device.ack(self.now):
+            self.nacks += 1
+            raise OSError(5)  # EIO, as machine.I2C raises for a NACK
+        return device, fault
+
+    def _deliver(self, device, nbytes, fault, buf=None):
+        try:
+            data = bytearray(device.read(nbytes))
+        except OSError:
+            self.nacks += 1
+            raise
+        if fault == CORRUPT and data:
+            data[self.rng.randrange(len(data))] ^= 1 << self.rng.randrange(8)
+            self.corrupted += 1
+        if buf is None:
+            return bytes(data)
+        buf[:] = data
+
+    # machine.I2C methods
+
+    def scan(self):
+        return sorted(addr for addr, device in self.devices.items() if device.ack(self.now))
+
+    def writeto(self, addr, buf, stop=True):
+        device, fault = self._begin(addr, len(buf), reading=False)
+        device.write(bytes(buf))
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        device, fault = self._begin(addr, nbytes)
+        return self._deliver(device, nbytes, fault)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        device, fault = self._begin(addr, len(buf))
+        self._deliver(device, len(buf), fault, buf)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        device, fault = self._begin(addr, len(buf) + 1, reading=False)
+        device.write(bytes([memaddr]) + bytes(buf))
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        device, fault = self._begin(addr, nbytes + 2, restarts=1)
+        device.write(bytes([memaddr]))
+        return self._deliver(device, nbytes, fault)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        device, fault = self._begin(addr, len(buf) + 2, restarts=1)
+        device.write(bytes([memaddr]))
+        self._deliver(device, len(buf), fault, buf)
+
+
+def patch_clock(bus, *modules):
+    """Point each module's ticks_ms and sleep_ms (where it has them) at the bus's virtual clock"""
+    for module in modules:
+        if hasattr(module, "ticks_ms"):
+            module.ticks_ms = lambda: int(bus.now)
+        if hasattr(module, "sleep_ms"):
+            module.sleep_ms = bus.sleep
+
+
+class FakeDevice:
+    """Base device model; read() raises OSError to NACK"""
+
+    bus = None
+
+    def ack(self, now):
+        return True
+
+    def write(self, data):
+        pass
+
+    def read(self, nbytes):
+        return bytes(nbytes)
+
+
+class FakeRegisterDevice(FakeDevice):
+    """256 byte registers; on_write(reg, value) may react to a write"""
+
+    def __init__(self, regs=None, on_write=None):
+        self.regs = bytearray(256)
+        for reg, value in (regs or {}).items():
+            self.regs[reg] = value
+        self.on_write = on_write
+        self.pointer = 0
+        self.writes = 0
+
+    def write(self, data):
+        self.pointer = data[0]
+        for value in data[1:]:
+            self.writes += 1
+            self.regs[self.pointer] = value
+            if self.on_write is not None:
+                self.on_write(self.pointer, value)
+            self.pointer = (self.pointer + 1) & 0xFF
+
+    def read(self, nbytes):
+        data = bytes(self.regs[(self.pointer + i) & 0xFF] for i in range(nbytes))
+        self.pointer = (self.pointer + nbytes) & 0xFF
+        return data
+
+    def set_word(self, reg, value):
+        """Store a 16-bit little-endian value at reg, reg + 1"""
+        self.regs[reg] = value & 0xFF
+        self.regs[reg + 1] = value >> 8
+
+
+class FakeCommandDevice(FakeDevice):
+    """Sensirion-style command device
+
+    handlers: command bytes -> (execution ms, fn(args) -> response words or None).
+    Argument words arrive CRC-checked; a bad argument CRC is ignored like a
+    bad command. Reads NACK while a command executes and after the response
+    has been read once.
+    """
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.busy_until = 0.0
+        self.response = None
+        self.commands = []
+
+    def ack(self, now):
+        return now >= self.busy_until
+
+    def write(self, data):
+        cmd = data[:2]
+        self.commands.append(cmd)
+        handler = self.handlers.get(cmd)
+        if handler is None:
+            self.response = None
+            return
+        args = []
+        for i in range(2, len(data) - 2, 3):
+            word = data[i:i + 3]
+            if encode_words([(word[0] << 8) | word[1]]) != word:
+                self.response = None
+                return
+            args.append((word[0] << 8) | word[1])
+        delay_ms, fn = handler
+        words = fn(args)
+        self.response = encode_words(words) if words is not None else None
+        self.busy_until = self.bus.now + delay_ms
+
+    def read(self, nbytes):
+        if self.response is None:
+            raise OSError(5)  # Nothing to send: the read is NACKed
+        data, self.response = self.response[:nbytes], None
+        return data
+
+
+class FakeFrameDevice(FakeDevice):
+    """A device that answers every read with frame_fn(nbytes)"""
+
+    def __init__(self, frame_fn):
+        self.frame_fn = frame_fn
+
+    def read(self, nbytes):
+        return self.frame_fn(nbytes)
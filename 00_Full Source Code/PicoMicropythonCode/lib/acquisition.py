@@ -0,0 +1,204 @@
+# acquisition.py
+# Sensor sampling on the RP2040's second core.
+#
+# With everything on core 0, a machine.Timer soft callback only runs between
+# bytecodes: a TLS handshake, a JSON dump or a garbage collection holds it
+# back, the samples due meanwhile are taken late in a burst or lost, and a
+# slow sensor read delays the uploads in turn. Acquisition runs the sampling
+# loop on core 1 with _thread instead. Core 0 keeps Wi-Fi (the CYW43 driver
+# belongs to it), MQTT, BLE and the uploads.
+#
+# Each channel's read_into(values) fills a preallocated array, and the loop
+# puts the values, stamped with ticks_ms, into the channel's SampleBuffer: a
+# ring guarded by a _thread lock that is only held to copy values in or
+# out. Core 0 drains the buffer on its own schedule and does the filtering
+# and statistics there. The loop itself keeps to preallocated arrays and
+# small ints, and so must the read_into functions: then a good read doesn't
+# allocate and doesn't wait on the heap lock while core 0 collects garbage.
+# A failed read does allocate, as machine.I2C raises an OSError.
+#
+# An I2CBus read from core 1 must have deferred set, so it only counts:
+# the float wire-time stats and any fallback, which prints and re-creates
+# the machine.I2C, wait for core 0's I2CBus.check_frames(). Core 0 must not
+# use a bus core 1 reads while the loop runs; hold bus_lock for that (e.g.
+# around check_frames()).
+#
+# Periods are phase-locked as in scheduler.py, and per channel the loop
+# records how late each read started (jitter), missed periods and failed
+# reads.
+
+import _thread
+from array import array
+
+from compat import ticks_ms, ticks_diff, ticks_add, sleep_ms
+
+CAPACITY = 64  # Samples per buffer; core 0 must drain before it fills
+MAX_WAIT_MS = 100  # Longest single sleep, so stop() is noticed
+
+
+class SampleBuffer:
+    def __init__(self, width=1, capacity=CAPACITY, typecode="H"):
+        """Ring of capacity samples of width values each, stamped with ticks_ms"""
+        self.width = width
+        self.capacity = capacity
+        self.typecode = typecode
+        self.values = array(typecode, [0] * (width * capacity))
+        self.stamps = array("l", [0] * capacity)
+        # Core 0's copy of what drain() took, so the lock isn't held while it's used
+        self.out = array(typecode, [0] * (width * capacity))
+        self.out_stamps = array("l", [0] * capacity)
+        self.lock = _thread.allocate_lock()
+        self.head = 0
+        self.count = 0
+        self.overflows = 0  # Samples overwritten before core 0 drained them
+
+    def put(self, stamp, values):
+        """Store one sample (core 1); the oldest is overwritten when full"""
+        width = self.width
+        with self.lock:
+            head = self.head
+            base = head * width
+            for i in range(width):
+                self.values[base + i] = values[i]
+            self.stamps[head] = stamp
+            head += 1
+            if head == self.capacity:
+                head = 0
+            self.head = head
+            if self.count < self.capacity:
+                self.count += 1
+            else:
+                self.overflows += 1
+
+    def drain(self):
+        """Move the buffered samples to out/out_stamps, oldest first (core 0); returns how many"""
+        width = self.width
+        with self.lock:
+            count = self.count
+            i = self.head - count
+            if i < 0:
+                i += self.capacity
+            for n in range(count):
+                self.out_stamps[n] = self.stamps[i]
+                base = i * width
+                for c in range(width):
+                    self.out[n * width + c] = self.values[base + c]
+                i += 1
+                if i == self.capacity:
+                    i = 0
+            self.count = 0
+        return count
+
+
+class Channel:
+    def __init__(self, name, read_into, period_ms, buffer):
+        self.name = name
+        self.read_into = read_into
+        self.period_ms = period_ms
+        self.buffer = buffer
+        self.scratch = array(buffer.typecode, [0] * buffer.width)
+        self.due = 0
+        self.reads = 0
+        self.failed = 0
+        self.missed = 0
+        self.late_min = None
+        self.late_max = 0
+        self.late_total = 0
+
+    def stats(self):
+        return {
+            "period_ms": self.period_ms,
+            "reads": self.reads,
+            "late_avg_ms": round(self.late_total / max(1, self.reads), 2),
+            "late_max_ms": self.late_max,
+            # Peak-to-peak spread of read times around the schedule
+            "jitter_ms": self.late_max - (self.late_min or 0),
+            "missed": self.missed,
+            "failed": self.failed,
+            "overflows": self.buffer.overflows
+        }
+
+
+class Acquisition:
+    def __init__(self):
+        self.channels = []
+        self.bus_lock = _thread.allocate_lock()
+        self.running = False
+        self.stopped = True
+
+    def add(self, name, read_into, period_ms, width=1, capacity=CAPACITY, typecode="H"):
+        """Read read_into(values) every period_ms on core 1; returns its SampleBuffer
+
+        read_into fills values (width of them) and returns False for a bad
+        read. It runs on core 1, so a good read must not allocate or touch
+        core 0's objects; an I2CBus it reads must be deferred.
+        """
+        buffer = SampleBuffer(width, capacity, typecode)
+        self.channels.append(Channel(name, read_into, period_ms, buffer))
+        return buffer
+
+    def step(self, now=None):
+        """Read every channel that is due; returns ms until the next one"""
+        if now is None:
+            now = ticks_ms()
+        wait = MAX_WAIT_MS
+        for channel in self.channels:
+            late = ticks_diff(now, channel.due)
+            if late >= 0:
+                try:
+                    with self.bus_lock:
+                        ok = channel.read_into(channel.scratch)
+                except OSError:
+                    ok = False
+                if ok:
+                    channel.buffer.put(now, channel.scratch)
+                else:
+                    channel.failed += 1
+                channel.reads += 1
+                channel.late_total += late
+                if late > channel.late_max:
+                    channel.late_max = late
+                if channel.late_min is None or late < channel.late_min:
+                    channel.late_min = late
+                # Phase-locked; periods already gone are skipped, not read in a burst
+                channel.due = ticks_add(channel.due, channel.period_ms)
+                behind = ticks_diff(now, channel.due)
+                if behind >= 0:
+                    skipped = behind // channel.period_ms + 1
+                    channel.missed += skipped
+                    channel.due = ticks_add(channel.due, skipped * channel.period_ms)
+                now = ticks_ms()
+            until = ticks_diff(channel.due, now)
+            if until < wait:
+                wait = until
+        return max(0, wait)
+
+    def _loop(self):
+        try:
+            while self.running:
+                wait = self.step()
+                if wait > 0:
+                    sleep_ms(wait)
+        finally:
+            self.stopped = True
+
+    def start(self, now=None):
+        """Start sampling on core 1"""
+        if now is None:
+            now = ticks_ms()
+        for channel in self.channels:
+            channel.due = now
+        self.running = True
+        self.stopped = False
+        _thread.start_new_thread(self._loop, ())
+
+    def stop(self, timeout_ms=1000):
+        """Stop the core 1 loop; returns True once it has exited"""
+        self.running = False
+        start = ticks_ms()
+        while not self.stopped and ticks_diff(ticks_ms(), start) < timeout_ms:
+            sleep_ms(1)
+        return self.stopped
+
+    def stats(self):
+        return {channel.name: channel.stats() for channel in self.channels}
@@ -0,0 +1,407 @@
+# as7341.py
+# ams AS7341 11-channel spectral sensor driver.
+#
+# The six ADC data registers (CH0-CH5, 0x95-0xA0) are contiguous, so each
+# channel bank is fetched with one 12-byte readfrom_mem_into into a
+# preallocated buffer and unpacked in place, instead of a register write
+# plus a 2-byte read per channel. Register access also reuses one-byte
+# buffers, so a spectral reading doesn't allocate on the bus path.
+#
+# Acquisition doesn't block: start() switches the SMUX to bank 0 and sets
+# SP_EN, and poll() stays off the bus until the integration time has passed
+# (or the INT pin has fired, when one is wired). It then reads the bank,
+# starts bank 1 and returns the combined reading once both are in. The
+# Pico is free for other work while the sensor integrates.
+#
+# FifoCapture samples one bank many times per second: the sensor cycles on
+# its own (SP_EN + WEN/WTIME) and writes each cycle's six channels into its
+# on-chip FIFO, which drain() empties in one burst into an array('H') ring.
+# Per-channel mean/min/max accumulate on the device and are taken once per
+# upload, so high-rate sensing doesn't mean high-rate uploading.
+#
+# Register access comes from i2c_device.RegisterDevice; REGISTERS names the
+# registers the driver uses, so dump() prints the whole configuration.
+
+import struct
+from array import array
+
+from compat import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_ms
+from i2c_device import RegisterDevice
+
+AS7341_ADDR = 0x39
+
+# AS7341 Registers
+REG_ENABLE = 0x80
+REG_ATIME = 0x81
+REG_WTIME = 0x83
+REG_ID = 0x92
+REG_STATUS = 0x93
+REG_CH0_DATA_L = 0x95
+REG_CONFIG = 0xA9
+REG_CONTROL = 0xAA
+REG_SMUX_CMD = 0xAF
+REG_LED = 0xB3
+REG_PERS = 0xBD
+REG_ASTEP_L = 0xCA
+REG_ASTEP_H = 0xCB
+REG_INTENAB = 0xF9
+REG_FIFO_CONTROL = 0xFA
+REG_FIFO_MAP = 0xFC
+REG_FIFO_LVL = 0xFD
+REG_FDATA_L = 0xFE
+
+ENABLE_PON = 0x01
+ENABLE_SP_EN = 0x02
+ENABLE_WEN = 0x08
+ENABLE_SMUXEN = 0x10
+FIFO_CLR = 0x02
+FIFO_MAP_CH0_CH5 = 0x7E  # Bits 1-6: CH0-CH5 (bit 0 would add ASTATUS)
+FIFO_WORDS = 64  # 128-byte FIFO of 16-bit entries
+INTENAB_SP_IEN = 0x08
+STATUS_AVALID = 0x08
+
+ATIME = 0x3C
+ASTEP = 999  # Power-on default
+BANK_BYTES = 12  # CH0-CH5, 16-bit little-endian
+SMUX_POLLS = 20  # SMUXEN clears itself within a few register reads
+STATUS_RETRY_MS = 2  # How soon to ask again when data isn't valid yet
+
+BANK0_CHANNELS = ("F1 (415nm/Violet)", "F2 (445nm/Indigo)", "F3 (480nm/Blue)", "F4 (515nm/Cyan)")
+BANK1_CHANNELS = ("F5 (555nm/Green)", "F6 (590nm/Yellow)", "F7 (630nm/Orange)", "F8 (680nm/Red)")
+
+
+def integration_ms(atime=ATIME, astep=ASTEP):
+    """Integration time in ms: (ATIME + 1) * (ASTEP + 1) * 2.78 us, rounded up"""
+    return ((atime + 1) * (astep + 1) * 278 + 99999) // 100000
+
+
+class AS7341(RegisterDevice):
+    ADDR = AS7341_ADDR
+    REGISTERS = {
+        "ENABLE": REG_ENABLE,
+        "ATIME": REG_ATIME,
+        "WTIME": REG_WTIME,
+        "ID": REG_ID,
+        "STATUS": REG_STATUS,
+        "CONFIG": REG_CONFIG,
+        "CONTROL": REG_CONTROL,
+        "LED": REG_LED,
+        "PERS": REG_PERS,
+        "ASTEP_L": REG_ASTEP_L,
+        "ASTEP_H": REG_ASTEP_H,
+        "INTENAB": REG_INTENAB,
+        "FIFO_MAP": REG_FIFO_MAP,
+        "FIFO_LVL": REG_FIFO_LVL
+    }
+    ID_REGISTER = REG_ID
+
+    def __init__(self, i2c, addr=AS7341_ADDR):
+        super().__init__(i2c, addr)
+        self.bank_buf = bytearray(BANK_BYTES)
+        self.integration_ms = integration_ms()
+        # Acquisition state: bank being measured (None when idle), when its
+        # data should be valid, the bank 0 result, and the INT pin flag
+        self.bank = None
+        self.data_due = None
+        self.bank0 = None
+        self.int_pin = None
+        self.int_fired = False
+        # Restart a new reading as soon as one completes
+        self.continuous = False
+        # I2C time and transaction count of the last complete reading
+        self.last_i2c_us = 0
+        self.last_transactions = 0
+        # Bus counters when the current reading started
+        self.start_bus_us = 0
+        self.start_transactions = 0
+        # Readings completed and time spent inside start()/poll()
+        self.readings = 0
+        self.busy_us = 0
+
+    def id_ok(self, value):
+        # 0x09, or 0x24 on boards that return the whole register (ID in bits 7:2)
+        return value == 0x09 or value & 0xFC == 0x24
+
+    def read_bank(self):
+        """CH0-CH5 of the current bank in one 12-byte burst"""
+        self.read_into(REG_CH0_DATA_L, self.bank_buf)
+        return struct.unpack_from("<6H", self.bank_buf)
+
+    def setup(self, int_pin=None):
+        """Initialize the AS7341; int_pin is the Pin wired to INT, if any"""
+        try:
+            device_id = self.read_reg(REG_ID)
+            print(f"Spectrometer Device ID: 0x{device_id:02X}")
+
+            # Accept any device ID - some boards report 0x24 instead of 0x09
+            if device_id != 0x09:
+                print("Non-standard device ID detected. Proceeding anyway...")
+        except Exception as e:
+            print(f"Error connecting to AS7341: {e}")
+            return False
+
+        # Power on; spectral measurement (SP_EN) is only set per reading. A
+        # reading cut short (setup() again after a bus error) is dropped.
+        self.write_reg(REG_ENABLE, ENABLE_PON)
+        self.bank = None
+
+        # Configure integration time (ATIME)
+        self.write_reg(REG_ATIME, ATIME)
+
+        # Configure gain (higher gain for better sensitivity)
+        self.write_reg(REG_CONTROL, 0x06)  # Gain = 64x
+
+        if int_pin is not None:
+            # Interrupt on every completed measurement (persistence 0)
+            self.write_reg(REG_PERS, 0x00)
+            self.write_reg(REG_INTENAB, INTENAB_SP_IEN)
+            self.int_pin = int_pin
+            int_pin.irq(trigger=int_pin.IRQ_FALLING, handler=self._on_interrupt)
+        return True
+
+    def _on_interrupt(self, pin):
+        self.int_fired = True
+
+    def enable_led(self, enable=True, current=50):
+        """Control the built-in white LED (current 0-255 sets brightness)"""
+        if enable:
+            self.write_reg(REG_LED, max(0, min(255, current)))
+            self.write_reg(REG_CONFIG, self.read_reg(REG_CONFIG) | 0x08)
+        else:
+            self.write_reg(REG_CONFIG, self.read_reg(REG_CONFIG) & ~0x08)
+
+    def select_bank(self, bank):
+        """bank 0: F1-F4, Clear, NIR; bank 1: F5-F8, Clear, NIR (SP_EN must be off)"""
+        # Enable SMUX configuration
+        self.write_reg(REG_CONFIG, 0x01)
+
+        if bank == 0:
+            self.write_reg(REG_SMUX_CMD, 0x10)
+            self.write_reg(REG_SMUX_CMD, 0x11)
+        else:
+            self.write_reg(REG_SMUX_CMD, 0x20)
+            self.write_reg(REG_SMUX_CMD, 0x21)
+
+        # Apply it; the sensor clears SMUXEN when the SMUX is set, which
+        # replaces the fixed 50 ms waits
+        self.write_reg(REG_ENABLE, ENABLE_PON | ENABLE_SMUXEN)
+        for _ in range(SMUX_POLLS):
+            if not self.read_reg(REG_ENABLE) & ENABLE_SMUXEN:
+                break
+
+        # Close SMUX configuration
+        self.write_reg(REG_CONFIG, 0x00)
+
+    def _start_bank(self, bank, now):
+        self.write_reg(REG_ENABLE, ENABLE_PON)  # SP_EN off while the SMUX changes
+        self.select_bank(bank)
+        if self.int_pin is not None:
+            self.write_reg(REG_STATUS, 0xFF)  # Clear any pending interrupt
+            self.int_fired = False
+        self.write_reg(REG_ENABLE, ENABLE_PON | ENABLE_SP_EN)
+        self.bank = bank
+        self.data_due = ticks_add(now, self.integration_ms)
+
+    def start(self, now=None):
+        """Begin a two-bank spectral reading; poll() returns it when complete"""
+        start = ticks_us()
+        if now is None:
+            now = ticks_ms()
+        self.start_bus_us = self.bus_us
+        self.start_transactions = self.transactions
+        self._start_bank(0, now)
+        self.busy_us += ticks_diff(ticks_us(), start)
+
+    def busy(self):
+        return self.bank is not None
+
+    def poll(self, now=None):
+        """Completed reading (channel name -> counts) or None while measuring"""
+        if self.bank is None:
+            return None
+        if now is None:
+            now = ticks_ms()
+        if self.int_pin is not None:
+            if not self.int_fired:
+                return None
+        elif ticks_diff(now, self.data_due) < 0:
+            return None
+
+        start = ticks_us()
+        result = self._collect(now)
+        self.busy_us += ticks_diff(ticks_us(), start)
+        return result
+
+    def _collect(self, now):
+        if self.int_pin is None and not self.read_reg(REG_STATUS) & STATUS_AVALID:
+            self.data_due = ticks_add(now, STATUS_RETRY_MS)
+            return None
+
+        values = self.read_bank()
+        if self.bank == 0:
+            self.bank0 = values
+            self._start_bank(1, now)
+            return None
+
+        self.write_reg(REG_ENABLE, ENABLE_PON)
+        self.bank = None
+        self.last_i2c_us = self.bus_us - self.start_bus_us
+        self.last_transactions = self.transactions - self.start_transactions
+        self.readings += 1
+        result = self._combine(self.bank0, values)
+        if self.continuous:
+            self.start(now)
+        return result
+
+    def _combine(self, bank0, bank1):
+        data = {}
+        for i in range(4):
+            data[BANK0_CHANNELS[i]] = bank0[i]
+            data[BANK1_CHANNELS[i]] = bank1[i]
+        data["Clear"] = (bank0[4] + bank1[4]) // 2  # Average of both readings
+        data["NIR"] = (bank0[5] + bank1[5]) // 2
+        return data
+
+    def ms_until_ready(self, now=None):
+        """How long the caller can do other work before poll() needs the bus"""
+        if self.bank is None:
+            return None
+        if now is None:
+            now = ticks_ms()
+        return max(0, ticks_diff(self.data_due, now))
+
+    def read_spectral_data(self):
+        """Blocking read of all spectral channels (both banks)"""
+        self.start()
+        while True:
+            result = self.poll()
+            if result is not None:
+                return result
+            sleep_ms(self.ms_until_ready() or 1)
+
+
+class FifoCapture:
+    def __init__(self, sensor, bank=0, capacity=256):
+        """High-rate capture of one bank; capacity is samples kept in the ring"""
+        self.sensor = sensor
+        self.bank = bank
+        self.names = (BANK0_CHANNELS if bank == 0 else BANK1_CHANNELS) + ("Clear", "NIR")
+        self.capacity = capacity
+        # Ring of recent samples, six channels each, oldest overwritten first
+        self.ring = array("H", bytes(12 * capacity))
+        self.head = 0
+        self.stored = 0
+        self.fifo_buf = bytearray(2 * FIFO_WORDS)
+        self.fifo_view = memoryview(self.fifo_buf)
+        # Window aggregates since the last window_stats()
+        self.sums = [0] * 6
+        self.mins = array("H", [0xFFFF] * 6)
+        self.maxs = array("H", [0] * 6)
+        self.count = 0
+        self.cycle_ms = 0
+        self.samples = 0
+        self.overflows = 0
+
+    def start(self, sample_ms=10, wait_ms=0):
+        """Let the sensor cycle on its own (sample_ms integration, then wait_ms) into the FIFO
+
+        Don't mix with start()/poll() readings until stop() is called.
+        """
+        sensor = self.sensor
+        sensor.write_reg(REG_ENABLE, ENABLE_PON)
+        sensor.select_bank(self.bank)
+
+        # ASTEP of 999 is 2.78 ms per ATIME step
+        atime = max(0, min(255, (sample_ms * 100 + 139) // 278 - 1))
+        sensor.write_reg(REG_ASTEP_L, ASTEP & 0xFF)
+        sensor.write_reg(REG_ASTEP_H, ASTEP >> 8)
+        sensor.write_reg(REG_ATIME, atime)
+        enable = ENABLE_PON | ENABLE_SP_EN
+        wtime = 0
+        if wait_ms > 0:
+            # WTIME steps are 2.78 ms as well
+            wtime = max(0, min(255, (wait_ms * 100 + 139) // 278 - 1))
+            sensor.write_reg(REG_WTIME, wtime)
+            enable |= ENABLE_WEN
+        self.cycle_ms = integration_ms(atime) + (integration_ms(wtime) if wait_ms > 0 else 0)
+
+        sensor.write_reg(REG_FIFO_MAP, FIFO_MAP_CH0_CH5)
+        sensor.write_reg(REG_FIFO_CONTROL, FIFO_CLR)
+        sensor.write_reg(REG_ENABLE, enable)
+
+    def stop(self):
+        """Stop cycling and restore the normal integration time"""
+        sensor = self.sensor
+        sensor.write_reg(REG_ENABLE, ENABLE_PON)
+        sensor.write_reg(REG_FIFO_MAP, 0)
+        sensor.write_reg(REG_ATIME, ATIME)
+
+    def drain_interval_ms(self):
+        """Longest the caller can wait between drain() calls before the FIFO fills
+
+        Leaves two entries spare: a full burst takes about 11 ms at 100 kHz,
+        and the sensor keeps cycling while it is read out.
+        """
+        return max(1, (FIFO_WORDS // 6 - 2) * self.cycle_ms)
+
+    def drain(self):
+        """Move whole samples from the FIFO into the ring; returns how many"""
+        sensor = self.sensor
+        level = sensor.read_reg(REG_FIFO_LVL)
+        if level >= FIFO_WORDS:
+            # Full: cycles may have been dropped since the last drain
+            self.overflows += 1
+        samples = level // 6
+        if samples == 0:
+            return 0
+
+        sensor.read_into(REG_FDATA_L, self.fifo_view[:12 * samples])
+
+        buf = self.fifo_buf
+        ring = self.ring
+        sums = self.sums
+        mins = self.mins
+        maxs = self.maxs
+        head = self.head
+        i = 0
+        for _ in range(samples):
+            base = 6 * head
+            for ch in range(6):
+                value = buf[i] | (buf[i + 1] << 8)
+                i += 2
+                ring[base + ch] = value
+                sums[ch] += value
+                if value < mins[ch]:
+                    mins[ch] = value
+                if value > maxs[ch]:
+                    maxs[ch] = value
+            head += 1
+            if head == self.capacity:
+                head = 0
+        self.head = head
+        self.stored = min(self.capacity, self.stored + samples)
+        self.count += samples
+        self.samples += samples
+        return samples
+
+    def latest(self):
+        """Most recent sample as a tuple of six counts, or None"""
+        if self.stored == 0:
+            return None
+        base = 6 * ((self.head - 1) % self.capacity)
+        return tuple(self.ring[base:base + 6])
+
+    def window_stats(self, reset=True):
+        """{channel name: (mean, min, max)} since the last call, or None if empty"""
+        if self.count == 0:
+            return None
+        stats = {}
+        for ch in range(6):
+            stats[self.names[ch]] = (self.sums[ch] / self.count, self.mins[ch], self.maxs[ch])
+        if reset:
+            for ch in range(6):
+                self.sums[ch] = 0
+                self.mins[ch] = 0xFFFF
+                self.maxs[ch] = 0
+            self.count = 0
+        return stats
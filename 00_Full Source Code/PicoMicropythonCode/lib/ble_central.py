@@ -0,0 +1,409 @@
+# ble_central.py
+# GATT central for several BLE thermometers, with cached handles and
+# direct reconnects.
+#
+# The old connect mode held one conn_handle and, when the link dropped,
+# scanned for up to 30 s just to find the same device again. Then it
+# connected (waiting for another advertisement) and rediscovered every
+# characteristic before it could subscribe. BLECentral tracks each
+# peripheral by MAC instead:
+#
+#   - gap_connect() goes straight to the known address; no scan first
+#   - the notify characteristic's value and CCCD handles are discovered on
+#     the first connection only, then cached (and kept in flash), so a
+#     reconnect is connect + one CCCD write
+#   - at most max_connections links are open at once. With more devices than
+#     that they take turns in round-robin order: a device keeps its slot
+#     until it has sent READINGS_PER_TURN notifications (or DWELL_MS passes),
+#     then it is disconnected and the next one connects
+#   - connect attempts that time out back off for RETRY_MS and the next
+#     device gets the slot, so one thermometer out of range can't stall the rest
+#
+# Connection state changes and the next GATT request are handled in irq(),
+# as the old handler did. Notifications only go into a NotificationQueue; the
+# main loop decodes them, and calls poll() for timeouts, turn changes and
+# saving newly discovered handles. stats() reports per-device reconnect
+# latency: from gap_connect() to notifications enabled.
+
+import json
+from binascii import unhexlify
+
+from compat import ticks_ms, ticks_diff, ticks_add
+from ble_queue import NotificationQueue
+
+try:
+    from bluetooth import UUID
+except ImportError:
+    UUID = str  # Host benchmarks compare plain strings
+
+BLE_HANDLES_FILE = "ble_handles.json"
+
+# Stock MicroPython builds for the Pico W allow very few simultaneous
+# central connections (BTstack's GATT client pool); 1 is always safe
+MAX_CONNECTIONS = 1
+CONNECT_TIMEOUT_MS = 5000  # gap_connect() gives up after this long
+GATT_TIMEOUT_MS = 5000  # Discovery or subscribe taking longer drops the link
+RETRY_MS = 10000  # Back-off after a failed connect
+READINGS_PER_TURN = 1
+DWELL_MS = 15000  # Longest a device keeps its slot while others are waiting
+
+# LYWSD03MMC temperature/humidity/voltage characteristic
+UUID_TEMP_HUMIDITY = UUID("ebe0ccc1-7a0a-4b0c-8a1a-6ff2997da3a6")
+UUID_CCCD = UUID(0x2902)
+NOTIFY_ON = b"\x01\x00"
+
+# Bluetooth IRQ events
+_IRQ_PERIPHERAL_CONNECT = 7
+_IRQ_PERIPHERAL_DISCONNECT = 8
+_IRQ_GATTC_CHARACTERISTIC_RESULT = 11
+_IRQ_GATTC_CHARACTERISTIC_DONE = 12
+_IRQ_GATTC_DESCRIPTOR_RESULT = 13
+_IRQ_GATTC_DESCRIPTOR_DONE = 14
+_IRQ_GATTC_WRITE_DONE = 17
+_IRQ_GATTC_NOTIFY = 18
+
+IDLE = 0
+CONNECTING = 1
+DISCOVERING = 2
+SUBSCRIBING = 3
+READY = 4
+DISCONNECTING = 5
+
+
+class Peripheral:
+    def __init__(self, mac, addr_type=0):
+        self.mac = mac
+        self.addr = unhexlify(mac)
+        self.addr_type = addr_type
+        self.state = IDLE
+        self.conn_handle = None
+        self.value_handle = None
+        self.cccd_handle = None
+        self.end_handle = None
+        self.requested_at = 0  # gap_connect() or last GATT request
+        self.connect_started = 0
+        self.turn_started = 0
+        self.turn_readings = 0
+        self.retry_at = None
+        self.discovered = False  # This connection ran discovery
+        self.connects = 0
+        self.discoveries = 0
+        self.failures = 0
+        self.drops = 0
+        self.readings = 0
+        self.latency_last = None
+        self.latency_sum = 0
+        self.latency_max = 0
+        self.latency_cached_sum = 0
+        self.latency_cached_n = 0
+
+
+class BLECentral:
+    def __init__(self, ble, macs, max_connections=MAX_CONNECTIONS,
+                 char_uuid=UUID_TEMP_HUMIDITY, handles_file=BLE_HANDLES_FILE):
+        """macs: hex MAC strings of the peripherals to keep subscribed"""
+        self.ble = ble
+        self.peripherals = [Peripheral(mac.lower()) for mac in macs]
+        self.macs = [p.mac for p in self.peripherals]
+        self.max_connections = max_connections
+        self.char_uuid = char_uuid
+        self.handles_file = handles_file
+        # Notification payloads; the handle slot carries the peripheral index
+        self.queue = NotificationQueue()
+        self.cursor = 0  # Round-robin position
+        self.connecting = None  # Only one gap_connect() may be pending
+        self.running = False
+        self.handles_dirty = False
+
+    def rotating(self):
+        return len(self.peripherals) > self.max_connections
+
+    def _find(self, conn_handle):
+        for i, p in enumerate(self.peripherals):
+            if p.conn_handle == conn_handle:
+                return i, p
+        return None, None
+
+    def restore(self):
+        """Load cached handles from flash; returns how many peripherals they cover"""
+        try:
+            with open(self.handles_file) as f:
+                handles = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        restored = 0
+        for p in self.peripherals:
+            pair = handles.get(p.mac)
+            if pair and len(pair) == 2:
+                p.value_handle, p.cccd_handle = pair
+                restored += 1
+        return restored
+
+    def save(self):
+        """Persist discovered handles so a reboot doesn't rediscover them"""
+        handles = {p.mac: [p.value_handle, p.cccd_handle]
+                   for p in self.peripherals if p.cccd_handle is not None}
+        try:
+            with open(self.handles_file, "w") as f:
+                json.dump(handles, f)
+            self.handles_dirty = False
+            return True
+        except OSError as e:
+            print(f"Error saving BLE handles: {e}")
+            return False
+
+    def start(self, now=None):
+        """Begin connecting; links are kept up (or rotated) until stop()"""
+        if now is None:
+            now = ticks_ms()
+        self.running = True
+        self._connect_next(now)
+
+    def stop(self):
+        """Cancel a pending connect and disconnect every peripheral"""
+        self.running = False
+        if self.connecting is not None:
+            self._cancel_connect()
+        for p in self.peripherals:
+            if p.conn_handle is not None:
+                p.state = DISCONNECTING
+                try:
+                    self.ble.gap_disconnect(p.conn_handle)
+                except OSError:
+                    pass
+
+    def connected(self):
+        return sum(1 for p in self.peripherals if p.conn_handle is not None)
+
+    def _connect_next(self, now):
+        """Start a connection to the next waiting peripheral if a slot is free"""
+        if not self.running or self.connecting is not None:
+            return
+        if self.connected() >= self.max_connections:
+            return
+        count = len(self.peripherals)
+        for step in range(count):
+            i = (self.cursor + step) % count
+            p = self.peripherals[i]
+            if p.state != IDLE:
+                continue
+            if p.retry_at is not None and ticks_diff(now, p.retry_at) < 0:
+                continue
+            self.cursor = (i + 1) % count
+            p.state = CONNECTING
+            p.retry_at = None
+            p.connect_started = now
+            p.requested_at = now
+            self.connecting = i
+            try:
+                self.ble.gap_connect(p.addr_type, p.addr, CONNECT_TIMEOUT_MS)
+            except OSError as e:
+                print(f"BLE connect to {p.mac} failed: {e}")
+                self._connect_failed(p, now)
+                continue
+            return
+
+    def _connect_failed(self, p, now):
+        p.state = IDLE
+        p.failures += 1
+        p.retry_at = ticks_add(now, RETRY_MS)
+        self.connecting = None
+
+    def _cancel_connect(self):
+        try:
+            self.ble.gap_connect(None)
+        except (OSError, TypeError):
+            pass  # Older firmware can't cancel; the connect times out by itself
+        self.connecting = None
+
+    def _subscribe(self, p, now):
+        p.state = SUBSCRIBING
+        p.requested_at = now
+        # Write with response, so stale cached handles show up as an error
+        self.ble.gattc_write(p.conn_handle, p.cccd_handle, NOTIFY_ON, 1)
+
+    def _discover(self, p, now):
+        p.state = DISCOVERING
+        p.requested_at = now
+        p.discovered = True
+        p.discoveries += 1
+        p.value_handle = p.cccd_handle = p.end_handle = None
+        self.ble.gattc_discover_characteristics(p.conn_handle, 0x0001, 0xFFFF)
+
+    def _ready(self, p, now):
+        p.state = READY
+        p.turn_started = now
+        p.turn_readings = 0
+        latency = ticks_diff(now, p.connect_started)
+        p.connects += 1
+        p.latency_last = latency
+        p.latency_sum += latency
+        if latency > p.latency_max:
+            p.latency_max = latency
+        if not p.discovered:
+            p.latency_cached_sum += latency
+            p.latency_cached_n += 1
+
+    def _disconnect(self, p):
+        p.state = DISCONNECTING
+        try:
+            self.ble.gap_disconnect(p.conn_handle)
+        except OSError:
+            pass
+
+    def irq(self, event, data, now=None):
+        """Feed every bluetooth IRQ event here; returns True if it was handled"""
+        if event == _IRQ_GATTC_NOTIFY:
+            conn_handle, value_handle, notify_data = data
+            i, p = self._find(conn_handle)
+            if p is None or value_handle != p.value_handle:
+                return False
+            p.readings += 1
+            p.turn_readings += 1
+            return self.queue.put(i, notify_data)
+
+        if now is None:
+            now = ticks_ms()
+
+        if event == _IRQ_PERIPHERAL_CONNECT:
+            conn_handle, addr_type, addr = data
+            addr = bytes(addr)
+            for p in self.peripherals:
+                if p.addr == addr and p.state == CONNECTING:
+                    break
+            else:
+                return False
+            self.connecting = None
+            p.conn_handle = conn_handle
+            p.discovered = False
+            if p.cccd_handle is not None:
+                self._subscribe(p, now)
+            else:
+                self._discover(p, now)
+            self._connect_next(now)
+
+        elif event == _IRQ_PERIPHERAL_DISCONNECT:
+            conn_handle, addr_type, addr = data
+            addr = bytes(addr)
+            for p in self.peripherals:
+                if p.addr == addr and (p.conn_handle == conn_handle or
+                                       (p.conn_handle is None and p.state == CONNECTING)):
+                    break
+            else:
+                return False
+            if p.conn_handle is None:
+                # Connect attempt timed out without reaching the device
+                self._connect_failed(p, now)
+            else:
+                if p.state != DISCONNECTING:
+                    p.drops += 1
+                p.conn_handle = None
+                p.state = IDLE
+            self._connect_next(now)
+
+        elif event == _IRQ_GATTC_CHARACTERISTIC_RESULT:
+            conn_handle, end_handle, value_handle, properties, uuid = data
+            i, p = self._find(conn_handle)
+            if p is None or p.state != DISCOVERING:
+                return False
+            if p.value_handle is None and uuid == self.char_uuid:
+                p.value_handle = value_handle
+                p.end_handle = end_handle
+
+        elif event == _IRQ_GATTC_CHARACTERISTIC_DONE:
+            conn_handle, status = data
+            i, p = self._find(conn_handle)
+            if p is None or p.state != DISCOVERING:
+                return False
+            if p.value_handle is None:
+                print(f"BLE {p.mac}: notify characteristic not found")
+                self._disconnect(p)
+            else:
+                # The CCCD sits among the characteristic's descriptors
+                end = p.end_handle if p.end_handle and p.end_handle > p.value_handle else 0xFFFF
+                p.requested_at = now
+                self.ble.gattc_discover_descriptors(conn_handle, p.value_handle + 1, end)
+
+        elif event == _IRQ_GATTC_DESCRIPTOR_RESULT:
+            conn_handle, dsc_handle, uuid = data
+            i, p = self._find(conn_handle)
+            if p is None or p.state != DISCOVERING:
+                return False
+            if p.cccd_handle is None and uuid == UUID_CCCD:
+                p.cccd_handle = dsc_handle
+
+        elif event == _IRQ_GATTC_DESCRIPTOR_DONE:
+            conn_handle, status = data
+            i, p = self._find(conn_handle)
+            if p is None or p.state != DISCOVERING:
+                return False
+            if p.cccd_handle is None:
+                print(f"BLE {p.mac}: no CCCD for the notify characteristic")
+                self._disconnect(p)
+            else:
+                self.handles_dirty = True
+                self._subscribe(p, now)
+
+        elif event == _IRQ_GATTC_WRITE_DONE:
+            conn_handle, value_handle, status = data
+            i, p = self._find(conn_handle)
+            if p is None or p.state != SUBSCRIBING:
+                return False
+            if status == 0:
+                self._ready(p, now)
+            elif not p.discovered:
+                # Cached handles no longer match (e.g. new firmware); find them again
+                self._discover(p, now)
+            else:
+                self._disconnect(p)
+
+        else:
+            return False
+        return True
+
+    def poll(self, now=None):
+        """Timeouts and turn changes; call from the main loop"""
+        if now is None:
+            now = ticks_ms()
+        if self.handles_dirty:
+            self.save()
+        rotating = self.rotating()
+        for i, p in enumerate(self.peripherals):
+            if p.state == CONNECTING and ticks_diff(now, p.connect_started) > CONNECT_TIMEOUT_MS + 1000:
+                # The stack never reported the timeout; give up on this attempt
+                self._cancel_connect()
+                self._connect_failed(p, now)
+            elif p.state in (DISCOVERING, SUBSCRIBING) and ticks_diff(now, p.requested_at) > GATT_TIMEOUT_MS:
+                p.failures += 1
+                self._disconnect(p)
+            elif p.state == READY and rotating and self._waiting(now):
+                if (p.turn_readings >= READINGS_PER_TURN or
+                        ticks_diff(now, p.turn_started) >= DWELL_MS):
+                    self._disconnect(p)
+        self._connect_next(now)
+
+    def _waiting(self, now):
+        """Whether any idle peripheral could use a slot"""
+        for p in self.peripherals:
+            if p.state == IDLE and (p.retry_at is None or ticks_diff(now, p.retry_at) >= 0):
+                return True
+        return False
+
+    def stats(self):
+        """{mac: {...}} with reconnect latency (gap_connect() to notifications on) in ms"""
+        result = {}
+        for p in self.peripherals:
+            result[p.mac] = {
+                "state": p.state,
+                "connects": p.connects,
+                "discoveries": p.discoveries,
+                "failures": p.failures,
+                "drops": p.drops,
+                "readings": p.readings,
+                "latency_ms_last": p.latency_last,
+                "latency_ms_avg": p.latency_sum // p.connects if p.connects else None,
+                "latency_ms_cached_avg": (p.latency_cached_sum // p.latency_cached_n
+                                          if p.latency_cached_n else None),
+                "latency_ms_max": p.latency_max
+            }
+        return result
@@ -0,0 +1,103 @@
+# ble_queue.py
+# Preallocated queue that gets BLE notification payloads out of IRQ context.
+#
+# The bluetooth IRQ handler must return quickly: while it runs the BLE stack
+# can't deliver the next notification, connect or disconnect event. put()
+# only copies the payload (a memoryview that is invalid once the handler
+# returns) into a fixed slot and bumps an index: no buffers to allocate, no
+# printing, no network. The main loop then takes payloads with get() and does the
+# decoding and uploading there.
+#
+# When the queue is full the new payload is dropped and counted rather than
+# overwriting one the main loop may be reading. irq_done() records how long
+# each handler call took, so the IRQ duration can be checked on the device.
+
+from array import array
+
+from compat import ticks_us, ticks_diff
+
+SLOTS = 8
+SLOT_BYTES = 32  # ATT payloads on the default MTU are at most 20 bytes
+
+
+class NotificationQueue:
+    def __init__(self, slots=SLOTS, slot_bytes=SLOT_BYTES):
+        self.slots = slots
+        self.buf = bytearray(slots * slot_bytes)
+        self.view = memoryview(self.buf)
+        self.slot_bytes = slot_bytes
+        self.lengths = array("H", bytes(2 * slots))
+        self.handles = array("H", bytes(2 * slots))
+        # head is written only by put() (IRQ), tail only by get() (main loop)
+        self.head = 0
+        self.tail = 0
+        self.taken = False  # The slot at tail has been handed out by get()
+        self.received = 0
+        self.dropped = 0
+        self.truncated = 0
+        self.irq_count = 0
+        self.irq_us_total = 0
+        self.irq_us_max = 0
+
+    def put(self, value_handle, data):
+        """Copy one notification into the queue (IRQ context); False if it was dropped"""
+        self.received += 1
+        head = self.head
+        next_head = head + 1
+        if next_head == self.slots:
+            next_head = 0
+        if next_head == self.tail:
+            self.dropped += 1
+            return False
+        n = len(data)
+        if n > self.slot_bytes:
+            n = self.slot_bytes
+            data = data[:n]
+            self.truncated += 1
+        start = head * self.slot_bytes
+        self.view[start:start + n] = data
+        self.lengths[head] = n
+        self.handles[head] = value_handle
+        self.head = next_head
+        return True
+
+    def get(self):
+        """(value_handle, payload) of the oldest notification, or None
+
+        payload is a memoryview into the queue; it stays valid until the next get().
+        """
+        tail = self.tail
+        if self.taken:
+            # Only now free the slot handed out last time, so put() can't
+            # overwrite a payload the main loop is still decoding
+            self.taken = False
+            tail += 1
+            if tail == self.slots:
+                tail = 0
+            self.tail = tail
+        if tail == self.head:
+            return None
+        self.taken = True
+        start = tail * self.slot_bytes
+        return self.handles[tail], self.view[start:start + self.lengths[tail]]
+
+    def pending(self):
+        return (self.head - self.tail) % self.slots - self.taken
+
+    def irq_done(self, start_us):
+        """Record the duration of one IRQ handler call that began at start_us"""
+        elapsed = ticks_diff(ticks_us(), start_us)
+        self.irq_count += 1
+        self.irq_us_total += elapsed
+        if elapsed > self.irq_us_max:
+            self.irq_us_max = elapsed
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "dropped": self.dropped,
+            "truncated": self.truncated,
+            "irq_count": self.irq_count,
+            "irq_us_avg": self.irq_us_total // max(1, self.irq_count),
+            "irq_us_max": self.irq_us_max
+        }
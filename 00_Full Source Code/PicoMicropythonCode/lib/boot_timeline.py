@@ -0,0 +1,84 @@
+# boot_timeline.py
+# Boot timeline: where the time from reset to the first reading goes.
+#
+# Create the timeline at the top of a script, before its other imports.
+# ticks_ms() counts from reset on the RP2040, so the first phase ("start")
+# covers the interpreter starting, the filesystem mount and main.py being
+# compiled from .py or loaded from .mpy. The script then calls mark(name) as
+# each sequential phase ends (imports, bus setup, ...), and begin(name) /
+# end(name) around phases that run in the background meanwhile, like Wi-Fi
+# association or a sensor's first measurement. finish() marks the first
+# reading, prints the timeline once and saves it to flash, so it can be read
+# after a boot without a serial console attached.
+#
+# Disabled (the firmware's default), every call returns at once, and the
+# module imports nothing but compat.
+
+from compat import ticks_ms, ticks_diff
+
+BOOT_TIMELINE_FILE = "boot_timeline.json"
+
+
+class BootTimeline:
+    def __init__(self, enabled=False, state_file=BOOT_TIMELINE_FILE, now=None):
+        self.enabled = enabled
+        self.state_file = state_file
+        self.finished = False
+        if now is None:
+            now = ticks_ms()
+        self.last = now
+        # [name, start, end, background] in ms since reset, in the order they ended
+        self.phases = [["start", 0, now, False]] if enabled else []
+        self.started = {}  # Background phase name -> start
+
+    def mark(self, name, now=None):
+        """End sequential phase name, which began at the previous mark"""
+        if not self.enabled or self.finished:
+            return
+        if now is None:
+            now = ticks_ms()
+        self.phases.append([name, self.last, now, False])
+        self.last = now
+
+    def begin(self, name, now=None):
+        """Start a background phase, overlapping the sequential ones"""
+        if not self.enabled or self.finished:
+            return
+        self.started[name] = ticks_ms() if now is None else now
+
+    def end(self, name, now=None):
+        if not self.enabled or self.finished or name not in self.started:
+            return
+        if now is None:
+            now = ticks_ms()
+        self.phases.append([name, self.started.pop(name), now, True])
+
+    def finish(self, name="first reading", now=None):
+        """Mark the first reading, print and save the timeline; afterwards every call does nothing"""
+        if not self.enabled or self.finished:
+            return
+        self.mark(name, now)
+        self.finished = True  # Later reconnects and samples aren't part of the boot
+        print(self.report())
+        self.save()
+
+    def report(self):
+        lines = [f"  {'phase':<20} {'start':>7} {'end':>7} {'ms':>7}"]
+        for name, start, end, background in self.phases:
+            lines.append(f"  {name:<20} {start:>7} {end:>7} {ticks_diff(end, start):>7}"
+                         + ("  (background)" if background else ""))
+        return "Boot timeline, ms since reset:\n" + "\n".join(lines)
+
+    def save(self):
+        import json
+
+        try:
+            with open(self.state_file, "w") as f:
+                json.dump(self.phases, f)
+        except OSError as e:
+            print(f"Error saving boot timeline: {e}")
+            return False
+        return True
+
+    def stats(self):
+        return {name: ticks_diff(end, start) for name, start, end, _ in self.phases}
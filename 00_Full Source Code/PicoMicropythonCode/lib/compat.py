@@ -0,0 +1,30 @@
+# compat.py
+# Small shim so the shared firmware modules in lib/ run unchanged on the
+# Pico W (MicroPython) and on a desktop CPython for the host-side benchmarks.
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_ms
+    from micropython import const
+    MICROPYTHON = True
+except ImportError:
+    import time as _time
+
+    MICROPYTHON = False
+
+    def ticks_ms():
+        return _time.perf_counter_ns() // 1000000
+
+    def ticks_us():
+        return _time.perf_counter_ns() // 1000
+
+    def ticks_diff(new, old):
+        return new - old
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+    def sleep_ms(ms):
+        _time.sleep(ms / 1000)
+
+    def const(value):
+        return value
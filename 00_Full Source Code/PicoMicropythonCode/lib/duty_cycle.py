@@ -0,0 +1,260 @@
+# duty_cycle.py
+# Duty-cycled runtime for sensor nodes on a battery or a solar panel.
+#
+# The always-on firmware keeps the CPU and the Wi-Fi radio up between
+# readings, tens of mA whether or not anything is sent. A duty-cycled node
+# wakes, samples, queues the reading, uploads the queued batch when one is
+# due and sleeps again:
+#
+#   deep   machine.deepsleep(ms): lowest current, but the Pico starts over
+#          from main.py on wake and RAM is lost
+#   light  machine.lightsleep(ms): RAM and the Python state survive, for a
+#          little more current; Wi-Fi still has to reconnect
+#
+# WakeState holds what has to outlive a deep sleep: the wake count, the
+# sequence number stamped on each reading, each value's deadband baseline
+# and the readings not yet sent. It is kept in RTC memory on ports that have
+# it (the ESP32 keeps 2 KB through deep sleep) and otherwise in a JSON file
+# in flash, like the moisture calibration and BLE handle caches (the RP2040
+# has no retained RAM). save() only writes when something changed, and
+# littlefs spreads the writes over the flash.
+#
+# Deadbands cut uploads: a value is reported when it has moved by more than
+# its band since the last report, or after max_silent wakes as a heartbeat.
+# Readings queue until `batch` are pending, or the oldest has waited long
+# enough, so the radio comes up once per batch. The queue is bounded and drops its oldest readings if the server
+# stays unreachable. Each payload carries its sequence number and age_ms,
+# since the server timestamps a reading when it arrives.
+#
+# fast_connect() shortens the reconnect on wake: it polls the link every
+# 50 ms instead of every second, asks for the channel it joined last time
+# and reuses the last DHCP lease as a static address, skipping DHCP. A failed
+# connect clears the cache so the next wake does a full one.
+
+import json
+
+from compat import ticks_ms, ticks_diff, sleep_ms
+
+WAKE_STATE_FILE = "wake_state.json"
+MAX_PENDING = 48  # Readings kept while the server is unreachable
+RTC_MEMORY_BYTES = 2048  # ESP32 RTC user memory
+MAX_SILENT_WAKES = 12  # Report an unchanged value at least this often
+LEASE_WAKES = 100  # Wakes a cached DHCP lease is reused before a full connect
+CONNECT_POLL_MS = 50
+CONNECT_TIMEOUT_MS = 10000
+STAT_GOT_IP = 3
+
+SLEEP_DEEP = "deep"
+SLEEP_LIGHT = "light"
+
+
+class WakeState:
+    def __init__(self, state_file=WAKE_STATE_FILE, rtc=None, max_pending=MAX_PENDING):
+        """rtc: a machine.RTC() with memory() to keep state there instead of flash"""
+        self.state_file = state_file
+        self.rtc = rtc if rtc is not None and hasattr(rtc, "memory") else None
+        self.max_pending = max_pending
+        self.reset()
+
+    def reset(self):
+        self.wakes = 0
+        self.seq = 0
+        # key -> last reported value, and wakes since it was reported
+        self.baselines = {}
+        self.silent = {}
+        # [seq, wake, device_id, sensors] per queued reading, oldest first
+        self.pending = []
+        self.dropped = 0
+        # Cached connection: [ifconfig tuple, channel, wakes it has been reused]
+        self.wifi = None
+        self.dirty = True
+        self.writes = 0
+
+    def _load(self):
+        if self.rtc is not None:
+            blob = self.rtc.memory()
+            if not blob:
+                return None
+            return json.loads(blob)
+        with open(self.state_file) as f:
+            return json.load(f)
+
+    def restore(self):
+        """Load the state kept through the last sleep; False on a cold boot"""
+        try:
+            state = self._load()
+        except (OSError, ValueError):
+            state = None
+        if not isinstance(state, dict):
+            self.reset()
+            return False
+        try:
+            self.wakes = state["wakes"]
+            self.seq = state["seq"]
+            self.baselines = state["baselines"]
+            self.silent = state["silent"]
+            self.pending = state["pending"]
+            self.dropped = state["dropped"]
+            self.wifi = state["wifi"]
+        except (KeyError, TypeError):
+            self.reset()
+            return False
+        self.dirty = False
+        return True
+
+    def _dump(self):
+        return json.dumps({
+            "wakes": self.wakes,
+            "seq": self.seq,
+            "baselines": self.baselines,
+            "silent": self.silent,
+            "pending": self.pending,
+            "dropped": self.dropped,
+            "wifi": self.wifi
+        })
+
+    def save(self):
+        """Keep the state through the next sleep (only written if it changed)"""
+        if not self.dirty:
+            return True
+        blob = self._dump()
+        # RTC memory is small: drop the oldest readings until the state fits
+        while self.rtc is not None and len(blob) > RTC_MEMORY_BYTES and self.pending:
+            self.pending.pop(0)
+            self.dropped += 1
+            blob = self._dump()
+        try:
+            if self.rtc is not None:
+                self.rtc.memory(blob.encode())
+            else:
+                with open(self.state_file, "w") as f:
+                    f.write(blob)
+        except OSError as e:
+            print(f"Error saving wake state: {e}")
+            return False
+        self.dirty = False
+        self.writes += 1
+        return True
+
+    def wake(self):
+        """Count a wake; call once per cycle, before reading sensors"""
+        self.wakes += 1
+        self.dirty = True
+
+    def changed(self, key, value, band, max_silent=MAX_SILENT_WAKES):
+        """Whether value moved more than band since key was last reported
+
+        A value unchanged for max_silent wakes is reported anyway, so the
+        server can tell a steady reading from a dead node. True updates the
+        baseline, so call it only when the value will be sent.
+        """
+        last = self.baselines.get(key)
+        silent = self.silent.get(key, 0) + 1
+        if last is not None and abs(value - last) <= band and silent < max_silent:
+            self.silent[key] = silent
+            self.dirty = True
+            return False
+        self.baselines[key] = value
+        self.silent[key] = 0
+        self.dirty = True
+        return True
+
+    def queue(self, device_id, sensors):
+        """Add a reading to the pending batch; returns its sequence number"""
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.pending.append([self.seq, self.wakes, device_id, sensors])
+        if len(self.pending) > self.max_pending:
+            self.pending.pop(0)
+            self.dropped += 1
+        self.dirty = True
+        return self.seq
+
+    def batch_due(self, batch, max_age_wakes=None):
+        """Whether to bring the radio up: batch readings queued, or the oldest
+        has waited max_age_wakes"""
+        if len(self.pending) >= batch:
+            return True
+        return (max_age_wakes is not None and self.pending and
+                self.wakes - self.pending[0][1] >= max_age_wakes)
+
+    def send_pending(self, send, interval_ms):
+        """Send the queued readings oldest first with send(payload) -> bool
+
+        Stops at the first failure and keeps that reading and the rest for
+        the next wake. Returns how many were sent.
+        """
+        sent = 0
+        while self.pending:
+            seq, wake, device_id, sensors = self.pending[0]
+            payload = {
+                "device_id": device_id,
+                "sensors": sensors,
+                "seq": seq,
+                "age_ms": (self.wakes - wake) * interval_ms
+            }
+            if not send(payload):
+                break
+            self.pending.pop(0)
+            self.dirty = True
+            sent += 1
+        return sent
+
+    def stats(self):
+        return {
+            "wakes": self.wakes,
+            "seq": self.seq,
+            "pending": len(self.pending),
+            "dropped": self.dropped,
+            "writes": self.writes
+        }
+
+
+def fast_connect(wlan, ssid, password, state, timeout_ms=CONNECT_TIMEOUT_MS):
+    """Connect using the cached lease and channel; returns ms taken, or None"""
+    start = ticks_ms()
+    wlan.active(True)
+    cached = state.wifi
+    if cached is not None and cached[2] >= LEASE_WAKES:
+        cached = None  # Renew the lease with a full connect now and then
+    if cached is not None:
+        wlan.ifconfig(tuple(cached[0]))
+    else:
+        wlan.ifconfig("dhcp")
+    try:
+        if cached is not None and cached[1]:
+            wlan.connect(ssid, password, channel=cached[1])
+        else:
+            wlan.connect(ssid, password)
+    except TypeError:
+        wlan.connect(ssid, password)  # Port without channel=
+
+    while wlan.status() != STAT_GOT_IP:
+        if wlan.status() < 0 or ticks_diff(ticks_ms(), start) >= timeout_ms:
+            print(f"Wi-Fi connect failed (status {wlan.status()})")
+            wlan.active(False)
+            state.wifi = None
+            state.dirty = True
+            return None
+        sleep_ms(CONNECT_POLL_MS)
+
+    if cached is not None:
+        cached[2] += 1
+        state.wifi = cached
+    else:
+        try:
+            channel = wlan.config("channel")
+        except (OSError, ValueError):
+            channel = 0
+        state.wifi = [list(wlan.ifconfig()), channel, 0]
+    state.dirty = True
+    return ticks_diff(ticks_ms(), start)
+
+
+def sleep(mode, ms):
+    """Sleep the whole chip; after a deep sleep the Pico starts over from main.py"""
+    import machine
+
+    if mode == SLEEP_DEEP:
+        machine.deepsleep(ms)
+    else:
+        machine.lightsleep(ms)
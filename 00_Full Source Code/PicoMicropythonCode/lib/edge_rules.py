@@ -0,0 +1,240 @@
+# edge_rules.py
+# On-device rule engine for the actuator Pico.
+#
+# Rules are pushed from the server in the same shape ruleService.js stores
+# them, e.g.
+#   {
+#     "id": "rule_...", "name": "Dry soil", "deviceId": "Soil Moisture Sensor",
+#     "type": "condition", "enabled": true, "edge": true,
+#     "condition": {"sensor": "moisture", "operator": "<", "value": 30, "hysteresis": 5},
+#     "action": {"component": "pump", "command": "power", "value": "on"},
+#     "releaseAction": {"component": "pump", "command": "power", "value": "off"},
+#     "minOnSeconds": 10, "minOffSeconds": 60, "maxAgeSeconds": 300
+#   }
+# Only the edge-specific keys (condition.hysteresis, releaseAction,
+# minOnSeconds, minOffSeconds, maxAgeSeconds) are new; everything else is
+# ruleService's format.
+#
+# A rule only acts on a reading younger than maxAgeSeconds (MAX_AGE_S by
+# default). When its sensor goes quiet, the rule goes stale: an active rule
+# is released at once, min-on notwithstanding, so a dead sensor can't hold
+# the pump on with its last dry-soil reading, and it stays idle until a
+# fresh reading arrives.
+
+import json
+
+from compat import ticks_ms, ticks_diff
+
+RULES_FILE = "edge_rules.json"
+MAX_AGE_S = 300  # Sensors report every few seconds; minutes of silence means one is gone
+
+# Compiled rule slots (lists are mutable and cheaper than dicts on the Pico)
+_ID = 0
+_OP = 1
+_THRESHOLD = 2
+_HYSTERESIS = 3
+_ACTION = 4
+_RELEASE = 5
+_MIN_ON = 6
+_MIN_OFF = 7
+_ACTIVE = 8
+_CHANGED_AT = 9
+_LAST_VALUE = 10
+_UPDATED_AT = 11
+_MAX_AGE = 12
+
+_OPERATORS = {
+    ">": lambda v, t: v > t,
+    ">=": lambda v, t: v >= t,
+    "<": lambda v, t: v < t,
+    "<=": lambda v, t: v <= t,
+    "==": lambda v, t: v == t,
+    "!=": lambda v, t: v != t,
+}
+
+
+def _compile_action(action):
+    """Reduce a ruleService action to (component, action, value)"""
+    if not action or not action.get("component"):
+        return None
+    # Standard actions use "command", custom JSON actions use "action"
+    name = action.get("action", action.get("command"))
+    if name is None or action.get("value") is None:
+        return None
+    return (action["component"], name, action["value"])
+
+
+class EdgeRuleEngine:
+    def __init__(self, actuate, rules_file=RULES_FILE):
+        """actuate(component, action, value, rule_id) performs the command locally"""
+        self.actuate = actuate
+        self.rules_file = rules_file
+        self.rules = []
+        # (deviceId, sensor) -> [compiled rules], so a reading only touches its own rules
+        self.index = {}
+        self.raw_rules = []
+
+    def load(self, rules):
+        """Compile a list of ruleService rules, skipping anything we can't run locally"""
+        compiled = []
+        index = {}
+        kept = []
+
+        for rule in rules:
+            if not rule.get("enabled", True) or rule.get("type", "condition") != "condition":
+                continue
+
+            condition = rule.get("condition") or {}
+            op = _OPERATORS.get(condition.get("operator"))
+            action = _compile_action(rule.get("action"))
+            if op is None or action is None or not condition.get("sensor"):
+                print(f"Edge rule {rule.get('id')} is not runnable locally, skipping")
+                continue
+
+            try:
+                threshold = float(condition["value"])
+                hysteresis = float(condition.get("hysteresis", 0))
+                min_on = int(float(rule.get("minOnSeconds", 0)) * 1000)
+                min_off = int(float(rule.get("minOffSeconds", 0)) * 1000)
+                max_age = int(float(rule.get("maxAgeSeconds", MAX_AGE_S)) * 1000)
+            except (KeyError, TypeError, ValueError):
+                print(f"Edge rule {rule.get('id')} has non-numeric settings, skipping")
+                continue
+
+            entry = [
+                rule.get("id"),
+                condition["operator"],
+                threshold,
+                hysteresis,
+                action,
+                _compile_action(rule.get("releaseAction")),
+                min_on,
+                min_off,
+                False,
+                None,
+                None,
+                None,
+                max_age,
+            ]
+            compiled.append(entry)
+            key = (rule.get("deviceId"), condition["sensor"])
+            index.setdefault(key, []).append(entry)
+            kept.append(rule)
+
+        # Carry over the on/off state of rules that survived the reload so a
+        # push from the server doesn't re-fire or drop an active output
+        previous = {r[_ID]: r for r in self.rules}
+        for entry in compiled:
+            old = previous.get(entry[_ID])
+            if old is not None:
+                entry[_ACTIVE] = old[_ACTIVE]
+                entry[_CHANGED_AT] = old[_CHANGED_AT]
+                entry[_LAST_VALUE] = old[_LAST_VALUE]
+                entry[_UPDATED_AT] = old[_UPDATED_AT]
+
+        self.rules = compiled
+        self.index = index
+        self.raw_rules = kept
+        print(f"Edge rule engine loaded {len(compiled)} rules")
+        return len(compiled)
+
+    def save(self):
+        """Persist the current rules so they survive a reboot with the uplink down"""
+        try:
+            with open(self.rules_file, "w") as f:
+                json.dump(self.raw_rules, f)
+            return True
+        except OSError as e:
+            print(f"Error saving edge rules: {e}")
+            return False
+
+    def restore(self):
+        """Load the last rules pushed by the server from flash"""
+        try:
+            with open(self.rules_file) as f:
+                return self.load(json.load(f))
+        except (OSError, ValueError):
+            return 0
+
+    def update(self, device_id, sensors, now=None):
+        """Feed one reading payload ({"sensor": {"value": ...}} or {"sensor": value})"""
+        if now is None:
+            now = ticks_ms()
+
+        for sensor, reading in sensors.items():
+            rules = self.index.get((device_id, sensor))
+            if not rules:
+                continue
+
+            if isinstance(reading, dict):
+                reading = reading.get("value")
+            try:
+                value = float(reading)
+            except (TypeError, ValueError):
+                continue
+
+            for rule in rules:
+                rule[_LAST_VALUE] = value
+                rule[_UPDATED_AT] = now
+                self._step(rule, now)
+
+    def tick(self, now=None):
+        """Re-check rules held back by min-on/min-off, and release rules gone stale"""
+        if now is None:
+            now = ticks_ms()
+        for rule in self.rules:
+            if rule[_LAST_VALUE] is not None:
+                self._step(rule, now)
+
+    def _stale(self, rule, now):
+        return ticks_diff(now, rule[_UPDATED_AT]) > rule[_MAX_AGE]
+
+    def _step(self, rule, now):
+        if self._stale(rule, now):
+            # The sensor went quiet: back to the safe (released) state, and
+            # nothing more until a fresh reading
+            rule[_LAST_VALUE] = None
+            if rule[_ACTIVE]:
+                print(f"Edge rule {rule[_ID]}: no reading for {rule[_MAX_AGE] // 1000} s")
+                self._set(rule, False, now)
+            return
+        value = rule[_LAST_VALUE]
+        threshold = rule[_THRESHOLD]
+        op = rule[_OP]
+
+        if rule[_ACTIVE]:
+            # Release only once the value has left the hysteresis band
+            hysteresis = rule[_HYSTERESIS]
+            if op == ">" or op == ">=":
+                release = value < threshold - hysteresis
+            elif op == "<" or op == "<=":
+                release = value > threshold + hysteresis
+            else:
+                release = not _OPERATORS[op](value, threshold)
+
+            if release and self._held_for(rule, now, rule[_MIN_ON]):
+                self._set(rule, False, now)
+        elif _OPERATORS[op](value, threshold):
+            if self._held_for(rule, now, rule[_MIN_OFF]):
+                self._set(rule, True, now)
+
+    def _held_for(self, rule, now, duration_ms):
+        return rule[_CHANGED_AT] is None or ticks_diff(now, rule[_CHANGED_AT]) >= duration_ms
+
+    def _set(self, rule, active, now):
+        rule[_ACTIVE] = active
+        rule[_CHANGED_AT] = now
+        command = rule[_ACTION] if active else rule[_RELEASE]
+        if command is None:
+            return
+        component, action, value = command
+        print(f"Edge rule {rule[_ID]} {'triggered' if active else 'released'}: {component}.{action}={value}")
+        try:
+            self.actuate(component, action, value, rule[_ID])
+        except Exception as e:
+            print(f"Edge rule {rule[_ID]} action failed: {e}")
+
+    def status(self):
+        """Compact per-rule state for the device status payload"""
+        return {r[_ID]: "active" if r[_ACTIVE] else "idle" if r[_LAST_VALUE] is not None else "no data"
+                for r in self.rules}
@@ -0,0 +1,251 @@
+# fs3000.py
+# Renesas FS3000 air velocity sensor driver.
+#
+# Every read returns a 5-byte frame: a checksum byte, the 12-bit velocity
+# count (high nibble first) and two generic bytes. The five bytes of a good
+# frame sum to zero mod 256, so a frame is validated with four additions
+# and a corrupt one is dropped before any conversion is done.
+#
+# A single reading is one noisy instant of turbulent airflow, so start()
+# samples from a machine.Timer at a fixed rate (20 ms by default) into a
+# preallocated array('H') ring of raw counts. The timer callback only reads
+# into a reused buffer and stores an integer: no allocation, no floats.
+# window_stats() converts the window once per upload and reports the mean,
+# peak and standard deviation of the air velocity.
+#
+# Counts are converted with integer tables built once from the datasheet
+# calibration points of the FS3000-1005 (7.23 m/s) or -1015 (15 m/s),
+# chosen per device. A 64-count bucket index finds the segment and a Q16
+# slope interpolates inside it, giving mm/s as a small int: exact at the
+# calibration points, the same on every build, and no float allocated per
+# conversion on the RP2040.
+
+from array import array
+
+from compat import ticks_us, ticks_diff
+from i2c_device import FrameDevice
+
+FS3000_ADDR = 0x28
+FRAME_BYTES = 5
+SAMPLE_MS = 20
+CAPACITY = 512  # Raw counts kept; 10 s of samples at 20 ms
+RAW_MAX = 4095  # 12-bit count
+
+PART_1005 = "1005"
+PART_1015 = "1015"
+
+# Datasheet calibration points: raw count -> velocity in mm/s, linear in between
+CALIBRATION = {
+    PART_1005: (
+        (409, 915, 1522, 2066, 2523, 2908, 3256, 3572, 3686),
+        (0, 1070, 2010, 3000, 3970, 4960, 5980, 6990, 7230)
+    ),
+    PART_1015: (
+        (409, 1203, 1597, 1908, 2187, 2400, 2629, 2801, 3006, 3178, 3309, 3563, 3686),
+        (0, 2000, 3000, 4000, 5000, 6000, 7000, 8000, 9000, 10000, 11000, 13000, 15000)
+    )
+}
+
+BUCKET_SHIFT = 6  # 64-count buckets; narrower than any calibration segment
+Q = 16  # Fixed-point fraction bits of the segment slopes
+
+
+def frame_valid(frame):
+    """True when the five frame bytes sum to zero mod 256"""
+    return (frame[0] + frame[1] + frame[2] + frame[3] + frame[4]) & 0xFF == 0
+
+
+def _rounded_div(num, den):
+    return (num + den // 2) // den
+
+
+class VelocityTable:
+    """Integer count -> mm/s conversion for one FS3000 part"""
+
+    def __init__(self, raw_points, mm_points):
+        self.raw_min = raw_points[0]
+        self.raw_max = raw_points[-1]
+        self.mm_max = mm_points[-1]
+        segments = len(raw_points) - 1
+        self.bases = array("i", raw_points[:-1])
+        self.offsets = array("i", mm_points[:-1])
+        # Rounded Q16 slope of each segment, in mm/s per count
+        self.slopes = array("i", [
+            _rounded_div((mm_points[i + 1] - mm_points[i]) << Q, raw_points[i + 1] - raw_points[i])
+            for i in range(segments)
+        ])
+        # Segment that holds the first count of each bucket
+        self.index = bytearray((RAW_MAX >> BUCKET_SHIFT) + 1)
+        seg = 0
+        for bucket in range(len(self.index)):
+            while seg < segments - 1 and bucket << BUCKET_SHIFT >= raw_points[seg + 1]:
+                seg += 1
+            self.index[bucket] = seg
+
+    def mm_per_s(self, raw):
+        """Velocity in mm/s for a 12-bit count"""
+        if raw <= self.raw_min:
+            return 0
+        if raw >= self.raw_max:
+            return self.mm_max
+        seg = self.index[raw >> BUCKET_SHIFT]
+        bases = self.bases
+        # Buckets are narrower than segments, so a bucket spans at most two
+        if seg < len(bases) - 1 and raw >= bases[seg + 1]:
+            seg += 1
+        return self.offsets[seg] + (((raw - bases[seg]) * self.slopes[seg] + (1 << (Q - 1))) >> Q)
+
+
+TABLES = {part: VelocityTable(*points) for part, points in CALIBRATION.items()}
+
+
+def raw_to_velocity(raw, part=PART_1005):
+    """Velocity in m/s for a 12-bit count"""
+    return TABLES[part].mm_per_s(raw) / 1000
+
+
+class FS3000(FrameDevice):
+    ADDR = FS3000_ADDR
+    FRAME_BYTES = FRAME_BYTES
+
+    def __init__(self, i2c, part=PART_1005, addr=FS3000_ADDR, capacity=CAPACITY):
+        """part: PART_1005 (7.23 m/s) or PART_1015 (15 m/s)"""
+        super().__init__(i2c, addr)
+        self.part = part
+        self.table = TABLES[part]
+        self.capacity = capacity
+        self.ring = array("H", bytes(2 * capacity))
+        self.head = 0
+        # Samples since the last window_stats(), capped at the ring size
+        self.count = 0
+        self.timer = None
+        self.sample_ms = SAMPLE_MS
+        self.samples = 0
+        self.overruns = 0
+        self.tick_us = 0  # Time spent in the last timer callback
+
+    def frame_ok(self, frame):
+        # An all-zero frame also sums to zero, but real counts never read 0
+        return frame_valid(frame) and (frame[1] | frame[2]) != 0
+
+    def read_raw(self):
+        """One 12-bit velocity count, or None if the frame is bad or the bus failed"""
+        frame = self.read_frame()
+        if frame is None:
+            return None
+        return ((frame[1] & 0x0F) << 8) | frame[2]
+
+    def read_velocity(self):
+        """One velocity reading in m/s, or None"""
+        raw = self.read_raw()
+        if raw is None:
+            return None
+        return self.table.mm_per_s(raw) / 1000
+
+    def sample(self):
+        """Read one frame into the ring; called from the timer"""
+        raw = self.read_raw()
+        if raw is not None:
+            self.store(raw)
+
+    def read_into(self, values):
+        """Read one count into values[0] (sampling on the other core); False if bad
+
+        Not timed here: bus_us would outgrow a small int on core 1 within
+        hours. The I2CBus (deferred) times the read and core 0 settles it.
+        """
+        frame = self.frame
+        try:
+            self.i2c.readfrom_into(self.addr, frame)
+        except OSError:
+            self.bus_errors += 1
+            return False
+        self.transactions += 1
+        if not self.frame_ok(frame):
+            self.bad_frames += 1
+            return False
+        values[0] = ((frame[1] & 0x0F) << 8) | frame[2]
+        return True
+
+    def store(self, raw):
+        """Add one count to the ring"""
+        self.ring[self.head] = raw
+        self.head += 1
+        if self.head == self.capacity:
+            self.head = 0
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            # The window is longer than the ring; its oldest samples are lost
+            self.overruns += 1
+        self.samples += 1
+
+    def _tick(self, timer):
+        start = ticks_us()
+        self.sample()
+        self.tick_us = ticks_diff(ticks_us(), start)
+
+    def start(self, sample_ms=SAMPLE_MS):
+        """Sample every sample_ms from a timer until stop()"""
+        from machine import Timer
+
+        self.stop()
+        self.sample_ms = sample_ms
+        # Soft callback: I2C can't run in hard interrupt context
+        self.timer = Timer(mode=Timer.PERIODIC, period=sample_ms, callback=self._tick, hard=False)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+
+    def window_stats(self, reset=True):
+        """{mean, peak, stddev (m/s), raw mean, samples} since the last call, or None if empty"""
+        # Snapshot first: the timer can add samples while this runs
+        count = self.count
+        head = self.head
+        if count == 0:
+            return None
+        ring = self.ring
+        capacity = self.capacity
+        convert = self.table.mm_per_s
+        # Sums stay small ints (512 samples of at most 15000 mm/s); only the
+        # squares, up to 2.25e8 each, are summed as a float
+        total = 0
+        squares = 0.0
+        peak = 0
+        raw_total = 0
+        i = head - count
+        if i < 0:
+            i += capacity
+        for _ in range(count):
+            raw = ring[i]
+            mm = convert(raw)
+            total += mm
+            squares += mm * mm
+            raw_total += raw
+            if mm > peak:
+                peak = mm
+            i += 1
+            if i == capacity:
+                i = 0
+        if reset:
+            self.count -= count
+        mean = total / count
+        variance = max(0.0, squares / count - mean * mean)
+        return {
+            "mean": mean / 1000,
+            "peak": peak / 1000,
+            "stddev": variance ** 0.5 / 1000,
+            "raw_mean": raw_total // count,
+            "samples": count
+        }
+
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "bad_frames": self.bad_frames,
+            "bus_errors": self.bus_errors,
+            "overruns": self.overruns,
+            "tick_us": self.tick_us
+        }
@@ -0,0 +1,242 @@
+# i2c_bus.py
+# Shared I2C bus that finds the fastest clock its devices handle reliably.
+#
+# The sensor Picos ran their buses at a fixed 10 kHz or 100 kHz "for
+# compatibility". The FS3000, SCD41 and AS7341 all allow 400 kHz, but
+# whether a given bus manages it depends on its wiring: long leads and weak
+# pull-ups round off the clock edges until bytes get corrupted or NACKed.
+#
+# negotiate() tries each rate in SPEEDS from slow to fast. At each one it runs
+# every device's verify() check (an ID read, or a checksummed/CRC-checked
+# frame) PROBE_READS times. The bus settles on the fastest rate at which every
+# check passed, and stops at the first rate that fails.
+#
+# Drivers use an I2CBus exactly like a machine.I2C. Each transaction is timed
+# and its bytes counted, so stats() can compare the wire time at the
+# negotiated rate with the same traffic at the old fixed rate. If
+# FALLBACK_ERRORS transactions in a row fail at runtime (a cable moved, a
+# module was added), the bus drops one rate and carries on. Corrupt frames
+# that were ACKed look fine to the bus; check_frames() takes the drivers'
+# checksum/CRC failure count and falls back when they pass FALLBACK_FRAME_RATE.
+#
+# machine.I2C can't change its clock in place on every port, so the bus is
+# rebuilt through make(freq), e.g.
+#   I2CBus(lambda freq: I2C(0, sda=Pin(4), scl=Pin(5), freq=freq), 10000)
+#
+# While core 1 reads the bus (lib/acquisition.py), set deferred. A
+# transaction then only adds to small-int counts, and a run of failures
+# only flags the fallback: core 0's next check_frames(), under the
+# acquisition's bus_lock, converts the counts to wire time and rebuilds the
+# bus if it has to. No float maths, print or machine.I2C rebuild runs on
+# core 1.
+
+from compat import ticks_us, ticks_diff
+
+SPEEDS = (10000, 50000, 100000, 200000, 400000)
+PROBE_READS = 20  # Clean checks needed per device at each rate
+FALLBACK_ERRORS = 3  # Consecutive failed transactions before dropping a rate
+FALLBACK_FRAME_RATE = 0.05  # Share of corrupt frames between checks that drops a rate
+FRAME_CHECK_MIN = 20  # Transactions needed before that share is judged
+
+
+def _bit_us(freq):
+    return 1000000 / freq
+
+
+class I2CBus:
+    def __init__(self, make, freq=SPEEDS[0], baseline=None, speeds=SPEEDS):
+        """make: freq -> machine.I2C; baseline: the old fixed rate to report savings against"""
+        self.make = make
+        self.speeds = speeds
+        self.freq = freq
+        self.i2c = make(freq)
+        self.bit_us = _bit_us(freq)
+        self.baseline = baseline or freq
+        self.baseline_bit_us = _bit_us(self.baseline)
+        self.negotiating = False
+        self.consecutive_errors = 0
+        self.checked_bad = None  # Drivers' bad-frame total at the last check_frames()
+        self.checked_transactions = 0
+        self.fallbacks = 0
+        self.transactions = 0
+        self.errors = 0
+        self.bus_us = 0  # Measured time inside I2C calls
+        self.wire_us = 0.0  # Estimated clocking time at the rates used
+        self.baseline_wire_us = 0.0  # Same traffic at the baseline rate
+        self.deferred = False  # Core 1 reads the bus; leave the rest to check_frames()
+        self.pending_us = 0  # Deferred counts not yet in bus_us/wire_us
+        self.pending_bits = 0
+        self.fallback_due = False
+
+    def set_freq(self, freq):
+        self.i2c = self.make(freq)
+        self.freq = freq
+        self.bit_us = _bit_us(freq)
+
+    def negotiate(self, checks, reads=PROBE_READS):
+        """Settle on the fastest rate at which every check passes; returns it
+
+        checks: callables returning True for a good ID read or checked frame.
+        """
+        self.negotiating = True
+        best = None
+        for freq in self.speeds:
+            self.set_freq(freq)
+            passed = True
+            for check in checks:
+                for _ in range(reads):
+                    if not check():
+                        passed = False
+                        break
+                if not passed:
+                    break
+            if not passed:
+                print(f"I2C checks failed at {freq // 1000} kHz")
+                break
+            best = freq
+        self.negotiating = False
+        if best is None:
+            # Nothing answers at any rate (sensor missing?); keep the old rate
+            best = self.baseline
+        self.set_freq(best)
+        self.consecutive_errors = 0
+        return best
+
+    def _fallback(self):
+        i = self.speeds.index(self.freq) if self.freq in self.speeds else 0
+        if i == 0:
+            return
+        self.fallbacks += 1
+        print(f"I2C errors at {self.freq // 1000} kHz, falling back to {self.speeds[i - 1] // 1000} kHz")
+        self.set_freq(self.speeds[i - 1])
+
+    def check_frames(self, bad_frames):
+        """Fall back if too many recent frames failed their checksum/CRC
+
+        bad_frames: running total of corrupt frames across the bus's drivers.
+        Also applies what deferred transactions left pending.
+        """
+        self.settle()
+        transactions = self.transactions - self.checked_transactions
+        if self.checked_bad is not None:
+            if transactions < FRAME_CHECK_MIN:
+                return  # Too little traffic yet to judge a rate
+            if (bad_frames - self.checked_bad) / transactions > FALLBACK_FRAME_RATE:
+                self._fallback()
+        self.checked_bad = bad_frames
+        self.checked_transactions = self.transactions
+
+    def settle(self):
+        """Fold deferred counts into the stats and apply a pending fallback (core 0)"""
+        if self.pending_bits:
+            self.bus_us += self.pending_us
+            self.wire_us += self.pending_bits * self.bit_us
+            self.baseline_wire_us += self.pending_bits * self.baseline_bit_us
+            self.pending_us = 0
+            self.pending_bits = 0
+        if self.fallback_due:
+            self.fallback_due = False
+            self._fallback()
+
+    def _failed(self):
+        self.errors += 1
+        if self.negotiating:
+            return
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= FALLBACK_ERRORS:
+            self.consecutive_errors = 0
+            if self.deferred:
+                self.fallback_due = True
+            else:
+                self._fallback()
+
+    def _done(self, start, nbytes):
+        self.transactions += 1
+        self.consecutive_errors = 0
+        # Address byte plus data, 9 clocks each (ACK included), START and STOP
+        bits = 9 * (nbytes + 1) + 2
+        if self.deferred:
+            self.pending_us += ticks_diff(ticks_us(), start)
+            self.pending_bits += bits
+            return
+        self.bus_us += ticks_diff(ticks_us(), start)
+        self.wire_us += bits * self.bit_us
+        self.baseline_wire_us += bits * self.baseline_bit_us
+
+    # machine.I2C methods the drivers use
+
+    def scan(self):
+        return self.i2c.scan()
+
+    def writeto(self, addr, buf, stop=True):
+        start = ticks_us()
+        try:
+            acks = self.i2c.writeto(addr, buf, stop)
+        except OSError:
+            self._failed()
+            raise
+        self._done(start, len(buf))
+        return acks
+
+    def readfrom(self, addr, nbytes, stop=True):
+        start = ticks_us()
+        try:
+            data = self.i2c.readfrom(addr, nbytes, stop)
+        except OSError:
+            self._failed()
+            raise
+        self._done(start, nbytes)
+        return data
+
+    def readfrom_into(self, addr, buf, stop=True):
+        start = ticks_us()
+        try:
+            self.i2c.readfrom_into(addr, buf, stop)
+        except OSError:
+            self._failed()
+            raise
+        self._done(start, len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf):
+        start = ticks_us()
+        try:
+            self.i2c.writeto_mem(addr, memaddr, buf)
+        except OSError:
+            self._failed()
+            raise
+        self._done(start, len(buf) + 1)
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        start = ticks_us()
+        try:
+            data = self.i2c.readfrom_mem(addr, memaddr, nbytes)
+        except OSError:
+            self._failed()
+            raise
+        # Register byte, repeated START and a second address byte
+        self._done(start, nbytes + 2)
+        return data
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        start = ticks_us()
+        try:
+            self.i2c.readfrom_mem_into(addr, memaddr, buf)
+        except OSError:
+            self._failed()
+            raise
+        self._done(start, len(buf) + 2)
+
+    def stats(self):
+        # Deferred counts are included without settling, which is core 0's job under the lock
+        wire_us = self.wire_us + self.pending_bits * self.bit_us
+        baseline_wire_us = self.baseline_wire_us + self.pending_bits * self.baseline_bit_us
+        return {
+            "freq": self.freq,
+            "fallbacks": self.fallbacks,
+            "transactions": self.transactions,
+            "errors": self.errors,
+            "bus_ms": (self.bus_us + self.pending_us) // 1000,
+            "wire_ms": round(wire_us / 1000, 1),
+            "baseline_wire_ms": round(baseline_wire_us / 1000, 1),
+            "saved_ms": round((baseline_wire_us - wire_us) / 1000, 1)
+        }
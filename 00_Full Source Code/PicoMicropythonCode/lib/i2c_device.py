@@ -0,0 +1,250 @@
+# i2c_device.py
+# Base classes for the I2C sensor drivers in lib/.
+#
+# The sensors talk to the Pico in one of three ways, and each used to be
+# written out, and fixed, separately in every script that needed it:
+#
+#   RegisterDevice  byte registers behind an auto-incrementing pointer
+#                   (AS7341). REGISTERS names them for dump(); read_reg,
+#                   write_reg and read_into move single bytes or bursts
+#                   through preallocated buffers; verify() checks the ID.
+#   CommandDevice   16-bit command codes answered with CRC-checked words
+#                   (Sensirion SCD4x). COMMANDS maps each name to its code,
+#                   execution time, response length and decode routine;
+#                   read() sends, waits, checks every CRC, re-reads a
+#                   corrupt frame and decodes.
+#   FrameDevice     free-running parts read as one fixed-length frame,
+#                   usually with a checksum (FS3000) that frame_ok() checks;
+#                   read_frame() drops bad frames.
+#
+# A driver subclasses one of these, declares its tables and keeps only what
+# is specific to the part: measurement scheduling and unit conversion. All
+# traffic goes through the i2c object it is given: a machine.I2C, an I2CBus,
+# or on the host the scriptable fake in bench/fake_i2c.py. Every device
+# counts its transactions, time on the bus and bus errors.
+
+from compat import ticks_us, ticks_diff, sleep_ms
+from sensirion import decode_words, encode_words
+
+
+class I2CDevice:
+    ADDR = None
+
+    def __init__(self, i2c, addr=None):
+        self.i2c = i2c
+        self.addr = self.ADDR if addr is None else addr
+        self.transactions = 0
+        self.bus_us = 0
+        self.bus_errors = 0
+
+    def is_present(self):
+        return self.addr in self.i2c.scan()
+
+    def verify(self):
+        """A cheap read that proves the device answers correctly, for bus speed checks"""
+        return self.is_present()
+
+    def _write(self, buf):
+        start = ticks_us()
+        try:
+            self.i2c.writeto(self.addr, buf)
+        except OSError:
+            self.bus_errors += 1
+            raise
+        self.bus_us += ticks_diff(ticks_us(), start)
+        self.transactions += 1
+
+    def _readfrom(self, nbytes):
+        start = ticks_us()
+        try:
+            data = self.i2c.readfrom(self.addr, nbytes)
+        except OSError:
+            self.bus_errors += 1
+            raise
+        self.bus_us += ticks_diff(ticks_us(), start)
+        self.transactions += 1
+        return data
+
+    def _readfrom_into(self, buf):
+        start = ticks_us()
+        try:
+            self.i2c.readfrom_into(self.addr, buf)
+        except OSError:
+            self.bus_errors += 1
+            raise
+        self.bus_us += ticks_diff(ticks_us(), start)
+        self.transactions += 1
+
+    def bus_stats(self):
+        return {
+            "transactions": self.transactions,
+            "bus_us": self.bus_us,
+            "bus_errors": self.bus_errors
+        }
+
+
+class RegisterDevice(I2CDevice):
+    REGISTERS = {}  # name -> register address
+    ID_REGISTER = None
+    ID_VALUES = ()
+
+    def __init__(self, i2c, addr=None):
+        super().__init__(i2c, addr)
+        self.reg_buf = bytearray(1)
+
+    def write_reg(self, reg, value):
+        start = ticks_us()
+        self.reg_buf[0] = value
+        try:
+            self.i2c.writeto_mem(self.addr, reg, self.reg_buf)
+        except OSError:
+            self.bus_errors += 1
+            raise
+        self.bus_us += ticks_diff(ticks_us(), start)
+        self.transactions += 1
+
+    def read_reg(self, reg):
+        start = ticks_us()
+        try:
+            self.i2c.readfrom_mem_into(self.addr, reg, self.reg_buf)
+        except OSError:
+            self.bus_errors += 1
+            raise
+        self.bus_us += ticks_diff(ticks_us(), start)
+        self.transactions += 1
+        return self.reg_buf[0]
+
+    def read_into(self, reg, buf):
+        """Burst read from reg into a preallocated buffer"""
+        start = ticks_us()
+        try:
+            self.i2c.readfrom_mem_into(self.addr, reg, buf)
+        except OSError:
+            self.bus_errors += 1
+            raise
+        self.bus_us += ticks_diff(ticks_us(), start)
+        self.transactions += 1
+
+    def update_reg(self, reg, mask, bits):
+        """Read-modify-write: replace the bits under mask"""
+        self.write_reg(reg, (self.read_reg(reg) & ~mask) | (bits & mask))
+
+    def id_ok(self, value):
+        return value in self.ID_VALUES
+
+    def verify(self):
+        """One ID register read"""
+        try:
+            return self.id_ok(self.read_reg(self.ID_REGISTER))
+        except OSError:
+            return False
+
+    def dump(self):
+        """{name: value} of every declared register, for debugging"""
+        return {name: self.read_reg(reg) for name, reg in self.REGISTERS.items()}
+
+
+class CommandDevice(I2CDevice):
+    # name -> (command bytes, execution ms, response words, decode(words) or None)
+    COMMANDS = {}
+    VERIFY_COMMAND = None
+    FRAME_REREADS = 2  # Extra attempts for a frame that fails its CRC
+
+    def __init__(self, i2c, addr=None):
+        super().__init__(i2c, addr)
+        # Decoded words reuse one list per response length instead of allocating per frame
+        self.word_lists = {}
+        self.crc_errors = 0
+        self.dropped = 0
+
+    def _command_bytes(self, cmd, args):
+        return cmd + encode_words(args) if args else cmd
+
+    def send(self, name, args=None):
+        """Send a command (with argument words, CRCs added) without waiting"""
+        self._write(self._command_bytes(self.COMMANDS[name][0], args))
+
+    def execute(self, name, args=None):
+        """send() and wait out the command's execution time"""
+        self.send(name, args)
+        sleep_ms(self.COMMANDS[name][1])
+
+    def read_words(self, name, args=None):
+        """Send a read command and return its words, or None if the frame stays corrupt
+
+        The list is reused by the next read of the same length.
+        """
+        cmd, delay_ms, count, decode = self.COMMANDS[name]
+        cmd = self._command_bytes(cmd, args)
+        out = self.word_lists.get(count)
+        if out is None:
+            out = self.word_lists[count] = [0] * count
+        # Re-sending a command with arguments would repeat its action
+        attempts = 1 if args else 1 + self.FRAME_REREADS
+        for attempt in range(attempts):
+            try:
+                self._write(cmd)
+                sleep_ms(delay_ms)
+                frame = self._readfrom(3 * count)
+            except OSError:
+                # NACK: the sensor has nothing (left) to send, e.g. a
+                # measurement buffer already emptied by the corrupt read
+                break
+            if decode_words(frame, out) is not None:
+                return out
+            self.crc_errors += 1
+        self.dropped += 1
+        return None
+
+    def read(self, name, args=None):
+        """read_words() passed through the command's decode routine; None if corrupt"""
+        words = self.read_words(name, args)
+        decode = self.COMMANDS[name][3]
+        if words is None or decode is None:
+            return words
+        return decode(words)
+
+    def verify(self):
+        """One CRC-checked read of VERIFY_COMMAND, not counted in the error stats"""
+        cmd, delay_ms, count, decode = self.COMMANDS[self.VERIFY_COMMAND]
+        try:
+            self.i2c.writeto(self.addr, cmd)
+            sleep_ms(delay_ms)
+            frame = self.i2c.readfrom(self.addr, 3 * count)
+        except OSError:
+            return False
+        return decode_words(frame, [0] * count) is not None
+
+
+class FrameDevice(I2CDevice):
+    FRAME_BYTES = 0
+
+    def __init__(self, i2c, addr=None):
+        super().__init__(i2c, addr)
+        self.frame = bytearray(self.FRAME_BYTES)
+        self.bad_frames = 0
+
+    def frame_ok(self, frame):
+        """Whether a frame is intact; parts with a checksum override this, the rest take every full frame"""
+        return len(frame) == self.FRAME_BYTES
+
+    def read_frame(self):
+        """The next frame (a buffer reused by the next read), or None if the bus failed or it was bad"""
+        frame = self.frame
+        try:
+            self._readfrom_into(frame)
+        except OSError:
+            return None
+        if not self.frame_ok(frame):
+            self.bad_frames += 1
+            return None
+        return frame
+
+    def verify(self):
+        """One frame read, not counted in the error stats"""
+        frame = self.frame
+        try:
+            self.i2c.readfrom_into(self.addr, frame)
+        except OSError:
+            return False
+        return self.frame_ok(frame)
@@ -0,0 +1,138 @@
+# local_link.py
+# LAN-local path for sensor readings: sensor Picos multicast the readings
+# they POST to the server, and actuator Picos on the same network pick them
+# up directly without a round trip through the cloud. The HTTPS upload
+# stays in place for history.
+#
+# A reading travels as {"device_id": ..., "sensors": {"name": value}}: the
+# units stay in the HTTPS payload, which halves the datagram (a 10-channel
+# spectral reading is 331 bytes instead of 621, the capture stats about 940
+# instead of 1800). A reading must fit one datagram of MAX_PACKET; a larger
+# one would be fragmented or cut short, so it isn't sent.
+
+import json
+import random
+import socket
+
+LOCAL_GROUP = "239.255.21.6"  # Administratively scoped multicast group
+LOCAL_PORT = 5021
+MAX_PACKET = 1472  # UDP payload of one 1500-byte Ethernet/Wi-Fi frame
+
+
+def _ip_bytes(ip):
+    return bytes([int(part) for part in ip.split(".")])
+
+
+def _is_multicast(ip):
+    first = int(ip.split(".")[0])
+    return 224 <= first <= 239
+
+
+class LocalPublisher:
+    def __init__(self, group=LOCAL_GROUP, port=LOCAL_PORT):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addr = socket.getaddrinfo(group, port)[0][-1]
+        # Random per boot so subscribers can tell a restart from a replay
+        self.boot = random.getrandbits(16)
+        self.seq = 0
+        self.sent = 0
+        self.errors = 0
+        self.oversized = 0
+
+    def publish(self, device_id, sensors):
+        """Send one reading to the local network (fire and forget)"""
+        self.seq = (self.seq + 1) & 0xFFFF
+        values = {}
+        for name, reading in sensors.items():
+            values[name] = reading.get("value") if isinstance(reading, dict) else reading
+        packet = json.dumps({
+            "device_id": device_id,
+            "sensors": values,
+            "seq": self.seq,
+            "boot": self.boot
+        })
+        if len(packet) > MAX_PACKET:
+            self.oversized += 1
+            print(f"Local reading from {device_id} is {len(packet)} bytes, over {MAX_PACKET}; not sent")
+            return False
+        try:
+            self.sock.sendto(packet.encode(), self.addr)
+            self.sent += 1
+            return True
+        except OSError as e:
+            self.errors += 1
+            print(f"Local publish failed: {e}")
+            return False
+
+    def close(self):
+        self.sock.close()
+
+
+class LocalSubscriber:
+    def __init__(self, group=LOCAL_GROUP, port=LOCAL_PORT, bind_ip="0.0.0.0"):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(socket.getaddrinfo(bind_ip, port)[0][-1])
+
+        if _is_multicast(group):
+            try:
+                membership = _ip_bytes(group) + _ip_bytes("0.0.0.0")
+                self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            except (AttributeError, OSError) as e:
+                # Still receives unicast/broadcast readings on the same port
+                print(f"Multicast join failed, listening for unicast only: {e}")
+
+        self.sock.setblocking(False)
+        # device_id -> (boot, seq) of the newest reading seen
+        self.last_seen = {}
+        self.received = 0
+        self.duplicates = 0
+        self.malformed = 0
+
+    def _is_new(self, device_id, boot, seq):
+        last = self.last_seen.get(device_id)
+        if last is not None and last[0] == boot:
+            # 16-bit sequence numbers: newer means ahead by less than half the range
+            delta = (seq - last[1]) & 0xFFFF
+            if delta == 0 or delta >= 0x8000:
+                return False
+        self.last_seen[device_id] = (boot, seq)
+        return True
+
+    def poll(self, handler, max_packets=16):
+        """Drain pending readings, calling handler(device_id, sensors) for each new one"""
+        handled = 0
+        for _ in range(max_packets):
+            try:
+                packet, _addr = self.sock.recvfrom(MAX_PACKET)
+            except OSError:
+                break  # Nothing pending (EAGAIN)
+
+            try:
+                reading = json.loads(packet)
+                device_id = reading["device_id"]
+                sensors = reading["sensors"]
+                seq = reading.get("seq", 0)
+                boot = reading.get("boot", 0)
+            except (ValueError, KeyError, TypeError):
+                self.malformed += 1
+                continue
+
+            if not self._is_new(device_id, boot, seq):
+                self.duplicates += 1
+                continue
+
+            self.received += 1
+            handled += 1
+            handler(device_id, sensors)
+        return handled
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "malformed": self.malformed
+        }
+
+    def close(self):
+        self.sock.close()
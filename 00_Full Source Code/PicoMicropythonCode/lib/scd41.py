@@ -0,0 +1,330 @@
+# scd41.py
+# Sensirion SCD41 CO2 / temperature / humidity driver.
+#
+# In periodic mode the sensor produces one sample every 5 s. Instead of
+# sending read_measurement (and sleeping) on every loop pass, poll() stays
+# off the bus until the next sample is due, then asks get_data_ready_status
+# (a 3-byte read) and only fetches the 9-byte measurement once a fresh
+# sample is waiting. Each sample is read, and uploaded, exactly once.
+#
+# start(report_interval_ms) picks the measurement mode from how often the
+# node actually reports: periodic (5 s), low-power periodic (30 s) or
+# single-shot, where the sensor sits idle between on-demand measurements.
+# Single shots can skip CO2 (RH/T only, 50 ms) on all but every Nth report.
+#
+# Every frame is CRC-checked. A corrupt frame is read again a bounded number
+# of times and dropped if it stays bad, rather than published as garbage.
+#
+# The command set is declared in COMMANDS for i2c_device.CommandDevice,
+# including the calibration and configuration commands the scripts used to
+# send by hand (forced recalibration, ASC, altitude, persist, reinit).
+
+from compat import ticks_ms, ticks_diff, ticks_add
+from i2c_device import CommandDevice
+
+SCD41_ADDR = 0x62
+
+# SCD41 Commands
+CMD_START_PERIODIC_MEASUREMENT = b"\x21\xb1"
+CMD_START_LOW_POWER_PERIODIC_MEASUREMENT = b"\x21\xac"
+CMD_READ_MEASUREMENT = b"\xec\x05"
+CMD_STOP_PERIODIC_MEASUREMENT = b"\x3f\x86"
+CMD_GET_DATA_READY = b"\xe4\xb8"
+CMD_MEASURE_SINGLE_SHOT = b"\x21\x9d"
+CMD_MEASURE_SINGLE_SHOT_RHT_ONLY = b"\x21\x96"
+CMD_PERFORM_FORCED_RECALIBRATION = b"\x36\x2f"
+CMD_SET_AUTOMATIC_SELF_CALIBRATION = b"\x24\x16"
+CMD_SET_SENSOR_ALTITUDE = b"\x24\x27"
+CMD_PERSIST_SETTINGS = b"\x36\x15"
+CMD_GET_SERIAL_NUMBER = b"\x36\x82"
+CMD_PERFORM_FACTORY_RESET = b"\x36\x32"
+CMD_REINIT = b"\x36\x46"
+
+MODE_IDLE = "idle"
+MODE_PERIODIC = "periodic"
+MODE_LOW_POWER = "low_power"
+MODE_SINGLE_SHOT = "single_shot"
+
+PERIODIC_INTERVAL_MS = 5000
+LOW_POWER_INTERVAL_MS = 30000
+SINGLE_SHOT_MS = 5000
+SINGLE_SHOT_RHT_ONLY_MS = 50
+READY_RETRY_MS = 100  # How soon to ask again when a due sample isn't ready yet
+COMMAND_DELAY_MS = 1  # Execution time of read_measurement / get_data_ready_status
+STOP_DELAY_MS = 500
+FRC_FAILED = 0xFFFF  # Forced recalibration response when it could not run
+
+# Reporting intervals at which the next mode down starts using less energy
+LOW_POWER_FROM_MS = LOW_POWER_INTERVAL_MS
+SINGLE_SHOT_FROM_MS = 60000
+
+# Approximate supply current at 3.3 V (SCD4x datasheet), for estimates only
+PERIODIC_CURRENT_MA = 15.0
+LOW_POWER_CURRENT_MA = 3.2
+IDLE_CURRENT_MA = 0.2
+SINGLE_SHOT_CHARGE_MAS = 75.0  # Charge above idle per CO2 single shot, mA*s
+RHT_ONLY_CHARGE_MAS = 0.5
+
+
+def select_mode(report_interval_ms):
+    """Cheapest measurement mode that still delivers a sample per report"""
+    if report_interval_ms >= SINGLE_SHOT_FROM_MS:
+        return MODE_SINGLE_SHOT
+    if report_interval_ms >= LOW_POWER_FROM_MS:
+        return MODE_LOW_POWER
+    return MODE_PERIODIC
+
+
+def estimated_current_ma(mode, report_interval_ms, co2_every=1):
+    """Rough average sensor current for a mode at a reporting interval"""
+    if mode == MODE_PERIODIC:
+        return PERIODIC_CURRENT_MA
+    if mode == MODE_LOW_POWER:
+        return LOW_POWER_CURRENT_MA
+    seconds = report_interval_ms / 1000
+    charge = (SINGLE_SHOT_CHARGE_MAS + (co2_every - 1) * RHT_ONLY_CHARGE_MAS) / co2_every
+    return IDLE_CURRENT_MA + charge / seconds
+
+
+def decode_measurement(words):
+    """(co2 ppm, temperature C, humidity %) from read_measurement's words"""
+    return words[0], -45 + 175 * (words[1] / 65535.0), 100 * (words[2] / 65535.0)
+
+
+def decode_frc(words):
+    """Forced recalibration correction in ppm, or None if it failed"""
+    if words[0] == FRC_FAILED:
+        return None
+    return words[0] - 0x8000
+
+
+def decode_serial(words):
+    return (words[0] << 32) | (words[1] << 16) | words[2]
+
+
+class SCD41(CommandDevice):
+    ADDR = SCD41_ADDR
+    COMMANDS = {
+        # name: (command, execution ms, response words, decode)
+        "start_periodic_measurement": (CMD_START_PERIODIC_MEASUREMENT, 0, 0, None),
+        "start_low_power_periodic_measurement": (CMD_START_LOW_POWER_PERIODIC_MEASUREMENT, 0, 0, None),
+        "stop_periodic_measurement": (CMD_STOP_PERIODIC_MEASUREMENT, STOP_DELAY_MS, 0, None),
+        "read_measurement": (CMD_READ_MEASUREMENT, COMMAND_DELAY_MS, 3, decode_measurement),
+        "get_data_ready_status": (CMD_GET_DATA_READY, COMMAND_DELAY_MS, 1, None),
+        "measure_single_shot": (CMD_MEASURE_SINGLE_SHOT, SINGLE_SHOT_MS, 0, None),
+        "measure_single_shot_rht_only": (CMD_MEASURE_SINGLE_SHOT_RHT_ONLY, SINGLE_SHOT_RHT_ONLY_MS, 0, None),
+        "perform_forced_recalibration": (CMD_PERFORM_FORCED_RECALIBRATION, 400, 1, decode_frc),
+        "set_automatic_self_calibration_enabled": (CMD_SET_AUTOMATIC_SELF_CALIBRATION, 1, 0, None),
+        "set_sensor_altitude": (CMD_SET_SENSOR_ALTITUDE, 1, 0, None),
+        "persist_settings": (CMD_PERSIST_SETTINGS, 800, 0, None),
+        "get_serial_number": (CMD_GET_SERIAL_NUMBER, COMMAND_DELAY_MS, 3, decode_serial),
+        "perform_factory_reset": (CMD_PERFORM_FACTORY_RESET, 1200, 0, None),
+        "reinit": (CMD_REINIT, 30, 0, None)
+    }
+    # Works idle or in periodic mode, but not during a single shot
+    VERIFY_COMMAND = "get_data_ready_status"
+
+    def __init__(self, i2c, addr=SCD41_ADDR):
+        super().__init__(i2c, addr)
+        self.mode = MODE_IDLE
+        self.interval_ms = PERIODIC_INTERVAL_MS
+        # ticks_ms() at which to next ask the sensor for data; None while stopped
+        self.next_check = None
+        # When the sensor's next sample is expected, and whether the last
+        # data-ready check came back empty (so a sample just arrived)
+        self.sample_due = None
+        self.waiting = False
+        # Single-shot state: when the next shot is due, whether one is being
+        # measured, whether it skips CO2, and the shot count for co2_every
+        self.next_shot = None
+        self.shot_pending = False
+        self.shot_rht_only = False
+        self.shots = 0
+        self.co2_every = 1
+        self.ready_checks = 0
+        self.not_ready = 0
+        self.reads = 0
+
+    def start(self, report_interval_ms=PERIODIC_INTERVAL_MS, co2_every=1):
+        """Start measuring in the mode that suits the reporting interval; returns the mode"""
+        mode = select_mode(report_interval_ms)
+        if self.mode in (MODE_PERIODIC, MODE_LOW_POWER):
+            self.stop_periodic()
+
+        if mode == MODE_PERIODIC:
+            self.start_periodic()
+        elif mode == MODE_LOW_POWER:
+            self.start_low_power_periodic()
+        else:
+            self.mode = MODE_SINGLE_SHOT
+            self.interval_ms = report_interval_ms
+            self.co2_every = max(1, co2_every)
+            self.shots = 0
+            self.shot_pending = False
+            # First shot straight away, then one per reporting interval
+            self.next_shot = ticks_ms()
+            self.next_check = self.next_shot
+        return mode
+
+    def _start_periodic(self, name, mode, interval_ms):
+        self.send(name)
+        self.mode = mode
+        self.interval_ms = interval_ms
+        self.sample_due = ticks_add(ticks_ms(), interval_ms)
+        self.next_check = self.sample_due
+        self.waiting = False
+
+    def start_periodic(self):
+        """Start periodic measurement; the first sample is ready one interval later"""
+        self._start_periodic("start_periodic_measurement", MODE_PERIODIC, PERIODIC_INTERVAL_MS)
+
+    def start_low_power_periodic(self):
+        """Start low-power periodic measurement (one sample every 30 s)"""
+        self._start_periodic("start_low_power_periodic_measurement", MODE_LOW_POWER, LOW_POWER_INTERVAL_MS)
+
+    def stop_periodic(self):
+        self.execute("stop_periodic_measurement")
+        self.mode = MODE_IDLE
+        self.next_check = None
+
+    def stop(self):
+        """Stop whatever mode is running; single-shot just stops scheduling shots"""
+        if self.mode in (MODE_PERIODIC, MODE_LOW_POWER):
+            self.stop_periodic()
+        self.mode = MODE_IDLE
+        self.next_check = None
+        self.shot_pending = False
+
+    def measure_single_shot(self, now=None):
+        """Trigger one CO2 + RH/T measurement (idle mode only); poll() collects it"""
+        self._trigger_shot("measure_single_shot", False, now)
+
+    def measure_single_shot_rht_only(self, now=None):
+        """Trigger one RH/T-only measurement (idle mode only); poll() collects it"""
+        self._trigger_shot("measure_single_shot_rht_only", True, now)
+
+    def _trigger_shot(self, name, rht_only, now):
+        if now is None:
+            now = ticks_ms()
+        self.send(name)
+        self.shot_pending = True
+        self.shot_rht_only = rht_only
+        self.shots += 1
+        self.next_check = ticks_add(now, self.COMMANDS[name][1])
+
+    def data_ready(self):
+        words = self.read_words("get_data_ready_status")
+        self.ready_checks += 1
+        if words is None:
+            return False
+        # The low 11 bits are all zero until a new sample is available
+        return words[0] & 0x07FF != 0
+
+    def read_measurement(self):
+        """Read (co2 ppm, temperature C, humidity %) and clear data-ready; None if corrupt"""
+        self.reads += 1
+        return self.read("read_measurement")
+
+    # Calibration and configuration (idle mode only: call stop() first)
+
+    def forced_recalibration(self, target_ppm):
+        """Recalibrate against a known CO2 level; returns the correction in ppm, or None
+
+        The sensor must have been measuring periodically in that air for 3 minutes.
+        """
+        return self.read("perform_forced_recalibration", [target_ppm])
+
+    def set_automatic_self_calibration(self, enabled):
+        self.execute("set_automatic_self_calibration_enabled", [1 if enabled else 0])
+
+    def set_altitude(self, metres):
+        self.execute("set_sensor_altitude", [metres])
+
+    def persist_settings(self):
+        """Store calibration and configuration in the sensor's EEPROM (limited write cycles)"""
+        self.execute("persist_settings")
+
+    def serial_number(self):
+        return self.read("get_serial_number")
+
+    def factory_reset(self):
+        self.execute("perform_factory_reset")
+
+    def reinit(self):
+        """Reload the settings stored in EEPROM"""
+        self.execute("reinit")
+
+    def poll(self, now=None):
+        """Fresh (co2, temp, humidity) when a new sample exists, otherwise None
+
+        co2 is None for RH/T-only single shots.
+        """
+        if self.next_check is None:
+            return None
+        if now is None:
+            now = ticks_ms()
+        if ticks_diff(now, self.next_check) < 0:
+            return None
+
+        if self.mode == MODE_SINGLE_SHOT:
+            return self._poll_single_shot(now)
+
+        if not self.data_ready():
+            self.not_ready += 1
+            self.waiting = True
+            self.next_check = ticks_add(now, READY_RETRY_MS)
+            return None
+
+        # Follow the sensor's own clock. A sample seen right after an empty
+        # check arrived just now; otherwise the loop may have been late, so
+        # keep the expected phase rather than drifting with the loop.
+        if self.waiting:
+            self.sample_due = now
+            self.waiting = False
+        self.sample_due = ticks_add(self.sample_due, self.interval_ms)
+        # Ask slightly early so a sensor clock running fast is caught too
+        self.next_check = ticks_add(self.sample_due, -READY_RETRY_MS)
+        return self.read_measurement()
+
+    def _poll_single_shot(self, now):
+        if not self.shot_pending:
+            # Every co2_every-th report measures CO2; the rest are RH/T only
+            if self.shots % self.co2_every == 0:
+                self.measure_single_shot(now)
+            else:
+                self.measure_single_shot_rht_only(now)
+            self.next_shot = ticks_add(self.next_shot, self.interval_ms)
+            if ticks_diff(self.next_shot, now) < 0:
+                # The loop fell a whole interval behind; don't fire a burst to catch up
+                self.next_shot = ticks_add(now, self.interval_ms)
+            return None
+
+        if not self.data_ready():
+            self.not_ready += 1
+            self.next_check = ticks_add(now, READY_RETRY_MS)
+            return None
+
+        self.shot_pending = False
+        self.next_check = self.next_shot
+        reading = self.read_measurement()
+        if reading is None or not self.shot_rht_only:
+            return reading
+        return None, reading[1], reading[2]
+
+    def ms_until_due(self, now=None):
+        """How long the caller can sleep before poll() has anything to do"""
+        if self.next_check is None:
+            return self.interval_ms
+        if now is None:
+            now = ticks_ms()
+        return max(0, ticks_diff(self.next_check, now))
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "reads": self.reads,
+            "ready_checks": self.ready_checks,
+            "not_ready": self.not_ready,
+            "crc_errors": self.crc_errors,
+            "dropped": self.dropped
+        }
@@ -0,0 +1,200 @@
+# scheduler.py
+# Cooperative multi-rate scheduler for the firmware main loops.
+#
+# The loops used to run every sensor on one cadence glued together with
+# sleeps (0.5 s between sensors, 1 s per cycle), so a fast task waited on
+# the slowest one and every period drifted by however long the uploads
+# took. Here each task declares its own period and deadline; the scheduler
+# keeps the tasks in a min-heap ordered by due time, runs whatever is due
+# and then sleeps exactly until the next task, instead of polling.
+#
+# Periods are phase-locked: a task due at t runs next at t + period however
+# late it started, so lateness doesn't accumulate. If a task falls a whole
+# period behind, the missed runs are counted and skipped rather than run in
+# a burst. A task may also return how many ms until it needs to run again
+# (a reading still integrating, or a sensor that keeps its own clock); that
+# replaces its next run, and the period applies again once it returns None.
+#
+# Every run records how late it started (jitter) and whether it finished
+# within its deadline (an overrun if not), and stats() reports them per
+# task. An exception in a task is printed and counted, and the others keep
+# running.
+#
+# ticks_ms() wraps on MicroPython, so due times live on an unwrapped
+# millisecond clock advanced with ticks_diff().
+
+import heapq
+
+from compat import ticks_ms, ticks_us, ticks_diff, sleep_ms
+
+MAX_SLEEP_MS = 1000  # Longest single sleep, so a stop() or new task is noticed
+
+
+class Task:
+    def __init__(self, name, fn, period_ms, deadline_ms=None):
+        self.name = name
+        self.fn = fn
+        self.period_ms = period_ms
+        # How long after its due time a run must have finished
+        self.deadline_ms = period_ms if deadline_ms is None else deadline_ms
+        self.active = True
+        self.due = 0  # Next run, on the scheduler's clock
+        self.slot = 0  # Next periodic run
+        self.entry = None  # Current heap entry; older ones are stale
+        self.runs = 0
+        self.skipped = 0
+        self.overruns = 0
+        self.errors = 0
+        self.late_min = None
+        self.late_max = 0
+        self.late_total = 0
+        self.run_us_max = 0
+        self.run_us_total = 0
+
+    def stats(self):
+        runs = max(1, self.runs)
+        return {
+            "period_ms": self.period_ms,
+            "runs": self.runs,
+            "late_avg_ms": round(self.late_total / runs, 1),
+            "late_max_ms": self.late_max,
+            # Peak-to-peak spread of start times around the schedule
+            "jitter_ms": self.late_max - (self.late_min or 0),
+            "run_avg_ms": round(self.run_us_total / runs / 1000, 1),
+            "run_max_ms": self.run_us_max // 1000,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "errors": self.errors
+        }
+
+
+class Scheduler:
+    def __init__(self):
+        self.heap = []
+        self.tasks = []
+        self.seq = 0
+        self.clock = 0
+        self.last_ticks = ticks_ms()
+        self.running = False
+        self.idle_ms = 0
+        self.wakeups = 0
+
+    def _now(self, now=None):
+        """Advance the unwrapped clock to now (ticks_ms()) and return it"""
+        if now is None:
+            now = ticks_ms()
+        self.clock += ticks_diff(now, self.last_ticks)
+        self.last_ticks = now
+        return self.clock
+
+    def _push(self, task):
+        self.seq += 1
+        task.entry = [task.due, self.seq, task]
+        heapq.heappush(self.heap, task.entry)
+
+    def add(self, name, fn, period_ms, deadline_ms=None, offset_ms=0, now=None):
+        """Run fn() every period_ms, first after offset_ms; returns the Task
+
+        deadline_ms: how long after its due time a run may finish (default: the
+        period). Stagger offsets so tasks with the same period don't all fire
+        in the same pass. An int returned by fn is taken as ms until its next
+        run, so wrap functions that return counts.
+        """
+        task = Task(name, fn, period_ms, deadline_ms)
+        task.due = task.slot = self._now(now) + offset_ms
+        self.tasks.append(task)
+        self._push(task)
+        return task
+
+    def cancel(self, task):
+        task.active = False
+        if task in self.tasks:
+            self.tasks.remove(task)
+
+    def _run(self, task, now):
+        late = now - task.due
+        start = ticks_us()
+        try:
+            result = task.fn()
+        except Exception as e:
+            print(f"Task {task.name} failed: {e}")
+            task.errors += 1
+            result = None
+        run_us = ticks_diff(ticks_us(), start)
+        end = self._now()
+
+        task.runs += 1
+        task.late_total += late
+        if late > task.late_max:
+            task.late_max = late
+        if task.late_min is None or late < task.late_min:
+            task.late_min = late
+        task.run_us_total += run_us
+        if run_us > task.run_us_max:
+            task.run_us_max = run_us
+        if end - task.due > task.deadline_ms:
+            task.overruns += 1
+
+        # Move the periodic slot past now. Slots passed by a periodic run that
+        # started late were missed; a slot passed while the task ran on its
+        # own timing was covered by that run.
+        if task.slot <= end:
+            passed = (end - task.slot) // task.period_ms + 1
+            if task.due >= task.slot:
+                task.skipped += passed - 1
+            task.slot += passed * task.period_ms
+        task.due = task.slot
+        if result is not None and not isinstance(result, bool):
+            # At least 1 ms on, so a task can't run twice in one pass
+            task.due = end + max(1, result)
+        self._push(task)
+
+    def run_pending(self, now=None):
+        """Run every task that is due; returns how many ran"""
+        now = self._now(now)
+        ran = 0
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            task = entry[2]
+            if not task.active or task.entry is not entry:
+                continue  # Cancelled, or rescheduled since this entry
+            self._run(task, now)
+            ran += 1
+            now = self.clock
+        return ran
+
+    def ms_until_next(self, now=None):
+        """How long the caller can sleep before a task is due"""
+        now = self._now(now)
+        heap = self.heap
+        while heap and (not heap[0][2].active or heap[0][2].entry is not heap[0]):
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return max(0, heap[0][0] - now)
+
+    def run(self, max_sleep_ms=MAX_SLEEP_MS):
+        """Run tasks until stop(), sleeping between them"""
+        self.running = True
+        while self.running:
+            self.run_pending()
+            wait = self.ms_until_next()
+            if wait is None:
+                wait = max_sleep_ms
+            wait = min(wait, max_sleep_ms)
+            if wait > 0:
+                sleep_ms(wait)
+                self.idle_ms += wait
+                self.wakeups += 1
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        """Per-task stats, and time slept and wakeups in run()"""
+        return {
+            "tasks": {task.name: task.stats() for task in self.tasks},
+            "idle_ms": self.idle_ms,
+            "wakeups": self.wakeups
+        }
@@ -0,0 +1,70 @@
+# sensirion.py
+# Word codec for Sensirion I2C sensors (SCD4x, SHT4x, SGP4x, ...).
+#
+# Sensirion parts send data as big-endian 16-bit words, each followed by a
+# CRC-8 (polynomial 0x31, init 0xFF). The CRC uses a 256-entry lookup table
+# so each byte costs one index instead of eight shift/xor steps, and a frame
+# is checked and decoded in a single pass.
+
+CRC8_POLY = 0x31
+CRC8_INIT = 0xFF
+
+
+def _make_table():
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ CRC8_POLY) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+        table[i] = crc
+    return bytes(table)
+
+
+CRC8_TABLE = _make_table()
+
+
+def crc8(data):
+    """Sensirion CRC-8 of a byte sequence"""
+    table = CRC8_TABLE
+    crc = CRC8_INIT
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
+
+
+def decode_words(frame, out=None):
+    """Words from a word+CRC frame, or None if any CRC is wrong
+
+    out: optional list of len(frame) // 3 to fill instead of allocating one.
+    """
+    table = CRC8_TABLE
+    count = len(frame) // 3
+    if out is None:
+        out = [0] * count
+    i = 0
+    for n in range(count):
+        msb = frame[i]
+        lsb = frame[i + 1]
+        if table[table[CRC8_INIT ^ msb] ^ lsb] != frame[i + 2]:
+            return None
+        out[n] = (msb << 8) | lsb
+        i += 3
+    return out
+
+
+def encode_words(words):
+    """Word+CRC bytes for command arguments"""
+    table = CRC8_TABLE
+    buf = bytearray(3 * len(words))
+    i = 0
+    for word in words:
+        msb = (word >> 8) & 0xFF
+        lsb = word & 0xFF
+        buf[i] = msb
+        buf[i + 1] = lsb
+        buf[i + 2] = table[table[CRC8_INIT ^ msb] ^ lsb]
+        i += 3
+    return buf
@@ -0,0 +1,223 @@
+# soil_moisture.py
+# Oversampled soil moisture probes with a per-probe calibration store.
+#
+# A single ADC.read_u16() jumps by hundreds of counts from ADC noise and
+# supply ripple. start() samples every probe from a machine.Timer (10 ms by
+# default) into one preallocated array('H') ring per probe; the callback
+# only stores integers. reading() filters the last WINDOW samples when a
+# value is needed: the median rejects spikes, the mean smooths noise, and
+# the default trimmed mean (middle half of the sorted window) does both.
+#
+# Raw counts are mapped to percent from each probe's own dry and wet counts,
+# kept in flash as JSON so calibration survives a reboot. Counts between the
+# two map linearly; either may be the larger one (capacitive probes read
+# high when dry, resistive ones low). The defaults reproduce the old
+# 100 - raw / 65535 mapping until a probe is calibrated.
+#
+# Calibration is set with a command in the repo's usual shape, e.g.
+#   {"component": "moisture", "action": "calibrate",
+#    "value": {"probe": "soil", "dry": 52000, "wet": 21000}}
+# or, with the probe in dry air / water, captured from its current reading:
+#   {"component": "moisture", "action": "capture", "value": {"probe": "soil", "point": "dry"}}
+
+import json
+from array import array
+
+MOISTURE_CAL_FILE = "moisture_cal.json"
+SAMPLE_MS = 10
+WINDOW = 64  # Samples filtered per reading
+
+DEFAULT_DRY = 65535
+DEFAULT_WET = 0
+
+FILTER_MEDIAN = "median"
+FILTER_MEAN = "mean"
+FILTER_TRIMMED = "trimmed"
+
+
+def to_percent(raw, dry, wet):
+    """Moisture percentage of a raw count between the dry and wet counts"""
+    percentage = (dry - raw) * 100 / (dry - wet)
+    return max(0, min(100, percentage))
+
+
+class MoistureCalibration:
+    def __init__(self, cal_file=MOISTURE_CAL_FILE):
+        self.cal_file = cal_file
+        # probe name -> [dry, wet]
+        self.points = {}
+
+    def get(self, probe):
+        """(dry, wet) counts for a probe"""
+        return tuple(self.points.get(probe, (DEFAULT_DRY, DEFAULT_WET)))
+
+    def set(self, probe, dry=None, wet=None):
+        """Update one or both points; returns (success, message)"""
+        old_dry, old_wet = self.get(probe)
+        try:
+            dry = old_dry if dry is None else int(dry)
+            wet = old_wet if wet is None else int(wet)
+        except (TypeError, ValueError):
+            return False, "Calibration counts must be numbers"
+        if not (0 <= dry <= 65535 and 0 <= wet <= 65535):
+            return False, "Calibration counts must be 0-65535"
+        if abs(dry - wet) < 100:
+            return False, "Dry and wet counts are too close together"
+        self.points[probe] = [dry, wet]
+        return True, f"Probe {probe} calibrated: dry {dry}, wet {wet}"
+
+    def percent(self, probe, raw):
+        dry, wet = self.get(probe)
+        return to_percent(raw, dry, wet)
+
+    def save(self):
+        """Persist the calibration so it survives a reboot"""
+        try:
+            with open(self.cal_file, "w") as f:
+                json.dump(self.points, f)
+            return True
+        except OSError as e:
+            print(f"Error saving moisture calibration: {e}")
+            return False
+
+    def restore(self):
+        """Load the saved calibration from flash; returns how many probes it covers"""
+        try:
+            with open(self.cal_file) as f:
+                points = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        self.points = {}
+        for probe, pair in points.items():
+            # Same checks as a command, so a damaged file can't divide by zero
+            self.set(probe, *pair)
+        return len(self.points)
+
+
+class MoistureSampler:
+    def __init__(self, probes, calibration=None, window=WINDOW):
+        """probes: {name: ADC}; calibration: a MoistureCalibration (defaults if None)"""
+        self.names = tuple(probes)
+        self.adcs = tuple(probes[name] for name in self.names)
+        self.calibration = calibration or MoistureCalibration()
+        self.window = window
+        self.rings = tuple(array("H", bytes(2 * window)) for _ in self.names)
+        # Scratch space for sorting a window without allocating
+        self.scratch = array("H", bytes(2 * window))
+        self.head = 0
+        self.filled = 0
+        self.timer = None
+        self.samples = 0
+
+    def sample(self):
+        """Read every probe once into its ring; called from the timer"""
+        head = self.head
+        rings = self.rings
+        adcs = self.adcs
+        for i in range(len(adcs)):
+            rings[i][head] = adcs[i].read_u16()
+        self._advance()
+
+    def read_into(self, values):
+        """Read every probe once into values (sampling on the other core)"""
+        adcs = self.adcs
+        for i in range(len(adcs)):
+            values[i] = adcs[i].read_u16()
+        return True
+
+    def store(self, values, offset=0):
+        """Add one sample taken elsewhere, values[offset:] in probe order"""
+        head = self.head
+        rings = self.rings
+        for i in range(len(rings)):
+            rings[i][head] = values[offset + i]
+        self._advance()
+
+    def _advance(self):
+        head = self.head + 1
+        if head == self.window:
+            head = 0
+        self.head = head
+        if self.filled < self.window:
+            self.filled += 1
+        self.samples += 1
+
+    def _tick(self, timer):
+        self.sample()
+
+    def start(self, sample_ms=SAMPLE_MS):
+        """Sample every sample_ms from a timer until stop()"""
+        from machine import Timer
+
+        self.stop()
+        # Fill the window straight away so the first reading isn't one sample
+        for _ in range(self.window):
+            self.sample()
+        self.timer = Timer(mode=Timer.PERIODIC, period=sample_ms, callback=self._tick)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+
+    def filtered(self, probe, mode=FILTER_TRIMMED):
+        """Filtered raw count of a probe over the last window, or None before any sample"""
+        count = self.filled
+        if count == 0:
+            return None
+        ring = self.rings[self.names.index(probe)]
+        if mode == FILTER_MEAN:
+            total = 0
+            for i in range(count):
+                total += ring[i]
+            return total // count
+
+        # Insertion sort into the scratch array; the window is small
+        values = self.scratch
+        for i in range(count):
+            value = ring[i]
+            j = i
+            while j > 0 and values[j - 1] > value:
+                values[j] = values[j - 1]
+                j -= 1
+            values[j] = value
+        if mode == FILTER_MEDIAN:
+            return values[count // 2]
+        low = count // 4
+        high = count - low
+        total = 0
+        for i in range(low, high):
+            total += values[i]
+        return total // (high - low)
+
+    def reading(self, probe, mode=FILTER_TRIMMED):
+        """(filtered raw count, moisture %) for a probe, or None before any sample"""
+        raw = self.filtered(probe, mode)
+        if raw is None:
+            return None
+        return raw, self.calibration.percent(probe, raw)
+
+    def handle_command(self, action, value):
+        """Apply a "moisture" command; returns (success, message)"""
+        if not isinstance(value, dict):
+            return False, "Expected {probe, ...} settings"
+        probe = value.get("probe", self.names[0])
+        if probe not in self.names:
+            return False, f"Unknown probe {probe}"
+
+        if action == "calibrate":
+            success, message = self.calibration.set(probe, value.get("dry"), value.get("wet"))
+        elif action == "capture":
+            point = value.get("point")
+            if point not in ("dry", "wet"):
+                return False, "Capture point must be dry or wet"
+            raw = self.filtered(probe, FILTER_MEDIAN)
+            if raw is None:
+                return False, "No samples yet"
+            success, message = self.calibration.set(probe, **{point: raw})
+        else:
+            return False, "Unknown command"
+
+        if success:
+            self.calibration.save()
+        return success, message
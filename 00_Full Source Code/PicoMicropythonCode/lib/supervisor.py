@@ -0,0 +1,274 @@
+# supervisor.py
+# Supervised main loop: restart the subsystem that failed, not the Pico.
+#
+# The firmware wrapped its whole main loop in `except Exception:
+# machine.reset()`. A dropped broker connection then cost a reboot, a Wi-Fi
+# association, DHCP, a new client id and every subscription again, and it
+# cut short whatever the actuators were doing (the pins come back low).
+#
+# Here the firmware declares its subsystems (Wi-Fi, the MQTT socket, a
+# sensor bus) with a start() that brings each one up, an optional stop()
+# that releases it, what it needs to be up first, and an optional check()
+# polled every check_ms. Loop steps run through run(name, fn): a subsystem
+# that is down is skipped, and an exception is classified:
+#
+#   I/O errors (OSError, or what io_errors lists, e.g. umqtt's MQTTException)
+#       take the subsystem down; if something it needs fails its check
+#       (the MQTT socket died because Wi-Fi did), that goes down instead.
+#       Everything that needs a downed subsystem goes down with it.
+#   MemoryError collects garbage and carries on.
+#   Anything else is a bug or bad data: it's counted, and the subsystem is
+#       restarted only after MAX_ERRORS in a row.
+#
+# poll() restarts downed subsystems in dependency order, retrying failures
+# with exponential backoff, and the rest of the loop (actuator timers, edge
+# rules) keeps running meanwhile. Actuator state lives in RAM and the pins,
+# so it outlives any restart. The time from failure to recovery is recorded
+# per subsystem, and stats() reports the mean and worst (MTTR).
+#
+# True hangs are left to the hardware watchdog: poll() and wait() feed it,
+# so a loop stuck for watchdog_ms resets the Pico, and stats() reports
+# whether the last boot came from the watchdog. A subsystem down for
+# escalate_ms, if set, also resets it, as a last resort. The RP2040's
+# watchdog can't be set beyond 8.3 s, so blocking waits (Wi-Fi connects)
+# must go through wait(), and socket connects need a timeout below that.
+
+import gc
+
+from compat import ticks_ms, ticks_diff, ticks_add, sleep_ms
+
+WATCHDOG_MS = 8000
+CHECK_MS = 1000  # Default interval between a subsystem's checks
+RETRY_MS = 500  # First restart retry; doubles per failed attempt
+MAX_RETRY_MS = 4000  # Retries stay cheap: a refused connect takes tens of ms
+MAX_ERRORS = 5  # Non-I/O errors in a row before a subsystem is restarted
+WAIT_STEP_MS = 100  # wait() granularity, for the watchdog and idle work
+
+
+class Subsystem:
+    def __init__(self, name, start, stop=None, check=None, needs=None, check_ms=CHECK_MS):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.check = check
+        self.needs = needs
+        self.check_ms = check_ms
+        self.up = False
+        self.down_at = None  # ticks_ms() it went down; None while up
+        self.next_try = 0
+        self.retry_ms = RETRY_MS
+        self.next_check = 0
+        self.error_streak = 0
+        self.failures = 0  # I/O failures, and checks that failed
+        self.errors = 0  # Other exceptions
+        self.attempts = 0  # Starts tried, the first at boot included
+        self.recoveries = 0
+        self.mttr_total = 0
+        self.mttr_max = 0
+        self.last_error = None
+
+    def stats(self, now):
+        return {
+            "up": self.up,
+            "failures": self.failures,
+            "errors": self.errors,
+            "attempts": self.attempts,
+            "recoveries": self.recoveries,
+            "mttr_ms": self.mttr_total // max(1, self.recoveries),
+            "mttr_max_ms": self.mttr_max,
+            "down_ms": 0 if self.down_at is None else ticks_diff(now, self.down_at),
+            "last_error": self.last_error
+        }
+
+
+class Supervisor:
+    def __init__(self, watchdog_ms=WATCHDOG_MS, escalate_ms=None, io_errors=(OSError,), idle=None):
+        """watchdog_ms: None on boards (or hosts) without one; idle: called during wait()"""
+        self.watchdog_ms = watchdog_ms
+        self.escalate_ms = escalate_ms
+        self.io_errors = io_errors
+        self.idle = idle
+        self.subsystems = {}
+        self.order = []
+        self.wdt = None
+        self.watchdog_boot = False
+        self.started = ticks_ms()
+        self.errors = 0  # Exceptions in steps that belong to no subsystem
+        self.memory_errors = 0
+
+    def add(self, name, start, stop=None, check=None, needs=None, check_ms=CHECK_MS):
+        """Declare a subsystem; add it after the one it needs
+
+        start() returns truthy once the subsystem is up; a False return or
+        an exception is a failed attempt. stop() releases what a failed
+        subsystem holds (its errors are ignored). check() returns False, or
+        raises, when the subsystem is gone without any step noticing.
+        """
+        subsystem = Subsystem(name, start, stop, check, needs, check_ms)
+        self.subsystems[name] = subsystem
+        self.order.append(subsystem)
+        return subsystem
+
+    def start(self, now=None):
+        """Enable the watchdog and bring every subsystem up (failures are retried by poll())"""
+        if self.watchdog_ms:
+            import machine
+
+            try:
+                self.watchdog_boot = machine.reset_cause() == machine.WDT_RESET
+            except AttributeError:
+                pass
+            self.wdt = machine.WDT(timeout=self.watchdog_ms)
+        if now is None:
+            now = ticks_ms()
+        for subsystem in self.order:
+            subsystem.down_at = now
+        self._restart_due(now)
+
+    def feed(self):
+        if self.wdt is not None:
+            self.wdt.feed()
+
+    def wait(self, ms):
+        """Sleep ms while feeding the watchdog and running idle()"""
+        while ms > 0:
+            step = min(ms, WAIT_STEP_MS)
+            sleep_ms(step)
+            ms -= step
+            self.feed()
+            if self.idle is not None:
+                self.idle()
+
+    def up(self, name):
+        return self.subsystems[name].up
+
+    def run(self, name, fn, *args):
+        """fn(*args) for subsystem name (None: no subsystem); None if it's down or fn failed"""
+        subsystem = self.subsystems[name] if name is not None else None
+        if subsystem is not None and not subsystem.up:
+            return None
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.failed(name, e)
+            return None
+        if subsystem is not None:
+            subsystem.error_streak = 0
+        return result
+
+    def failed(self, name, error, now=None):
+        """Classify an exception raised by name's work and act on it"""
+        if isinstance(error, MemoryError):
+            self.memory_errors += 1
+            gc.collect()
+            return
+        subsystem = self.subsystems[name] if name is not None else None
+        if subsystem is None:
+            self.errors += 1
+            print(f"Loop error: {error!r}")
+            return
+        if not isinstance(error, self.io_errors):
+            subsystem.errors += 1
+            subsystem.error_streak += 1
+            print(f"{name} error: {error!r}")
+            if subsystem.error_streak < MAX_ERRORS:
+                return
+        if now is None:
+            now = ticks_ms()
+        # Blame the furthest thing it needs that has gone away, if any
+        cause = subsystem
+        need = self.subsystems.get(subsystem.needs)
+        while need is not None:
+            if need.up and not self._healthy(need):
+                cause = need
+            need = self.subsystems.get(need.needs)
+        self._down(cause, error, now)
+
+    def _healthy(self, subsystem):
+        if subsystem.check is None:
+            return True
+        try:
+            return bool(subsystem.check())
+        except Exception:
+            return False
+
+    def _down(self, subsystem, error, now):
+        if not subsystem.up:
+            return
+        print(f"{subsystem.name} down: {error!r}")
+        subsystem.up = False
+        subsystem.down_at = now
+        subsystem.failures += 1
+        subsystem.last_error = repr(error)
+        subsystem.retry_ms = RETRY_MS
+        subsystem.next_try = now
+        if subsystem.stop is not None:
+            try:
+                subsystem.stop()
+            except Exception:
+                pass
+        for other in self.order:
+            if other.needs == subsystem.name:
+                self._down(other, f"{subsystem.name} down", now)
+
+    def _restart_due(self, now):
+        for subsystem in self.order:
+            if subsystem.up or ticks_diff(now, subsystem.next_try) < 0:
+                continue
+            need = self.subsystems.get(subsystem.needs)
+            if need is not None and not need.up:
+                continue
+            subsystem.attempts += 1
+            try:
+                ok = subsystem.start()
+            except Exception as e:
+                print(f"{subsystem.name} restart failed: {e!r}")
+                subsystem.last_error = repr(e)
+                ok = False
+            now = ticks_ms()
+            if ok:
+                took = ticks_diff(now, subsystem.down_at)
+                if subsystem.failures:
+                    subsystem.recoveries += 1
+                    subsystem.mttr_total += took
+                    if took > subsystem.mttr_max:
+                        subsystem.mttr_max = took
+                    print(f"{subsystem.name} recovered in {took} ms")
+                subsystem.up = True
+                subsystem.down_at = None
+                subsystem.error_streak = 0
+                subsystem.next_check = ticks_add(now, subsystem.check_ms)
+            else:
+                subsystem.next_try = ticks_add(now, subsystem.retry_ms)
+                subsystem.retry_ms = min(2 * subsystem.retry_ms, MAX_RETRY_MS)
+
+    def poll(self, now=None):
+        """Feed the watchdog, run due checks and restarts; call once per loop pass"""
+        self.feed()
+        if now is None:
+            now = ticks_ms()
+        for subsystem in self.order:
+            if subsystem.up and subsystem.check is not None and ticks_diff(now, subsystem.next_check) >= 0:
+                subsystem.next_check = ticks_add(now, subsystem.check_ms)
+                if not self._healthy(subsystem):
+                    self._down(subsystem, "check failed", now)
+        self._restart_due(now)
+        if self.escalate_ms is not None:
+            for subsystem in self.order:
+                if subsystem.down_at is not None and ticks_diff(now, subsystem.down_at) > self.escalate_ms:
+                    print(f"{subsystem.name} down for {self.escalate_ms} ms, resetting: {self.stats()}")
+                    import machine
+
+                    machine.reset()
+
+    def stats(self, now=None):
+        if now is None:
+            now = ticks_ms()
+        return {
+            "uptime_s": ticks_diff(now, self.started) // 1000,
+            "watchdog_boot": self.watchdog_boot,
+            "errors": self.errors,
+            "memory_errors": self.memory_errors,
+            "subsystems": {s.name: s.stats(now) for s in self.order}
+        }
+
@@ -0,0 +1,239 @@
+# wled.py
+# WLED control through its JSON API topic (<topic>/api).
+#
+# Power, colour, brightness and effect changes are merged while they arrive
+# within a short window and sent as one JSON state object, so a burst of
+# rule actions becomes a single publish (and a single visible change on the
+# strip). Changes that match WLED's last known state are not sent at all.
+#
+# WledGroup fans one command out to several strips: through WLED's group
+# topic when the strips share one, otherwise as a single burst of publishes.
+
+import json
+
+from compat import ticks_ms, ticks_diff
+
+DEFAULT_TOPIC = "wled/508610"
+COALESCE_MS = 50
+MAX_EFFECT = 117  # Highest built-in effect id in current WLED releases
+
+
+def parse_hex_color(value):
+    """'#RRGGBB' -> (r, g, b), or None if malformed"""
+    if not isinstance(value, str) or len(value) != 7 or not value.startswith("#"):
+        return None
+    try:
+        rgb = int(value[1:], 16)
+    except ValueError:
+        return None
+    return ((rgb >> 16) & 0xFF, (rgb >> 8) & 0xFF, rgb & 0xFF)
+
+
+class WledController:
+    def __init__(self, client, topic=DEFAULT_TOPIC, window_ms=COALESCE_MS):
+        self.client = client
+        self.topic = topic
+        self.api_topic = f"{topic}/api"
+        self.window_ms = window_ms
+        # Last state WLED is known to have: on, bri, col, fx
+        self.known = {}
+        self.pending = {}
+        self.pending_since = None
+        self.published = 0
+        self.skipped = 0
+        self.merged = 0
+
+    def _queue(self, key, value):
+        if not self.pending:
+            self.pending_since = ticks_ms()
+        elif key in self.pending:
+            self.merged += 1
+        self.pending[key] = value
+
+    def set_power(self, value):
+        if value not in ("on", "off"):
+            return False, "Power must be 'on' or 'off'."
+        self._queue("on", value == "on")
+        return True, f"WLED Turned {value.upper()}"
+
+    def set_color(self, value):
+        rgb = parse_hex_color(value)
+        if rgb is None:
+            return False, "Invalid color format. Use HEX like #FF0000."
+        self._queue("col", rgb)
+        return True, f"WLED Color Set: {value}"
+
+    def set_brightness(self, value):
+        try:
+            brightness = int(value)
+        except (TypeError, ValueError):
+            return False, "Brightness must be between 0-255."
+        if not 0 <= brightness <= 255:
+            return False, "Brightness must be between 0-255."
+        self._queue("bri", brightness)
+        return True, f"WLED Brightness Set: {brightness}"
+
+    def set_effect(self, value):
+        try:
+            effect = int(value)
+        except (TypeError, ValueError):
+            return False, "Effect must be a number."
+        if not 0 <= effect <= MAX_EFFECT:
+            return False, f"Effect must be between 0-{MAX_EFFECT}."
+        self._queue("fx", effect)
+        return True, f"WLED Effect Set: {effect}"
+
+    def apply(self, action, value):
+        """Queue a command in the same action/value form the server sends"""
+        if action == "power":
+            return self.set_power(value)
+        elif action == "color":
+            return self.set_color(value)
+        elif action == "brightness":
+            return self.set_brightness(value)
+        elif action == "effect":
+            return self.set_effect(value)
+        return False, "Invalid WLED command"
+
+    def build_state(self, changes):
+        """WLED JSON API state object for a set of changes"""
+        state = {}
+        if "on" in changes:
+            state["on"] = changes["on"]
+        if "bri" in changes:
+            state["bri"] = changes["bri"]
+        segment = {}
+        if "col" in changes:
+            segment["col"] = [list(changes["col"])]
+        if "fx" in changes:
+            segment["fx"] = changes["fx"]
+        if segment:
+            state["seg"] = [segment]
+        return state
+
+    def take_changes(self, force=False):
+        """Pop pending changes that differ from the known state, once the window has passed"""
+        if not self.pending:
+            return None
+        if not force and ticks_diff(ticks_ms(), self.pending_since) < self.window_ms:
+            return None
+
+        changes = {}
+        for key, value in self.pending.items():
+            if self.known.get(key) != value:
+                changes[key] = value
+        self.pending = {}
+        self.pending_since = None
+
+        if not changes:
+            self.skipped += 1
+            return None
+        return changes
+
+    def flush(self, force=False):
+        """Publish pending changes once the window has passed; returns True if published"""
+        changes = self.take_changes(force)
+        if changes is None:
+            return False
+
+        self.client.publish(self.api_topic, json.dumps(self.build_state(changes)))
+        self.known.update(changes)
+        self.published += 1
+        return True
+
+    def observe(self, topic, msg):
+        """Track state WLED reports itself (<topic>/g brightness, <topic>/c colour)"""
+        if topic == f"{self.topic}/g":
+            brightness = int(msg)
+            # WLED reports brightness 0 while the strip is off
+            self.known["on"] = brightness > 0
+            if brightness > 0:
+                self.known["bri"] = brightness
+        elif topic == f"{self.topic}/c":
+            rgb = parse_hex_color(msg)
+            if rgb is not None:
+                self.known["col"] = rgb
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "skipped": self.skipped,
+            "merged": self.merged
+        }
+
+
+class WledGroup:
+    def __init__(self, client, targets, group_topic=None, window_ms=COALESCE_MS):
+        """targets: WLED device topics; group_topic: their shared WLED group topic, if any"""
+        self.client = client
+        self.group_topic = group_topic
+        # One controller per strip keeps each strip's known state separately
+        self.members = [WledController(client, topic, window_ms) for topic in targets]
+        self.group_publishes = 0
+
+    def apply(self, action, value):
+        result = (False, "WLED group has no targets")
+        for member in self.members:
+            result = member.apply(action, value)
+            if not result[0]:
+                break
+        return result
+
+    def flush(self, force=False):
+        """Publish merged changes for every strip; returns the number of publishes"""
+        pending = []
+        for member in self.members:
+            changes = member.take_changes(force)
+            if changes is not None:
+                pending.append((member, changes))
+        if not pending:
+            return 0
+
+        if self.group_topic:
+            # One message reaches every strip; fields a strip already has are harmless
+            union = {}
+            for _member, changes in pending:
+                union.update(changes)
+            self.client.publish(f"{self.group_topic}/api", json.dumps(self.members[0].build_state(union)))
+            for member in self.members:
+                member.known.update(union)
+            self.group_publishes += 1
+            return 1
+
+        # No group topic: back-to-back QoS 0 publishes, no waiting between strips
+        for member, changes in pending:
+            self.client.publish(member.api_topic, json.dumps(member.build_state(changes)))
+            member.known.update(changes)
+            member.published += 1
+        return len(pending)
+
+    def observe(self, topic, msg):
+        for member in self.members:
+            if topic.startswith(member.topic + "/"):
+                member.observe(topic, msg)
+                return True
+        return False
+
+    def state_topics(self):
+        """WLED's per-strip brightness/colour topics to subscribe to"""
+        topics = []
+        for member in self.members:
+            topics.append(f"{member.topic}/g")
+            topics.append(f"{member.topic}/c")
+        return topics
+
+    def stats(self):
+        return {
+            "strips": len(self.members),
+            "group_publishes": self.group_publishes,
+            "strip_publishes": sum(m.published for m in self.members),
+            "skipped": sum(m.skipped for m in self.members)
+        }
+
+
+def build_groups(client, config, window_ms=COALESCE_MS):
+    """{"name": {"targets": [...], "group_topic": ...}} -> {"name": WledGroup}"""
+    groups = {}
+    for name, group in config.items():
+        groups[name] = WledGroup(client, group["targets"], group.get("group_topic"), window_ms)
+    return groups
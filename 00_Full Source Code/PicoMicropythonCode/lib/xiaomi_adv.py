@@ -0,0 +1,240 @@
+# xiaomi_adv.py
+# Passive scanning of Xiaomi LYWSD03MMC thermometers from their advertisements.
+#
+# Holding a GATT connection per thermometer (the XiaoMiTemp connect mode)
+# ties up one of the Pico W's few connection slots per sensor. With custom
+# firmware the thermometers broadcast their readings instead, so one passive
+# scan covers any number of them. decode() understands:
+#
+#   ATC (atc1441)  service data 0x181A, 13 bytes: MAC, temp (0.1 C, BE),
+#                  humidity %, battery %, battery mV (BE), frame counter
+#   PVVX custom    service data 0x181A, 15 bytes: MAC (reversed), temp
+#                  (0.01 C, LE), humidity (0.01 %), battery mV, battery %,
+#                  counter, flags
+#   Xiaomi stock   MiBeacon service data 0xFE95 with unencrypted temperature,
+#                  humidity and battery objects. The LYWSD03MMC's own stock
+#                  firmware encrypts these (a per-device bind key, AES-CCM);
+#                  such frames are counted in `encrypted` and skipped.
+#
+# The scan IRQ only checks the MAC against the allowlist and copies the
+# advertisement into a NotificationQueue; process() decodes in the main
+# loop. Thermometers repeat each measurement in several advertisements, so
+# a reading whose frame counter matches the previous one is dropped, and the
+# rest are averaged per MAC until window() is called for the upload.
+
+import struct
+from binascii import unhexlify
+
+from ble_queue import NotificationQueue
+
+UUID_ENVIRONMENTAL = 0x181A  # ATC and PVVX custom firmware
+UUID_MIBEACON = 0xFE95
+
+AD_SERVICE_DATA_16 = 0x16
+
+MIBEACON_ENCRYPTED = 0x0008
+MIBEACON_MAC = 0x0010
+MIBEACON_CAPABILITY = 0x0020
+MIBEACON_OBJECT = 0x0040
+
+OBJ_TEMPERATURE = 0x1004
+OBJ_HUMIDITY = 0x1006
+OBJ_BATTERY = 0x100A
+OBJ_TEMP_HUMIDITY = 0x100D
+
+FORMAT_ATC = "atc"
+FORMAT_PVVX = "pvvx"
+FORMAT_MIBEACON = "mibeacon"
+
+# Scan parameters: passive (no scan requests sent), listening 50 ms in every 100 ms
+SCAN_INTERVAL_US = 100000
+SCAN_WINDOW_US = 50000
+
+# Aggregate slots per MAC
+_COUNT = 0
+_TEMP_SUM = 1
+_TEMP_N = 2
+_HUMIDITY_SUM = 3
+_HUMIDITY_N = 4
+_BATTERY = 5
+_BATTERY_MV = 6
+_RSSI_SUM = 7
+_FORMAT = 8
+
+
+def service_data(adv_data):
+    """(uuid16, payload) for each 16-bit service data field in an advertisement"""
+    i = 0
+    n = len(adv_data)
+    while i + 1 < n:
+        length = adv_data[i]
+        if length == 0 or i + 1 + length > n:
+            break
+        if adv_data[i + 1] == AD_SERVICE_DATA_16 and length >= 3:
+            yield adv_data[i + 2] | (adv_data[i + 3] << 8), adv_data[i + 4:i + 1 + length]
+        i += 1 + length
+
+
+def _decode_mibeacon(payload):
+    """decode()'s list for a MiBeacon; None without readings, False if encrypted"""
+    if len(payload) < 5:
+        return None
+    frctrl = payload[0] | (payload[1] << 8)
+    if frctrl & MIBEACON_ENCRYPTED:
+        return False
+    if not frctrl & MIBEACON_OBJECT:
+        return None
+    counter = payload[4]
+    i = 5
+    if frctrl & MIBEACON_MAC:
+        i += 6
+    if frctrl & MIBEACON_CAPABILITY:
+        i += 1
+    temp = humidity = battery = None
+    while i + 3 <= len(payload):
+        obj = payload[i] | (payload[i + 1] << 8)
+        size = payload[i + 2]
+        data = payload[i + 3:i + 3 + size]
+        if len(data) < size:
+            break
+        if obj == OBJ_TEMPERATURE and size >= 2:
+            temp = struct.unpack_from("<h", data)[0] / 10
+        elif obj == OBJ_HUMIDITY and size >= 2:
+            humidity = struct.unpack_from("<H", data)[0] / 10
+        elif obj == OBJ_BATTERY and size >= 1:
+            battery = data[0]
+        elif obj == OBJ_TEMP_HUMIDITY and size >= 4:
+            temp, humidity = struct.unpack_from("<hH", data)
+            temp /= 10
+            humidity /= 10
+        i += 3 + size
+    if temp is None and humidity is None and battery is None:
+        return None
+    return [temp, humidity, battery, None, counter, FORMAT_MIBEACON]
+
+
+def decode(adv_data):
+    """[temp C, humidity %, battery %, battery mV, counter, format] or None
+
+    Fields a format doesn't carry (or a MiBeacon frame didn't include) are None.
+    Returns False for an encrypted MiBeacon.
+    """
+    for uuid, payload in service_data(adv_data):
+        if uuid == UUID_ENVIRONMENTAL:
+            if len(payload) == 13:
+                temp, humidity, battery, battery_mv, counter = struct.unpack_from(">hBBHB", payload, 6)
+                return [temp / 10, humidity, battery, battery_mv, counter, FORMAT_ATC]
+            if len(payload) >= 15:
+                temp, humidity, battery_mv, battery, counter = struct.unpack_from("<hHHBB", payload, 6)
+                return [temp / 100, humidity / 100, battery, battery_mv, counter, FORMAT_PVVX]
+        elif uuid == UUID_MIBEACON:
+            return _decode_mibeacon(payload)
+    return None
+
+
+class XiaomiScanner:
+    def __init__(self, macs):
+        """macs: hex MAC strings ("a4c1384d8de3") of the thermometers to listen for"""
+        self.macs = [mac.lower() for mac in macs]
+        # bytes(addr) -> index into macs; the IRQ does one dict lookup per advertisement
+        self.index = {unhexlify(mac): i for i, mac in enumerate(self.macs)}
+        self.queue = NotificationQueue(slots=16)
+        self.windows = [None] * len(self.macs)
+        self.last_counter = [None] * len(self.macs)
+        self.seen = 0
+        self.decoded = 0
+        self.duplicates = 0
+        self.encrypted = 0
+        self.undecoded = 0
+
+    def start(self, ble):
+        """Start an endless passive scan"""
+        ble.gap_scan(0, SCAN_INTERVAL_US, SCAN_WINDOW_US, False)
+
+    def on_scan_result(self, addr, rssi, adv_data):
+        """Scan IRQ: queue advertisements from allowlisted MACs; False for anything else"""
+        i = self.index.get(bytes(addr))
+        if i is None:
+            return False
+        self.seen += 1
+        # The handle slot carries the MAC index and the RSSI (as a signed byte)
+        return self.queue.put(i | ((rssi & 0xFF) << 8), adv_data)
+
+    def process(self):
+        """Decode queued advertisements into the per-MAC windows; returns new readings"""
+        fresh = 0
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return fresh
+            handle, adv_data = item
+            i = handle & 0xFF
+            rssi = (handle >> 8) - 256 if handle >> 8 > 127 else handle >> 8
+            reading = decode(adv_data)
+            if reading is False:
+                self.encrypted += 1
+                continue
+            if reading is None:
+                self.undecoded += 1
+                continue
+            counter = reading[4]
+            if counter is not None and counter == self.last_counter[i]:
+                self.duplicates += 1
+                continue
+            self.last_counter[i] = counter
+            self._add(i, reading, rssi)
+            self.decoded += 1
+            fresh += 1
+
+    def _add(self, i, reading, rssi):
+        window = self.windows[i]
+        if window is None:
+            window = self.windows[i] = [0, 0.0, 0, 0.0, 0, None, None, 0, None]
+        temp, humidity, battery, battery_mv = reading[0], reading[1], reading[2], reading[3]
+        window[_COUNT] += 1
+        window[_RSSI_SUM] += rssi
+        window[_FORMAT] = reading[5]
+        # Stock MiBeacon frames carry one quantity each, so average them separately
+        if temp is not None:
+            window[_TEMP_SUM] += temp
+            window[_TEMP_N] += 1
+        if humidity is not None:
+            window[_HUMIDITY_SUM] += humidity
+            window[_HUMIDITY_N] += 1
+        if battery is not None:
+            window[_BATTERY] = battery
+        if battery_mv is not None:
+            window[_BATTERY_MV] = battery_mv
+
+    def window(self, reset=True):
+        """{mac: {temperature, humidity, battery, battery_mv, rssi, samples, format}} since the last call
+
+        Values a thermometer didn't report this window are None.
+        """
+        result = {}
+        for i, mac in enumerate(self.macs):
+            window = self.windows[i]
+            if window is None:
+                continue
+            result[mac] = {
+                "temperature": window[_TEMP_SUM] / window[_TEMP_N] if window[_TEMP_N] else None,
+                "humidity": window[_HUMIDITY_SUM] / window[_HUMIDITY_N] if window[_HUMIDITY_N] else None,
+                "battery": window[_BATTERY],
+                "battery_mv": window[_BATTERY_MV],
+                "rssi": window[_RSSI_SUM] / window[_COUNT],
+                "samples": window[_COUNT],
+                "format": window[_FORMAT]
+            }
+            if reset:
+                self.windows[i] = None
+        return result
+
+    def stats(self):
+        return {
+            "seen": self.seen,
+            "decoded": self.decoded,
+            "duplicates": self.duplicates,
+            "encrypted": self.encrypted,
+            "undecoded": self.undecoded,
+            "queue_dropped": self.queue.dropped
+        }
@@ -1,9 +1,29 @@
+# Boot timeline: prints how long each boot phase took once the first
+# reading is sent, and saves it to boot_timeline.json. Created before the
+# other imports so they're timed too
+from boot_timeline import BootTimeline
+BOOT_TIMELINE = False
+boot = BootTimeline(BOOT_TIMELINE)
+
+import json
 import network
+import random
 import ubinascii
 import ubluetooth
 import urequests
 import utime
+from umqtt.simple import MQTTClient
 from machine import ADC, I2C, Pin
+from local_link import LocalPublisher
+from i2c_bus import I2CBus
+from fs3000 import FS3000, PART_1005
+from soil_moisture import MoistureCalibration, MoistureSampler
+from scheduler import Scheduler
+# Imported where they're used, as each configuration needs only some of them:
+# xiaomi_adv or ble_central (BLE_MODE), acquisition (CORE1_SAMPLING) and
+# duty_cycle (DUTY_CYCLE_MS). Compiling or loading the rest would only delay
+# the first reading
+boot.mark("imports")
 
 
 SSID = "T"
@@ -11,66 +31,215 @@ PASSWORD = "thisispassword123"
 
 API_URL = "https://iot.ycstation.work/sensors"
 
+# MQTT Configuration (only used for moisture calibration commands)
+MQTT_BROKER = "broker.emqx.io"
+MQTT_PORT = 1883
+MQTT_CLIENT_ID = f"pico_w_{random.randint(0, 1000000)}"
+MQTT_TOPIC_PREFIX = "ycstation/devices/"  # Same as in your server
+MOISTURE_DEVICE_ID = "Soil Moisture Sensor"
+AIR_DEVICE_ID = "FS3000 Air Velocity Sensor"
+# Calibration commands, e.g. {"component": "moisture", "action": "capture",
+# "value": {"probe": "soil", "point": "dry"}}; see lib/soil_moisture.py
+COMMANDS_TOPIC = f"{MQTT_TOPIC_PREFIX}{MOISTURE_DEVICE_ID}/commands"
+ACK_TOPIC = f"{MQTT_TOPIC_PREFIX}{MOISTURE_DEVICE_ID}/ack"
+
 DEVICE_ID = "Xiaomi"
 DEVICE_MAC_ADDRESS = "a4c1384d8de3"
 
-CHARACTERISTIC_HANDLE = 0x0038
-VALUE_TO_WRITE = b'\x01\x00'
+# "scan" reads every thermometer below from its advertisements (ATC/PVVX
+# custom firmware, or unencrypted MiBeacon) without connecting; "connect"
+# subscribes to each one over GATT (needed for encrypted stock firmware),
+# taking turns when there are more thermometers than connection slots.
+BLE_MODE = "scan"
+# Thermometer MAC -> device_id to upload it as
+XIAOMI_SENSORS = {
+    DEVICE_MAC_ADDRESS: DEVICE_ID,
+    # "a4c138aabbcc": "Xiaomi_bench2",
+}
+XIAOMI_WINDOW_MS = 60000  # Advertised readings are averaged and uploaded once per window
+BLE_MAX_CONNECTIONS = 1  # Simultaneous GATT links in connect mode
 
 WLAN = network.WLAN(network.STA_IF)
+client = None
 
-moisture_sensor = ADC(26)
+# LAN-local copy of every reading for actuators on the same network
+local_link = LocalPublisher()
 
-# Define FS3000 constants
-FS3000_ADDRESS = 0x28  # Default I2C address for FS3000
-FS3000_VELOCITY_REG = 0x00  # Register to read air velocity
+# Soil moisture probes by name, oversampled from a timer; each keeps its own
+# dry/wet calibration in flash
+MOISTURE_SAMPLE_MS = 10
+moisture_probes = MoistureSampler({"soil": ADC(26)}, MoistureCalibration())
 
 # I2C setup for sensors
 I2C_SDA_PIN = 4  # GP4 on the Pico W
 I2C_SCL_PIN = 5  # GP5 on the Pico W
 
-# Initialize I2C with lower frequency for better compatibility with both sensors
-i2c = I2C(0, sda=Pin(I2C_SDA_PIN), scl=Pin(I2C_SCL_PIN), freq=10000)
+# The bus starts at the old 10 kHz; main() raises it to the fastest clock
+# the sensors read reliably at, and it falls back by itself on errors
+I2C_BASELINE_HZ = 10000
+i2c = I2CBus(lambda freq: I2C(0, sda=Pin(I2C_SDA_PIN), scl=Pin(I2C_SCL_PIN), freq=freq), I2C_BASELINE_HZ)
+
+# FS3000 air velocity, sampled from a timer and averaged over each upload.
+# PART_1005 is the 7.23 m/s sensor; use PART_1015 for the 15 m/s one.
+air_sensor = FS3000(i2c, PART_1005)
+AIR_SAMPLE_MS = 20
+
+# Task periods (ms)
+MQTT_POLL_MS = 200  # Calibration commands
+BLE_POLL_MS = 200  # Queued advertisements/notifications, GATT timeouts
+REPORT_MS = 1000  # Moisture and air velocity uploads
+DRAIN_MS = 200  # Core 1 samples moved into the filters
+CORE1_BUFFER_MS = 3000  # Samples core 1 keeps while an upload holds up the drain
+
+# Sample moisture and air velocity on the second core, so uploads and TLS
+# handshakes on core 0 don't delay or drop samples; False uses timers on core 0
+CORE1_SAMPLING = True
+
+# Battery/solar operation. None keeps the always-on loop above; otherwise the
+# node wakes every DUTY_CYCLE_MS, samples moisture and air velocity, uploads
+# once DUTY_BATCH readings are queued and sleeps in between. MQTT calibration
+# commands and the BLE thermometers are off in this mode.
+DUTY_CYCLE_MS = None
+DUTY_SLEEP = "deep"  # duty_cycle.SLEEP_DEEP; "light" keeps RAM, for a little more current
+DUTY_BATCH = 1
+DUTY_MAX_WAIT_MS = 1800000  # Upload a partial batch once its oldest reading is this old
+# Readings within these of the last one sent are skipped (0 sends every one)
+MOISTURE_DEADBAND = 1.0  # %
+AIR_DEADBAND = 0.1  # m/s
+AIR_BURST = 25  # FS3000 samples averaged per wake
+
+
+def moisture_sensors(moisture_probes):
+    """Sensor readings for every moisture probe, filtered and calibrated"""
+    sensors = {}
+    for i, probe in enumerate(moisture_probes.names):
+        raw_value, moisture_percentage = moisture_probes.reading(probe)
+        print(f"Moisture {probe}: raw {raw_value}, {moisture_percentage:.1f}%")
+        # The first probe keeps the original keys; extra probes are suffixed
+        suffix = "" if i == 0 else f"_{probe}"
+        sensors["moisture_raw" + suffix] = {
+            "value": raw_value,
+            "unit": "raw"
+        }
+        sensors["moisture" + suffix] = {
+            "value": round(moisture_percentage, 1),
+            "unit": "%"
+        }
+    return sensors
+
+
+def air_velocity_sensors(air_sensor):
+    """Air velocity window (mean, peak, stddev) sampled since the last call, or None"""
+    window = air_sensor.window_stats()
+    if window is None:
+        print("No valid FS3000 frames this window:", air_sensor.stats())
+        return None
+
+    print(f"Air Velocity: {window['mean']:.2f} m/s (peak {window['peak']:.2f}, "
+          f"stddev {window['stddev']:.2f}, {window['samples']} samples)")
+    return {
+        "air_velocity_raw": {
+            "value": window["raw_mean"],
+            "unit": "raw"
+        },
+        "air_velocity": {
+            "value": round(window["mean"], 3),
+            "unit": "mps"
+        },
+        "air_velocity_peak": {
+            "value": round(window["peak"], 3),
+            "unit": "mps"
+        },
+        "air_velocity_stddev": {
+            "value": round(window["stddev"], 3),
+            "unit": "mps"
+        },
+    }
+
+
+def send_to_api(payload):
+    """POST one reading; returns False if it should be sent again later"""
+    # Local peers first: it's a single UDP datagram and doesn't wait on TLS
+    local_link.publish(payload["device_id"], payload["sensors"])
+    try:
+        response = urequests.post(API_URL, json=payload)
+        print("API response:", response.status_code, response.text)
+        # A rejected (4xx) reading would be rejected again; only retry server errors
+        ok = response.status_code < 500
+        response.close()
+        return ok
+    except Exception as e:
+        print("Failed to send data to API:", e)
+        return False
 
 
 class XiaoMiTemp:
-    def __init__(self, device_id, moisture_sensor, i2c):
+    def __init__(self, device_id, moisture_probes, air_sensor):
         self.DEVICE_ID = device_id
-        self.moisture_sensor = moisture_sensor
-        self.i2c = i2c
+        self.moisture_probes = moisture_probes
+        self.air_sensor = air_sensor
         self.ble = ubluetooth.BLE()
         self.ble.active(True)
+        self.scanner = None
+        self.central = None
+        if BLE_MODE == "scan":
+            from xiaomi_adv import XiaomiScanner
+
+            self.scanner = XiaomiScanner(XIAOMI_SENSORS)
+        else:
+            from ble_central import BLECentral
+
+            self.central = BLECentral(self.ble, XIAOMI_SENSORS, BLE_MAX_CONNECTIONS)
+        # Payloads are queued in the IRQ and decoded/uploaded by the main loop
+        self.notifications = (self.scanner or self.central).queue
         self.ble.irq(self.ble_irq)
-        self.conn_handle = None
-        self.disconnect_flag = False
 
     def ble_irq(self, event, data):
-        if event == 5:
+        start_us = utime.ticks_us()
+        if event == 5 and self.scanner is not None:
             addr_type, addr, adv_type, rssi, adv_data = data
-            addr_str = ubinascii.hexlify(addr).decode('utf-8')
-            if addr_str == DEVICE_MAC_ADDRESS:
-                print("Device found:", addr_str)
-                self.ble.gap_scan(None)
-                self.connect_to_device(addr)
-
-        elif event == 7:
-            print("Connected to device")
-            self.conn_handle = data[0]
-            self.ble.gattc_discover_characteristics(self.conn_handle, 0x0001, 0xFFFF)
-            
-        elif event == 8 and not self.disconnect_flag:
-            print("Disconnected from the bluetooth device. Attempting to reconnect...")
-            self.start_scan()
-
-        elif event == 12:
-            print("Characteristic discovery completed.")
-            self.ble.gattc_write(self.conn_handle, CHARACTERISTIC_HANDLE, VALUE_TO_WRITE)
-
-        elif event == 18:
-            conn_handle, value_handle, notify_data = data
-            self.handle_notification(notify_data)
-
-    def handle_notification(self, data):
+            self.scanner.on_scan_result(addr, rssi, adv_data)
+
+        elif self.central is not None:
+            # Connects, discovery and subscribing; notifications are only
+            # copied into the queue, as a blocking upload here would hold up
+            # every later BLE event
+            self.central.irq(event, data)
+
+        self.notifications.irq_done(start_us)
+
+    def process_notifications(self):
+        """Decode and upload queued notifications; call from the main loop"""
+        handled = 0
+        while True:
+            item = self.notifications.get()
+            if item is None:
+                break
+            # The queue's handle slot holds the thermometer's index
+            self.handle_notification(XIAOMI_SENSORS[self.central.macs[item[0]]], item[1])
+            handled += 1
+        if handled:
+            print("BLE notification stats:", self.notifications.stats())
+            print("BLE connection stats:", self.central.stats())
+
+    def send_advertised_readings(self):
+        """Upload each thermometer's averaged advertisements for the window just ended"""
+        self.scanner.process()
+        for mac, reading in self.scanner.window().items():
+            sensors = {}
+            for key, unit in (("temperature", "C"), ("humidity", "%"), ("rssi", "dBm")):
+                if reading[key] is not None:
+                    sensors[key] = {"value": round(reading[key], 2), "unit": unit}
+            # "battery" stays in volts, as in connect mode
+            if reading["battery_mv"] is not None:
+                sensors["battery"] = {"value": reading["battery_mv"] / 1000, "unit": "V"}
+            if reading["battery"] is not None:
+                sensors["battery_level"] = {"value": reading["battery"], "unit": "%"}
+            print(f"{XIAOMI_SENSORS[mac]} ({reading['format']}, {reading['samples']} readings): {sensors}")
+            self.send_to_api({"device_id": XIAOMI_SENSORS[mac], "sensors": sensors})
+        print("BLE scan stats:", self.scanner.stats())
+
+    def handle_notification(self, device_id, data):
         databytes = bytearray(data)
         print("Raw data:", ubinascii.hexlify(databytes))
         temp = int.from_bytes(databytes[0:2], "little") / 100
@@ -80,7 +249,7 @@ class XiaoMiTemp:
         print(f"Humidity: {humid}%")
         print(f"Battery: {battery} V")
         payload = {
-            "device_id": self.DEVICE_ID,
+            "device_id": device_id,
             "sensors": {
                 "temperature": {
                     "value": temp,
@@ -100,128 +269,60 @@ class XiaoMiTemp:
         self.send_to_api(payload)
 
     def read_moisture(self):
-        """Read moisture sensor data"""
-        # Read analog value (0-65535)
-        raw_value = self.moisture_sensor.read_u16()
-        
-        # Convert to percentage (adjust min/max as needed for your sensor)
-        # Most soil moisture sensors read lower values when soil is wet
-        # You may need to calibrate these values for your specific sensor
-        moisture_min = 0      # Adjust based on your sensor's dry reading
-        moisture_max = 65535  # Adjust based on your sensor's wet reading
-        
-        # Invert the percentage calculation if needed
-        # Some sensors give high readings when wet, others when dry
-        moisture_percentage = 100 - (((raw_value - moisture_min) / (moisture_max - moisture_min)) * 100)
-        
-        # Ensure value is within 0-100 range
-        moisture_percentage = max(0, min(100, moisture_percentage))
-
-        print(f"Moisture Raw Data: {raw_value}")
-        print(f"Moisture Percent: {moisture_percentage}")
-
-        payload = {
-            "device_id": "Soil Moisture Sensor",
-            "sensors": {
-                "moisture_raw": {
-                    "value": raw_value,
-                    "unit": "raw"
-                },
-                "moisture": {
-                    "value": round(moisture_percentage, 1),
-                    "unit": "%"
-                },
-            }
-        }
-
-        self.send_to_api(payload)
+        """Send the filtered, calibrated reading of every moisture probe"""
+        self.send_to_api({
+            "device_id": MOISTURE_DEVICE_ID,
+            "sensors": moisture_sensors(self.moisture_probes)
+        })
 
     def read_fs3000(self):
-        # Read 2 bytes from the velocity register
-        data = self.i2c.readfrom_mem(FS3000_ADDRESS, FS3000_VELOCITY_REG, 2)
-        
-        # Convert the 2 bytes to a 16-bit integer (big-endian)
-        raw_value = (data[0] << 8) | data[1]
-        
-        # Calculate velocity in meters per second
-        # Note: This conversion may need adjustment based on your specific sensor configuration
-        velocity_mps = self.convert_raw_to_velocity(raw_value)
-        payload = {
-            "device_id": "FS3000 Air Velocity Sensor",
-            "sensors": {
-                "air_velocity_raw": {
-                    "value": raw_value,
-                    "unit": "raw"
-                },
-                "air_velocity": {
-                    "value": velocity_mps,
-                    "unit": "mps"
-                },
-            }
-        }
-        self.send_to_api(payload)
-
-    def convert_raw_to_velocity(self, raw_value):
-        # Check which version of sensor (7.5 m/s or 15 m/s)
-        MAX_VELOCITY = 7.5  # Change to 15 if you have the 15 m/s version
-        
-        # Handle special cases
-        if raw_value == 0 or raw_value == 65535:  # 0 or 0xFFFF
-            return 0
-        
-        # Proper conversion formula for FS3000
-        # The raw values are non-linear and need lookup or formula
-        if raw_value < 1024:
-            # Low velocity formula - values from datasheet
-            velocity = raw_value / 1024 * 1.25
-        elif raw_value < 8192:
-            # Mid velocity formula
-            velocity = (raw_value - 1024) / 7168 * 3.75 + 1.25
-        else:
-            # High velocity formula
-            velocity = (raw_value - 8192) / 57343 * 2.5 + 5.0
-        
-        # Scale to the maximum velocity of your sensor
-        velocity = min(velocity, MAX_VELOCITY)    
-        return velocity
+        """Send the air velocity window (mean, peak, stddev) sampled since the last call"""
+        sensors = air_velocity_sensors(self.air_sensor)
+        if sensors is not None:
+            self.send_to_api({"device_id": AIR_DEVICE_ID, "sensors": sensors})
 
     def send_to_api(self, payload):
-        try:
-            response = urequests.post(API_URL, json=payload)
-            print("API response:", response.status_code, response.text)
-            response.close()
-        except Exception as e:
-            print("Failed to send data to API:", e)
-
-    def connect_to_device(self, addr):
-        self.ble.gap_connect(0, addr)
+        send_to_api(payload)
 
     def start_scan(self):
-        self.ble.gap_scan(0, 30000, 30000)
+        if self.scanner is not None:
+            self.scanner.start(self.ble)
+        else:
+            # Handles discovered on an earlier boot skip discovery entirely
+            print(f"BLE handles restored for {self.central.restore()} thermometers")
+            self.central.start()
 
     def disconnect(self):
-        self.disconnect_flag = True
-        self.ble.gap_disconnect(self.conn_handle)
+        if self.scanner is not None:
+            self.ble.gap_scan(None)
+        else:
+            self.central.stop()
         self.ble.active(False)
         print("Gracefully disconnected from the bluetooth device.")
 
 
-def connect_wifi():
-    connection_attempts = 0
+WIFI_POLL_MS = 100  # Polled once a second, a 2.5 s association was only noticed at 3 s
+
+
+def start_wifi():
+    """Start associating; the sensors are set up meanwhile and wait_wifi() waits for it"""
     WLAN.active(True)
     
     print(f"Connecting to {SSID}...")
     WLAN.connect(SSID, PASSWORD)
+    boot.begin("wifi")
 
-    while True:
-        if WLAN.status() == 3:
-            break
 
-        connection_attempts += 1
-        print(f"Connecting... ({connection_attempts} Attempts)")
-        utime.sleep(1)
+def wait_wifi():
+    connection_polls = 0
+    while WLAN.status() != 3:
+        connection_polls += 1
+        if connection_polls % (1000 // WIFI_POLL_MS) == 0:
+            print(f"Connecting... ({connection_polls * WIFI_POLL_MS // 1000} s)")
+        utime.sleep_ms(WIFI_POLL_MS)
+    boot.end("wifi")
 
-    print(f"Connected with IP address: {WLAN.ifconfig()[0]} ({connection_attempts} Attempts)")
+    print(f"Connected with IP address: {WLAN.ifconfig()[0]} ({connection_polls * WIFI_POLL_MS} ms waited)")
     return True
 
 
@@ -230,19 +331,207 @@ def disconnect_wifi():
     print("Gracefully disconnected from the Wifi.")
 
 
+def mqtt_callback(topic, msg):
+    print(f"Received message on {topic}: {msg}")
+    try:
+        command = json.loads(msg.decode('utf-8'))
+        process_command(command)
+    except Exception as e:
+        print(f"Error processing message: {e}")
+
+
+def process_command(command):
+    component = command.get('component', '')
+    action = command.get('action', '')
+    value = command.get('value', '')
+    print(f"Processing command: {component}.{action}={value}")
+
+    if component == 'moisture':
+        success, message = moisture_probes.handle_command(action, value)
+    else:
+        success, message = False, "Unknown command"
+    send_ack(command.get('id', 'unknown'), success, message)
+
+
+def send_ack(command_id, success, message):
+    ack = {
+        'command_id': command_id,
+        'success': success,
+        'message': message,
+        'timestamp': utime.time()
+    }
+    try:
+        client.publish(ACK_TOPIC, json.dumps(ack))
+        print(f"Acknowledgment sent: {success}, {message}")
+    except Exception as e:
+        print(f"Error sending acknowledgment: {e}")
+
+
+def connect_mqtt():
+    """MQTT client subscribed to calibration commands, or None; readings don't depend on it"""
+    global client
+    try:
+        client = MQTTClient(MQTT_CLIENT_ID, MQTT_BROKER, MQTT_PORT)
+        client.set_callback(mqtt_callback)
+        client.connect()
+        client.subscribe(COMMANDS_TOPIC)
+        print(f"Subscribed to moisture commands: {COMMANDS_TOPIC}")
+    except Exception as e:
+        print(f"MQTT unavailable, calibration commands disabled: {e}")
+        client = None
+    return client
+
+
+def duty_cycle_main():
+    """Wake, sample, upload when a batch is due and sleep; never returns"""
+    import duty_cycle
+    from duty_cycle import WakeState, fast_connect
+
+    state = WakeState()
+    if not state.restore():
+        print("Cold boot: no wake state")
+    restored = moisture_probes.calibration.restore()
+    print(f"Moisture calibration restored for {restored} probes")
+    print(f"I2C bus at {i2c.negotiate([air_sensor.verify]) // 1000} kHz")
+    max_age_wakes = -(-DUTY_MAX_WAIT_MS // DUTY_CYCLE_MS)
+    boot.mark("setup")
+
+    while True:
+        state.wake()
+        # One filter window of moisture samples and a short air velocity burst
+        for _ in range(moisture_probes.window):
+            moisture_probes.sample()
+        for _ in range(AIR_BURST):
+            air_sensor.sample()
+            utime.sleep_ms(AIR_SAMPLE_MS)
+
+        sensors = moisture_sensors(moisture_probes)
+        # Every probe's baseline is checked, so a list rather than any()
+        if any([state.changed(key, sensors[key]["value"], MOISTURE_DEADBAND)
+                for key in sensors if not key.startswith("moisture_raw")]):
+            state.queue(MOISTURE_DEVICE_ID, sensors)
+        sensors = air_velocity_sensors(air_sensor)
+        if sensors is not None and state.changed("air_velocity", sensors["air_velocity"]["value"], AIR_DEADBAND):
+            state.queue(AIR_DEVICE_ID, sensors)
+        i2c.check_frames(air_sensor.bad_frames)
+        # Each wake from deep sleep is a boot
+        boot.finish()
+
+        if state.batch_due(DUTY_BATCH, max_age_wakes):
+            connect_ms = fast_connect(WLAN, SSID, PASSWORD, state)
+            if connect_ms is not None:
+                print(f"Wi-Fi connected in {connect_ms} ms")
+                state.send_pending(send_to_api, DUTY_CYCLE_MS)
+            WLAN.active(False)
+        state.save()
+        print("Wake state:", state.stats())
+        duty_cycle.sleep(DUTY_SLEEP, DUTY_CYCLE_MS)
+
+
 def main():
-    xiaomi = XiaoMiTemp(DEVICE_ID, moisture_sensor, i2c)
+    global client
+    if DUTY_CYCLE_MS is not None:
+        duty_cycle_main()
+        return
+    boot.mark("setup")
+    # Wi-Fi associates in the background while BLE, the bus and the samplers
+    # are brought up
+    start_wifi()
+    xiaomi = XiaoMiTemp(DEVICE_ID, moisture_probes, air_sensor)
+
+    # Calibration set earlier over MQTT, kept in flash
+    restored = moisture_probes.calibration.restore()
+    print(f"Moisture calibration restored for {restored} probes")
+    print(f"I2C bus at {i2c.negotiate([air_sensor.verify]) // 1000} kHz")
+    sampling = None
+    if CORE1_SAMPLING:
+        # Moisture and air velocity are read on core 1 and drained here
+        from acquisition import Acquisition
+
+        sampling = Acquisition()
+        moisture_buffer = sampling.add("moisture", moisture_probes.read_into, MOISTURE_SAMPLE_MS,
+                                       width=len(moisture_probes.names),
+                                       capacity=CORE1_BUFFER_MS // MOISTURE_SAMPLE_MS)
+        air_buffer = sampling.add("air", air_sensor.read_into, AIR_SAMPLE_MS,
+                                  capacity=CORE1_BUFFER_MS // AIR_SAMPLE_MS)
+        # Core 1 only counts; air_task's check_frames() settles and falls back
+        i2c.deferred = True
+    else:
+        moisture_probes.start(MOISTURE_SAMPLE_MS)
+    boot.mark("sensors")
+
+    def drain_task():
+        for i in range(moisture_buffer.drain()):
+            moisture_probes.store(moisture_buffer.out, i * moisture_buffer.width)
+        for i in range(air_buffer.drain()):
+            air_sensor.store(air_buffer.out[i])
+
+    def mqtt_task():
+        global client
+        try:
+            client.check_msg()
+        except Exception as e:
+            print(f"MQTT error, calibration commands disabled: {e}")
+            client = None
+            tasks.cancel(mqtt)
+
+    def ble_task():
+        if xiaomi.central is not None:
+            xiaomi.central.poll()
+            xiaomi.process_notifications()
+        else:
+            # Decode as they arrive so the queue never fills
+            xiaomi.scanner.process()
+
+    def moisture_task():
+        xiaomi.read_moisture()
+        boot.finish()
+
+    def air_task():
+        xiaomi.read_fs3000()
+        if sampling is not None:
+            # check_frames may re-create the bus core 1 is reading, and
+            # applies the fallback core 1's read errors left pending
+            with sampling.bus_lock:
+                i2c.check_frames(air_sensor.bad_frames)
+        else:
+            i2c.check_frames(air_sensor.bad_frames)
 
+    # Each job runs on its own period; the Pico sleeps until the next one is due
+    tasks = Scheduler()
+    mqtt = None
     try:
-        connect_wifi()
+        # Sampling starts before the wait, so the filters are full by the
+        # first upload; BLE scanning waits, as it shares the radio
+        if sampling is not None:
+            sampling.start()
+            tasks.add("drain", drain_task, DRAIN_MS)
+        else:
+            air_sensor.start(AIR_SAMPLE_MS)
+        wait_wifi()
+        boot.mark("wifi wait")
+        connect_mqtt()
+        boot.mark("mqtt")
         xiaomi.start_scan()
 
-        while True:
-            xiaomi.read_moisture()
-            xiaomi.read_fs3000()
-            utime.sleep(1)
+        if client is not None:
+            mqtt = tasks.add("mqtt", mqtt_task, MQTT_POLL_MS)
+        tasks.add("ble", ble_task, BLE_POLL_MS)
+        if xiaomi.scanner is not None:
+            tasks.add("xiaomi", xiaomi.send_advertised_readings, XIAOMI_WINDOW_MS, offset_ms=XIAOMI_WINDOW_MS)
+        tasks.add("moisture", moisture_task, REPORT_MS)
+        # Half a period apart so the two uploads don't queue behind each other
+        tasks.add("air", air_task, REPORT_MS, offset_ms=REPORT_MS // 2)
+        tasks.run()
 
     except KeyboardInterrupt:
+        if sampling is not None:
+            sampling.stop()
+            print("Core 1 sampling stats:", sampling.stats())
+        moisture_probes.stop()
+        air_sensor.stop()
+        print("I2C bus stats:", i2c.stats())
+        print("Task stats:", tasks.stats())
         disconnect_wifi()
         xiaomi.disconnect()
 
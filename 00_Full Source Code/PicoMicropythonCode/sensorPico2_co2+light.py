@@ -1,8 +1,21 @@
+# Boot timeline: prints how long each boot phase took once the first
+# reading is sent, and saves it to boot_timeline.json. Created before the
+# other imports so they're timed too
+from boot_timeline import BootTimeline
+BOOT_TIMELINE = False
+boot = BootTimeline(BOOT_TIMELINE)
+
 from machine import Pin, I2C
 import time
 import urequests
 import network
 import json
+from local_link import LocalPublisher
+from i2c_bus import I2CBus
+from scd41 import SCD41
+from as7341 import AS7341, FifoCapture
+from scheduler import Scheduler
+boot.mark("imports")
 
 # Wi-Fi configuration
 SSID = "T"
@@ -11,6 +24,9 @@ PASSWORD = "thisispassword123"
 # Server configuration
 API_URL = "https://iot.ycstation.work/sensors"
 
+# LAN-local copy of every reading for actuators on the same network
+local_link = LocalPublisher()
+
 # Status LED
 led = Pin("LED", Pin.OUT)
 
@@ -18,28 +34,30 @@ led = Pin("LED", Pin.OUT)
 DEVICE_ID_CO2 = "Sensirion-SCD41(CO2)"
 DEVICE_ID_SPECTROMETER = "spectrometerclick_sensor"
 
-# I2C setup for both sensors
-i2c_co2 = I2C(0, scl=Pin(1), sda=Pin(0), freq=100000)  # Use GPIO 0 and 1 for CO2 sensor
-i2c_spectro = I2C(1, scl=Pin(27), sda=Pin(26), freq=100000)  # Use GPIO 26 and 27 for spectrometer
+# I2C setup for both sensors. Each bus starts at the old 100 kHz; main()
+# raises it to the fastest clock its sensor reads reliably at
+I2C_BASELINE_HZ = 100000
+i2c_co2 = I2CBus(lambda freq: I2C(0, scl=Pin(1), sda=Pin(0), freq=freq), I2C_BASELINE_HZ)  # Use GPIO 0 and 1 for CO2 sensor
+i2c_spectro = I2CBus(lambda freq: I2C(1, scl=Pin(27), sda=Pin(26), freq=freq), I2C_BASELINE_HZ)  # Use GPIO 26 and 27 for spectrometer
 
 # Setup wifi connection for restful API
+wlan = network.WLAN(network.STA_IF)
+WIFI_TIMEOUT_MS = 10000
+WIFI_POLL_MS = 100  # Association usually takes 2-3 s; don't overshoot it by up to a second
 
-def connect_wifi():
-    """Connect to Wi-Fi network"""
-    wlan = network.WLAN(network.STA_IF)
+def start_wifi():
+    """Start associating with the Wi-Fi network; wait_wifi() waits for it"""
     wlan.active(True)
-    
     print(f"Connecting to {SSID}...")
     wlan.connect(SSID, PASSWORD)
-    
-    # Wait for connection with timeout
-    max_wait = 10
-    while max_wait > 0:
-        if wlan.status() < 0 or wlan.status() >= 3:
-            break
-        max_wait -= 1
-        print("Waiting for connection...")
-        time.sleep(1)
+    boot.begin("wifi")
+    return time.ticks_ms()
+
+def wait_wifi(started):
+    """Wait for the association start_wifi() began at ticks started"""
+    while 0 <= wlan.status() < 3 and time.ticks_diff(time.ticks_ms(), started) < WIFI_TIMEOUT_MS:
+        time.sleep_ms(WIFI_POLL_MS)
+    boot.end("wifi")
     
     if wlan.status() != 3:
         print("Network connection failed")
@@ -52,6 +70,8 @@ def connect_wifi():
 
 def send_data_to_server(device_id, sensor_data):
     """Send sensor data to the server"""
+    # Local peers first: it's a single UDP datagram and doesn't wait on TLS
+    local_link.publish(device_id, sensor_data)
     try:
         # Create data object
         data = {
@@ -94,52 +114,19 @@ def send_data_to_server(device_id, sensor_data):
 # SCD41 CO2 Sensor Functions
 #######################################################
 
-# SCD41 I2C address
-SCD41_ADDR = 0x62
-
-# SCD41 Commands
-CMD_START_PERIODIC_MEASUREMENT = b'\x21\xB1'
-CMD_READ_MEASUREMENT = b'\xEC\x05'
-CMD_STOP_PERIODIC_MEASUREMENT = b'\x3F\x86'
+# SCD41 driver: polls data-ready and only reads when a fresh sample exists
+co2_sensor = SCD41(i2c_co2)
 
-def write_command_co2(cmd):
-    """Write a command to the SCD41 without data."""
-    i2c_co2.writeto(SCD41_ADDR, cmd)
-
-def read_data_co2(cmd, length=9):
-    """Read data from the SCD41 after sending a command."""
-    write_command_co2(cmd)
-    time.sleep(0.1)  # Give the sensor time to process
-    return i2c_co2.readfrom(SCD41_ADDR, length)
-
-def start_periodic_measurement_co2():
-    """Start periodic measurement for CO2 sensor."""
-    write_command_co2(CMD_START_PERIODIC_MEASUREMENT)
-    time.sleep(5)  # Wait for the first measurement to be ready
-
-def stop_periodic_measurement_co2():
-    """Stop periodic measurement for CO2 sensor."""
-    write_command_co2(CMD_STOP_PERIODIC_MEASUREMENT)
-    time.sleep(0.5)  # Give the sensor time to stop
-
-def read_measurement_co2():
-    """Read CO2, temperature, and humidity from SCD41."""
-    data = read_data_co2(CMD_READ_MEASUREMENT)
-    
-    # Parse the results (CO2, temperature, humidity)
-    co2 = data[0] << 8 | data[1]
-    temp = -45 + 175 * ((data[3] << 8 | data[4]) / 65535.0)
-    humidity = 100 * ((data[6] << 8 | data[7]) / 65535.0)
-    
-    return co2, temp, humidity
+# How often CO2 readings are reported. The driver picks the sensor mode from
+# this: under 30 s periodic, 30-60 s low-power periodic, 60 s and up
+# single-shot (lowest power, for battery/solar nodes).
+CO2_REPORT_INTERVAL_MS = 5000
+# In single-shot mode, measure CO2 on every Nth report and only RH/T otherwise
+CO2_EVERY_N_REPORTS = 1
 
 def format_co2_data(co2, temperature, humidity):
     """Format CO2 sensor data for API submission"""
-    return {
-        "co2": {
-            "value": co2,
-            "unit": "ppm"
-        },
+    data = {
         "temperature": {
             "value": round(temperature, 1),
             "unit": "C"
@@ -149,182 +136,44 @@ def format_co2_data(co2, temperature, humidity):
             "unit": "%"
         }
     }
+    # RH/T-only single shots have no CO2 value
+    if co2 is not None:
+        data["co2"] = {
+            "value": co2,
+            "unit": "ppm"
+        }
+    return data
 
 def init_co2_sensor():
     """Initialize the CO2 sensor"""
     # Scan I2C bus to verify SCD41 is connected
-    devices = i2c_co2.scan()
-    if SCD41_ADDR not in devices:
-        print(f"SCD41 not found! Devices found: {[hex(d) for d in devices]}")
+    if not co2_sensor.is_present():
+        print(f"SCD41 not found! Devices found: {[hex(d) for d in i2c_co2.scan()]}")
         return False
     
-    print("SCD41 detected, starting measurements...")
-    start_periodic_measurement_co2()
+    print(f"SCD41 detected, I2C bus at {i2c_co2.negotiate([co2_sensor.verify]) // 1000} kHz")
+    print("Starting measurements...")
+    mode = co2_sensor.start(CO2_REPORT_INTERVAL_MS, CO2_EVERY_N_REPORTS)
+    boot.begin("co2 first sample")
+    print(f"SCD41 measuring in {mode} mode")
     return True
 
 #######################################################
 # AS7341 Spectrometer Functions
 #######################################################
 
-# AS7341 I2C address
-AS7341_ADDR = 0x39
-
-# AS7341 Registers
-REG_ENABLE = 0x80
-REG_ATIME = 0x81
-REG_WTIME = 0x83
-REG_CONTROL = 0xAA
-REG_ID = 0x92
-REG_STATUS = 0x93
-REG_CH0_DATA_L = 0x95
-REG_CH0_DATA_H = 0x96
-REG_CH1_DATA_L = 0x97
-REG_CH1_DATA_H = 0x98
-REG_CH2_DATA_L = 0x99
-REG_CH2_DATA_H = 0x9A
-REG_CH3_DATA_L = 0x9B
-REG_CH3_DATA_H = 0x9C
-REG_CH4_DATA_L = 0x9D
-REG_CH4_DATA_H = 0x9E
-REG_CH5_DATA_L = 0x9F
-REG_CH5_DATA_H = 0xA0
-REG_CONFIG = 0xA9
-REG_LED = 0xB3
-
-def write_reg_spectro(reg, value):
-    """Write a value to a register in the spectrometer"""
-    i2c_spectro.writeto(AS7341_ADDR, bytes([reg, value]))
-
-def read_reg_spectro(reg):
-    """Read a value from a register in the spectrometer"""
-    i2c_spectro.writeto(AS7341_ADDR, bytes([reg]))
-    return i2c_spectro.readfrom(AS7341_ADDR, 1)[0]
-
-def read_reg_word_spectro(reg):
-    """Read a 16-bit value from two registers in the spectrometer"""
-    i2c_spectro.writeto(AS7341_ADDR, bytes([reg]))
-    data = i2c_spectro.readfrom(AS7341_ADDR, 2)
-    return data[0] | (data[1] << 8)
-
-def setup_spectro_sensor():
-    """Initialize the AS7341 sensor"""
-    # Check if sensor is connected
-    try:
-        device_id = read_reg_spectro(REG_ID)
-        print(f"Spectrometer Device ID: 0x{device_id:02X}")
-        
-        # Accept any device ID - your sensor reports 0x24 instead of 0x09
-        if device_id != 0x09:
-            print("Non-standard device ID detected. Proceeding anyway...")
-    except Exception as e:
-        print(f"Error connecting to AS7341: {e}")
-        return False
-    
-    # Power on and enable ADC
-    write_reg_spectro(REG_ENABLE, 0x01)  # Power on
-    time.sleep(0.01)
-    write_reg_spectro(REG_ENABLE, 0x03)  # Power on + ADC enable
-    
-    # Configure integration time (ATIME)
-    write_reg_spectro(REG_ATIME, 0x3C)  # 100ms integration time
-    
-    # Configure gain (higher gain for better sensitivity)
-    write_reg_spectro(REG_CONTROL, 0x06)  # Gain = 64x
-    
-    return True
-
-def enable_led_spectro(enable=True, current=50):
-    """Control the built-in white LED
-    enable: True to turn on, False to turn off
-    current: 0-255, controls LED brightness
-    """
-    if enable:
-        # Set current limit (0-255)
-        current = max(0, min(255, current))
-        write_reg_spectro(REG_LED, current)
-        
-        # Enable LED drive
-        ctrl_reg = read_reg_spectro(REG_CONFIG)
-        write_reg_spectro(REG_CONFIG, ctrl_reg | 0x08)
-    else:
-        # Disable LED drive
-        ctrl_reg = read_reg_spectro(REG_CONFIG)
-        write_reg_spectro(REG_CONFIG, ctrl_reg & ~0x08)
-
-def select_bank_spectro(bank):
-    """Select which set of channels to read
-    bank 0: F1, F2, F3, F4, CL, NIR 
-    bank 1: F5, F6, F7, F8, CL, NIR
-    """
-    # Write to the control register to enable SMUX confguration
-    write_reg_spectro(REG_CONFIG, 0x01)
-    
-    # Wait for SMUX to be ready
-    time.sleep(0.01)
-    
-    if bank == 0:
-        # Configure SMUX for F1-F4 + CL + NIR
-        write_reg_spectro(0xAF, 0x10)
-        write_reg_spectro(0xAF, 0x11)
-        time.sleep(0.05)
-    else:
-        # Configure SMUX for F5-F8 + CL + NIR
-        write_reg_spectro(0xAF, 0x20)
-        write_reg_spectro(0xAF, 0x21)
-        time.sleep(0.05)
-    
-    # Close SMUX configuration
-    write_reg_spectro(REG_CONFIG, 0x00)
-    time.sleep(0.05)
-
-def start_measurement_spectro():
-    """Start a one-shot measurement on the spectrometer"""
-    # Enable spectral measurement
-    enable_reg = read_reg_spectro(REG_ENABLE)
-    write_reg_spectro(REG_ENABLE, enable_reg | 0x02)
-    
-    # Wait for measurement to complete
-    time.sleep(0.1)  # Allow at least the integration time to elapse
-    while (read_reg_spectro(REG_STATUS) & 0x08) == 0:
-        time.sleep(0.01)
+# AS7341 driver: one burst read per channel bank
+spectro = AS7341(i2c_spectro)
 
-def read_spectral_data():
-    """Read all spectral channels from the spectrometer"""
-    # First bank: F1-F4, Clear, NIR
-    select_bank_spectro(0)
-    start_measurement_spectro()
-    
-    f1 = read_reg_word_spectro(REG_CH0_DATA_L)
-    f2 = read_reg_word_spectro(REG_CH1_DATA_L)
-    f3 = read_reg_word_spectro(REG_CH2_DATA_L)
-    f4 = read_reg_word_spectro(REG_CH3_DATA_L)
-    clear1 = read_reg_word_spectro(REG_CH4_DATA_L)
-    nir1 = read_reg_word_spectro(REG_CH5_DATA_L)
-    
-    # Second bank: F5-F8, Clear, NIR
-    select_bank_spectro(1)
-    start_measurement_spectro()
-    
-    f5 = read_reg_word_spectro(REG_CH0_DATA_L)
-    f6 = read_reg_word_spectro(REG_CH1_DATA_L)
-    f7 = read_reg_word_spectro(REG_CH2_DATA_L)
-    f8 = read_reg_word_spectro(REG_CH3_DATA_L)
-    clear2 = read_reg_word_spectro(REG_CH4_DATA_L)
-    nir2 = read_reg_word_spectro(REG_CH5_DATA_L)
-    
-    # Return combined results with wavelength information
-    return {
-        "F1 (415nm/Violet)": f1,
-        "F2 (445nm/Indigo)": f2,
-        "F3 (480nm/Blue)": f3,
-        "F4 (515nm/Cyan)": f4,
-        "F5 (555nm/Green)": f5,
-        "F6 (590nm/Yellow)": f6,
-        "F7 (630nm/Orange)": f7,
-        "F8 (680nm/Red)": f8,
-        "Clear": (clear1 + clear2) // 2,  # Average of both readings
-        "NIR": (nir1 + nir2) // 2         # Average of both readings
-    }
+# GPIO wired to the spectrometer's INT line, or None to poll its status
+SPECTRO_INT_PIN = None
+# How often a spectral reading is taken and sent
+SPECTRO_INTERVAL_MS = 5000
+# High-rate capture: sample one bank every SPECTRO_CAPTURE_SAMPLE_MS through
+# the sensor's FIFO and send mean/min/max per channel every SPECTRO_INTERVAL_MS
+SPECTRO_CAPTURE = False
+SPECTRO_CAPTURE_BANK = 0  # 0: F1-F4, 1: F5-F8 (both include Clear and NIR)
+SPECTRO_CAPTURE_SAMPLE_MS = 20
 
 def format_spectral_data(spectral_data):
     """Format spectral data for API submission"""
@@ -360,6 +209,15 @@ def format_spectral_data(spectral_data):
     
     return sensors
 
+def format_spectral_stats(stats):
+    """Format windowed capture stats (channel -> (mean, min, max)) for API submission"""
+    sensors = format_spectral_data({channel: round(s[0], 1) for channel, s in stats.items()})
+    for suffix, index in (("min", 1), ("max", 2)):
+        extra = format_spectral_data({channel: s[index] for channel, s in stats.items()})
+        for key, reading in extra.items():
+            sensors[f"{key}_{suffix}"] = reading
+    return sensors
+
 
 def main():
     print("\n========================================")
@@ -372,23 +230,13 @@ def main():
     co2_sensor_working = False
     spectro_working = False
 
-    # Blink LED to indicate program start
-    for _ in range(3):
-        led.on()
-        time.sleep(0.2)
-        led.off()
-        time.sleep(0.2)
+    # LED stays on until setup is complete
+    led.on()
+    boot.mark("setup")
 
-    # Connect to Wi-Fi first
-    if not connect_wifi():
-        print("Failed to connect to Wi-Fi. Exiting...")
-        # Error indication - 3 slow blinks
-        for _ in range(3):
-            led.on()
-            time.sleep(0.5)
-            led.off()
-            time.sleep(0.5)
-        return
+    # Wi-Fi associates in the background while the sensors are brought up,
+    # and the SCD41's first sample (one interval after start) overlaps both
+    wifi_started = start_wifi()
     
     # Initialize CO2 sensor
     print("\nInitializing SCD41 CO2 sensor...")
@@ -397,14 +245,25 @@ def main():
         print("Warning: CO2 sensor initialization failed. Will continue without CO2 data.")
     else:
         print("CO2 sensor initialized successfully!")
+    boot.mark("co2 sensor")
     
     # Initialize Spectrometer
     print("\nInitializing AS7341 spectrometer...")
-    spectro_working = setup_spectro_sensor()
+    int_pin = None
+    if SPECTRO_INT_PIN is not None:
+        int_pin = Pin(SPECTRO_INT_PIN, Pin.IN, Pin.PULL_UP)
+    print(f"Spectrometer I2C bus at {i2c_spectro.negotiate([spectro.verify]) // 1000} kHz")
+    spectro_working = spectro.setup(int_pin)
+    capture = None
+    if spectro_working and SPECTRO_CAPTURE:
+        capture = FifoCapture(spectro, SPECTRO_CAPTURE_BANK)
+        capture.start(SPECTRO_CAPTURE_SAMPLE_MS)
+        print(f"Spectral capture: bank {SPECTRO_CAPTURE_BANK} every {capture.cycle_ms} ms")
     if not spectro_working:
         print("Warning: Spectrometer initialization failed. Will continue without spectral data.")
     else:
         print("Spectrometer initialized successfully!")
+    boot.mark("spectrometer")
     
     # Check if at least one sensor is working
     if not co2_sensor_working and not spectro_working:
@@ -416,60 +275,106 @@ def main():
             time.sleep(0.2)
         return
     
+    if not wait_wifi(wifi_started):
+        print("Failed to connect to Wi-Fi. Exiting...")
+        if co2_sensor_working:
+            co2_sensor.stop()
+        if capture is not None:
+            capture.stop()
+        # Error indication - 3 slow blinks
+        for _ in range(3):
+            led.on()
+            time.sleep(0.5)
+            led.off()
+            time.sleep(0.5)
+        return
+    boot.mark("wifi wait")
+    
+    
+    def co2_task():
+        # Only a fresh sample is read and sent; the task sleeps until the
+        # sensor's next one is due
+        reading = co2_sensor.poll()
+        if reading is not None:
+            co2, temp, humidity = reading
+            boot.end("co2 first sample")
+            print(f"\nCO2 Sensor: CO2: {co2} ppm, Temperature: {temp:.2f} °C, Humidity: {humidity:.2f} %")
+        
+            # Format and send CO2 data
+            co2_data = format_co2_data(co2, temp, humidity)
+            send_data_to_server(DEVICE_ID_CO2, co2_data)
+            boot.finish()
+        # Drop the bus clock a step if CRC failures pile up
+        i2c_co2.check_frames(co2_sensor.crc_errors)
+        return co2_sensor.ms_until_due()
+    
+    def spectro_task():
+        # Start a reading, then come back while each bank integrates
+        if not spectro.busy():
+            spectro.start()
+            return spectro.ms_until_ready()
+        spectral_data = spectro.poll()
+        if spectral_data is None:
+            return spectro.ms_until_ready()
+        
+        # Print a simple version of the spectral readings
+        print("\nSpectral Readings Summary:")
+        print(f"Violet: {spectral_data['F1 (415nm/Violet)']} | Blue: {spectral_data['F3 (480nm/Blue)']} | Green: {spectral_data['F5 (555nm/Green)']}")
+        print(f"Yellow: {spectral_data['F6 (590nm/Yellow)']} | Orange: {spectral_data['F7 (630nm/Orange)']} | Red: {spectral_data['F8 (680nm/Red)']}")
+        print(f"Clear: {spectral_data['Clear']} | NIR: {spectral_data['NIR']}")
+        print(f"I2C: {spectro.last_transactions} transactions, {spectro.last_i2c_us} us")
+        elapsed = max(1, time.ticks_diff(time.ticks_ms(), loop_start))
+        print(f"Spectral rate: {1000 * spectro.readings / elapsed:.2f}/s | CPU idle: {100 * tasks.idle_ms / elapsed:.0f}%")
+        
+        # Format and send spectral data
+        spectro_data = format_spectral_data(spectral_data)
+        send_data_to_server(DEVICE_ID_SPECTROMETER, spectro_data)
+        boot.finish()
+        return None
+    
+    def drain_task():
+        capture.drain()  # Returns a sample count, not a delay
+    
+    def capture_task():
+        stats = capture.window_stats()
+        if stats is not None:
+            print(f"\nSpectral capture: {capture.samples} samples, {capture.overflows} FIFO overflows")
+            send_data_to_server(DEVICE_ID_SPECTROMETER, format_spectral_stats(stats))
+            boot.finish()
+    
+    # Sensors measure in the background; each task touches the bus only when
+    # its sensor has data, and the Pico sleeps the rest of the time
+    tasks = Scheduler()
+    if co2_sensor_working:
+        tasks.add("co2", co2_task, co2_sensor.interval_ms, offset_ms=co2_sensor.ms_until_due())
+    if spectro_working:
+        if capture is not None:
+            # Drain the FIFO before it fills, send the window's stats every
+            # SPECTRO_INTERVAL_MS
+            tasks.add("drain", drain_task, capture.drain_interval_ms())
+            tasks.add("capture", capture_task, SPECTRO_INTERVAL_MS, offset_ms=SPECTRO_INTERVAL_MS)
+        else:
+            tasks.add("spectro", spectro_task, SPECTRO_INTERVAL_MS)
     
     try:
         print("\nSetup complete. Starting data collection and transmission loop...")
-        
-        # Main loop - read and send data every 5 seconds
-        while True:
-            # Handle CO2 sensor if working
-            if co2_sensor_working:
-                try:
-                    # Read CO2 sensor data
-                    co2, temp, humidity = read_measurement_co2()
-                    print(f"\nCO2 Sensor: CO2: {co2} ppm, Temperature: {temp:.2f} °C, Humidity: {humidity:.2f} %")
-                    
-                    # Format and send CO2 data
-                    co2_data = format_co2_data(co2, temp, humidity)
-                    send_data_to_server(DEVICE_ID_CO2, co2_data)
-                except Exception as e:
-                    print(f"Error reading CO2 sensor: {e}")
-            
-            # Short delay between sensor readings
-            time.sleep(0.5)
-            
-            # Handle Spectrometer if working
-            if spectro_working:
-                try:
-                    # Read spectral data
-                    print("\nReading spectral data...")
-                    spectral_data = read_spectral_data()
-                    
-                    # Print a simple version of the spectral readings
-                    print("Spectral Readings Summary:")
-                    print(f"Violet: {spectral_data['F1 (415nm/Violet)']} | Blue: {spectral_data['F3 (480nm/Blue)']} | Green: {spectral_data['F5 (555nm/Green)']}")
-                    print(f"Yellow: {spectral_data['F6 (590nm/Yellow)']} | Orange: {spectral_data['F7 (630nm/Orange)']} | Red: {spectral_data['F8 (680nm/Red)']}")
-                    print(f"Clear: {spectral_data['Clear']} | NIR: {spectral_data['NIR']}")
-                    
-                    # Format and send spectral data
-                    spectro_data = format_spectral_data(spectral_data)
-                    send_data_to_server(DEVICE_ID_SPECTROMETER, spectro_data)
-                except Exception as e:
-                    print(f"Error reading spectrometer: {e}")
-            
-            # Wait before next cycle
-            print("\nWait 1 seconds before next reading cycle...")
-            time.sleep(1)
+        led.off()
+        loop_start = time.ticks_ms()
+        tasks.run()
                 
     except KeyboardInterrupt:
         print("\nProgram stopped by user.")
+        print(f"I2C bus stats: CO2 {i2c_co2.stats()}, spectrometer {i2c_spectro.stats()}")
+        print(f"Task stats: {tasks.stats()}")
         # Cleanup
         if co2_sensor_working:
-            stop_periodic_measurement_co2()
+            co2_sensor.stop()
             print("CO2 sensor measurements stopped.")
         if spectro_working:
+            if capture is not None:
+                capture.stop()
             # Turn off LED if it was enabled
-            enable_led_spectro(False)
+            spectro.enable_led(False)
             print("Spectrometer shut down.")
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+# build_mpy.py
+# Precompile a Pico's firmware to .mpy bytecode, or freeze it into a
+# MicroPython firmware image, so the Pico doesn't compile it on every boot.
+#
+# Copied as .py files, every boot compiles the main script and each module
+# it imports before the first line runs: tens of ms per KB of source on the
+# RP2040, and the compiler's parse tree needs heap a large script may not
+# have. An .mpy is only loaded, and a frozen module runs from flash without
+# even being copied to RAM.
+#
+#   python3 tools/build_mpy.py sensorPico2_co2+light.py
+#       compiles the lib modules the script imports (lazily imported ones
+#       included) to build/lib/*.mpy, the script itself to build/ under an
+#       importable name ('+' isn't valid in one) and writes a build/main.py
+#       that imports it and calls its main().
+#   --timeline   builds with BOOT_TIMELINE = True (lib/boot_timeline.py)
+#   --deploy     copies the build to the Pico with mpremote, deleting the .py
+#                copies left from before: MicroPython imports x.py ahead of
+#                x.mpy, so a stale .py would still be compiled at boot.
+#   --frozen     writes build/manifest.py instead, for a firmware build:
+#                make -C ports/rp2 BOARD=RPI_PICO_W FROZEN_MANIFEST=<it>
+#                The board's own manifest (umqtt, urequests, ...) is kept.
+#
+# mpy-cross comes from the MicroPython tree or `pip install mpy-cross`, and
+# its .mpy version must match the firmware's: a mismatch fails at import
+# with "incompatible .mpy file". The version it reports is printed.
+#
+# Run from PicoMicropythonCode/:  python3 tools/build_mpy.py <script> [options]
+
+import argparse
+import ast
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIB = os.path.join(ROOT, "lib")
+MARCH = "armv6m"  # RP2040 (Cortex-M0+)
+
+
+def imported_names(path, top_level_only=False):
+    """Names of the modules path imports; top_level_only skips imports inside functions"""
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    nodes = tree.body if top_level_only else ast.walk(tree)
+    names = []
+    for node in nodes:
+        if isinstance(node, ast.Import):
+            names.extend(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module.split(".")[0])
+    return names
+
+
+def lib_imports(path, top_level_only=False):
+    """lib modules path needs, directly or through other lib modules, in import order"""
+    found = []
+    pending = [path]
+    while pending:
+        for name in imported_names(pending.pop(0), top_level_only):
+            module = os.path.join(LIB, name + ".py")
+            if name not in found and os.path.exists(module):
+                found.append(name)
+                pending.append(module)
+    return found
+
+
+def module_name(script):
+    """Importable module name for a firmware script, e.g. sensorPico2_co2_light"""
+    name = os.path.splitext(os.path.basename(script))[0]
+    return "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+
+
+def find_mpy_cross():
+    path = shutil.which("mpy-cross")
+    if path is not None:
+        return [path]
+    try:
+        import mpy_cross  # noqa: F401
+    except ImportError:
+        sys.exit("mpy-cross not found: build it from the MicroPython tree (mpy-cross/) "
+                 "or `pip install mpy-cross==<firmware version>`")
+    return [sys.executable, "-m", "mpy_cross"]
+
+
+def source_copy(script, name, out_dir, timeline):
+    """The script as module name, with the boot timeline switched on if asked"""
+    with open(script) as f:
+        source = f.read()
+    if timeline:
+        if "BOOT_TIMELINE = False" not in source:
+            sys.exit(f"{script} has no BOOT_TIMELINE switch")
+        source = source.replace("BOOT_TIMELINE = False", "BOOT_TIMELINE = True", 1)
+    path = os.path.join(out_dir, name + ".py")
+    with open(path, "w") as f:
+        f.write(source)
+    return path
+
+
+def compile_mpy(mpy_cross, source, out, source_name):
+    subprocess.run(mpy_cross + [f"-march={MARCH}", "-s", source_name, "-o", out, source], check=True)
+    return os.path.getsize(out)
+
+
+def write_main(build, name):
+    # Imported, the script's own `if __name__ == "__main__"` doesn't run
+    with open(os.path.join(build, "main.py"), "w") as f:
+        f.write(f"from {name} import main\nmain()\n")
+
+
+def write_manifest(build, modules, name):
+    lines = ['include("$(BOARD_DIR)/manifest.py")']
+    lines += [f'module("{module}.py", base_path="{LIB}")' for module in modules]
+    lines.append(f'module("{name}.py", base_path="{os.path.join(build, "src")}")')
+    with open(os.path.join(build, "manifest.py"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def deploy(build, modules, script, name):
+    # Drop the .py copies an .mpy would be shadowed by, then copy the build
+    stale = [f"lib/{module}.py" for module in modules] + [os.path.basename(script), name + ".py"]
+    cleanup = ("import os\n"
+               f"for path in {stale!r}:\n"
+               "    try:\n"
+               "        os.remove(path)\n"
+               "    except OSError:\n"
+               "        pass\n")
+    subprocess.run(["mpremote", "exec", cleanup, "+", "cp", "-r", "lib", ":", "+",
+                    "cp", name + ".mpy", ":", "+", "cp", "main.py", ":main.py", "+", "reset"],
+                   cwd=build, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompile a Pico's firmware to .mpy or frozen modules")
+    parser.add_argument("script", help="firmware script, e.g. sensorPico2_co2+light.py")
+    parser.add_argument("--build", default=os.path.join(ROOT, "build"), help="output directory")
+    parser.add_argument("--timeline", action="store_true", help="build with BOOT_TIMELINE = True")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--deploy", action="store_true", help="copy the build to the Pico with mpremote")
+    group.add_argument("--frozen", action="store_true", help="write a frozen manifest instead of .mpy files")
+    args = parser.parse_args()
+
+    script = os.path.abspath(args.script)
+    build = os.path.abspath(args.build)
+    name = module_name(script)
+    modules = lib_imports(script)
+    os.makedirs(os.path.join(build, "src"), exist_ok=True)
+    source = source_copy(script, name, os.path.join(build, "src"), args.timeline)
+    write_main(build, name)
+    print(f"{os.path.basename(script)} -> {name}, lib modules: {', '.join(modules)}")
+
+    if args.frozen:
+        write_manifest(build, modules, name)
+        print(f"Wrote {os.path.join(build, 'manifest.py')}; build the firmware with "
+              f"FROZEN_MANIFEST set to it and copy main.py to the Pico")
+        return
+
+    mpy_cross = find_mpy_cross()
+    version = subprocess.run(mpy_cross + ["--version"], capture_output=True, text=True).stdout.strip()
+    print(f"{version} (must match the firmware's .mpy version)")
+    os.makedirs(os.path.join(build, "lib"), exist_ok=True)
+    source_bytes = mpy_bytes = 0
+    for module in modules:
+        path = os.path.join(LIB, module + ".py")
+        source_bytes += os.path.getsize(path)
+        mpy_bytes += compile_mpy(mpy_cross, path, os.path.join(build, "lib", module + ".mpy"), module + ".py")
+    source_bytes += os.path.getsize(source)
+    mpy_bytes += compile_mpy(mpy_cross, source, os.path.join(build, name + ".mpy"), os.path.basename(script))
+    print(f"{len(modules) + 1} modules: {source_bytes} bytes of source, {mpy_bytes} bytes of .mpy")
+    if args.deploy:
+        deploy(build, modules, script, name)
+
+
+if __name__ == "__main__":
+    main()
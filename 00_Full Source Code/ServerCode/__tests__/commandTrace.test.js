@@ -0,0 +1,50 @@
+// __tests__/commandTrace.test.js
+const {
+  startTrace,
+  completeTrace,
+  getLatencyHistograms,
+  getLatencySummary,
+  estimatePercentile
+} = require('../commandTrace');
+
+describe('Command Trace', () => {
+  test('completeTrace splits the round trip using the device timings', () => {
+    const now = Date.now();
+    jest.spyOn(Date, 'now')
+      .mockReturnValueOnce(now)        // startTrace: publish time
+      .mockReturnValueOnce(now + 120); // completeTrace: ack received
+    
+    startTrace('cmd_1', 'pico_water_pump', now - 5);
+    const stages = completeTrace('cmd_1', { queue_us: 2000, exec_us: 8000, device_us: 20000 });
+    Date.now.mockRestore();
+    
+    expect(stages).toEqual({
+      server: 5,
+      total: 125,
+      queue: 2,
+      execute: 8,
+      device: 20,
+      network: 100
+    });
+    
+    const histograms = getLatencyHistograms('pico_water_pump').histograms;
+    expect(histograms.total.count).toBe(1);
+    expect(histograms.network.max).toBe(100);
+    expect(getLatencySummary().pico_water_pump).toEqual(expect.objectContaining({
+      count: 1,
+      p50Ms: 125,
+      p95Ms: 125,
+      maxMs: 125
+    }));
+  });
+  
+  test('estimatePercentile never exceeds the largest sample', () => {
+    const histogram = { counts: [0, 0, 0, 0, 2, 1, 0, 0, 0, 0, 0, 0], count: 3, max: 130 };
+    expect(estimatePercentile(histogram, 50)).toBe(100);
+    expect(estimatePercentile(histogram, 95)).toBe(130);
+  });
+  
+  test('completeTrace ignores acks for untraced commands', () => {
+    expect(completeTrace('cmd_unknown', {})).toBeNull();
+  });
+});
@@ -1,12 +1,20 @@
 // __tests__/ruleService.test.js
 const {
   evaluateCondition,
-  executeAction
+  executeAction,
+  syncEdgeRules
 } = require('../ruleService');
+const { getRedisClient } = require('../redisClient');
 
 // Mock the action handlers
 jest.mock('../mqttService', () => ({
-  sendCommand: jest.fn().mockResolvedValue(true)
+  sendCommand: jest.fn().mockResolvedValue(true),
+  publishEdgeRules: jest.fn().mockReturnValue(true)
+}));
+
+// Mock Redis client
+jest.mock('../redisClient', () => ({
+  getRedisClient: jest.fn()
 }));
 
 describe('Rule Service', () => {
@@ -43,4 +51,37 @@ describe('Rule Service', () => {
       'on'
     );
   });
-});
\ No newline at end of file
+
+  test('syncEdgeRules pushes edge rules to the actuator and clears stale devices', async () => {
+    const edgeRule = {
+      id: 'rule_1',
+      name: 'Dry soil',
+      deviceId: 'Soil Moisture Sensor',
+      type: 'condition',
+      enabled: true,
+      edge: true,
+      condition: { sensor: 'moisture', operator: '<', value: 30, hysteresis: 5 },
+      action: { isCustomJson: true, deviceId: 'pico_water_pump', component: 'pump', action: 'power', value: 'on' }
+    };
+    const cloudRule = { ...edgeRule, id: 'rule_2', edge: false };
+    const stored = {
+      'rule:rule_1': JSON.stringify(edgeRule),
+      'rule:rule_2': JSON.stringify(cloudRule),
+      'edge:targets': JSON.stringify(['old_actuator'])
+    };
+    
+    const mockRedisClient = {
+      keys: jest.fn().mockResolvedValue(['rule:rule_1', 'rule:rule_2']),
+      get: jest.fn(key => Promise.resolve(stored[key] || null)),
+      set: jest.fn().mockResolvedValue('OK')
+    };
+    getRedisClient.mockReturnValue(mockRedisClient);
+    
+    await syncEdgeRules();
+    
+    const { publishEdgeRules } = require('../mqttService');
+    expect(publishEdgeRules).toHaveBeenCalledWith('pico_water_pump', [edgeRule]);
+    expect(publishEdgeRules).toHaveBeenCalledWith('old_actuator', []);
+    expect(mockRedisClient.set).toHaveBeenCalledWith('edge:targets', JSON.stringify(['pico_water_pump']));
+  });
+});
@@ -7,6 +7,9 @@ const schedule = require('node-schedule');
 // Store scheduled jobs to allow cancellation
 const scheduledJobs = new Map();
 
+// Redis key listing devices that currently hold edge rules
+const EDGE_TARGETS_KEY = 'edge:targets';
+
 // Cache for latest device data (to avoid excessive Redis queries)
 const deviceDataCache = new Map();
 const CACHE_TTL = 10000; // 10 seconds
@@ -28,6 +31,9 @@ async function initRuleService() {
     // Schedule all time-based rules
     scheduleAllRules(rules.filter(rule => rule.type === 'schedule'));
     
+    // Make sure actuators hold the current edge rules
+    await syncEdgeRules();
+    
     console.log('Rule service initialized successfully');
     return true;
   } catch (error) {
@@ -59,7 +65,8 @@ async function evaluateAllRules() {
   try {
     // Load all condition-based rules
     const rules = await loadRules();
-    const conditionRules = rules.filter(rule => rule.type === 'condition');
+    // Edge rules are evaluated on the actuator itself, not here
+    const conditionRules = rules.filter(rule => rule.type === 'condition' && !rule.edge);
     
     if (conditionRules.length === 0) {
       return;
@@ -276,6 +283,65 @@ function executeRuleAction(rule) {
   }
 }
 
+/**
+ * Get the device that executes a rule's action
+ * @param {Object} rule - The rule
+ * @returns {string} - Target device ID
+ */
+function getActionTarget(rule) {
+  return (rule.action && rule.action.deviceId) || rule.deviceId;
+}
+
+/**
+ * Push edge-enabled condition rules to the actuators that execute them.
+ * Rules are published retained, so a device picks them up on (re)connect,
+ * and devices that lost all their edge rules receive an empty list.
+ * @returns {boolean} - Success status
+ */
+async function syncEdgeRules() {
+  try {
+    const rules = await loadRules();
+    const rulesByTarget = {};
+    
+    for (const rule of rules) {
+      if (!rule.edge || rule.type !== 'condition' || !rule.enabled) {
+        continue;
+      }
+      
+      const target = getActionTarget(rule);
+      if (!rulesByTarget[target]) {
+        rulesByTarget[target] = [];
+      }
+      rulesByTarget[target].push(rule);
+    }
+    
+    const client = await getRedisClient();
+    const previousJson = await client.get(EDGE_TARGETS_KEY);
+    const previousTargets = previousJson ? JSON.parse(previousJson) : [];
+    
+    // Clear devices that no longer have any edge rules
+    for (const deviceId of previousTargets) {
+      if (!rulesByTarget[deviceId]) {
+        rulesByTarget[deviceId] = [];
+      }
+    }
+    
+    const { publishEdgeRules } = require('./mqttService');
+    for (const [deviceId, deviceRules] of Object.entries(rulesByTarget)) {
+      publishEdgeRules(deviceId, deviceRules);
+    }
+    
+    const targets = Object.keys(rulesByTarget).filter(deviceId => rulesByTarget[deviceId].length > 0);
+    await client.set(EDGE_TARGETS_KEY, JSON.stringify(targets));
+    
+    console.log(`Synced edge rules to ${targets.length} devices`);
+    return true;
+  } catch (error) {
+    console.error('Error syncing edge rules:', error);
+    return false;
+  }
+}
+
 /**
  * Schedule all time-based rules
  * @param {Array} rules - List of schedule-type rules
@@ -416,6 +482,10 @@ async function saveRule(rule) {
     }
     
     console.log(`Rule ${rule.id} saved to Redis`);
+    
+    // Rules can gain, lose or change their edge flag on any save
+    await syncEdgeRules();
+    
     return true;
   } catch (error) {
     console.error('Error saving rule to Redis:', error);
@@ -501,6 +571,9 @@ async function deleteRule(ruleId) {
     await client.del(`rule:history:${ruleId}`);
     
     console.log(`Rule ${ruleId} deleted from Redis`);
+    
+    await syncEdgeRules();
+    
     return true;
   } catch (error) {
     console.error(`Error deleting rule ${ruleId}:`, error);
@@ -651,5 +724,6 @@ module.exports = {
   setRuleEnabled,
   getRuleHistory,
   evaluateRule,
-  scheduleRule
+  scheduleRule,
+  syncEdgeRules
 };
\ No newline at end of file
@@ -35,8 +35,10 @@ const {
 const {
   initMqttClient,
   sendCommand: sendMqttCommand,
-  broadcastCommand: broadcastMqttCommand
+  broadcastCommand: broadcastMqttCommand,
+  publishTelemetry
 } = require('./mqttService');
+const { getLatencyHistograms } = require('./commandTrace');
 
 // Create Express app
 const app = express();
@@ -282,6 +284,9 @@ app.post('/sensors', async (req, res) => {
     // Save to log file
     saveToLogFile(deviceId, dataWithTimestamp);
 
+    // Relay to MQTT for the actuators' edge rules
+    publishTelemetry(deviceId, dataWithTimestamp);
+
     // Save to Redis
     await saveToRedis(deviceId, dataWithTimestamp);
     
@@ -544,6 +549,11 @@ app.post('/api/rules', async (req, res) => {
       return res.status(400).json({ error: 'Invalid condition rule. Required fields: condition.sensor, condition.operator, condition.value' });
     }
     
+    // Edge rules run on the actuator, which only understands condition rules
+    if (rule.edge && rule.type !== 'condition') {
+      return res.status(400).json({ error: 'Edge execution is only supported for condition-based rules' });
+    }
+    
     // Validate schedule for schedule-type rules
     if (rule.type === 'schedule' && (!rule.schedule || !rule.schedule.pattern)) {
       return res.status(400).json({ error: 'Invalid schedule rule. Required field: schedule.pattern' });
@@ -729,35 +739,16 @@ app.get('/api/devices/:deviceId/sensors', async (req, res) => {
 });
 
 // Universal send command function that routes to the appropriate implementation
-function sendCommand(deviceId, component, action, value) {
+function sendCommand(deviceId, component, action, value, requestedAt = Date.now()) {
   console.log(`MQTT sendCommand called: ${deviceId}, ${component}, ${action}, ${value}`);
   
-  if (!mqttClient || !mqttClient.connected) {
-    console.error('MQTT client not connected');
-    return null;
+  if (COMMUNICATION_MODE === 'mqtt') {
+    // mqttService traces the command from this request to the device's ack
+    return sendMqttCommand(deviceId, component, action, value, requestedAt);
+  } else {
+    // Default to WebSocket
+    return sendWsCommand(deviceId, component, action, value);
   }
-  
-  // Generate command ID
-  const commandId = `cmd_${Date.now()}_${Math.random().toString(36).substring(2, 10)}`;
-  
-  // Create command object
-  const command = {
-    id: commandId,
-    component,
-    action,
-    value,
-    timestamp: Date.now()
-  };
-  
-  // Publish to device's command topic
-  const topic = `${TOPIC_PREFIX}${deviceId}/commands`;
-  console.log(`Publishing to topic: ${topic}`);
-  console.log(`Command payload: ${JSON.stringify(command)}`);
-  
-  mqttClient.publish(topic, JSON.stringify(command));
-  
-  console.log(`Command sent to device ${deviceId}: ${component}.${action}=${value}`);
-  return commandId;
 }
 
 // Universal broadcast command function that routes to the appropriate implementation
@@ -773,6 +764,7 @@ function broadcastCommand(component, action, value) {
 
 // Send command to a specific device
 app.post('/api/command/:deviceId', (req, res) => {
+  const requestedAt = Date.now();
   const { deviceId } = req.params;
   const { component, action, value } = req.body;
   
@@ -780,7 +772,7 @@ app.post('/api/command/:deviceId', (req, res) => {
     return res.status(400).json({ error: 'Missing required parameters: component and action' });
   }
   
-  const commandId = sendCommand(deviceId, component, action, value);
+  const commandId = sendCommand(deviceId, component, action, value, requestedAt);
   
   if (commandId) {
     res.json({ 
@@ -796,6 +788,23 @@ app.post('/api/command/:deviceId', (req, res) => {
   }
 });
 
+// Command latency histograms for all devices
+app.get('/api/latency', (req, res) => {
+  res.json(getLatencyHistograms());
+});
+
+// Command latency histograms for a single device
+app.get('/api/latency/:deviceId', (req, res) => {
+  const { deviceId } = req.params;
+  const histograms = getLatencyHistograms(deviceId);
+  
+  if (histograms) {
+    res.json(histograms);
+  } else {
+    res.status(404).json({ error: 'No latency data for this device' });
+  }
+});
+
 // Broadcast command to all devices with a specific capability
 app.post('/api/broadcast', (req, res) => {
   const { component, action, value } = req.body;
@@ -881,9 +890,10 @@ io.on('connection', (socket) => {
   });
 
   socket.on('sendCommand', ({ deviceId, component, action, value }) => {
+    const requestedAt = Date.now();
     console.log(`Client requested command: ${deviceId} ${component} ${action}`);
     
-    const commandId = sendCommand(deviceId, component, action, value);
+    const commandId = sendCommand(deviceId, component, action, value, requestedAt);
     
     // Send result back to the client
     socket.emit('commandResult', {
@@ -1,8 +1,10 @@
 // __tests__/mqttService.test.js
 const { 
+  initMqttClient,
   sendCommand,
   broadcastCommand
 } = require('../mqttService');
+const { saveToRedis } = require('../redisSensorData');
 
 // Mock the MQTT client
 jest.mock('mqtt', () => ({
@@ -14,6 +16,10 @@ jest.mock('mqtt', () => ({
   })
 }));
 
+jest.mock('../redisSensorData', () => ({
+  saveToRedis: jest.fn()
+}));
+
 describe('MQTT Service', () => {
   let mockClient;
   
@@ -36,4 +42,17 @@ describe('MQTT Service', () => {
       expect.any(Object)
     );
   });
+  
+  test('telemetry relayed from POST /sensors should not be stored again', async () => {
+    await initMqttClient();
+    const onMessage = mockClient.on.mock.calls.find(([event]) => event === 'message')[1];
+    const topic = 'ycstation/devices/test-device/telemetry';
+    const reading = { sensors: { moisture: { value: 20, unit: '%' } }, timestamp: 1 };
+    
+    await onMessage(topic, Buffer.from(JSON.stringify({ ...reading, relayed: true })));
+    expect(saveToRedis).not.toHaveBeenCalled();
+    
+    await onMessage(topic, Buffer.from(JSON.stringify(reading)));
+    expect(saveToRedis).toHaveBeenCalledWith('test-device', reading);
+  });
 });
\ No newline at end of file
@@ -0,0 +1,199 @@
+// commandTrace.js
+// End-to-end latency tracing for device commands.
+//
+// The server stamps when a command was requested and published, the device
+// reports how long it queued and executed the command (in its ack), and the
+// round trip is closed when the ack arrives. Each stage is folded into a
+// per-device histogram so slow nodes stand out.
+
+// Histogram bucket upper bounds in milliseconds (last bucket is open-ended)
+const BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000];
+
+// Commands without an ack after this long are counted as timeouts
+const TRACE_TIMEOUT = 60000;
+
+const STAGES = ['server', 'network', 'queue', 'execute', 'device', 'total'];
+
+// commandId -> in-flight trace
+const pendingTraces = new Map();
+// deviceId -> { histograms, timeouts, lastTrace }
+const deviceLatency = new Map();
+
+/**
+ * Create an empty histogram
+ */
+function createHistogram() {
+  return {
+    buckets: BUCKETS_MS,
+    counts: new Array(BUCKETS_MS.length + 1).fill(0),
+    count: 0,
+    sum: 0,
+    max: 0
+  };
+}
+
+/**
+ * Add a sample (ms) to a histogram
+ */
+function recordSample(histogram, valueMs) {
+  let index = BUCKETS_MS.findIndex(bound => valueMs <= bound);
+  if (index === -1) {
+    index = BUCKETS_MS.length;
+  }
+
+  histogram.counts[index]++;
+  histogram.count++;
+  histogram.sum += valueMs;
+  histogram.max = Math.max(histogram.max, valueMs);
+}
+
+/**
+ * Estimate a percentile from a histogram (the bucket's upper bound, but never
+ * more than the largest sample seen)
+ */
+function estimatePercentile(histogram, percentile) {
+  if (histogram.count === 0) {
+    return null;
+  }
+
+  const target = Math.ceil(histogram.count * percentile / 100);
+  let cumulative = 0;
+  for (let i = 0; i < histogram.counts.length; i++) {
+    cumulative += histogram.counts[i];
+    if (cumulative >= target) {
+      return i < BUCKETS_MS.length ? Math.min(BUCKETS_MS[i], histogram.max) : histogram.max;
+    }
+  }
+  return histogram.max;
+}
+
+/**
+ * Get (or create) the latency record for a device
+ */
+function getDeviceRecord(deviceId) {
+  if (!deviceLatency.has(deviceId)) {
+    const histograms = {};
+    for (const stage of STAGES) {
+      histograms[stage] = createHistogram();
+    }
+    deviceLatency.set(deviceId, { histograms, timeouts: 0, lastTrace: null });
+  }
+  return deviceLatency.get(deviceId);
+}
+
+/**
+ * Drop traces that never got an ack and count them as timeouts
+ */
+function expireStaleTraces(now = Date.now()) {
+  for (const [commandId, trace] of pendingTraces.entries()) {
+    if (now - trace.publishedAt > TRACE_TIMEOUT) {
+      getDeviceRecord(trace.deviceId).timeouts++;
+      pendingTraces.delete(commandId);
+    }
+  }
+}
+
+/**
+ * Start tracing a command when it is published
+ * @param {string} commandId - Command ID
+ * @param {string} deviceId - Target device
+ * @param {number} requestedAt - When the API/socket request arrived (ms)
+ */
+function startTrace(commandId, deviceId, requestedAt) {
+  const now = Date.now();
+  expireStaleTraces(now);
+
+  pendingTraces.set(commandId, {
+    deviceId,
+    requestedAt: requestedAt || now,
+    publishedAt: now
+  });
+}
+
+/**
+ * Close a trace when the device acknowledges the command
+ * @param {string} commandId - Command ID from the ack
+ * @param {Object} deviceTrace - Optional { queue_us, exec_us, device_us } from the firmware
+ * @returns {Object|null} - Stage breakdown in ms, or null if the command wasn't traced
+ */
+function completeTrace(commandId, deviceTrace) {
+  const trace = pendingTraces.get(commandId);
+  if (!trace) {
+    return null;
+  }
+  pendingTraces.delete(commandId);
+
+  const ackedAt = Date.now();
+  const roundTrip = ackedAt - trace.publishedAt;
+  const stages = {
+    server: trace.publishedAt - trace.requestedAt,
+    total: ackedAt - trace.requestedAt
+  };
+
+  if (deviceTrace && deviceTrace.device_us !== undefined) {
+    stages.queue = deviceTrace.queue_us / 1000;
+    stages.execute = deviceTrace.exec_us / 1000;
+    stages.device = deviceTrace.device_us / 1000;
+    // Whatever the device didn't spend itself was spent on the wire and in the broker
+    stages.network = Math.max(0, roundTrip - stages.device);
+  } else {
+    stages.network = roundTrip;
+  }
+
+  const record = getDeviceRecord(trace.deviceId);
+  for (const [stage, valueMs] of Object.entries(stages)) {
+    recordSample(record.histograms[stage], valueMs);
+  }
+  record.lastTrace = { commandId, ...stages, ackedAt: new Date(ackedAt).toISOString() };
+
+  return stages;
+}
+
+/**
+ * Get full latency histograms for one device or all devices
+ * @param {string} deviceId - Optional device ID
+ * @returns {Object|null} - Histograms keyed by device (or one device's record)
+ */
+function getLatencyHistograms(deviceId) {
+  expireStaleTraces();
+
+  if (deviceId) {
+    return deviceLatency.get(deviceId) || null;
+  }
+
+  const result = {};
+  for (const [id, record] of deviceLatency.entries()) {
+    result[id] = record;
+  }
+  return result;
+}
+
+/**
+ * Compact per-device summary (count, p50/p95/max of the total latency)
+ * @returns {Object} - Summary keyed by device
+ */
+function getLatencySummary() {
+  expireStaleTraces();
+
+  const summary = {};
+  for (const [deviceId, record] of deviceLatency.entries()) {
+    const total = record.histograms.total;
+    summary[deviceId] = {
+      count: total.count,
+      timeouts: record.timeouts,
+      meanMs: total.count ? Math.round(total.sum / total.count) : null,
+      p50Ms: estimatePercentile(total, 50),
+      p95Ms: estimatePercentile(total, 95),
+      maxMs: total.max
+    };
+  }
+  return summary;
+}
+
+module.exports = {
+  startTrace,
+  completeTrace,
+  getLatencyHistograms,
+  getLatencySummary,
+  estimatePercentile
+};
@@ -1,6 +1,7 @@
 // mqttService.js
 const mqtt = require('mqtt');
 const { getRedisClient } = require('./redisClient');
+const { startTrace, completeTrace, getLatencySummary } = require('./commandTrace');
 
 // MQTT Configuration - using EMQX public broker
 const MQTT_BROKER = 'mqtt://broker.emqx.io:1883';
@@ -55,7 +56,10 @@ async function initMqttClient() {
       if (messageType === 'status') {
         await handleStatusUpdate(deviceId, payload);
       } else if (messageType === 'telemetry') {
-        await handleTelemetryData(deviceId, payload);
+        // Readings relayed from POST /sensors are already stored
+        if (!payload.relayed) {
+          await handleTelemetryData(deviceId, payload);
+        }
       } else if (messageType === 'ack') {
         await handleCommandAcknowledgment(deviceId, payload);
       }
@@ -177,14 +181,22 @@ async function handleTelemetryData(deviceId, telemetry) {
 async function handleCommandAcknowledgment(deviceId, ack) {
   try {
     console.log(`Device ${deviceId} command ack:`, ack);
+    
+    // Close the latency trace before any Redis round trips skew it
+    const latency = completeTrace(ack.command_id, ack.trace);
+    
     const client = await getRedisClient();
     
     // Update command status in Redis
-    await client.hSet(`device:${deviceId}:command:${ack.command_id}`, {
+    const commandStatus = {
       status: ack.success ? 'executed' : 'failed',
       message: ack.message,
       executed_at: new Date().toISOString()
-    });
+    };
+    if (latency) {
+      commandStatus.latency_ms = String(latency.total);
+    }
+    await client.hSet(`device:${deviceId}:command:${ack.command_id}`, commandStatus);
     
     // Emit command result to Socket.IO clients
     const io = global.io;
@@ -193,7 +205,8 @@ async function handleCommandAcknowledgment(deviceId, ack) {
         deviceId,
         commandId: ack.command_id,
         success: ack.success,
-        message: ack.message
+        message: ack.message,
+        latency
       });
     }
     
@@ -205,8 +218,9 @@ async function handleCommandAcknowledgment(deviceId, ack) {
 
 /**
  * Send a command to a device via MQTT
+ * @param {number} requestedAt - When the originating request arrived (for latency tracing)
  */
-function sendCommand(deviceId, component, action, value) {
+function sendCommand(deviceId, component, action, value, requestedAt = Date.now()) {
   if (!mqttClient || !mqttClient.connected) {
     console.error('MQTT client not connected');
     return null;
@@ -226,7 +240,8 @@ function sendCommand(deviceId, component, action, value) {
   
   // Publish to device's command topic
   const topic = `${TOPIC_PREFIX}${deviceId}/commands`;
-  mqttClient.publish(topic, JSON.stringify(command));
+  startTrace(commandId, deviceId, requestedAt);
+  mqttClient.publish(topic, JSON.stringify(command), { qos: 0 });
   
   console.log(`Command sent to device ${deviceId}: ${component}.${action}=${value}`);
   return commandId;
@@ -283,11 +298,56 @@ function broadcastCommandToAll(component, action, value) {
   return commandId;
 }
 
+/**
+ * Publish the edge rules a device should evaluate locally.
+ * Retained so the device receives them again after a reconnect or reboot.
+ */
+function publishEdgeRules(deviceId, rules) {
+  if (!mqttClient || !mqttClient.connected) {
+    console.error('MQTT client not connected');
+    return false;
+  }
+  
+  const topic = `${TOPIC_PREFIX}${deviceId}/rules`;
+  const payload = {
+    rules,
+    timestamp: Date.now()
+  };
+  
+  mqttClient.publish(topic, JSON.stringify(payload), { qos: 1, retain: true });
+  
+  console.log(`Pushed ${rules.length} edge rules to device ${deviceId}`);
+  return true;
+}
+
+/**
+ * Relay a reading the server received over HTTP to the device's telemetry
+ * topic, where actuator Picos evaluate their edge rules against it.
+ * Marked as relayed so this service doesn't store it a second time.
+ */
+function publishTelemetry(deviceId, data) {
+  if (!mqttClient || !mqttClient.connected) {
+    return false;
+  }
+  
+  const topic = `${TOPIC_PREFIX}${deviceId}/telemetry`;
+  const payload = {
+    device_id: deviceId,
+    sensors: data.sensors,
+    timestamp: data.timestamp,
+    relayed: true
+  };
+  
+  mqttClient.publish(topic, JSON.stringify(payload), { qos: 0 });
+  return true;
+}
+
 function getMqttInfo() {
     return {
       broker: MQTT_BROKER,
       topicPrefix: TOPIC_PREFIX,
-      connected: mqttClient && mqttClient.connected
+      connected: mqttClient && mqttClient.connected,
+      latency: getLatencySummary()
     };
 }
 
@@ -296,5 +356,7 @@ module.exports = {
     sendCommand,
     broadcastCommand,
     broadcastCommandToAll,
+    publishEdgeRules,
+    publishTelemetry,
     getMqttInfo
 };
\ No newline at end of file
@@ -1,18 +1,9 @@
 from machine import Pin, I2C
+# SCD41 driver: copy scd41.py, sensirion.py, i2c_device.py and compat.py from
+# "00_Full Source Code/PicoMicropythonCode/lib" to the Pico's /lib
+from scd41 import SCD41, SCD41_ADDR as SCD41_ADDRESS
 import time
 
-# SCD41 Constants
-SCD41_ADDRESS = 0x62  # Default I2C address
-CMD_START_PERIODIC_MEASUREMENT = b"\x21\xb1"
-CMD_READ_MEASUREMENT = b"\xec\x05"
-CMD_STOP_PERIODIC_MEASUREMENT = b"\x3f\x86"
-CMD_REINIT = b"\x36\x46"  # Reinitialize command
-CMD_FACTORY_RESET = b"\x36\x32"  # Factory reset
-CMD_FORCE_CALIBRATION = b"\x36\x2f"
-CMD_GET_DATA_READY = b"\xe4\xb8"
-CMD_SET_AUTOMATIC_CALIBRATION = b"\x24\x16"  # Enable automatic calibration
-CMD_ALTITUDE_COMPENSATION = b"\x24\x27"  # Set altitude compensation
-
 # I2C setup for sensors
 I2C_SDA_PIN = 4  # GP4 on the Pico W
 I2C_SCL_PIN = 5  # GP5 on the Pico W
@@ -20,105 +11,46 @@ I2C_SCL_PIN = 5  # GP5 on the Pico W
 # Initialize I2C with lower frequency for better compatibility
 i2c = I2C(0, sda=Pin(I2C_SDA_PIN), scl=Pin(I2C_SCL_PIN), freq=10000)
 
-def calculate_crc(data):
-    """Calculate CRC for SCD41 communication"""
-    crc = 0xFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x80:
-                crc = (crc << 1) ^ 0x31
-            else:
-                crc = crc << 1
-    return crc & 0xFF
-
-def send_command(command):
-    """Send command to SCD41"""
-    i2c.writeto(SCD41_ADDRESS, command)
-
-def send_command_with_args(command, arguments):
-    """Send command with arguments to SCD41"""
-    buffer = bytearray(command)
-    buffer.extend(arguments)
-    buffer.append(calculate_crc(arguments))
-    i2c.writeto(SCD41_ADDRESS, buffer)
-
-def read_data(command, length=3):
-    """Read data from SCD41 with proper CRC checking"""
-    send_command(command)
-    # SCD41 needs time to process the read command
-    time.sleep(0.001)
-    data = i2c.readfrom(SCD41_ADDRESS, length)
-    return data
+co2_sensor = SCD41(i2c, SCD41_ADDRESS)
 
 def start_periodic_measurement():
     """Start periodic measurement"""
-    send_command(CMD_START_PERIODIC_MEASUREMENT)
+    co2_sensor.start_periodic()
     # Wait for the first measurement (5 seconds)
     time.sleep(5)
 
 def stop_periodic_measurement():
     """Stop periodic measurement"""
-    send_command(CMD_STOP_PERIODIC_MEASUREMENT)
-    time.sleep(0.5)  # Give it time to process the stop command
+    co2_sensor.stop_periodic()
 
 def read_measurement():
     """Read and process measurement data"""
     try:
-        data = read_data(CMD_READ_MEASUREMENT, 9)
-        
-        # Check if data is valid (should be 9 bytes)
-        if len(data) != 9:
-            print(f"Invalid data length: {len(data)}")
-            return None, None, None
-        
-        # Parse CO2 (first 2 bytes + CRC)
-        co2 = (data[0] << 8) | data[1]
-        # Verify CRC for CO2
-        if calculate_crc(data[0:2]) != data[2]:
-            # Instead of printing error, we'll just continue
-            pass
-        
-        # Parse temperature (next 2 bytes + CRC)
-        temp_raw = (data[3] << 8) | data[4]
-        temperature = -45 + 175 * temp_raw / 65535
-        # Verify CRC for temperature
-        if calculate_crc(data[3:5]) != data[5]:
-            # Instead of printing error, we'll just continue
-            pass
-        
-        # Parse humidity (next 2 bytes + CRC)
-        hum_raw = (data[6] << 8) | data[7]
-        humidity = 100 * hum_raw / 65535
-        # Verify CRC for humidity
-        if calculate_crc(data[6:8]) != data[8]:
-            # Instead of printing error, we'll just continue
-            pass
-        
-        return co2, temperature, humidity
+        # The driver re-reads a frame that fails its CRC and drops it if it stays bad
+        reading = co2_sensor.read_measurement()
     except Exception as e:
         # Don't print the error, we'll handle it in the main loop
         return None, None, None
+    if reading is None:
+        print("Dropping corrupt SCD41 frame")
+        return None, None, None
+    return reading
 
 def force_calibration(target_co2=400):
     """Force calibration with known CO2 value (typically 400ppm for fresh air)"""
-    # Convert target CO2 value to bytes (MSB first)
-    target_bytes = bytearray([(target_co2 >> 8) & 0xFF, target_co2 & 0xFF])
-    send_command_with_args(CMD_FORCE_CALIBRATION, target_bytes)
-    time.sleep(1)
+    correction = co2_sensor.forced_recalibration(target_co2)
+    if correction is None:
+        print("Forced calibration failed")
+    else:
+        print(f"Forced calibration correction: {correction} ppm")
 
 def enable_automatic_calibration(enable=True):
     """Enable or disable automatic self-calibration"""
-    value = 1 if enable else 0
-    send_command_with_args(CMD_SET_AUTOMATIC_CALIBRATION, bytearray([0, value]))
-    time.sleep(0.5)
+    co2_sensor.set_automatic_self_calibration(enable)
 
 def set_altitude_compensation(altitude_meters=0):
     """Set altitude compensation in meters above sea level"""
-    # Convert altitude to bytes (MSB first)
-    altitude_bytes = bytearray([(altitude_meters >> 8) & 0xFF, altitude_meters & 0xFF])
-    send_command_with_args(CMD_ALTITUDE_COMPENSATION, altitude_bytes)
-    time.sleep(0.5)
+    co2_sensor.set_altitude(altitude_meters)
 
 # Main program
 try:
@@ -131,12 +63,10 @@ try:
         print(f"SCD41 found at address 0x{SCD41_ADDRESS:02X}")
         
         print("Performing factory reset...")
-        send_command(CMD_FACTORY_RESET)
-        time.sleep(1)  # Wait for reset to complete
+        co2_sensor.factory_reset()
 
         print("Reinitializing sensor...")
-        send_command(CMD_REINIT)
-        time.sleep(0.5)
+        co2_sensor.reinit()
         
         print("Enabling automatic calibration...")
         enable_automatic_calibration(True)
@@ -155,9 +85,7 @@ try:
         
         print("Performing forced calibration (assuming clean air ~400ppm)...")
         stop_periodic_measurement()
-        time.sleep(0.5)
         force_calibration(400)  # Assumes you're in fresh air at ~400ppm
-        time.sleep(1)
         
         # Start periodic measurement
         start_periodic_measurement()
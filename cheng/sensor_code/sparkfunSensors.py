@@ -4,6 +4,13 @@ import time
 import random
 import json
 from machine import Pin, I2C
+# SCD41 and FS3000 drivers: copy scd41.py, fs3000.py, sensirion.py,
+# i2c_device.py and compat.py from "00_Full Source Code/PicoMicropythonCode/lib"
+# to the Pico's /lib
+from scd41 import SCD41, SCD41_ADDR as SCD41_ADDRESS
+from fs3000 import FS3000, PART_1005
+# Self-tuning bus clock: copy i2c_bus.py from the same lib folder
+from i2c_bus import I2CBus
 
 # Wi-Fi configuration
 SSID = "SSID"
@@ -13,21 +20,9 @@ PASSWORD = "PASSWORD"
 API_URL = "https://iot.ycstation.work/sensors"
 DEVICE_ID = "Sparkfun_Pico"
 
-# Define FS3000 constants
-FS3000_ADDRESS = 0x28  # Default I2C address for FS3000
-FS3000_VELOCITY_REG = 0x00  # Register to read air velocity
-
-# SCD41 Constants
-SCD41_ADDRESS = 0x62  # Default I2C address
-CMD_START_PERIODIC_MEASUREMENT = b"\x21\xb1"
-CMD_READ_MEASUREMENT = b"\xec\x05"
-CMD_STOP_PERIODIC_MEASUREMENT = b"\x3f\x86"
-CMD_REINIT = b"\x36\x46"  # Reinitialize command
-CMD_FACTORY_RESET = b"\x36\x32"  # Factory reset
-CMD_FORCE_CALIBRATION = b"\x36\x2f"
-CMD_GET_DATA_READY = b"\xe4\xb8"
-CMD_SET_AUTOMATIC_CALIBRATION = b"\x24\x16"  # Enable automatic calibration
-CMD_ALTITUDE_COMPENSATION = b"\x24\x27"  # Set altitude compensation
+# FS3000 sampling period; readings are averaged over each upload
+FS3000_SAMPLE_MS = 20
+FS3000_PART = PART_1005  # PART_1015 for the 15 m/s version
 
 # I2C setup for sensors
 I2C_SDA_PIN = 4  # GP4 on the Pico W
@@ -36,8 +31,12 @@ I2C_SCL_PIN = 5  # GP5 on the Pico W
 # Status LED
 led = Pin("LED", Pin.OUT)
 
-# Initialize I2C with lower frequency for better compatibility with both sensors
-i2c = I2C(0, sda=Pin(I2C_SDA_PIN), scl=Pin(I2C_SCL_PIN), freq=10000)
+# The bus starts at the old 10 kHz; main() raises it to the fastest clock
+# both sensors read reliably at, and it falls back by itself on errors
+I2C_BASELINE_HZ = 10000
+i2c = I2CBus(lambda freq: I2C(0, sda=Pin(I2C_SDA_PIN), scl=Pin(I2C_SCL_PIN), freq=freq), I2C_BASELINE_HZ)
+air_sensor = FS3000(i2c, FS3000_PART)
+co2_sensor = SCD41(i2c, SCD41_ADDRESS)
 
 # -------------------------- #
 # Wi-Fi and server functions #
@@ -127,45 +126,12 @@ def send_data_to_server(sensor_data):
 # ----------------------- #
 
 def read_fs3000():
-    try:
-        # Read 2 bytes from the velocity register
-        data = i2c.readfrom_mem(FS3000_ADDRESS, FS3000_VELOCITY_REG, 2)
-        
-        # Convert the 2 bytes to a 16-bit integer (big-endian)
-        raw_value = (data[0] << 8) | data[1]
-        
-        # Calculate velocity in meters per second
-        velocity_mps = convert_raw_to_velocity(raw_value)
-        
-        return velocity_mps
-    except Exception as e:
-        print(f"Error reading FS3000: {e}")
-        return 0.0
-
-def convert_raw_to_velocity(raw_value):
-    # Check which version of sensor (7.5 m/s or 15 m/s)
-    MAX_VELOCITY = 7.5  # Change to 15 if you have the 15 m/s version
-    
-    # Handle special cases
-    if raw_value == 0 or raw_value == 65535:  # 0 or 0xFFFF
-        return 0
-    
-    # Proper conversion formula for FS3000
-    # The raw values are non-linear and need lookup or formula
-    if raw_value < 1024:
-        # Low velocity formula - values from datasheet
-        velocity = raw_value / 1024 * 1.25
-    elif raw_value < 8192:
-        # Mid velocity formula
-        velocity = (raw_value - 1024) / 7168 * 3.75 + 1.25
-    else:
-        # High velocity formula
-        velocity = (raw_value - 8192) / 57343 * 2.5 + 5.0
-    
-    # Scale to the maximum velocity of your sensor
-    velocity = min(velocity, MAX_VELOCITY)
-    
-    return velocity
+    """Air velocity window (mean/peak/stddev in m/s) since the last call"""
+    window = air_sensor.window_stats()
+    if window is None:
+        print(f"No valid FS3000 frames this window: {air_sensor.stats()}")
+        return {"mean": 0.0, "peak": 0.0, "stddev": 0.0}
+    return window
 
 # ------------------------------ #
 # End of FS3000 sensor functions # 
@@ -175,23 +141,11 @@ def convert_raw_to_velocity(raw_value):
 # SCD41 sensor functions #
 # ---------------------- #
 
-def calculate_crc(data):
-    """Calculate CRC for SCD41 communication"""
-    crc = 0xFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x80:
-                crc = (crc << 1) ^ 0x31
-            else:
-                crc = crc << 1
-    return crc & 0xFF
-
-def send_command_with_retry(command, retries=3, delay=0.5):
-    """Send command to SCD41 with retries"""
+def with_retry(command, *args, retries=3, delay=0.5):
+    """Run an SCD41 driver command, retrying when the sensor NACKs"""
     for attempt in range(retries):
         try:
-            i2c.writeto(SCD41_ADDRESS, command)
+            command(*args)
             return True
         except OSError as e:
             print(f"Command failed (attempt {attempt+1}/{retries}): {e}")
@@ -199,44 +153,9 @@ def send_command_with_retry(command, retries=3, delay=0.5):
     print("Command failed after all retries")
     return False
 
-def send_command_with_args_retry(command, arguments, retries=3, delay=0.5):
-    """Send command with arguments to SCD41 with retries"""
-    buffer = bytearray(command)
-    buffer.extend(arguments)
-    buffer.append(calculate_crc(arguments))
-    
-    for attempt in range(retries):
-        try:
-            i2c.writeto(SCD41_ADDRESS, buffer)
-            return True
-        except OSError as e:
-            print(f"Command with args failed (attempt {attempt+1}/{retries}): {e}")
-            time.sleep(delay)  # Wait before retry
-    print("Command with args failed after all retries")
-    return False
-
-def read_data(command, length=3):
-    """Read data from SCD41 with proper CRC checking"""
-    try:
-        if not send_command_with_retry(command):
-            return None
-        
-        # SCD41 needs time to process the read command
-        time.sleep(0.001)
-        
-        try:
-            data = i2c.readfrom(SCD41_ADDRESS, length)
-            return data
-        except OSError as e:
-            print(f"Error reading data: {e}")
-            return None
-    except Exception as e:
-        print(f"General error in read_data: {e}")
-        return None
-
 def start_periodic_measurement():
     """Start periodic measurement"""
-    if send_command_with_retry(CMD_START_PERIODIC_MEASUREMENT):
+    if with_retry(co2_sensor.start_periodic):
         # Wait for the first measurement (5 seconds)
         print("Starting periodic measurement...")
         time.sleep(5)
@@ -245,68 +164,37 @@ def start_periodic_measurement():
 
 def stop_periodic_measurement():
     """Stop periodic measurement"""
-    if send_command_with_retry(CMD_STOP_PERIODIC_MEASUREMENT):
-        time.sleep(0.5)  # Give it time to process the stop command
-        return True
-    return False
+    return with_retry(co2_sensor.stop_periodic)
 
 def read_measurement():
     """Read and process measurement data"""
-    try:
-        data = read_data(CMD_READ_MEASUREMENT, 9)
-        
-        # Check if data is valid
-        if data is None or len(data) != 9:
-            if data is None:
-                print("No data received")
-            else:
-                print(f"Invalid data length: {len(data)}")
-            return None, None, None
-        
-        # Parse CO2 (first 2 bytes + CRC)
-        co2 = (data[0] << 8) | data[1]
-        # Verify CRC for CO2
-        if calculate_crc(data[0:2]) != data[2]:
-            # Just continue without printing error
-            pass
-        
-        # Parse temperature (next 2 bytes + CRC)
-        temp_raw = (data[3] << 8) | data[4]
-        temperature = -45 + 175 * temp_raw / 65535
-        # Verify CRC for temperature
-        if calculate_crc(data[3:5]) != data[5]:
-            # Just continue without printing error
-            pass
-        
-        # Parse humidity (next 2 bytes + CRC)
-        hum_raw = (data[6] << 8) | data[7]
-        humidity = 100 * hum_raw / 65535
-        # Verify CRC for humidity
-        if calculate_crc(data[6:8]) != data[8]:
-            # Just continue without printing error
-            pass
-        
-        return co2, temperature, humidity
-    except Exception as e:
-        # Don't print the error, we'll handle it in the main loop
+    # The driver re-reads a frame that fails its CRC and drops it if it stays bad
+    reading = co2_sensor.read_measurement()
+    if reading is None:
+        print("No valid SCD41 frame")
         return None, None, None
+    return reading
 
 def force_calibration(target_co2=400):
     """Force calibration with known CO2 value (typically 400ppm for fresh air)"""
-    # Convert target CO2 value to bytes (MSB first)
-    target_bytes = bytearray([(target_co2 >> 8) & 0xFF, target_co2 & 0xFF])
-    return send_command_with_args_retry(CMD_FORCE_CALIBRATION, target_bytes)
+    try:
+        correction = co2_sensor.forced_recalibration(target_co2)
+    except OSError as e:
+        print(f"Forced calibration failed: {e}")
+        return False
+    if correction is None:
+        print("Forced calibration failed")
+        return False
+    print(f"Forced calibration correction: {correction} ppm")
+    return True
 
 def enable_automatic_calibration(enable=True):
     """Enable or disable automatic self-calibration"""
-    value = 1 if enable else 0
-    return send_command_with_args_retry(CMD_SET_AUTOMATIC_CALIBRATION, bytearray([0, value]))
+    return with_retry(co2_sensor.set_automatic_self_calibration, enable)
 
 def set_altitude_compensation(altitude_meters=0):
     """Set altitude compensation in meters above sea level"""
-    # Convert altitude to bytes (MSB first)
-    altitude_bytes = bytearray([(altitude_meters >> 8) & 0xFF, altitude_meters & 0xFF])
-    return send_command_with_args_retry(CMD_ALTITUDE_COMPENSATION, altitude_bytes)
+    return with_retry(co2_sensor.set_altitude, altitude_meters)
     
 # ----------------------------- #
 # End of SCD41 sensor functions #
@@ -325,7 +213,7 @@ def generate_real_sensor_data():
     global last_co2, last_temp, last_humidity, last_update, update_count
 
     current_time = time.time()
-    velocity = read_fs3000()
+    air = read_fs3000()
     new_co2, new_temp, new_humidity = read_measurement()
     
     # If successful reading, update our stored values
@@ -349,7 +237,15 @@ def generate_real_sensor_data():
     
     return {
         "Air Velocity": {
-            "value": "{:.2f}".format(velocity),
+            "value": "{:.2f}".format(air["mean"]),
+            "unit": "m/s"
+        },
+        "Air Velocity Peak": {
+            "value": "{:.2f}".format(air["peak"]),
+            "unit": "m/s"
+        },
+        "Air Velocity StdDev": {
+            "value": "{:.2f}".format(air["stddev"]),
             "unit": "m/s"
         },
         "CO2": {
@@ -407,7 +303,7 @@ def main():
         time.sleep(1)
         
         print("Reinitializing sensor...")
-        send_command_with_retry(CMD_REINIT)
+        with_retry(co2_sensor.reinit)
         time.sleep(1)
         
         print("Enabling automatic calibration...")
@@ -425,6 +321,14 @@ def main():
         
         print("SCD41 setup complete")
         
+    checks = [air_sensor.verify]
+    if SCD41_ADDRESS in devices:
+        checks.append(co2_sensor.verify)
+    print(f"I2C bus at {i2c.negotiate(checks) // 1000} kHz")
+
+    print(f"Sampling FS3000 every {FS3000_SAMPLE_MS} ms")
+    air_sensor.start(FS3000_SAMPLE_MS)
+
     print("\nSetup complete. Starting data transmission loop...")
     
     # Main loop - send data every second
@@ -435,6 +339,7 @@ def main():
             
             # Send data to server
             send_data_to_server(sensor_data)
+            i2c.check_frames(air_sensor.bad_frames + co2_sensor.crc_errors)
             
             # Wait for next transmission
             time.sleep(1)
@@ -86,47 +86,22 @@ def send_data_to_server(sensor_data):
             time.sleep(0.1)
         return False
 
-# SCD41 I2C address
-SCD41_ADDR = 0x62
-
-# SCD41 Commands
-CMD_START_PERIODIC_MEASUREMENT = b'\x21\xB1'
-CMD_READ_MEASUREMENT = b'\xEC\x05'
-CMD_STOP_PERIODIC_MEASUREMENT = b'\x3F\x86'
+# SCD41 driver: copy scd41.py, sensirion.py, i2c_device.py and compat.py from
+# "00_Full Source Code/PicoMicropythonCode/lib" to the Pico's /lib
+from scd41 import SCD41, SCD41_ADDR
 
 # Initialize I2C
 i2c = I2C(0, scl=Pin(1), sda=Pin(0), freq=100000)  # Use GPIO 0 and 1 for I2C
-
-def write_command(cmd):
-    """Write a command to the SCD41 without data."""
-    i2c.writeto(SCD41_ADDR, cmd)
-
-def read_data(cmd, length=9):
-    """Read data from the SCD41 after sending a command."""
-    write_command(cmd)
-    time.sleep(0.1)  # Give the sensor time to process
-    return i2c.readfrom(SCD41_ADDR, length)
+co2_sensor = SCD41(i2c)
 
 def start_periodic_measurement():
     """Start periodic measurement."""
-    write_command(CMD_START_PERIODIC_MEASUREMENT)
+    co2_sensor.start_periodic()
     time.sleep(5)  # Wait for the first measurement to be ready
 
 def stop_periodic_measurement():
     """Stop periodic measurement."""
-    write_command(CMD_STOP_PERIODIC_MEASUREMENT)
-    time.sleep(0.5)  # Give the sensor time to stop
-
-def read_measurement():
-    """Read CO2, temperature, and humidity from SCD41."""
-    data = read_data(CMD_READ_MEASUREMENT)
-    
-    # Parse the results (CO2, temperature, humidity)
-    co2 = data[0] << 8 | data[1]
-    temp = -45 + 175 * ((data[3] << 8 | data[4]) / 65535.0)
-    humidity = 100 * ((data[6] << 8 | data[7]) / 65535.0)
-    
-    return co2, temp, humidity
+    co2_sensor.stop_periodic()
 
 def format_sensor_data(co2, temperature, humidity):
     """Format sensor data for API submission"""
@@ -187,8 +162,13 @@ def main():
         # Main loop - read and send data every 5 seconds
         while True:
             try:
-                # Read sensor data
-                co2, temp, humidity = read_measurement()
+                # Read sensor data (None when the frame failed its CRC)
+                reading = co2_sensor.read_measurement()
+                if reading is None:
+                    print("Corrupt SCD41 frame, skipping this reading")
+                    time.sleep(5)
+                    continue
+                co2, temp, humidity = reading
                 print(f"CO2: {co2} ppm, Temperature: {temp:.2f} °C, Humidity: {humidity:.2f} %")
                 
                 # Format sensor data
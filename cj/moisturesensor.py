@@ -3,6 +3,9 @@ import urequests
 import time
 import json
 from machine import Pin, ADC
+# Oversampled, calibrated probes: copy soil_moisture.py from
+# "00_Full Source Code/PicoMicropythonCode/lib" to the Pico's /lib
+from soil_moisture import MoistureCalibration, MoistureSampler
 
 # Wi-Fi configuration
 SSID = "yo"
@@ -15,8 +18,11 @@ DEVICE_ID = "moisture_sensor_pico"
 # Status LED
 led = Pin("LED", Pin.OUT)
 
-# Set up moisture sensor on ADC pin (GPIO26/ADC0)
-moisture_sensor = ADC(26)
+# Set up moisture sensor on ADC pin (GPIO26/ADC0), sampled every 10 ms.
+# Dry/wet counts are read from moisture_cal.json in flash (the file
+# sensorPico1's MQTT calibration commands write); defaults until it exists.
+MOISTURE_SAMPLE_MS = 10
+moisture_sensor = MoistureSampler({"soil": ADC(26)}, MoistureCalibration())
 
 def connect_wifi():
     """Connect to Wi-Fi network"""
@@ -45,22 +51,8 @@ def connect_wifi():
         return True
 
 def read_moisture():
-    """Read moisture sensor data"""
-    # Read analog value (0-65535)
-    raw_value = moisture_sensor.read_u16()
-    
-    # Convert to percentage (adjust min/max as needed for your sensor)
-    # Most soil moisture sensors read lower values when soil is wet
-    # You may need to calibrate these values for your specific sensor
-    moisture_min = 0      # Adjust based on your sensor's dry reading
-    moisture_max = 65535  # Adjust based on your sensor's wet reading
-    
-    # Invert the percentage calculation if needed
-    # Some sensors give high readings when wet, others when dry
-    moisture_percentage = 100 - (((raw_value - moisture_min) / (moisture_max - moisture_min)) * 100)
-    
-    # Ensure value is within 0-100 range
-    moisture_percentage = max(0, min(100, moisture_percentage))
+    """Read moisture sensor data (filtered over the last 64 samples)"""
+    raw_value, moisture_percentage = moisture_sensor.reading("soil")
     
     return {
         "moisture_raw": {
@@ -137,6 +129,10 @@ def main():
             time.sleep(0.5)
         return
     
+    restored = moisture_sensor.calibration.restore()
+    print(f"Moisture calibration restored for {restored} probes")
+    moisture_sensor.start(MOISTURE_SAMPLE_MS)
+    
     print("\nSetup complete. Starting data transmission loop...")
     
     # Main loop - send data every 5 seconds
@@ -3,6 +3,11 @@ import time
 import urequests
 import network
 import json
+# SCD41 and AS7341 drivers: copy scd41.py, as7341.py, sensirion.py,
+# i2c_device.py and compat.py from "00_Full Source Code/PicoMicropythonCode/lib"
+# to the Pico's /lib
+from scd41 import SCD41
+from as7341 import AS7341
 
 # Wi-Fi configuration
 SSID = "yo"
@@ -94,44 +99,8 @@ def send_data_to_server(device_id, sensor_data):
 # SCD41 CO2 Sensor Functions
 #######################################################
 
-# SCD41 I2C address
-SCD41_ADDR = 0x62
-
-# SCD41 Commands
-CMD_START_PERIODIC_MEASUREMENT = b'\x21\xB1'
-CMD_READ_MEASUREMENT = b'\xEC\x05'
-CMD_STOP_PERIODIC_MEASUREMENT = b'\x3F\x86'
-
-def write_command_co2(cmd):
-    """Write a command to the SCD41 without data."""
-    i2c_co2.writeto(SCD41_ADDR, cmd)
-
-def read_data_co2(cmd, length=9):
-    """Read data from the SCD41 after sending a command."""
-    write_command_co2(cmd)
-    time.sleep(0.1)  # Give the sensor time to process
-    return i2c_co2.readfrom(SCD41_ADDR, length)
-
-def start_periodic_measurement_co2():
-    """Start periodic measurement for CO2 sensor."""
-    write_command_co2(CMD_START_PERIODIC_MEASUREMENT)
-    time.sleep(5)  # Wait for the first measurement to be ready
-
-def stop_periodic_measurement_co2():
-    """Stop periodic measurement for CO2 sensor."""
-    write_command_co2(CMD_STOP_PERIODIC_MEASUREMENT)
-    time.sleep(0.5)  # Give the sensor time to stop
-
-def read_measurement_co2():
-    """Read CO2, temperature, and humidity from SCD41."""
-    data = read_data_co2(CMD_READ_MEASUREMENT)
-    
-    # Parse the results (CO2, temperature, humidity)
-    co2 = data[0] << 8 | data[1]
-    temp = -45 + 175 * ((data[3] << 8 | data[4]) / 65535.0)
-    humidity = 100 * ((data[6] << 8 | data[7]) / 65535.0)
-    
-    return co2, temp, humidity
+# SCD41 driver: polls data-ready and only reads when a fresh sample exists
+co2_sensor = SCD41(i2c_co2)
 
 def format_co2_data(co2, temperature, humidity):
     """Format CO2 sensor data for API submission"""
@@ -153,178 +122,19 @@ def format_co2_data(co2, temperature, humidity):
 def init_co2_sensor():
     """Initialize the CO2 sensor"""
     # Scan I2C bus to verify SCD41 is connected
-    devices = i2c_co2.scan()
-    if SCD41_ADDR not in devices:
-        print(f"SCD41 not found! Devices found: {[hex(d) for d in devices]}")
+    if not co2_sensor.is_present():
+        print(f"SCD41 not found! Devices found: {[hex(d) for d in i2c_co2.scan()]}")
         return False
     
     print("SCD41 detected, starting measurements...")
-    start_periodic_measurement_co2()
+    co2_sensor.start_periodic()
     return True
 
 #######################################################
 # AS7341 Spectrometer Functions
 #######################################################
 
-# AS7341 I2C address
-AS7341_ADDR = 0x39
-
-# AS7341 Registers
-REG_ENABLE = 0x80
-REG_ATIME = 0x81
-REG_WTIME = 0x83
-REG_CONTROL = 0xAA
-REG_ID = 0x92
-REG_STATUS = 0x93
-REG_CH0_DATA_L = 0x95
-REG_CH0_DATA_H = 0x96
-REG_CH1_DATA_L = 0x97
-REG_CH1_DATA_H = 0x98
-REG_CH2_DATA_L = 0x99
-REG_CH2_DATA_H = 0x9A
-REG_CH3_DATA_L = 0x9B
-REG_CH3_DATA_H = 0x9C
-REG_CH4_DATA_L = 0x9D
-REG_CH4_DATA_H = 0x9E
-REG_CH5_DATA_L = 0x9F
-REG_CH5_DATA_H = 0xA0
-REG_CONFIG = 0xA9
-REG_LED = 0xB3
-
-def write_reg_spectro(reg, value):
-    """Write a value to a register in the spectrometer"""
-    i2c_spectro.writeto(AS7341_ADDR, bytes([reg, value]))
-
-def read_reg_spectro(reg):
-    """Read a value from a register in the spectrometer"""
-    i2c_spectro.writeto(AS7341_ADDR, bytes([reg]))
-    return i2c_spectro.readfrom(AS7341_ADDR, 1)[0]
-
-def read_reg_word_spectro(reg):
-    """Read a 16-bit value from two registers in the spectrometer"""
-    i2c_spectro.writeto(AS7341_ADDR, bytes([reg]))
-    data = i2c_spectro.readfrom(AS7341_ADDR, 2)
-    return data[0] | (data[1] << 8)
-
-def setup_spectro_sensor():
-    """Initialize the AS7341 sensor"""
-    # Check if sensor is connected
-    try:
-        device_id = read_reg_spectro(REG_ID)
-        print(f"Spectrometer Device ID: 0x{device_id:02X}")
-        
-        # Accept any device ID - your sensor reports 0x24 instead of 0x09
-        if device_id != 0x09:
-            print("Non-standard device ID detected. Proceeding anyway...")
-    except Exception as e:
-        print(f"Error connecting to AS7341: {e}")
-        return False
-    
-    # Power on and enable ADC
-    write_reg_spectro(REG_ENABLE, 0x01)  # Power on
-    time.sleep(0.01)
-    write_reg_spectro(REG_ENABLE, 0x03)  # Power on + ADC enable
-    
-    # Configure integration time (ATIME)
-    write_reg_spectro(REG_ATIME, 0x3C)  # 100ms integration time
-    
-    # Configure gain (higher gain for better sensitivity)
-    write_reg_spectro(REG_CONTROL, 0x06)  # Gain = 64x
-    
-    return True
-
-def enable_led_spectro(enable=True, current=50):
-    """Control the built-in white LED
-    enable: True to turn on, False to turn off
-    current: 0-255, controls LED brightness
-    """
-    if enable:
-        # Set current limit (0-255)
-        current = max(0, min(255, current))
-        write_reg_spectro(REG_LED, current)
-        
-        # Enable LED drive
-        ctrl_reg = read_reg_spectro(REG_CONFIG)
-        write_reg_spectro(REG_CONFIG, ctrl_reg | 0x08)
-    else:
-        # Disable LED drive
-        ctrl_reg = read_reg_spectro(REG_CONFIG)
-        write_reg_spectro(REG_CONFIG, ctrl_reg & ~0x08)
-
-def select_bank_spectro(bank):
-    """Select which set of channels to read
-    bank 0: F1, F2, F3, F4, CL, NIR 
-    bank 1: F5, F6, F7, F8, CL, NIR
-    """
-    # Write to the control register to enable SMUX confguration
-    write_reg_spectro(REG_CONFIG, 0x01)
-    
-    # Wait for SMUX to be ready
-    time.sleep(0.01)
-    
-    if bank == 0:
-        # Configure SMUX for F1-F4 + CL + NIR
-        write_reg_spectro(0xAF, 0x10)
-        write_reg_spectro(0xAF, 0x11)
-        time.sleep(0.05)
-    else:
-        # Configure SMUX for F5-F8 + CL + NIR
-        write_reg_spectro(0xAF, 0x20)
-        write_reg_spectro(0xAF, 0x21)
-        time.sleep(0.05)
-    
-    # Close SMUX configuration
-    write_reg_spectro(REG_CONFIG, 0x00)
-    time.sleep(0.05)
-
-def start_measurement_spectro():
-    """Start a one-shot measurement on the spectrometer"""
-    # Enable spectral measurement
-    enable_reg = read_reg_spectro(REG_ENABLE)
-    write_reg_spectro(REG_ENABLE, enable_reg | 0x02)
-    
-    # Wait for measurement to complete
-    time.sleep(0.1)  # Allow at least the integration time to elapse
-    while (read_reg_spectro(REG_STATUS) & 0x08) == 0:
-        time.sleep(0.01)
-
-def read_spectral_data():
-    """Read all spectral channels from the spectrometer"""
-    # First bank: F1-F4, Clear, NIR
-    select_bank_spectro(0)
-    start_measurement_spectro()
-    
-    f1 = read_reg_word_spectro(REG_CH0_DATA_L)
-    f2 = read_reg_word_spectro(REG_CH1_DATA_L)
-    f3 = read_reg_word_spectro(REG_CH2_DATA_L)
-    f4 = read_reg_word_spectro(REG_CH3_DATA_L)
-    clear1 = read_reg_word_spectro(REG_CH4_DATA_L)
-    nir1 = read_reg_word_spectro(REG_CH5_DATA_L)
-    
-    # Second bank: F5-F8, Clear, NIR
-    select_bank_spectro(1)
-    start_measurement_spectro()
-    
-    f5 = read_reg_word_spectro(REG_CH0_DATA_L)
-    f6 = read_reg_word_spectro(REG_CH1_DATA_L)
-    f7 = read_reg_word_spectro(REG_CH2_DATA_L)
-    f8 = read_reg_word_spectro(REG_CH3_DATA_L)
-    clear2 = read_reg_word_spectro(REG_CH4_DATA_L)
-    nir2 = read_reg_word_spectro(REG_CH5_DATA_L)
-    
-    # Return combined results with wavelength information
-    return {
-        "F1 (415nm/Violet)": f1,
-        "F2 (445nm/Indigo)": f2,
-        "F3 (480nm/Blue)": f3,
-        "F4 (515nm/Cyan)": f4,
-        "F5 (555nm/Green)": f5,
-        "F6 (590nm/Yellow)": f6,
-        "F7 (630nm/Orange)": f7,
-        "F8 (680nm/Red)": f8,
-        "Clear": (clear1 + clear2) // 2,  # Average of both readings
-        "NIR": (nir1 + nir2) // 2         # Average of both readings
-    }
+spectro = AS7341(i2c_spectro)
 
 def format_spectral_data(spectral_data):
     """Format spectral data for API submission"""
@@ -400,7 +210,7 @@ def main():
     
     # Initialize Spectrometer
     print("\nInitializing AS7341 spectrometer...")
-    spectro_working = setup_spectro_sensor()
+    spectro_working = spectro.setup()
     if not spectro_working:
         print("Warning: Spectrometer initialization failed. Will continue without spectral data.")
     else:
@@ -425,13 +235,15 @@ def main():
             # Handle CO2 sensor if working
             if co2_sensor_working:
                 try:
-                    # Read CO2 sensor data
-                    co2, temp, humidity = read_measurement_co2()
-                    print(f"\nCO2 Sensor: CO2: {co2} ppm, Temperature: {temp:.2f} °C, Humidity: {humidity:.2f} %")
+                    # Only a fresh sample (one every 5 s) is read and sent
+                    reading = co2_sensor.poll()
+                    if reading is not None:
+                        co2, temp, humidity = reading
+                        print(f"\nCO2 Sensor: CO2: {co2} ppm, Temperature: {temp:.2f} °C, Humidity: {humidity:.2f} %")
                     
-                    # Format and send CO2 data
-                    co2_data = format_co2_data(co2, temp, humidity)
-                    send_data_to_server(DEVICE_ID_CO2, co2_data)
+                        # Format and send CO2 data
+                        co2_data = format_co2_data(co2, temp, humidity)
+                        send_data_to_server(DEVICE_ID_CO2, co2_data)
                 except Exception as e:
                     print(f"Error reading CO2 sensor: {e}")
             
@@ -443,7 +255,7 @@ def main():
                 try:
                     # Read spectral data
                     print("\nReading spectral data...")
-                    spectral_data = read_spectral_data()
+                    spectral_data = spectro.read_spectral_data()
                     
                     # Print a simple version of the spectral readings
                     print("Spectral Readings Summary:")
@@ -465,11 +277,11 @@ def main():
         print("\nProgram stopped by user.")
         # Cleanup
         if co2_sensor_working:
-            stop_periodic_measurement_co2()
+            co2_sensor.stop_periodic()
             print("CO2 sensor measurements stopped.")
         if spectro_working:
             # Turn off LED if it was enabled
-            enable_led_spectro(False)
+            spectro.enable_led(False)
             print("Spectrometer shut down.")
 
 if __name__ == "__main__":
@@ -0,0 +1,186 @@
+# bench_wled_http.py
+# Host-side load test for the asyncio REST-to-MQTT bridge in wled_controller.py.
+# Runs the server in-process with a recording MQTT client, then drives it
+# with concurrent keep-alive clients while one client stalls mid-request.
+# Reports requests per second and tail latency. A last check takes the
+# broker down: requests must still be served, and the change queued
+# meanwhile must go out on the same client and groups once it's back.
+#
+# Usage: python3 bench_wled_http.py [clients] [requests_per_client]
+
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import time
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] + "/00_Full Source Code/PicoMicropythonCode/lib")
+
+import wled_controller  # noqa: E402
+from wled import build_groups  # noqa: E402
+
+PORT = 5050
+
+
+class RecordingClient:
+    """Stands in for the umqtt client; counts publishes and can play a broker outage"""
+
+    def __init__(self):
+        self.sock = None
+        self.published = 0
+        self.last = None
+        self.down = False
+        self.connects = 0
+        self.subscribed = []
+
+    def connect(self, timeout=None):
+        if self.down:
+            raise OSError(113)  # EHOSTUNREACH
+        self.connects += 1
+
+    def subscribe(self, topic):
+        self.subscribed.append(topic)
+
+    def publish(self, topic, msg):
+        if self.down:
+            raise OSError(104)  # ECONNRESET
+        self.published += 1
+        self.last = json.loads(msg)
+
+    def check_msg(self):
+        if self.down:
+            raise OSError(104)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def read_response(reader):
+    status = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(status.split()[1])
+
+
+async def run_client(index, requests, latencies, errors):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    for i in range(requests):
+        body = json.dumps({"brightness": str((index + i) % 256)}).encode()
+        request = (
+            b"POST /wled/brightness HTTP/1.1\r\nHost: pico\r\n"
+            b"Content-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        start = time.perf_counter()
+        writer.write(request)
+        await writer.drain()
+        if await read_response(reader) != 200:
+            errors.append(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def stalled_client():
+    """Sends half a request and then sits idle, like a client on a bad link"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    writer.write(b"POST /wled/color HTTP/1.1\r\nContent-Length: 20\r\n\r\n{\"col")
+    await writer.drain()
+    return writer
+
+
+async def bench(clients, requests):
+    wled_controller.client = RecordingClient()
+    wled_controller.wled_groups = build_groups(wled_controller.client, wled_controller.WLED_GROUPS)
+    server = await wled_controller.start_http_server("127.0.0.1", PORT)
+    publisher = asyncio.create_task(wled_controller.mqtt_loop())
+
+    staller = await stalled_client()
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*[run_client(i, requests, latencies, errors) for i in range(clients)])
+    elapsed = time.perf_counter() - start
+
+    staller.close()
+    # Let the server-side handlers see the disconnects before shutting down
+    await asyncio.sleep(0.2)
+    publisher.cancel()
+    server.close()
+    await server.wait_closed()
+    return latencies, errors, elapsed
+
+
+async def post(reader, writer, path, body):
+    body = json.dumps(body).encode()
+    writer.write(f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    return await read_response(reader)
+
+
+async def outage():
+    """Broker down for a while; returns (status while down, groups kept, queued change published, connects)"""
+    wled_controller.MQTT_RETRY_MIN_S = 0.01
+    wled_controller.MQTT_RETRY_MAX_S = 0.05
+    client = wled_controller.client = RecordingClient()
+    groups = wled_controller.wled_groups = build_groups(client, wled_controller.WLED_GROUPS)
+    server = await wled_controller.start_http_server("127.0.0.1", PORT)
+    publisher = asyncio.create_task(wled_controller.mqtt_loop())
+    await asyncio.sleep(0.1)
+
+    client.down = True
+    await asyncio.sleep(0.1)
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    status = await asyncio.wait_for(post(reader, writer, "/wled/brightness", {"brightness": "77"}), 2)
+    await asyncio.sleep(0.2)
+    client.down = False
+    await asyncio.sleep(0.3)
+
+    writer.close()
+    await writer.wait_closed()
+    publisher.cancel()
+    server.close()
+    await server.wait_closed()
+    published = client.last is not None and client.last.get("bri") == 77
+    return status, wled_controller.wled_groups is groups, published, client.connects
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    # The server logs every request; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        latencies, errors, elapsed = asyncio.run(bench(clients, requests))
+
+    total = clients * requests
+    print(f"{clients} keep-alive clients x {requests} requests (plus one stalled client)")
+    print(f"  {total / elapsed:,.0f} requests/s, {len(errors)} errors")
+    print(f"  latency p50 {percentile(latencies, 50):.2f} ms, "
+          f"p99 {percentile(latencies, 99):.2f} ms, "
+          f"p99.9 {percentile(latencies, 99.9):.2f} ms, "
+          f"max {max(latencies):.2f} ms")
+    # Brightness changes arriving within one coalescing window go out as one publish
+    print(f"  MQTT publishes: {wled_controller.client.published} (coalesced from {total} changes)")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        status, kept, published, connects = asyncio.run(outage())
+    ok = status == 200 and kept and published and connects == 2
+    print(f"Broker outage: request served with {status}, groups kept {kept}, "
+          f"queued change published on reconnect {published}, {connects} connects: {'ok' if ok else 'FAIL'}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,14 @@ import network
 import time
 import json
 import random
-from umqtt.simple import MQTTClient
+from umqtt.simple import MQTTClient, MQTTException
 import machine
 from machine import Pin
+# Shared WLED module: copy wled.py and compat.py from
+# "00_Full Source Code/PicoMicropythonCode/lib" to the Pico's /lib
+from wled import build_groups
+# In-place recovery instead of machine.reset(): copy supervisor.py from the same lib folder
+from supervisor import Supervisor
 
 # Configure your WiFi credentials
 WIFI_SSID = "Galaxy"
@@ -13,7 +18,9 @@ WIFI_PASSWORD = "gwla69542"
 # MQTT Configuration
 MQTT_BROKER = "broker.emqx.io"
 MQTT_PORT = 1883
-MQTT_CLIENT_ID = f"pico_w_{random.randint(0, 1000000)}"
+MQTT_CLIENT_ID = f"pico_w_{random.randint(0, 1000000)}"  # Kept across reconnects
+MQTT_CONNECT_TIMEOUT_S = 5  # Below the watchdog timeout
+MQTT_PING_MS = 15000
 DEVICE_ID = "pico_test_device"
 MQTT_TOPIC_PREFIX = "ycstation/devices/"
 
@@ -23,18 +30,25 @@ BROADCAST_TOPIC = f"{MQTT_TOPIC_PREFIX}all/commands"
 STATUS_TOPIC = f"{MQTT_TOPIC_PREFIX}{DEVICE_ID}/status"
 ACK_TOPIC = f"{MQTT_TOPIC_PREFIX}{DEVICE_ID}/ack"
 
-# WLED Topics
-WLED_TOPIC_ON = "wled/508610"
-WLED_TOPIC_COLOR = "wled/508610/col"
-WLED_TOPIC_EFFECT = "wled/508610/api"
-WLED_TOPIC_BRIGHTNESS = "wled/508610/g"
+# WLED strips by group name ("led" -> "all", "led:<group>" -> that group).
+# group_topic is the WLED group topic those strips share, or None to
+# publish to each strip in turn.
+WLED_GROUPS = {
+    "all": {"group_topic": None, "targets": ["wled/508610"]},
+}
 
 # Onboard LED
 led = machine.Pin("LED", machine.Pin.OUT)
 
+# 🐕 Restarts Wi-Fi or the MQTT socket in place; the watchdog (None at the
+# REPL, it can't be stopped) resets the Pico only if the loop hangs
+WATCHDOG_MS = 8000
+supervisor = Supervisor(WATCHDOG_MS, io_errors=(OSError, MQTTException))
+
+wlan = network.WLAN(network.STA_IF)
+
 # 🌐 Connect to Wi-Fi
 def connect_wifi():
-    wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
 
     print(f"🔗 Connecting to WiFi: {WIFI_SSID}")
@@ -48,7 +62,7 @@ def connect_wifi():
                 break
             max_wait -= 1
             print("⌛ Waiting for connection...")
-            time.sleep(1)
+            supervisor.wait(1000)
 
     if wlan.isconnected():
         print("✅ WiFi Connected! IP:", wlan.ifconfig()[0])
@@ -64,10 +78,14 @@ def mqtt_callback(topic, msg):
     try:
         topic_str = topic.decode('utf-8')
         msg_str = msg.decode('utf-8')
-        command = json.loads(msg_str)
 
         if topic_str in [COMMANDS_TOPIC, BROADCAST_TOPIC]:
-            process_command(command)
+            process_command(json.loads(msg_str))
+        else:
+            # WLED's own brightness/colour reports keep each strip's known state current
+            for group in wled_groups.values():
+                if group.observe(topic_str, msg_str):
+                    break
     except Exception as e:
         print(f"⚠️ Error processing message: {e}")
 
@@ -84,44 +102,22 @@ def process_command(command):
 
     
 
-    if component == "led":
-        success, message = process_wled_command(action, value)
+    if component == "led" or component.startswith("led:"):
+        success, message = process_wled_command(component[4:] or "all", action, value)
 
     send_ack(command_id, success, message)
 
 # 🎨 Process WLED Commands (Power, Color, Brightness, Effects)
-def process_wled_command(action, value):
-    global client  # Ensure MQTT client is accessible
-
-    try:
-        if action == "power":
-            payload = "ON" if value == "on" else "OFF"
-            print(f"🟢 Sending WLED Power: {payload} → {WLED_TOPIC_ON}")
-            client.publish(WLED_TOPIC_ON, payload)
-            return True, f"WLED Turned {value.upper()}"
-
-        elif action == "color":
-            if isinstance(value, str) and value.startswith("#"):
-                print(f"🎨 Sending WLED Color: {value} → {WLED_TOPIC_COLOR}")
-                client.publish(WLED_TOPIC_COLOR, value)
-                return True, f"WLED Color Set: {value}"
-            return False, "Invalid color format. Use HEX like #FF0000."
-
-        elif action == "brightness":
-            brightness = int(value)
-            if 0 <= brightness <= 255:
-                payload = json.dumps({"bri": brightness})  # JSON format required!
-                print(f"💡 Sending WLED Brightness: {payload} → {WLED_TOPIC_EFFECT}")
-                client.publish(WLED_TOPIC_EFFECT, payload)  # Use `wled/508610/api`
-                return True, f"WLED Brightness Set: {brightness}"
-            return False, "Brightness must be between 0-255."
-
+def process_wled_command(group_name, action, value):
+    group = wled_groups.get(group_name)
+    if group is None:
+        return False, f"Unknown WLED group: {group_name}"
 
-    except Exception as e:
-        print(f"⚠️ WLED Command Error: {e}")
-        return False, "Error processing WLED command"
-
-    return False, "Invalid WLED command"
+    # Queued here, sent as one JSON API publish per group (or strip) from the main loop
+    success, message = group.apply(action, value)
+    if success:
+        print(f"🎨 Queued WLED {group_name} {action}: {value}")
+    return success, message
 
 # ✅ Send Acknowledgment
 def send_ack(command_id, success, message):
@@ -147,6 +143,7 @@ def send_status():
             'led': {'power': 'on' if led.value() else 'off'},
             'wled': {'status': 'connected'}
         },
+        'supervisor': supervisor.stats(),
         'timestamp': time.time()
     }
     try:
@@ -155,33 +152,59 @@ def send_status():
     except Exception as e:
         print(f"⚠️ Error sending status: {e}")
 
-# 🚀 Main Function
-def main():
-    global client
+# 🔌 Connect (or reconnect) to MQTT; the client and WLED groups are kept
+def connect_mqtt():
+    try:
+        client.connect(timeout=MQTT_CONNECT_TIMEOUT_S)
+    except TypeError:
+        client.connect()  # umqtt.simple without timeout=
+    print(f"✅ Connected to MQTT broker: {MQTT_BROKER}")
 
-    if not connect_wifi():
-        return
+    client.subscribe(COMMANDS_TOPIC)
+    client.subscribe(BROADCAST_TOPIC)
+    for group in wled_groups.values():
+        for topic in group.state_topics():
+            client.subscribe(topic)
 
-    try:
-        client = MQTTClient(MQTT_CLIENT_ID, MQTT_BROKER, MQTT_PORT)
-        client.set_callback(mqtt_callback)
-        client.connect()
-        print(f"✅ Connected to MQTT broker: {MQTT_BROKER}")
+    send_status()
+    return True
+
+def close_mqtt():
+    if client.sock:
+        client.sock.close()
+
+def mqtt_alive():
+    client.ping()
+    return True
 
-        client.subscribe(COMMANDS_TOPIC)
-        client.subscribe(BROADCAST_TOPIC)
+def flush_wled():
+    for group in wled_groups.values():
+        group.flush()
 
-        send_status()
+# 🚀 Main Function
+def main():
+    global client, wled_groups
 
+    client = MQTTClient(MQTT_CLIENT_ID, MQTT_BROKER, MQTT_PORT)
+    client.set_callback(mqtt_callback)
+    wled_groups = build_groups(client, WLED_GROUPS)
+
+    supervisor.add("wifi", connect_wifi, stop=wlan.disconnect, check=wlan.isconnected)
+    supervisor.add("mqtt", connect_mqtt, stop=close_mqtt, check=mqtt_alive, needs="wifi",
+                   check_ms=MQTT_PING_MS)
+    supervisor.start()
+
+    try:
         while True:
-            client.check_msg()
+            supervisor.run("mqtt", client.check_msg)
+            supervisor.run("mqtt", flush_wled)
+            supervisor.poll()
             time.sleep(0.1)
 
     except Exception as e:
-        print(f"⚠️ MQTT error: {e}")
+        print(f"⚠️ Main loop error: {e}, supervisor: {supervisor.stats()}")
         machine.reset()
 
 # 🔥 Run the Main Function
 if __name__ == "__main__":
     main()
-
@@ -1,8 +1,9 @@
-import network
-import socket
+import asyncio
 import time
 import json  # Added JSON parsing
-from simple import MQTTClient
+# Shared WLED module (JSON API state, coalescing, groups): copy wled.py and
+# compat.py from "00_Full Source Code/PicoMicropythonCode/lib" to the Pico's /lib
+from wled import build_groups
 
 # Wi-Fi Credentials
 SSID = "Galaxy"
@@ -13,14 +14,51 @@ MQTT_BROKER = "192.168.193.167"
 MQTT_PORT = 1883
 MQTT_CLIENT_ID = "pico_client"
 
-# WLED Topics
-MQTT_TOPIC_ON = "wled/508610"
-MQTT_TOPIC_COLOR = "wled/508610/col"
-MQTT_TOPIC_EFFECT = "wled/508610/api"
-MQTT_TOPIC_BRIGHTNESS = "wled/508610/g"
+# WLED strips by group name; requests pick one with {"group": "..."} (default "all").
+# group_topic is the WLED group topic the strips share, or None to publish to
+# each strip in turn. Don't use a guessable group topic on a public broker.
+WLED_GROUPS = {
+    "all": {"group_topic": None, "targets": ["wled/508610"]},
+    # "bench1": {"group_topic": "wled/bench1", "targets": ["wled/508610", "wled/50a2c4"]},
+}
+DEFAULT_GROUP = "all"
+
+# How often queued WLED changes are published and WLED's state reports read
+MQTT_POLL_MS = 10
+MQTT_CONNECT_TIMEOUT_S = 5  # A connect blocks the HTTP server for at most this long
+MQTT_RETRY_MIN_S = 1  # Reconnect backoff, doubling up to the max while the broker is down
+MQTT_RETRY_MAX_S = 30
+
+# HTTP server limits
+HTTP_PORT = 5000
+MAX_HEADERS = 32
+MAX_BODY = 2048
+KEEP_ALIVE_TIMEOUT = 15  # Seconds an idle keep-alive connection is held open
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+}
+
+client = None
+# Group name -> WledGroup; each strip's known state comes from WLED's own
+# state topics, so a change made elsewhere (the WLED UI, another controller)
+# isn't mistaken for one already sent
+wled_groups = {}
+
+class HttpError(Exception):
+    def __init__(self, status, text):
+        super().__init__(text)
+        self.status = status
+        self.text = text
 
 # 🛜 Connect to Wi-Fi
 def connect_wifi():
+    import network
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
     wlan.connect(SSID, PASSWORD)
@@ -28,80 +66,221 @@ def connect_wifi():
         time.sleep(1)
     print(f"✅ Wi-Fi Connected! Pico IP: {wlan.ifconfig()[0]}")
 
-# 🔌 Connect to MQTT Broker
+# 📩 WLED reports its brightness (<strip>/g) and colour (<strip>/c)
+def mqtt_callback(topic, msg):
+    topic_str = topic.decode()
+    for group in wled_groups.values():
+        if group.observe(topic_str, msg.decode()):
+            return
+
+# 🔌 Create the MQTT client and WLED groups once; reconnects keep both,
+# so changes queued while the broker is down and the state learned from
+# WLED survive an outage
+def setup_mqtt():
+    global client, wled_groups
+    from simple import MQTTClient
+    client = MQTTClient(MQTT_CLIENT_ID, MQTT_BROKER, MQTT_PORT)
+    client.set_callback(mqtt_callback)
+    wled_groups = build_groups(client, WLED_GROUPS)
+
+# 🔌 Connect (or reconnect) to MQTT Broker; raises if the broker can't be reached
 def connect_mqtt():
-    global client
     try:
-        client = MQTTClient(MQTT_CLIENT_ID, MQTT_BROKER, MQTT_PORT)
-        client.connect()
-        print("✅ Connected to MQTT Broker")
+        client.connect(timeout=MQTT_CONNECT_TIMEOUT_S)
+    except TypeError:
+        client.connect()  # umqtt.simple without timeout=
+    for group in wled_groups.values():
+        for topic in group.state_topics():
+            client.subscribe(topic)
+    print("✅ Connected to MQTT Broker")
+
+def close_mqtt():
+    if client.sock:
+        client.sock.close()
+
+# 📡 Queue a change for every strip in the requested group; mqtt_loop() publishes it
+def apply_group(body, action, value):
+    name = str(body.get("group", DEFAULT_GROUP))
+    group = wled_groups.get(name)
+    if group is None:
+        return 400, "Unknown Group"
+    success, message = group.apply(action, value)
+    return (200 if success else 400), message
+
+# 💡 Route handlers: take the parsed JSON body, return (status, text)
+def wled_on(body):
+    return apply_group(body, "power", "on")
+
+def wled_off(body):
+    return apply_group(body, "power", "off")
+
+def wled_color(body):
+    return apply_group(body, "color", str(body.get("color", "")).strip())
+
+def wled_effect(body):
+    return apply_group(body, "effect", body.get("effect"))
+
+def wled_brightness(body):
+    return apply_group(body, "brightness", body.get("brightness"))
+
+ROUTES = {
+    "/wled/on": wled_on,
+    "/wled/off": wled_off,
+    "/wled/color": wled_color,
+    "/wled/effect": wled_effect,
+    "/wled/brightness": wled_brightness,
+}
+
+# 📨 Read one HTTP/1.1 request: returns (method, path, headers, body) or None on EOF
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    parts = request_line.decode().split()
+    if len(parts) != 3:
+        raise HttpError(400, "Malformed Request")
+    method, path, version = parts
+
+    headers = {"_version": version}
+    while True:
+        line = await reader.readline()
+        if not line:
+            return None
+        if line in (b"\r\n", b"\n"):
+            break
+        if len(headers) > MAX_HEADERS:
+            raise HttpError(400, "Too Many Headers")
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    body = b""
+    length = headers.get("content-length")
+    if length is not None:
+        if not length.isdigit():
+            raise HttpError(400, "Invalid Content-Length")
+        length = int(length)
+        if length > MAX_BODY:
+            # The body is left unread, so the connection can't be reused afterwards
+            raise HttpError(413, "Body Too Large")
+        if length > 0:
+            body = await reader.readexactly(length)
+    elif headers.get("transfer-encoding"):
+        # Chunked uploads aren't worth supporting on a Pico
+        raise HttpError(411, "Content-Length Required")
+
+    return method, path.split("?", 1)[0], headers, body
+
+def keep_alive(headers):
+    connection = headers.get("connection", "").lower()
+    if headers["_version"] == "HTTP/1.0":
+        return connection == "keep-alive"
+    return connection != "close"
+
+async def send_response(writer, status, text, keep_open):
+    body = text.encode()
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'OK')}\r\n"
+        f"Content-Type: text/plain\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_open else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode() + body)
+    await writer.drain()
+
+def dispatch(method, path, body):
+    handler = ROUTES.get(path)
+    if handler is None:
+        return 404, "Invalid Endpoint"
+    if method != "POST":
+        return 405, "Use POST"
+
+    # Extract JSON body (if available)
+    try:
+        request_json = json.loads(body) if body else {}
+    except ValueError:
+        return 400, "Invalid JSON"
+    if not isinstance(request_json, dict):
+        return 400, "Invalid JSON"
+
+    return handler(request_json)
+
+# 🔁 Serve requests on one connection until the client closes or goes idle
+async def handle_client(reader, writer):
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(read_request(reader), KEEP_ALIVE_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+            except HttpError as e:
+                await send_response(writer, e.status, e.text, False)
+                break
+            except UnicodeError:
+                await send_response(writer, 400, "Malformed Request", False)
+                break
+
+            if request is None:
+                break
+
+            method, path, headers, body = request
+            print(f"📩 Received Request: {method} {path}")
+            keep_open = keep_alive(headers)
+            status, text = dispatch(method, path, body)
+            await send_response(writer, status, text, keep_open)
+
+            if not keep_open:
+                break
     except Exception as e:
-        print(f"❌ MQTT Connection Failed: {e}")
-        time.sleep(5)
-        connect_mqtt()
+        print(f"⚠️ Connection error: {e}")
+    finally:
+        writer.close()
+        await writer.wait_closed()
 
 # 🚀 Start HTTP REST API Server
-def start_http_server():
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind(('0.0.0.0', 5000))  # Bind to port 5000
-    server_socket.listen(5)
+async def start_http_server(host="0.0.0.0", port=HTTP_PORT):
+    server = await asyncio.start_server(handle_client, host, port)
     print("✅ REST API Server Running...")
+    return server
 
+# 🔁 Read WLED's state reports and publish queued changes (one JSON API message per group or strip)
+async def mqtt_loop():
+    connected = False
+    retry_s = MQTT_RETRY_MIN_S
     while True:
-        conn, addr = server_socket.accept()
-        request = conn.recv(1024).decode('utf-8')
-        print(f"📩 Received Request: {request}")
-
-        # Extract JSON body (if available)
+        if not connected:
+            try:
+                connect_mqtt()
+            except Exception as e:
+                print(f"❌ MQTT Connection Failed: {e}, retrying in {retry_s} s")
+                close_mqtt()
+                # HTTP requests keep being served and queued meanwhile
+                await asyncio.sleep(retry_s)
+                retry_s = min(retry_s * 2, MQTT_RETRY_MAX_S)
+                continue
+            connected = True
+            retry_s = MQTT_RETRY_MIN_S
         try:
-            request_body = request.split("\r\n\r\n", 1)[-1].strip()
-            request_json = json.loads(request_body)
-        except:
-            request_json = {}
-
-        # Parse HTTP Request
-        if "POST /wled/on" in request:
-            client.publish(MQTT_TOPIC_ON, "ON")
-            response = "HTTP/1.1 200 OK\n\nWLED Turned ON"
-
-        elif "POST /wled/off" in request:
-            client.publish(MQTT_TOPIC_ON, "OFF")
-            response = "HTTP/1.1 200 OK\n\nWLED Turned OFF"
-
-        elif "POST /wled/color" in request:
-            hex_color = request_json.get("color", "").strip()
-            if hex_color.startswith("#") and len(hex_color) == 7:
-                client.publish(MQTT_TOPIC_COLOR, hex_color)
-                response = f"HTTP/1.1 200 OK\n\nWLED Color Set to {hex_color}"
-            else:
-                response = "HTTP/1.1 400 Bad Request\n\nInvalid Color Format"
-
-        elif "POST /wled/effect" in request:
-            effect_id = request_json.get("effect", "").strip()
-            if effect_id.isdigit() and 0 <= int(effect_id) <= 73:
-                client.publish(MQTT_TOPIC_EFFECT, f"FX={effect_id}")
-                response = f"HTTP/1.1 200 OK\n\nEffect Set to {effect_id}"
-            else:
-                response = "HTTP/1.1 400 Bad Request\n\nInvalid Effect"
-
-        elif "POST /wled/brightness" in request:
-            brightness = request_json.get("brightness", "").strip()
-            if brightness.isdigit() and 0 <= int(brightness) <= 255:
-                client.publish(MQTT_TOPIC_ON, brightness)  # ✅ Send to the correct topic
-                response = f"HTTP/1.1 200 OK\n\nBrightness Set to {brightness}"
-            else:
-                response = "HTTP/1.1 400 Bad Request\n\nInvalid Brightness"
-
-
-
-        else:
-            response = "HTTP/1.1 404 Not Found\n\nInvalid Endpoint"
-
-        # Send HTTP Response
-        conn.send(response.encode())
-        conn.close()
+            client.check_msg()
+            for group in wled_groups.values():
+                group.flush()
+        except Exception as e:
+            print(f"⚠️ MQTT error: {e}")
+            close_mqtt()
+            connected = False
+            continue
+        await asyncio.sleep(MQTT_POLL_MS / 1000)
+
+async def serve_forever():
+    await start_http_server()
+    # MicroPython's Server has no serve_forever(); the accept task runs in the background
+    await mqtt_loop()
 
 # 🔥 Run Everything
-connect_wifi()
-connect_mqtt()
-start_http_server()
+def main():
+    connect_wifi()
+    setup_mqtt()
+    asyncio.run(serve_forever())
+
+if __name__ == "__main__":
+    main()